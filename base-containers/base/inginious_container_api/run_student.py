@@ -12,8 +12,9 @@ import msgpack
 import zmq
 import struct
 import threading
+import time
 import zmq.asyncio
-from inginious_container_api.utils import read_block
+from inginious_container_api.utils import read_block, receive_session_message
 
 
 def run_student(cmd, container=None,
@@ -112,6 +113,189 @@ def run_student_simple(cmd, cmd_input=None, container=None,
              output is in the form (stdout, retval) is returned.
              The type of the returned strings (stdout, stderr) is dependent of the `text` arg.
     """
+    return _run_simple(lambda stdin, stdout, stderr: run_student(cmd, container, time_limit, hard_time_limit,
+                                                                 memory_limit, share_network, working_dir,
+                                                                 stdin, stdout, stderr),
+                       cmd_input, stdout_err_fuse, text)
+
+
+def open_student_session(container=None, time_limit=0, hard_time_limit=0, memory_limit=0, share_network=False,
+                         working_dir=None):
+    """
+    Start a student container that stays alive to run several commands, instead of starting a new container for each
+    call to `run_student` (for example to run the tests of a grader one by one). The commands are run in the same
+    container, one at a time, with `StudentSession.run` or `StudentSession.run_simple`. The session must be closed
+    when it is no longer needed (it can be used as a context manager).
+
+    The limits of the session apply to the student container, hence to all the commands it runs: the time limit is
+    the CPU time of all the commands, and the memory limit is for the whole container. They are bounded by the limits
+    of the current container, as with `run_student`. Each command can also have its own limits.
+
+    :param container: container to use. Must be present in the current agent. By default it is None, meaning the
+                      current container type will be used.
+    :param time_limit: time limit of the session in seconds. By default it is 0, which means that it will be the same
+                       as the current container (NB: it does not count in the "host" container timeout!)
+    :param hard_time_limit: hard time limit of the session. By default it is 0, which means that it will be the same as
+                       the current container (NB: it *does* count in the "host" container *hard* timeout!)
+    :param memory_limit: memory limit in megabytes. By default it is 0, which means that it will be the same as the
+                       current container (NB: it does not count in the "host" container memory limit!)
+    :param share_network: share the network with the host container if True. Default is False.
+    :param working_dir: The default working directory of the commands. By default, it is os.getcwd().
+    :remark When the current container or the student container does not run on a shared kernel (Kata), the commands
+            cannot be sent directly to a student container: each one is then run in its own container with
+            `run_student`.
+    :return: a StudentSession
+    """
+    return StudentSession(container, time_limit, hard_time_limit, memory_limit, share_network, working_dir)
+
+
+class StudentSession(object):
+    """ A student container running several commands. See open_student_session. """
+
+    def __init__(self, container=None, time_limit=0, hard_time_limit=0, memory_limit=0, share_network=False,
+                 working_dir=None):
+        self._container = container
+        self._time_limit = time_limit
+        self._hard_time_limit = hard_time_limit
+        self._memory_limit = memory_limit
+        self._share_network = share_network
+        self._working_dir = working_dir if working_dir is not None else os.getcwd()
+        self._connection = None
+        self._zmq_socket = None
+        self._socket_path, self._path = None, None
+        self._retval = None  # return value of the student container, once it has stopped
+        self.container_id = None
+
+        # usage of the last command: its CPU time and real time in seconds, and its peak memory usage in megabytes
+        # (CPU time and memory are None when the command was run with run_student)
+        self.last_usage = None
+
+        self._shared_kernel = os.path.exists("/.__input/__shared_kernel")
+        if self._shared_kernel:
+            try:
+                self._start()
+            except:
+                self._retval = 254  # as run_student, when an error occurred while starting the container
+                unlink_unneeded_files(self._socket_path, self._path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _start(self):
+        """ Start the student container, and wait for it to be ready to receive commands """
+        server, socket_id, self._socket_path, self._path = create_student_socket(True)
+        try:
+            self._zmq_socket, self.container_id = start_student_container(
+                self._container, self._time_limit, self._hard_time_limit, self._memory_limit, self._share_network,
+                socket_id, False, False, session=True)
+            self._connection, _ = server.accept()
+        finally:
+            server.close()
+
+        # _run_student_intern should say hello
+        assert self._connection.recv(1) == b'H'
+
+        # The agent sends the return value of the student container when it stops: when the session is closed, or
+        # before if it is killed (timeout, out-of-memory)
+        self._zmq_socket.send(msgpack.dumps({"type": "dummy_message"}, use_bin_type=True))
+
+    def _wait_for_container(self):
+        """ Wait for the student container to stop, and return its return value """
+        if self._retval is None:
+            message = msgpack.loads(self._zmq_socket.recv(), use_list=False, strict_map_key=False)
+            self._retval = message["retval"]
+            self._connection.close()
+            unlink_unneeded_files(self._socket_path, self._path)
+        return self._retval
+
+    def run(self, cmd, stdin=None, stdout=None, stderr=None, working_dir=None, time_limit=0, hard_time_limit=0,
+            memory_limit=0, reset=False):
+        """
+        Run a command in the student container of the session, and wait for it.
+
+        :param cmd: command to be ran (as a string, with parameters)
+        :param stdin: File descriptor for stdin. Can be None, in which case a file descriptor is open to /dev/null.
+        :param stdout: File descriptor for stdout. Can be None, in which case a file descriptor is open to /dev/null.
+        :param stderr: File descriptor for stderr. Can be None, in which case a file descriptor is open to /dev/null.
+        :param working_dir: The working directory of the command. By default, the one of the session.
+        :param time_limit: time limit of the command, in CPU seconds. By default it is 0, meaning that only the time
+                           limit of the session applies.
+        :param hard_time_limit: hard time limit of the command. By default it is 0, meaning three times time_limit.
+        :param memory_limit: memory limit of the command, in megabytes. By default it is 0, meaning that only the
+                             memory limit of the session applies.
+        :param reset: If set to True, the processes left by the previous commands are killed, and the files they
+                      created outside of the task directory are removed, before running the command.
+        :return: the return value of the command, with the special values of `run_student`. Once the student container
+                 has been killed (because the session exceeded its limits), the return value of the container is
+                 returned for all the following commands.
+        """
+        devnull = os.open(os.devnull, os.O_RDWR)
+        try:
+            fds = [devnull if fd is None else fd for fd in (stdin, stdout, stderr)]
+            working_dir = working_dir if working_dir is not None else self._working_dir
+
+            if not self._shared_kernel:
+                start = time.monotonic()
+                retval = run_student(cmd, self._container, time_limit or self._time_limit,
+                                     hard_time_limit or self._hard_time_limit, memory_limit or self._memory_limit,
+                                     self._share_network, working_dir, *fds)
+                self.last_usage = {"cpu_time": None, "wall_time": time.monotonic() - start, "memory": None}
+                return retval
+
+            self.last_usage = None
+            if self._retval is not None:
+                return self._retval
+
+            message = None
+            try:
+                self._connection.sendmsg([b'S'], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array("i", fds))])
+                self._connection.send(msgpack.dumps(
+                    {"type": "run_student_command", "student_container_id": self.container_id, "command": cmd,
+                     "teardown_script": "", "working_dir": working_dir, "ssh": False, "user": "worker",
+                     "session": True, "time_limit": time_limit, "hard_time_limit": hard_time_limit,
+                     "memory_limit": memory_limit, "reset": reset}))
+                message = receive_session_message(self._connection)
+            except OSError:
+                pass
+            if message is None:  # the student container was killed
+                return self._wait_for_container()
+
+            self.last_usage = {key: message[key] for key in ["cpu_time", "wall_time", "memory"]}
+            return message["retval"]
+        finally:
+            os.close(devnull)
+
+    def run_simple(self, cmd, cmd_input=None, stdout_err_fuse=False, text="utf-8", **kwargs):
+        """
+        A simpler version of `run`, which takes an input string and return the output of the command, as
+        `run_student_simple`. The other arguments are given to `run`.
+
+        :return: The output of the command, as a tuple of objects (stdout, stderr, retval). If stdout_err_fuse is True,
+                 the output is in the form (stdout, retval) is returned.
+        """
+        return _run_simple(lambda stdin, stdout, stderr: self.run(cmd, stdin, stdout, stderr, **kwargs),
+                           cmd_input, stdout_err_fuse, text)
+
+    def close(self):
+        """ Stop the student container of the session.
+        :return: the return value of the student container (None if the commands were run with run_student) """
+        if not self._shared_kernel:
+            return None
+        if self._retval is None:
+            try:
+                self._connection.send(b'C')
+            except OSError:
+                pass  # already stopped
+        return self._wait_for_container()
+
+
+# HELPER FUNCTIONS
+
+def _run_simple(run, cmd_input, stdout_err_fuse, text):
+    """ Give cmd_input to run (a function taking the stdin, stdout and stderr fds), and return its output """
     stdin = None
     if cmd_input is not None:
         r, w = os.pipe()
@@ -126,8 +310,9 @@ def run_student_simple(cmd, cmd_input=None, container=None,
     else:
         stderr_r, stderr_w = os.pipe()
 
-    retval = run_student(cmd, container, time_limit, hard_time_limit, memory_limit,
-                         share_network, working_dir, stdin, stdout_w, stderr_w)
+    retval = run(stdin, stdout_w, stderr_w)
+    if stdin is not None:
+        os.close(stdin)
 
     preprocess_out = (lambda x: x.decode(text)) if text is not False else (lambda x: x)
 
@@ -141,9 +326,6 @@ def run_student_simple(cmd, cmd_input=None, container=None,
         return stdout, retval
 
 
-
-# HELPER FUNCTIONS
-
 def _hack_signals(receive_signal):
     """ Catch every signal, and send it to the remote process """
     uncatchable = ['SIG_DFL', 'SIGSTOP', 'SIGKILL']
@@ -187,15 +369,17 @@ def create_student_socket(both_dockers):
         return None, socket_id, socket_path, path
 
 
-def start_student_container(container, time_limit, hard_time_limit, memory_limit, share_network, socket_id, ssh, run_as_root):
-    """ Ask the docker agent to create the student container """
+def start_student_container(container, time_limit, hard_time_limit, memory_limit, share_network, socket_id, ssh, run_as_root,
+                            session=False):
+    """ Ask the docker agent to create the student container (for a student session if session is True) """
     context = zmq.Context()
     zmq_socket = context.socket(zmq.REQ)
     zmq_socket.connect("ipc:///sockets/main.sock")
     zmq_socket.send(msgpack.dumps({"type": "run_student", "environment": container,
                                    "time_limit": time_limit, "hard_time_limit": hard_time_limit,
                                    "memory_limit": memory_limit, "share_network": share_network,
-                                   "socket_id": socket_id, "ssh": ssh, "run_as_root": run_as_root},
+                                   "socket_id": socket_id, "ssh": ssh, "run_as_root": run_as_root,
+                                   "session": session},
                                   use_bin_type=True))
     # Check if the container was correctly started
     message = msgpack.loads(zmq_socket.recv(), use_list=False, strict_map_key=False)
@@ -6,9 +6,13 @@ import os
 import tempfile
 import subprocess
 import resource
+import shutil
+import signal
 import stat
+import threading
 import time
 import logging
+import math
 import array
 import socket
 import shlex
@@ -215,15 +219,7 @@ def receive_initial_command(both_dockers, container_stdin, event_loop):
         print("Received fds")
         # Unpack the start message
         print("Unpacking start cmd")
-        unpacker = msgpack.Unpacker()
-        start_cmd = None
-        while start_cmd is None:
-            data = my_socket.recv(1)
-            unpacker.feed(data)
-            for msg in unpacker:
-                if msg["type"] == "run_student_command":
-                    return my_socket, fds, msg
-                raise Exception("Received wrong initial message")
+        return my_socket, fds, receive_command(my_socket)
     else:  # Grading or student container is on Kata
         msg = event_loop.run_until_complete(receive_message(container_stdin))
         if msg["type"] != "run_student_init":
@@ -231,6 +227,145 @@ def receive_initial_command(both_dockers, container_stdin, event_loop):
         return None, None, msg
 
 
+def receive_command(my_socket):
+    """ Unpack a run_student_command message sent by run_student on the socket, byte per byte (the fds of the next
+    command must not be read with it). Used only if both grading and student containers are using docker runtime"""
+    unpacker = msgpack.Unpacker()
+    while True:
+        data = my_socket.recv(1)
+        if not data:
+            raise Exception("Socket closed while receiving a command")
+        unpacker.feed(data)
+        for msg in unpacker:
+            if msg["type"] == "run_student_command":
+                return msg
+            raise Exception("Received wrong initial message")
+
+
+def receive_session_command(my_socket):
+    """ Receive the fds and the next command of a student session, or (None, None) when run_student closes the session.
+    Used only if both grading and student containers are using docker runtime """
+    msg, fds = recv_fds(my_socket, 1, 3)
+    if msg != b'S':  # b'C' (or nothing if the grading container stopped): end of the session
+        return None, None
+    return fds, receive_command(my_socket)
+
+
+def send_session_message(my_socket, msg):
+    """ Send a message (prefixed by its size) to run_student on the socket of a student session """
+    message = msgpack.dumps(msg, use_bin_type=True)
+    my_socket.sendall(struct.pack('!I', len(message)) + message)
+
+
+def receive_session_message(my_socket):
+    """ Receive a message sent with send_session_message, or None if the socket was closed """
+    buf = bytearray()
+    while len(buf) < 4:
+        data = my_socket.recv(4 - len(buf))
+        if not data:
+            return None
+        buf += data
+    length = struct.unpack('!I', bytes(buf))[0]
+    buf = bytearray()
+    while len(buf) < length:
+        data = my_socket.recv(length - len(buf))
+        if not data:
+            return None
+        buf += data
+    return msgpack.unpackb(bytes(buf), raw=False)
+
+
+def run_session_command(command, fds, set_limits):
+    """ Run a command of a student session and wait for it (with its own limits, if any).
+    :return: a dict with its return value (with the special values of run_student), its CPU time and real time in
+             seconds and its peak memory usage in megabytes """
+    time_limit = command["time_limit"]
+    hard_time_limit = command["hard_time_limit"] or 3 * time_limit
+
+    def preexec():
+        set_limits()
+        if time_limit:
+            resource.setrlimit(resource.RLIMIT_CPU, (math.ceil(time_limit), math.ceil(time_limit) + 1))
+
+    start = time.monotonic()
+    p = subprocess.Popen(shlex.split(command["command"]), preexec_fn=preexec, stdin=fds[0], stdout=fds[1],
+                         stderr=fds[2], cwd=command["working_dir"], start_new_session=True)
+    timed_out = []
+    timer = None
+    if hard_time_limit:
+        def kill():
+            timed_out.append(True)
+            try:
+                os.killpg(p.pid, signal.SIGKILL)
+            except OSError:
+                pass
+        timer = threading.Timer(hard_time_limit, kill)
+        timer.start()
+
+    # wait4 gives the resources used by this command only (and by the children it waited for)
+    _, status, usage = os.wait4(p.pid, 0)
+    if timer is not None:
+        timer.cancel()
+    if os.WIFSIGNALED(status):
+        retval = -os.WTERMSIG(status) & 0xFF  # as the exit code of a student container started by run_student
+    else:
+        retval = os.WEXITSTATUS(status)
+    p.returncode = retval
+
+    cpu_time = usage.ru_utime + usage.ru_stime
+    memory = usage.ru_maxrss / 1024  # in kilobytes on Linux
+    if timed_out or (time_limit and cpu_time >= time_limit):
+        retval = 253
+    elif command["memory_limit"] and memory > command["memory_limit"]:
+        retval = 252
+    return {"retval": retval, "cpu_time": cpu_time, "wall_time": time.monotonic() - start, "memory": memory}
+
+
+def reset_student_environment(uid=4242, directories=("/tmp", "/var/tmp", "/dev/shm")):
+    """ Kill the processes left by the previous commands of a student session, and remove the files they created in
+    the temporary directories of the student container. The task directory is shared with the grading container, and
+    is not reset. """
+    for pid in os.listdir("/proc"):
+        try:
+            if pid.isdigit() and os.stat(os.path.join("/proc", pid)).st_uid == uid:
+                os.kill(int(pid), signal.SIGKILL)
+        except OSError:
+            pass  # already stopped
+    for directory in directories:
+        try:
+            entries = os.listdir(directory)
+        except OSError:
+            continue
+        for entry in entries:
+            path = os.path.join(directory, entry)
+            try:
+                if os.lstat(path).st_uid != uid:
+                    continue
+                if os.path.isdir(path) and not os.path.islink(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    os.unlink(path)
+            except OSError:
+                pass
+
+
+def serve_student_session(my_socket, fds, command, set_limits):
+    """ Run the commands of a student session (see open_student_session) until run_student closes it. Each command
+    comes with its own fds, and its return value and resources used are sent back on the socket.
+    Used only if both grading and student containers are using docker runtime """
+    while command is not None:
+        if command["reset"]:
+            reset_student_environment()
+        try:
+            result = run_session_command(command, fds, set_limits)
+        except Exception:
+            result = {"retval": 254, "cpu_time": 0.0, "wall_time": 0.0, "memory": 0.0}
+        for fd in fds:  # otherwise the pipes given by run_student would never be closed
+            os.close(fd)
+        send_session_message(my_socket, dict(result, type="run_student_command_retval"))
+        fds, command = receive_session_command(my_socket)
+
+
 async def handle_stdin(reader: asyncio.StreamReader, proc_input, proc):
     """ Deamon to handle messages from the agent.
     Used only when both containers are not on a shared kernel"""
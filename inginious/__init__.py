@@ -16,7 +16,7 @@ except PackageNotFoundError:
     __version__ = "0.9.dev0"
 
 MARKETPLACE_URL = "https://marketplace.inginious.org/marketplace.json"
-DB_VERSION = 15
+DB_VERSION = 18
 
 builtins.__dict__['_'] = gettext.gettext
 
@@ -132,8 +132,9 @@ class Agent(object, metaclass=ABCMeta):
     async def __run_listen(self):
         """ Listen to the backend """
         while True:
-            message = await ZMQUtils.recv(self.__backend_socket)
-            await self.__handle_backend_message(message)
+            messages = await ZMQUtils.recv_many(self.__backend_socket)
+            for message in messages:
+                await self.__handle_backend_message(message)
 
     async def __handle_backend_message(self, message):
         """ Dispatch messages received from clients to the right handlers """
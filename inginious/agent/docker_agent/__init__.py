@@ -11,16 +11,20 @@ import resource
 import shutil
 import struct
 import tempfile
-from dataclasses import dataclass
+import time
+from dataclasses import dataclass, field
 from os.path import join as path_join
-from typing import Dict, Any, Union, List, Set
+from typing import Dict, Any, Union, List, Optional, Set
 import msgpack
 import psutil
+from inginious.agent.docker_agent._container_stream import ContainerStreamDecoder
 from inginious.agent.docker_agent._docker_interface import DockerInterface
 
 from inginious.agent import Agent, CannotCreateJobException
 from inginious.agent.docker_agent._docker_runtime import DockerRuntime
+from inginious.agent.docker_agent._task_cache import TaskCache, mount_overlay, unmount, unmount_all
 from inginious.agent.docker_agent._timeout_watcher import TimeoutWatcher
+from inginious.agent.docker_agent._warm_pool import WarmContainer, WarmContainerPool
 from inginious.common.asyncio_utils import AsyncIteratorWrapper, AsyncProxy
 from inginious.common.base import id_checker, id_checker_tests
 from inginious.common.filesystems import FileSystemProvider
@@ -50,6 +54,8 @@ class DockerRunningJob:
     assigned_external_ports: List[int]
     student_containers: Set[str]  # container ids of student containers
     enable_network: bool
+    task_mount: Optional[str] = None  # path of the overlay mounted on the task directory, if any
+    task_cache_paths: List[str] = field(default_factory=list)  # paths acquired from the task cache
 
 
 @dataclass
@@ -61,11 +67,25 @@ class DockerRunningStudentContainer:
     ssh: bool
     ports: Dict[int, int]  # internal port -> external port mapping
     assigned_external_ports: List[int]
+    session: bool = False  # True if the container runs the commands of a student session
+
+
+def get_student_container_limits(parent_info: DockerRunningJob, msg):
+    """
+    Returns the limits (memory, time, hard time) of a student container asked by a run_student message: the limits of
+    the grading container when none is given, and never more than them. As the timeouts are watched for the whole
+    student container, the limits of a student session apply to all the commands it runs.
+    """
+    memory_limit = min(msg["memory_limit"] or parent_info.mem_limit, parent_info.mem_limit)
+    time_limit = min(msg["time_limit"] or parent_info.time_limit, parent_info.time_limit)
+    hard_time_limit = min(msg["hard_time_limit"] or parent_info.hard_time_limit, parent_info.hard_time_limit)
+    return memory_limit, time_limit, hard_time_limit
 
 
 class DockerAgent(Agent):
     def __init__(self, context, backend_addr, friendly_name, concurrency, tasks_fs: FileSystemProvider,
-                 address_host=None, external_ports=None, tmp_dir="./agent_tmp", runtimes=None, ssh_allowed=False):
+                 address_host=None, external_ports=None, tmp_dir="./agent_tmp", runtimes=None, ssh_allowed=False,
+                 max_result_size=64 * 1024 * 1024, warm_pool_size=0, task_cache_size=100):
         """
         :param context: ZeroMQ context for this process
         :param backend_addr: address of the backend (for example, "tcp://127.0.0.1:2222")
@@ -78,6 +98,11 @@ class DockerAgent(Agent):
         :param type: type of the container ("docker" or "kata")
         :param runtime: runtime used by docker (the defaults are "runc" with docker or "kata-runtime" with kata)
         :param ssh_allowed: boolean to make this agent accept tasks with ssh or not
+        :param max_result_size: maximum size, in bytes, of a message sent by a container, such as the result of a job
+                                with its archive. Larger messages are discarded.
+        :param warm_pool_size: number of grading containers created in advance for each environment (0 to disable)
+        :param task_cache_size: number of versions of task directories kept in the task cache of the agent (0 to
+                                disable the cache, and copy the task files for each job)
         """
         super(DockerAgent, self).__init__(context, backend_addr, friendly_name, concurrency, tasks_fs)
 
@@ -103,6 +128,12 @@ class DockerAgent(Agent):
         # Does this agent allow ssh_student ?
         self._ssh_allowed = ssh_allowed
 
+        self._max_result_size = max_result_size
+
+        self._warm_pool_size = warm_pool_size
+
+        self._task_cache_size = task_cache_size
+
     async def _init_clean(self):
         """ Must be called when the agent is starting """
         # Data about running containers
@@ -113,7 +144,10 @@ class DockerAgent(Agent):
 
         self._containers_killed = dict()
 
+        self._warm_pool = WarmContainerPool(self._warm_pool_size)
+
         # Delete tmp_dir, and recreate-it again
+        unmount_all(self._tmp_dir)
         try:
             await self._ashutil.rmtree(self._tmp_dir)
         except OSError:
@@ -124,6 +158,11 @@ class DockerAgent(Agent):
         except OSError:
             pass
 
+        # Task files shared by the jobs
+        self._task_cache = TaskCache(path_join(self._tmp_dir, "task_cache"), self._task_cache_size) \
+            if self._task_cache_size > 0 else None
+        self._use_overlay = True  # disabled on the first failure to mount an overlay
+
         # Docker
         self._docker = AsyncProxy(DockerInterface())
 
@@ -157,6 +196,9 @@ class DockerAgent(Agent):
         """ Must be called when the agent is closing """
         await self._timeout_watcher.clean()
 
+        for warm_container in self._warm_pool.close():
+            await self._remove_warm_container(warm_container)
+
         async def close_and_delete(container_id):
             try:
                 await self._docker.remove_container(container_id)
@@ -168,6 +210,8 @@ class DockerAgent(Agent):
         for container_id in self._student_containers_running:
             await close_and_delete(container_id)
 
+        unmount_all(self._tmp_dir)
+
     @property
     def environments(self):
         return self._containers
@@ -246,6 +290,11 @@ class DockerAgent(Agent):
                             self._create_safe_task(self.handle_job_closing(container_id, retval))
                         elif container_id in self._student_containers_running:
                             self._create_safe_task(self.handle_student_job_closing(container_id, retval))
+                        else:
+                            warm_container = self._warm_pool.discard(container_id)
+                            if warm_container is not None:
+                                self._logger.warning("Warm container %s died before being used", container_id)
+                                self._create_safe_task(self._remove_warm_container(warm_container))
                     elif i["Type"] == "container" and i["status"] == "oom":
                         container_id = i["id"]
                         if container_id in self._containers_running or container_id in self._student_containers_running:
@@ -332,64 +381,86 @@ class DockerAgent(Agent):
                 raise CannotCreateJobException('No ports are available right now. Please retry later.')
             ports[p] = self._external_ports.pop()
 
-        # Create directories for storing all the data for the job
-        try:
-            container_path = tempfile.mkdtemp(dir=self._tmp_dir)
-        except Exception as e:
-            self._logger.error("Cannot make container temp directory! %s", str(e), exc_info=True)
-            for p in ports:
-                self._external_ports.add(ports[p])
-            raise CannotCreateJobException('Cannot make container temp directory.')
+        # Take a container from the warm pool if possible
+        pool_key = self.__warm_pool_key(environment_type, environment_name, enable_network, ports)
+        warm_container = self._warm_pool.claim(pool_key) if pool_key is not None else None
 
-        task_path = path_join(container_path, 'task')  # tmp_dir/id/task/
-        taskset_path = path_join(container_path, 'course')
+        # Create directories for storing all the data for the job
+        if warm_container is not None:
+            container_path = warm_container.container_path
+        else:
+            try:
+                container_path = self.__create_container_path()
+            except Exception as e:
+                self._logger.error("Cannot make container temp directory! %s", str(e), exc_info=True)
+                for p in ports:
+                    self._external_ports.add(ports[p])
+                raise CannotCreateJobException('Cannot make container temp directory.')
 
-        sockets_path = path_join(container_path, 'sockets')  # tmp_dir/id/socket/
+        task_path, sockets_path, taskset_common_path, taskset_common_student_path = self.__get_mounted_paths(container_path)
         student_path = path_join(task_path, 'student')  # tmp_dir/id/task/student/
         systemfiles_path = path_join(task_path, 'systemfiles')  # tmp_dir/id/task/systemfiles/
 
-        taskset_common_path = path_join(taskset_path, 'common')
-        taskset_common_student_path = path_join(taskset_path, 'common', 'student')
-
-        # Create the needed directories
-        os.mkdir(sockets_path)
-        os.chmod(container_path, 0o777)
-        os.chmod(sockets_path, 0o777)
-        os.mkdir(taskset_path)
-
-        # TODO: avoid copy
-        task_fs.copy_from(None, task_path)
-        os.chmod(task_path, 0o777)
-
-        if not os.path.exists(student_path):
-            os.mkdir(student_path)
-            os.chmod(student_path, 0o777)
-
-        # Copy common and common/student if needed
-        # TODO: avoid copy
-        if taskset_fs.from_subfolder("$common").exists():
-            taskset_fs.from_subfolder("$common").copy_from(None, taskset_common_path)
-        else:
-            os.mkdir(taskset_common_path)
+        # The mounts of a warm container are already made: the files are copied in its directories. Otherwise, the
+        # task directory is an overlay on top of the cached task files, and common directories are mounted from the
+        # cache directly, as they are read-only.
+        use_task_cache = self._task_cache is not None and warm_container is None
+        task_mount = None
+        task_cache_paths = []  # paths acquired from the task cache
+        try:
+            if use_task_cache and self._use_overlay:
+                task_mount = self.__mount_task_from_cache(task_fs, container_path, task_cache_paths)
+            if task_mount is None:
+                task_fs.copy_from(None, task_path)
+
+            if not os.path.exists(student_path):
+                os.mkdir(student_path)
+                os.chmod(student_path, 0o777)
+
+            # Provide common and common/student if needed
+            common_fs = taskset_fs.from_subfolder("$common")
+            cached_common_path = self.__acquire_from_task_cache(common_fs, task_cache_paths) \
+                if use_task_cache and common_fs.exists() else None
+            if cached_common_path is not None:
+                taskset_common_path = cached_common_path
+                if common_fs.from_subfolder("student").exists():
+                    taskset_common_student_path = path_join(cached_common_path, 'student')
+            else:
+                if common_fs.exists():
+                    common_fs.copy_from(None, taskset_common_path)
+                if common_fs.from_subfolder("student").exists():
+                    common_fs.from_subfolder("student").copy_from(None, taskset_common_student_path)
+        except:
+            if warm_container is not None:
+                self._create_safe_task_threadsafe(self._remove_warm_container(warm_container))
+            self.__release_task_files(task_mount, task_cache_paths)
+            raise
 
-        if taskset_fs.from_subfolder("$common").from_subfolder("student").exists():
-            taskset_fs.from_subfolder("$common").from_subfolder("student").copy_from(None, taskset_common_student_path)
-        else:
-            os.mkdir(taskset_common_student_path)
+        if warm_container is not None and warm_container.mem_limit != mem_limit:
+            try:
+                self._docker.sync.update_container_memory(warm_container.container_id, mem_limit)
+            except Exception as e:
+                self._logger.warning("Cannot update the memory limit of a warm container! %s", str(e), exc_info=True)
+                self._create_safe_task_threadsafe(self._remove_warm_container(warm_container, remove_path=False))
+                warm_container = None
 
         # Run the container
-        try:
-            container_id = self._docker.sync.create_container(environment, enable_network, mem_limit, task_path,
-                                                              sockets_path, taskset_common_path,
-                                                              taskset_common_student_path,
-                                                              self.__get_fd_limit(), runtime,
-                                                              ports)
-        except Exception as e:
-            self._logger.warning("Cannot create container! %s", str(e), exc_info=True)
-            shutil.rmtree(container_path)
-            for p in ports:
-                self._external_ports.add(ports[p])
-            raise CannotCreateJobException('Cannot create container.')
+        if warm_container is not None:
+            container_id = warm_container.container_id
+        else:
+            try:
+                container_id = self._docker.sync.create_container(environment, enable_network, mem_limit, task_path,
+                                                                  sockets_path, taskset_common_path,
+                                                                  taskset_common_student_path,
+                                                                  self.__get_fd_limit(), runtime,
+                                                                  ports)
+            except Exception as e:
+                self._logger.warning("Cannot create container! %s", str(e), exc_info=True)
+                self.__release_task_files(task_mount, task_cache_paths)
+                shutil.rmtree(container_path)
+                for p in ports:
+                    self._external_ports.add(ports[p])
+                raise CannotCreateJobException('Cannot create container.')
 
         # Store info
         info = DockerRunningJob(
@@ -413,17 +484,23 @@ class DockerAgent(Agent):
             run_cmd=run_cmd,
             assigned_external_ports=list(ports.values()),
             student_containers=set(),
-            enable_network=enable_network
+            enable_network=enable_network,
+            task_mount=task_mount,
+            task_cache_paths=task_cache_paths
         )
 
         self._containers_running[container_id] = info
         self._container_for_job[message.job_id] = container_id
 
+        if warm_container is not None:
+            return info  # already started
+
         try:
             # Start the container
             self._docker.sync.start_container(container_id)
         except Exception as e:
             self._logger.warning("Cannot start container! %s", str(e), exc_info=True)
+            self.__release_task_files(task_mount, task_cache_paths)
             shutil.rmtree(container_path)
             for p in ports:
                 self._external_ports.add(ports[p])
@@ -432,6 +509,146 @@ class DockerAgent(Agent):
 
         return info
 
+    def __acquire_from_task_cache(self, fs, task_cache_paths):
+        """ Returns the path of a cached copy of fs, added to task_cache_paths, or None if it cannot be cached """
+        try:
+            path = self._task_cache.acquire(fs)
+        except Exception as e:
+            self._logger.warning("Cannot put %s in the task cache! %s", fs.prefix, str(e), exc_info=True)
+            return None
+        task_cache_paths.append(path)
+        return path
+
+    def __mount_task_from_cache(self, task_fs, container_path, task_cache_paths):
+        """
+        Mounts an overlay of the cached task files on the task directory of a container path.
+        :return: the path of the mount, or None if the overlay cannot be mounted
+        """
+        lower_path = self.__acquire_from_task_cache(task_fs, task_cache_paths)
+        if lower_path is None:
+            return None
+
+        task_path = self.__get_mounted_paths(container_path)[0]
+        upper_path = path_join(container_path, 'overlay', 'upper')
+        work_path = path_join(container_path, 'overlay', 'work')
+        try:
+            os.makedirs(upper_path)
+            os.mkdir(work_path)
+            metacopy = mount_overlay(lower_path, upper_path, work_path, task_path)
+        except OSError as e:
+            self._logger.info("Cannot mount the task files with an overlay (%s). They will be copied for each job.",
+                              str(e))
+            metacopy = None
+        if not metacopy:
+            if metacopy is False:
+                # The grading container changes the permissions of all the task files when it starts: without
+                # metacopy, the overlay then copies them all, which is slower than copying them beforehand
+                unmount(task_path)
+                self._logger.info("The kernel does not allow overlays with metacopy=on. The task files will be "
+                                  "copied for each job.")
+            self._use_overlay = False
+            task_cache_paths.remove(lower_path)
+            self._task_cache.release(lower_path)
+            return None
+
+        os.chmod(task_path, 0o777)
+        return task_path
+
+    def __release_task_files(self, task_mount, task_cache_paths):
+        """ Unmounts the task directory of a job, and releases the paths it acquired from the task cache """
+        if task_mount is not None:
+            try:
+                unmount(task_mount)
+            except OSError:
+                self._logger.warning("Cannot unmount %s", task_mount, exc_info=True)
+        for path in task_cache_paths:
+            self._task_cache.release(path)
+        task_cache_paths.clear()
+
+    def __create_container_path(self):
+        """ Creates a directory for a grading container, with the subdirectories mounted in the container """
+        container_path = tempfile.mkdtemp(dir=self._tmp_dir)
+        os.chmod(container_path, 0o777)
+        task_path, sockets_path, taskset_common_path, taskset_common_student_path = self.__get_mounted_paths(container_path)
+        os.mkdir(sockets_path)
+        os.chmod(sockets_path, 0o777)
+        os.mkdir(task_path)
+        os.chmod(task_path, 0o777)
+        os.makedirs(taskset_common_student_path)
+        return container_path
+
+    @staticmethod
+    def __get_mounted_paths(container_path):
+        """ Returns the paths of the task, sockets, common and common/student directories of a container path """
+        task_path = path_join(container_path, 'task')  # tmp_dir/id/task/
+        sockets_path = path_join(container_path, 'sockets')  # tmp_dir/id/socket/
+        taskset_common_path = path_join(container_path, 'course', 'common')
+        taskset_common_student_path = path_join(taskset_common_path, 'student')
+        return task_path, sockets_path, taskset_common_path, taskset_common_student_path
+
+    def __warm_pool_key(self, environment_type, environment_name, enable_network, ports):
+        """ Returns the key of the warm pool containers that can run a job, or None if the job cannot use the pool """
+        if self._warm_pool_size == 0 or len(ports) != 0:
+            return None
+        return environment_type, environment_name, enable_network
+
+    def __create_warm_container_sync(self, pool_key, mem_limit) -> WarmContainer:
+        """ Creates and starts a grading container that waits for its job """
+        start = time.time()
+        environment_type, environment_name, enable_network = pool_key
+        environment = self._containers[environment_type][environment_name]
+        container_path = self.__create_container_path()
+        try:
+            container_id = self._docker.sync.create_container(environment["id"], enable_network, mem_limit,
+                                                              *self.__get_mounted_paths(container_path),
+                                                              self.__get_fd_limit(), environment["runtime"])
+        except:
+            shutil.rmtree(container_path)
+            raise
+
+        warm_container = WarmContainer(container_id, container_path, mem_limit, 0.0)
+        try:
+            self._docker.sync.start_container(container_id)
+        except:
+            self._create_safe_task_threadsafe(self._remove_warm_container(warm_container))
+            raise
+        warm_container.creation_time = time.time() - start
+        return warm_container
+
+    async def _refill_warm_pool(self, pool_key, mem_limit):
+        """ Creates containers until the warm pool is full for the given key """
+        while self._warm_pool.reserve(pool_key):
+            try:
+                warm_container = await self._loop.run_in_executor(
+                    None, lambda: self.__create_warm_container_sync(pool_key, mem_limit))
+            except asyncio.CancelledError:
+                self._warm_pool.cancel(pool_key)
+                raise
+            except:
+                self._logger.exception("Cannot create a warm container for %s", str(pool_key))
+                self._warm_pool.cancel(pool_key)
+                return
+            if not self._warm_pool.add(pool_key, warm_container):
+                await self._remove_warm_container(warm_container)
+
+    async def _remove_warm_container(self, warm_container: WarmContainer, remove_path=True):
+        """ Removes a container of the warm pool, and its directory """
+        try:
+            await self._docker.remove_container(warm_container.container_id)
+        except asyncio.CancelledError:
+            raise
+        except:
+            pass
+        if remove_path:
+            try:
+                await self._ashutil.rmtree(warm_container.container_path)
+            except OSError:
+                self._logger.debug("Cannot remove old container path!")
+
+    def _create_safe_task_threadsafe(self, coroutine):
+        """ Same as _create_safe_task, but can be called from another thread than the one running the event loop """
+        self._loop.call_soon_threadsafe(self._create_safe_task, coroutine)
+
     async def new_job(self, message: BackendNewJob):
         """
         Handles a new job: starts the grading container
@@ -441,17 +658,27 @@ class DockerAgent(Agent):
         self._create_safe_task(self.handle_running_container(out, future_results=future_results))
         await self._timeout_watcher.register_container(out.container_id, out.time_limit, out.hard_time_limit)
 
+        pool_key = self.__warm_pool_key(out.environment_type, out.environment_name, out.enable_network, out.ports)
+        if pool_key is not None:
+            self._create_safe_task(self._refill_warm_pool(pool_key, out.mem_limit))
+            stats = self._warm_pool.get_stats()
+            if (stats["hits"] + stats["misses"]) % 100 == 0:
+                self._logger.info("Warm pool: %.1f%% hit rate, %.3fs saved per job", stats["hit_rate"] * 100,
+                                  stats["time_saved_per_job"])
+
     async def create_student_container(self, parent_info, socket_id, environment_name,
                                        memory_limit, time_limit, hard_time_limit, share_network, write_stream, ssh,
-                                       run_as_root):
+                                       run_as_root, session=False):
         """
         Creates a new student container.
         :param write_stream: stream on which to write the return value of the container (with a correctly formatted msgpack message)
+        :param session: True if the container runs the commands of a student session, until the grading container
+                        closes it. Its limits apply to the whole session.
         """
         try:
             environment_type = parent_info.environment_type
-            self._logger.debug("Starting new student container... %s/%s %s %s %s", environment_type, environment_name,
-                               memory_limit, time_limit, hard_time_limit)
+            self._logger.debug("Starting new student %s... %s/%s %s %s %s", "session" if session else "container",
+                               environment_type, environment_name, memory_limit, time_limit, hard_time_limit)
 
             if environment_type not in self._containers or environment_name not in self._containers[environment_type]:
                 self._logger.warning("Student container asked for an unknown environment %s/%s",
@@ -511,7 +738,8 @@ class DockerAgent(Agent):
                 write_stream=write_stream,
                 ssh=ssh,
                 ports=ports,
-                assigned_external_ports=list(ports.values())
+                assigned_external_ports=list(ports.values()),
+                session=session
             )
 
             parent_info.student_containers.add(container_id)
@@ -533,64 +761,30 @@ class DockerAgent(Agent):
 
                 return
 
-            # Verify the time limit
+            # Verify the time limit (of all the commands run by the container, for a student session)
             await self._timeout_watcher.register_container(container_id, time_limit, hard_time_limit)
         except asyncio.CancelledError:
             raise
         except:
             self._logger.exception("Exception in create_student_container")
 
-    async def read_stream(self, reader_stream, buffer):
-        """Helper to read a read and put data on a buffer"""
-        msg_header = await reader_stream.readexactly(8)
-        outtype, length = struct.unpack_from('>BxxxL',
-                                             msg_header)  # format imposed by docker in the attach endpoint
-        if length != 0:
-            content = await reader_stream.readexactly(length)
-            if outtype == 1:  # stdout
-                buffer += content
-
-            if outtype == 2:  # stderr
-                self._logger.debug("Received stderr from containers:\n%s", content)
-            # 4 first bytes are the length of the message. If we have a complete message...
-            return buffer
-        else:
-            raise Exception("Wrong format message received")
-
-    def read_buffer(self, buffer, decode=True):
-        """Helper to read a buffer containing data from a stream"""
-        length = struct.unpack('!I', buffer[0:4])[0]
-        msg = buffer[4:4 + length]  # ... get it
-        buffer = buffer[4 + length:]  # ... withdraw it from the buffer
-        if decode:
-            msg = msgpack.unpackb(msg, use_list=False)
-        return buffer, msg
-
-    def buffer_has_data(self, buffer):
-        """Helper to know if a buffer still has available data"""
-        return len(buffer) > 4 and len(buffer) >= 4 + struct.unpack('!I', buffer[0:4])[0]
-
     async def start_ssh(self, reader_stream, info):
         """ Wait for ssh information from student_container and send ssh info to frontend """
-        buffer = bytearray()
         try:
-            while not reader_stream.at_eof():  # CHECK HERE
-                buffer = await self.read_stream(reader_stream, buffer)
-                while self.buffer_has_data(buffer):
-                    buffer, msg = self.read_buffer(buffer)
-                    self._logger.debug("Received msg %s from container %s", msg["type"], info.container_id)
-                    if msg["type"] == "ssh_student":
-                        info_student = None
-                        if len(self._student_containers_running) > 0 and msg[
-                            "container_id"] in info.student_containers:
-                            info_student = self._student_containers_running[msg["container_id"]]
-                            await self.send_ssh_job_info(info.job_id, self._address_host, info_student.ports[22],
-                                                         msg["ssh_user"], msg["ssh_key"])
-                        else:
-                            self._logger.exception("Exception: no linked student_container running.")
-                            self._create_safe_task(self.handle_job_closing(info.container_id, -1,
-                                                                           manual_feedback="Trying to connect with ssh to a non-children student container !"))
-                        return
+            async for msg in ContainerStreamDecoder(reader_stream, self._logger).messages():
+                self._logger.debug("Received msg %s from container %s", msg["type"], info.container_id)
+                if msg["type"] == "ssh_student":
+                    info_student = None
+                    if len(self._student_containers_running) > 0 and msg[
+                        "container_id"] in info.student_containers:
+                        info_student = self._student_containers_running[msg["container_id"]]
+                        await self.send_ssh_job_info(info.job_id, self._address_host, info_student.ports[22],
+                                                     msg["ssh_user"], msg["ssh_key"])
+                    else:
+                        self._logger.exception("Exception: no linked student_container running.")
+                        self._create_safe_task(self.handle_job_closing(info.container_id, -1,
+                                                                       manual_feedback="Trying to connect with ssh to a non-children student container !"))
+                    return
         except asyncio.IncompleteReadError:
             self._logger.debug("Container output ended with an IncompleteReadError; It was probably killed.")
         except:
@@ -611,21 +805,16 @@ class DockerAgent(Agent):
 
     async def _handle_student_container_outputs(self, student_reader_stream, grading_write_stream):
         """ Receive outputs (stdout and stderr) from student_container and send them to grading_container without decoding """
-        buffer = bytearray()
         try:
-            while not student_reader_stream.at_eof():
-                buffer = await self.read_stream(student_reader_stream, buffer)
-                while self.buffer_has_data(buffer):
-                    buffer, msg_encoded = self.read_buffer(buffer, decode=False)
-                    try:
-                        grading_write_stream.write(
-                            struct.pack('!I', len(msg_encoded)))  # Transfer the message without decoding it
-                        grading_write_stream.write(msg_encoded)
-                        await grading_write_stream.drain()
-                    except Exception as e:
-                        self._logger.info("Student container closed the stream")
-                        self._logger.info(e)
-                        return
+            decoder = ContainerStreamDecoder(student_reader_stream, self._logger, self._max_result_size)
+            async for msg_encoded in decoder.messages(decode=False):
+                try:
+                    grading_write_stream.write(msg_encoded)  # Transfer the message (and its length) without decoding it
+                    await grading_write_stream.drain()
+                except Exception as e:
+                    self._logger.info("Student container closed the stream")
+                    self._logger.info(e)
+                    return
         except asyncio.IncompleteReadError:
             self._logger.debug("Container output ended with an IncompleteReadError; It was probably killed.")
             return
@@ -650,98 +839,99 @@ class DockerAgent(Agent):
             hello_msg["run_cmd"] = info.run_cmd
         hello_msg["run_as_root"] = self._runtimes[info.environment_type].run_as_root
         hello_msg["shared_kernel"] = self._runtimes[info.environment_type].shared_kernel
+        hello_msg["max_result_size"] = self._max_result_size
 
         await self._write_to_container_stdin(write_stream, hello_msg)
         result = None
+        decoder = ContainerStreamDecoder(reader_stream, self._logger, self._max_result_size)
 
-        buffer = bytearray()
         try:
             student_containers_streams = {}
-            while not reader_stream.at_eof():
-                buffer = await self.read_stream(reader_stream, buffer)
-                while self.buffer_has_data(buffer):
-                    buffer, msg = self.read_buffer(buffer)
-                    try:
-                        self._logger.debug("Received msg %s from container %s", msg["type"], info.container_id)
-                        if msg["type"] == "run_student":
-                            # start a new student container
-                            environment = msg["environment"] or info.environment_name
-                            memory_limit = min(msg["memory_limit"] or info.mem_limit, info.mem_limit)
-                            time_limit = min(msg["time_limit"] or info.time_limit, info.time_limit)
-                            hard_time_limit = min(msg["hard_time_limit"] or info.hard_time_limit, info.hard_time_limit)
-                            share_network = msg["share_network"]
-                            socket_id = msg["socket_id"]
-                            ssh = msg["ssh"]
-                            run_as_root = msg["run_as_root"]
-                            assert "/" not in socket_id  # ensure task creator do not try to break the agent :-(
-                            if ssh and not (info.enable_network and "ssh" in info.environment_type and self._ssh_allowed):
-                                self._logger.error(
-                                    "Exception: ssh for student requires to allow ssh and internet access in the task %s environment configuration tab",
-                                    info.job_id)
-                                self._create_safe_task(self.handle_job_closing(info.container_id, -1,
-                                                                               manual_feedback="ssh for student requires to allow ssh and internet access in the task environment configuration tab!"))
-                            else:
-                                self._create_safe_task(
-                                    self.create_student_container(info, socket_id, environment, memory_limit,
-                                                                  time_limit, hard_time_limit, share_network,
-                                                                  write_stream, ssh, run_as_root))
-
-                        elif msg["type"] == "run_student_init":  # We use non docker-docker communication !
-                            if msg["student_container_id"] not in student_containers_streams:
-                                student_containers_streams[
-                                    msg["student_container_id"]] = await self.open_student_stream(
-                                    msg["student_container_id"])
-                            await self._write_to_container_stdin(
-                                student_containers_streams[msg["student_container_id"]][1],
-                                {"type": "run_student_init",
-                                 "socket_id": msg["socket_id"],
-                                 "command": msg["command"],
-                                 "teardown_script": msg["teardown_script"],
-                                 "student_container_id": msg[
-                                     "student_container_id"],
-                                 "working_dir": msg["working_dir"],
-                                 "ssh": msg["ssh"],
-                                 "user": msg["user"]})
-
-                            if msg["ssh"]:
-                                await self.start_ssh(student_containers_streams[msg["student_container_id"]][0],
-                                                     info)  # If using ssh with kata: wait for ssh info and start ssh
-                            else:  # classical run_student (not ssh_student) with a kata runtime -> handle student_container outputs
-                                self._loop.create_task(self._handle_student_container_outputs(
-                                    student_containers_streams[msg["student_container_id"]][0], write_stream))
-
-                        elif msg["type"] in ["stdin", "student_signal"]:  # Simply transfer to student_container
-                            if msg["student_container_id"] not in student_containers_streams:
-                                student_containers_streams[
-                                    msg["student_container_id"]] = await self.open_student_stream(
-                                    msg["student_container_id"])
-                            await self._write_to_container_stdin(
-                                student_containers_streams[msg["student_container_id"]][1], msg)
-
-                        elif msg["type"] == "ssh_debug":
-                            # send the data to the frontend (and client) to reach grading_container
-                            self._logger.info("%s %s", info.container_id, str(msg))
-                            await self.send_ssh_job_info(info.job_id, self._address_host, info.ports[22],
-                                                         msg["ssh_user"], msg["ssh_key"])
-
-                        elif msg["type"] == "ssh_student":
-                            # send the data to the frontend (and client) to reach student_container
-                            info_student = None
-                            if len(self._student_containers_running) > 0 and msg[
-                                "container_id"] in info.student_containers:
-                                info_student = self._student_containers_running[msg["container_id"]]
-                            else:
-                                self._logger.exception("Exception: no linked student_container running.")
-                                self._create_safe_task(self.handle_job_closing(info.container_id, -1,
-                                                                               manual_feedback="Trying to connect with ssh to a non-children student container !"))
-                            self._logger.info("%s %s", info_student.container_id, str(msg))
-                            await self.send_ssh_job_info(info.job_id, self._address_host, info_student.ports[22],
-                                                         msg["ssh_user"], msg["ssh_key"])
-                        elif msg["type"] == "result":
-                            result = msg["result"]  # last message containing the results of the container
-                    except:
-                        self._logger.exception("Received incorrect message from container %s (job id %s)",
-                                               info.container_id, info.job_id)
+            async for msg in decoder.messages():
+                try:
+                    self._logger.debug("Received msg %s from container %s", msg["type"], info.container_id)
+                    if msg["type"] == "run_student":
+                        # start a new student container
+                        environment = msg["environment"] or info.environment_name
+                        memory_limit, time_limit, hard_time_limit = get_student_container_limits(info, msg)
+                        share_network = msg["share_network"]
+                        socket_id = msg["socket_id"]
+                        ssh = msg["ssh"]
+                        run_as_root = msg["run_as_root"]
+                        session = msg.get("session", False)  # not sent by the containers older than student sessions
+                        assert "/" not in socket_id  # ensure task creator do not try to break the agent :-(
+                        if session and (ssh or run_as_root):
+                            self._logger.error("Student session asked with ssh or as root in job %s", info.job_id)
+                            await self._write_to_container_stdin(write_stream, {"type": "run_student_retval",
+                                                                                "retval": 254, "socket_id": socket_id})
+                        elif ssh and not (info.enable_network and "ssh" in info.environment_type and self._ssh_allowed):
+                            self._logger.error(
+                                "Exception: ssh for student requires to allow ssh and internet access in the task %s environment configuration tab",
+                                info.job_id)
+                            self._create_safe_task(self.handle_job_closing(info.container_id, -1,
+                                                                           manual_feedback="ssh for student requires to allow ssh and internet access in the task environment configuration tab!"))
+                        else:
+                            self._create_safe_task(
+                                self.create_student_container(info, socket_id, environment, memory_limit,
+                                                              time_limit, hard_time_limit, share_network,
+                                                              write_stream, ssh, run_as_root, session))
+
+                    elif msg["type"] == "run_student_init":  # We use non docker-docker communication !
+                        if msg["student_container_id"] not in student_containers_streams:
+                            student_containers_streams[
+                                msg["student_container_id"]] = await self.open_student_stream(
+                                msg["student_container_id"])
+                        await self._write_to_container_stdin(
+                            student_containers_streams[msg["student_container_id"]][1],
+                            {"type": "run_student_init",
+                             "socket_id": msg["socket_id"],
+                             "command": msg["command"],
+                             "teardown_script": msg["teardown_script"],
+                             "student_container_id": msg[
+                                 "student_container_id"],
+                             "working_dir": msg["working_dir"],
+                             "ssh": msg["ssh"],
+                             "user": msg["user"]})
+
+                        if msg["ssh"]:
+                            await self.start_ssh(student_containers_streams[msg["student_container_id"]][0],
+                                                 info)  # If using ssh with kata: wait for ssh info and start ssh
+                        else:  # classical run_student (not ssh_student) with a kata runtime -> handle student_container outputs
+                            self._loop.create_task(self._handle_student_container_outputs(
+                                student_containers_streams[msg["student_container_id"]][0], write_stream))
+
+                    elif msg["type"] in ["stdin", "student_signal"]:  # Simply transfer to student_container
+                        if msg["student_container_id"] not in student_containers_streams:
+                            student_containers_streams[
+                                msg["student_container_id"]] = await self.open_student_stream(
+                                msg["student_container_id"])
+                        await self._write_to_container_stdin(
+                            student_containers_streams[msg["student_container_id"]][1], msg)
+
+                    elif msg["type"] == "ssh_debug":
+                        # send the data to the frontend (and client) to reach grading_container
+                        self._logger.info("%s %s", info.container_id, str(msg))
+                        await self.send_ssh_job_info(info.job_id, self._address_host, info.ports[22],
+                                                     msg["ssh_user"], msg["ssh_key"])
+
+                    elif msg["type"] == "ssh_student":
+                        # send the data to the frontend (and client) to reach student_container
+                        info_student = None
+                        if len(self._student_containers_running) > 0 and msg[
+                            "container_id"] in info.student_containers:
+                            info_student = self._student_containers_running[msg["container_id"]]
+                        else:
+                            self._logger.exception("Exception: no linked student_container running.")
+                            self._create_safe_task(self.handle_job_closing(info.container_id, -1,
+                                                                           manual_feedback="Trying to connect with ssh to a non-children student container !"))
+                        self._logger.info("%s %s", info_student.container_id, str(msg))
+                        await self.send_ssh_job_info(info.job_id, self._address_host, info_student.ports[22],
+                                                     msg["ssh_user"], msg["ssh_key"])
+                    elif msg["type"] == "result":
+                        result = msg["result"]  # last message containing the results of the container
+                except:
+                    self._logger.exception("Received incorrect message from container %s (job id %s)",
+                                           info.container_id, info.job_id)
         except asyncio.IncompleteReadError:
             self._logger.debug("Container output ended with an IncompleteReadError; It was probably killed.")
         except asyncio.CancelledError:
@@ -752,6 +942,11 @@ class DockerAgent(Agent):
         except:
             self._logger.exception("Exception while reading container %s output", info.container_id)
 
+        if not result and decoder.discarded_messages:
+            result = {"result": "crash", "problems": {},
+                      "text": "The grader output is too large ({} bytes, the maximum is {} bytes)".format(
+                          max(decoder.discarded_messages), self._max_result_size)}
+
         write_stream.close()
         sock.close_socket()
         future_results.set_result(result)
@@ -796,6 +991,9 @@ class DockerAgent(Agent):
                 retval = 253
             elif killed == "overflow":
                 retval = 252
+            if killed and info.session:
+                self._logger.info("Student session %s of job %s stopped before being closed (%s)", container_id,
+                                  info.parent_info.job_id, killed)
 
             try:
                 await self._write_to_container_stdin(info.write_stream, {"type": "run_student_retval", "retval": retval,
@@ -878,7 +1076,7 @@ class DockerAgent(Agent):
 
                     # Accepted types for return dict
                     accepted_types = {"stdout": str, "stderr": str, "result": str, "text": str, "grade": float,
-                                      "problems": dict, "custom": dict, "tests": dict, "state": str, "archive": str}
+                                      "problems": dict, "custom": dict, "tests": dict, "state": str, "archive": (bytes, str)}
 
                     keys_fct = {"problems": id_checker, "custom": id_checker, "tests": id_checker_tests}
 
@@ -902,7 +1100,7 @@ class DockerAgent(Agent):
                     tests = return_value.get("tests", {})
                     state = return_value.get("state", "")
                     archive = return_value.get("archive", None)
-                    if archive is not None:
+                    if isinstance(archive, str):  # containers built with older versions of the base image
                         archive = base64.b64decode(archive)
                 except Exception as e:
                     self._logger.exception("Cannot get back output of container %s! (%s)", container_id, str(e))
@@ -927,6 +1125,8 @@ class DockerAgent(Agent):
                 pass
 
             # Delete folders
+            await self._loop.run_in_executor(None, lambda: self.__release_task_files(info.task_mount,
+                                                                                     info.task_cache_paths))
             try:
                 await self._ashutil.rmtree(info.container_path)
             except PermissionError:
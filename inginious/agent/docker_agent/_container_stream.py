@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Decoding of the messages sent by the containers on their (attached) output stream """
+
+import struct
+
+import msgpack
+
+_docker_header = struct.Struct('>BxxxL')  # format imposed by docker in the attach endpoint
+_length_prefix = struct.Struct('!I')
+_chunk_size = 65536
+
+
+class ContainerStreamDecoder(object):
+    """
+        Decodes the messages sent by a container through the attach endpoint of Docker.
+
+        The stream is multiplexed by Docker: each frame starts with an 8-bytes header containing the stream type
+        (1 for stdout, 2 for stderr) and the length of the frame. The stdout stream contains msgpack messages, prefixed
+        by their length (4 bytes, big endian), that can span multiple frames.
+
+        The content of the frames is appended to a single buffer, in which messages are read at an increasing offset.
+        The consumed part of the buffer is only dropped when it represents most of the buffer, so that each byte is
+        copied a constant number of times, whatever the number and the size of the messages.
+
+        Messages larger than `max_message_size` are skipped while they are read, without being buffered entirely.
+        The stderr frames are read by chunks too, and only their first `max_message_size` bytes are logged.
+    """
+
+    def __init__(self, reader_stream, logger, max_message_size=None):
+        """
+        :param reader_stream: asyncio stream reader of the attach socket of the container
+        :param logger: logger on which stderr output of the container is written
+        :param max_message_size: maximum size of a message, in bytes. None for no limit.
+        """
+        self._reader_stream = reader_stream
+        self._logger = logger
+        self._max_message_size = max_message_size
+        self._buffer = bytearray()
+        self._offset = 0  # position of the first unread byte in the buffer
+        self._frame_type = 0
+        self._frame_remaining = 0  # number of bytes of the current frame still to be read from the stream
+        self._skip = 0  # number of bytes of a discarded message still to be read from the stream
+        self._stderr_read = 0  # number of bytes of the current stderr frame already read
+        self.discarded_messages = []  # sizes of the discarded messages
+
+    def at_eof(self):
+        return self._frame_remaining == 0 and self._reader_stream.at_eof()
+
+    async def read_frame(self):
+        """
+        Reads (a chunk of) a frame from the stream, and appends its content to the buffer if it comes from stdout.
+        Frames are read by chunks, so that a discarded message is never entirely in memory.
+        """
+        if self._frame_remaining == 0:
+            self._frame_type, self._frame_remaining = _docker_header.unpack(await self._reader_stream.readexactly(8))
+            if self._frame_remaining == 0:
+                raise Exception("Wrong format message received")
+            self._stderr_read = 0
+
+        content = await self._reader_stream.readexactly(min(self._frame_remaining, _chunk_size))
+        self._frame_remaining -= len(content)
+        if self._frame_type == 2:  # stderr
+            self._log_stderr(content)
+            return
+        if self._frame_type != 1:  # not stdout
+            return
+        if self._skip:
+            skipped = min(self._skip, len(content))
+            self._skip -= skipped
+            content = content[skipped:]
+        if content:
+            self._compact()
+            self._buffer += content
+
+    def complete_messages(self, decode=True):
+        """
+        Removes the complete messages from the buffer.
+
+        :param decode: if False, the messages are returned as bytes, with their length prefix, ready to be forwarded
+                       to another container
+        :return: the list of the complete messages in the buffer
+        """
+        messages = []
+        buffer = self._buffer
+        offset = self._offset
+        end = len(buffer)
+        max_message_size = self._max_message_size
+        with memoryview(buffer) as view:
+            while end - offset >= _length_prefix.size:
+                length, = _length_prefix.unpack_from(buffer, offset)
+                msg_end = offset + _length_prefix.size + length
+                if max_message_size is not None and length > max_message_size:
+                    self._logger.warning("Discarding a message of %i bytes sent by a container (maximum is %i bytes)",
+                                         length, max_message_size)
+                    self.discarded_messages.append(length)
+                    self._skip = max(msg_end - end, 0)
+                    offset = min(msg_end, end)
+                    continue
+                if msg_end > end:
+                    break
+                if decode:
+                    messages.append(msgpack.unpackb(view[offset + _length_prefix.size:msg_end], use_list=False))
+                else:
+                    messages.append(bytes(view[offset:msg_end]))
+                offset = msg_end
+        self._offset = offset
+        return messages
+
+    async def messages(self, decode=True):
+        """ Yields the messages sent by the container until the end of the stream. See complete_messages. """
+        while not self.at_eof():
+            await self.read_frame()
+            for msg in self.complete_messages(decode):
+                yield msg
+
+    def _log_stderr(self, content):
+        """ Logs a chunk of a stderr frame, up to max_message_size bytes per frame """
+        logged = len(content)
+        if self._max_message_size is not None:
+            logged = max(min(logged, self._max_message_size - self._stderr_read), 0)
+            if self._stderr_read + len(content) > self._max_message_size and self._frame_remaining == 0:
+                self._logger.debug("Discarded %i bytes of stderr from containers (maximum is %i bytes)",
+                                   self._stderr_read + len(content) - self._max_message_size, self._max_message_size)
+        if logged:
+            self._logger.debug("Received stderr from containers:\n%s", content[:logged])
+        self._stderr_read += len(content)
+
+    def _compact(self):
+        """ Drops the consumed part of the buffer, when it is larger than the unread one """
+        if self._offset and self._offset >= len(self._buffer) - self._offset:
+            del self._buffer[:self._offset]
+            self._offset = 0
@@ -7,12 +7,14 @@
     (not asyncio) Interface to Docker
 """
 import os
+import threading
 from datetime import datetime
 from typing import List, Tuple, Dict
 
 import docker
 import logging
 
+from docker.transport import UnixHTTPAdapter
 from docker.types import Ulimit
 
 from inginious.agent.docker_agent._docker_runtime import DockerRuntime
@@ -26,11 +28,55 @@ class DockerInterface(object):  # pragma: no cover
 
         We do not test coverage here, as it is a bit complicated to interact with docker in tests.
         Docker-py itself is already well tested.
+
+        A single Docker client, and thus a single pool of connections to the daemon, is shared by all the threads
+        using the interface. Calls about a given container use the low-level API directly, to avoid fetching the
+        container description first.
     """
+
+    def __init__(self, max_pool_size=10):
+        """
+        :param max_pool_size: maximum number of idle connections to the Docker daemon kept open
+        """
+        self._max_pool_size = max_pool_size
+        self._client = None
+        self._client_lock = threading.Lock()
+
     @property
     def _docker(self):
-        return docker.from_env()
-    
+        """ The Docker client. It is created on first use, as creating it may contact the daemon. """
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    client = docker.from_env(max_pool_size=self._max_pool_size)
+                    adapter = client.api.get_adapter("http+docker://localhost")
+                    if isinstance(adapter, UnixHTTPAdapter):
+                        shared_adapter = _SharedUnixHTTPAdapter("http+unix://" + adapter.socket_path, adapter.timeout,
+                                                                max_pool_size=adapter.max_pool_size)
+                        client.api.mount('http+docker://', shared_adapter)
+                        adapter.close()
+                        # proxies do not apply to a Unix socket: avoid looking for them in the environment at each call
+                        client.api.trust_env = False
+                    self._client = client
+        return self._client
+
+    def _create_container(self, image, command, mem_limit, network_mode, ports, volumes, runtime, fd_limit):
+        """ Creates a container with the low-level API, and returns its id """
+        host_config = self._docker.api.create_host_config(
+            mem_limit=str(mem_limit) + "M",
+            memswap_limit=str(mem_limit) + "M",
+            mem_swappiness=0,
+            oom_kill_disable=True,
+            network_mode=network_mode,
+            port_bindings=ports,
+            binds=volumes,
+            runtime=runtime,
+            ulimits=[Ulimit(name='nofile', soft=fd_limit[0], hard=fd_limit[1])]
+        )
+        return self._docker.api.create_container(image, command=command, stdin_open=True, ports=list(ports),
+                                                 volumes=[volume["bind"] for volume in volumes.values()],
+                                                 host_config=host_config)["Id"]
+
     def get_containers(self, runtimes: List[DockerRuntime]) -> Dict[str, Dict[str, Dict[str, str]]]:
         """
         :param runtimes: a list of DockerRuntime. Each DockerRuntime.envtype must appear only once.
@@ -132,15 +178,10 @@ class DockerInterface(object):  # pragma: no cover
         if ports is None:
             ports = {}
 
-        nofile_limit = Ulimit(name='nofile', soft=fd_limit[0], hard=fd_limit[1])
-
-        response = self._docker.containers.create(
+        return self._create_container(
             image,
-            stdin_open=True,
-            mem_limit=str(mem_limit) + "M",
-            memswap_limit=str(mem_limit) + "M",
-            mem_swappiness=0,
-            oom_kill_disable=True,
+            command=None,
+            mem_limit=mem_limit,
             network_mode=("bridge" if (network_grading or len(ports) > 0) else 'none'),
             ports=ports,
             volumes={
@@ -150,9 +191,8 @@ class DockerInterface(object):  # pragma: no cover
                 taskset_common_student_path: {'bind': '/course/common/student', 'mode': 'ro'}
             },
             runtime=runtime,
-            ulimits=[nofile_limit]
+            fd_limit=fd_limit
         )
-        return response.id
 
     def create_container_student(self, runtime: str, image: str, mem_limit, student_path,
                                  socket_path, systemfiles_path, taskset_common_student_path,
@@ -188,16 +228,10 @@ class DockerInterface(object):  # pragma: no cover
         else:
             net_mode = 'container:' + share_network_of_container
 
-        nofile_limit = Ulimit(name='nofile', soft=fd_limit[0], hard=fd_limit[1])
-
-        response = self._docker.containers.create(
+        return self._create_container(
             image,
-            stdin_open=True,
             command="_run_student_intern "+runtime + " " + parent_runtime,  # the script takes the runtimes as arguments
-            mem_limit=str(mem_limit) + "M",
-            memswap_limit=str(mem_limit) + "M",
-            mem_swappiness=0,
-            oom_kill_disable=True,
+            mem_limit=mem_limit,
             network_mode=net_mode,
             ports=ports,
             volumes={
@@ -208,19 +242,22 @@ class DockerInterface(object):  # pragma: no cover
                 taskset_common_student_path: {'bind': '/course/common/student', 'mode': 'ro'}
             },
             runtime=runtime,
-            ulimits=[nofile_limit]
+            fd_limit=fd_limit
         )
 
-        return response.id
+    def update_container_memory(self, container_id, mem_limit):
+        """ Changes the memory limit (in Mo) of a container """
+        self._docker.api.update_container(container_id, mem_limit=str(mem_limit) + "M",
+                                          memswap_limit=str(mem_limit) + "M")
 
     def start_container(self, container_id):
         """ Starts a container (obviously) """
-        self._docker.containers.get(container_id).start()
+        self._docker.api.start(container_id)
 
     def attach_to_container(self, container_id):
         """ A socket attached to the stdin/stdout of a container. The object returned contains a get_socket() function to get a socket.socket
         object and  close_socket() to close the connection """
-        sock = self._docker.containers.get(container_id).attach_socket(params={
+        sock = self._docker.api.attach_socket(container_id, params={
             'stdin': 1,
             'stdout': 1,
             'stderr': 0,
@@ -231,8 +268,8 @@ class DockerInterface(object):  # pragma: no cover
 
     def get_logs(self, container_id):
         """ Return the full stdout/stderr of a container"""
-        stdout = self._docker.containers.get(container_id).logs(stdout=True, stderr=False).decode('utf8')
-        stderr = self._docker.containers.get(container_id).logs(stdout=False, stderr=True).decode('utf8')
+        stdout = self._docker.api.logs(container_id, stdout=True, stderr=False).decode('utf8')
+        stderr = self._docker.api.logs(container_id, stdout=False, stderr=True).decode('utf8')
         return stdout, stderr
 
     def get_stats(self, container_id):
@@ -240,7 +277,7 @@ class DockerInterface(object):  # pragma: no cover
         :param container_id:
         :return: an iterable that contains dictionnaries with the stats of the running container. See the docker api for content.
         """
-        return self._docker.containers.get(container_id).stats(decode=True)
+        return self._docker.api.stats(container_id, decode=True)
 
     def list_running_containers(self):
         """ Returns a set of running container ids """
@@ -250,14 +287,14 @@ class DockerInterface(object):  # pragma: no cover
         """
         Removes a container (with fire)
         """
-        self._docker.containers.get(container_id).remove(v=True, link=False, force=True)
+        self._docker.api.remove_container(container_id, v=True, link=False, force=True)
 
     def kill_container(self, container_id, signal=None):
         """
         Kills a container
         :param signal: custom signal. Default is SIGKILL.
         """
-        self._docker.containers.get(container_id).kill(signal)
+        self._docker.api.kill(container_id, signal)
 
     def event_stream(self, filters=None, since=None):
         """
@@ -275,6 +312,21 @@ class DockerInterface(object):  # pragma: no cover
         """
         return {name: x["path"] for name, x in self._docker.info()["Runtimes"].items()}
 
+class _SharedUnixHTTPAdapter(UnixHTTPAdapter):  # pragma: no cover
+    """
+    docker-py keeps a pool of connections per URL, so that connections are only reused by requests to the very same
+    URL (and thus not between two requests about different containers). All the requests go to the same socket, so
+    a single pool is used instead. Both connection methods of requests' HTTPAdapter are overridden, as the one
+    called depends on the version of requests.
+    """
+
+    def get_connection(self, url, proxies=None):
+        return super(_SharedUnixHTTPAdapter, self).get_connection("http+docker://localhost", proxies)
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        return self.get_connection(request.url, proxies)
+
+
 class FixDockerSocket():  # pragma: no cover
     """
     Fix the API inconsistency of docker-py with attach_socket
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Read-only cache of the task files on the agent, and overlay mounts giving each job a writable view of them
+"""
+
+import ctypes
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from errno import EINVAL
+
+from inginious.common.filesystems import FileSystemProvider
+
+_MNT_DETACH = 2
+_libc = ctypes.CDLL(None, use_errno=True)
+
+
+_metacopy_supported = None  # unknown until the first overlay is mounted
+
+
+def mount_overlay(lower_path, upper_path, work_path, target_path):
+    """
+    Mounts an overlay filesystem on target_path, showing the content of lower_path, in which all the modifications are
+    written to upper_path. work_path must be an empty directory on the same filesystem as upper_path.
+
+    The overlay is mounted with metacopy=on when the kernel supports it: changing the owner or the permissions of a
+    file (as the grading container does for the whole task directory when it starts) then only copies its metadata to
+    upper_path, not its content.
+
+    :return: True if the overlay was mounted with metacopy=on
+    :raises OSError: if the overlay cannot be mounted, for example if the agent is not run as root
+    """
+    global _metacopy_supported
+    paths = [os.path.abspath(path) for path in (lower_path, upper_path, work_path)]
+    if any("," in path or ":" in path for path in paths):
+        raise OSError("Cannot use paths containing ',' or ':' in an overlay mount")
+    options = "lowerdir={},upperdir={},workdir={}".format(*paths)
+
+    if _metacopy_supported is not False:
+        if _libc.mount(b"overlay", os.fsencode(target_path), b"overlay", 0, (options + ",metacopy=on").encode()) == 0:
+            _metacopy_supported = True
+            return True
+        errno = ctypes.get_errno()
+        if errno != EINVAL:
+            raise OSError(errno, os.strerror(errno), target_path)
+        _metacopy_supported = False  # kernel without metacopy, or that refuses it (for example in a user namespace)
+
+    if _libc.mount(b"overlay", os.fsencode(target_path), b"overlay", 0, options.encode()) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno), target_path)
+    return False
+
+
+def unmount(target_path):
+    """ Lazily unmounts the filesystem mounted on target_path """
+    if _libc.umount2(os.fsencode(target_path), _MNT_DETACH) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno), target_path)
+
+
+def unmount_all(path):
+    """ Unmounts all the filesystems mounted under path (typically left by a previous run of the agent) """
+    path = os.path.abspath(path)
+    try:
+        with open("/proc/self/mounts") as mounts:
+            targets = [line.split()[1] for line in mounts]
+    except OSError:
+        return
+    for target in reversed(targets):
+        if target.startswith(path + "/"):
+            try:
+                unmount(target)
+            except OSError:
+                logging.getLogger("inginious.agent.docker").warning("Cannot unmount %s", target)
+
+
+class TaskCache(object):
+    """
+        Keeps read-only copies of task directories, identified by the hash of their tree (the paths of the files and
+        their modification times). Jobs of the same version of a task thus share a single copy, instead of copying
+        the task for each job.
+
+        The copies are reference counted: acquire() gives the path of a copy, that remains valid until release() is
+        called. At most `max_entries` copies are kept (more if they are in use): the least recently used copies are
+        removed first.
+
+        The methods can be called from any thread.
+    """
+
+    def __init__(self, cache_dir, max_entries=100):
+        self._cache_dir = cache_dir
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # tree hash -> reference count, by order of last use
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def get_tree_hash(fs: FileSystemProvider) -> str:
+        """ Returns a hash of the tree of a directory, that changes when a file is added, removed or modified """
+        tree_hash = hashlib.sha256()
+        for path in sorted(fs.list(recursive=True)):
+            tree_hash.update("{}\0{!r}\0".format(path, fs.get_last_modification_time(path)).encode("utf8"))
+        return tree_hash.hexdigest()
+
+    def acquire(self, fs: FileSystemProvider) -> str:
+        """ Returns the path of a read-only copy of the directory fs, that must be released with release() """
+        tree_hash = self.get_tree_hash(fs)
+        path = os.path.join(self._cache_dir, tree_hash)
+        with self._lock:
+            if tree_hash in self._entries:
+                self._entries[tree_hash] += 1
+                self._entries.move_to_end(tree_hash)
+                return path
+
+        # Copy outside the lock, in a temporary directory renamed when complete
+        tmp_path = tempfile.mkdtemp(dir=self._cache_dir, prefix=".")
+        try:
+            fs.copy_from(None, tmp_path)
+            os.chmod(tmp_path, 0o755)
+        except:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+        with self._lock:
+            if tree_hash in self._entries:  # copied by another thread in the meantime
+                self._entries[tree_hash] += 1
+                self._entries.move_to_end(tree_hash)
+                to_remove = [tmp_path]
+            else:
+                os.rename(tmp_path, path)
+                self._entries[tree_hash] = 1
+                to_remove = self._evict()
+
+        for old_path in to_remove:
+            shutil.rmtree(old_path, ignore_errors=True)
+        return path
+
+    def release(self, path: str):
+        """ Releases a copy given by acquire() """
+        tree_hash = os.path.basename(path)
+        with self._lock:
+            self._entries[tree_hash] -= 1
+            to_remove = self._evict()
+        for old_path in to_remove:
+            shutil.rmtree(old_path, ignore_errors=True)
+
+    def _evict(self):
+        """ Removes the least recently used copies not in use above max_entries. Returns their paths. """
+        unused = len(self._entries) - self._max_entries
+        to_remove = []
+        for tree_hash, references in list(self._entries.items()):
+            if unused <= 0:
+                break
+            if references == 0:
+                del self._entries[tree_hash]
+                to_remove.append(os.path.join(self._cache_dir, tree_hash))
+                unused -= 1
+        return to_remove
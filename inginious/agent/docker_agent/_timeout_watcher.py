@@ -9,12 +9,116 @@
 
 import asyncio
 import logging
+import math
+import os
+import time
 
 from inginious.common.asyncio_utils import AsyncIteratorWrapper
 
+
+def find_cgroup_cpu_usage_file(container_id, cgroup_root="/sys/fs/cgroup"):
+    """
+    Finds the file giving the CPU time used by a container in the cgroup filesystem, for the usual layouts of Docker
+    (cgroup v1 or v2, with the cgroupfs or the systemd driver).
+
+    :return: the path of the file, or None if it cannot be found (for example if the container runs in a VM)
+    """
+    candidates = [
+        # cgroup v2
+        "system.slice/docker-{}.scope/cpu.stat",
+        "docker/{}/cpu.stat",
+        # cgroup v1
+        "cpuacct/docker/{}/cpuacct.usage",
+        "cpu,cpuacct/docker/{}/cpuacct.usage",
+        "cpuacct/system.slice/docker-{}.scope/cpuacct.usage",
+        "cpu,cpuacct/system.slice/docker-{}.scope/cpuacct.usage",
+    ]
+    for candidate in candidates:
+        path = os.path.join(cgroup_root, candidate.format(container_id))
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def read_cgroup_cpu_usage(path):
+    """
+    :param path: a path given by find_cgroup_cpu_usage_file
+    :return: the CPU time used by the container, in nanoseconds
+    :raises OSError: if the file cannot be read anymore (when the container is removed)
+    """
+    with open(path, "rb") as f:
+        content = f.read()
+    if path.endswith("cpu.stat"):  # cgroup v2: "usage_usec <microseconds>" on the first line
+        for line in content.splitlines():
+            if line.startswith(b"usage_usec "):
+                return int(line[11:]) * 1000
+        raise OSError("No usage_usec in %s" % path)
+    return int(content)  # cgroup v1: nanoseconds
+
+
+class TimerWheel(object):
+    """
+        Hashed timer wheel: timers are stored in `size` slots of `tick` seconds, according to their deadline modulo
+        the size of the wheel. Adding and removing a timer is in O(1), and advance() only looks at the slots of the
+        ticks that elapsed since its last call.
+    """
+
+    def __init__(self, tick=1.0, size=512, time_function=time.monotonic):
+        self._tick = tick
+        self._time = time_function
+        self._slots = [{} for _ in range(size)]  # key -> deadline
+        self._slot_of = {}  # key -> index of its slot
+        self._current_tick = int(self._time() / tick)
+
+    def __len__(self):
+        return len(self._slot_of)
+
+    def __contains__(self, key):
+        return key in self._slot_of
+
+    def add(self, key, delay):
+        """ Adds (or replaces) a timer that expires in `delay` seconds """
+        self.remove(key)
+        deadline = self._time() + delay
+        index = max(math.ceil(deadline / self._tick), self._current_tick + 1) % len(self._slots)
+        self._slots[index][key] = deadline
+        self._slot_of[key] = index
+
+    def remove(self, key):
+        """ Removes a timer, if it exists """
+        index = self._slot_of.pop(key, None)
+        if index is not None:
+            del self._slots[index][key]
+
+    def advance(self):
+        """ Removes and returns the keys of the expired timers """
+        now = self._time()
+        now_tick = int(now / self._tick)
+        ticks = range(self._current_tick + 1, now_tick + 1)
+        if len(ticks) > len(self._slots):
+            ticks = range(len(self._slots))  # the wheel did a full turn: every slot must be checked
+        self._current_tick = now_tick
+
+        expired = []
+        for tick in ticks:
+            slot = self._slots[tick % len(self._slots)]
+            for key, deadline in list(slot.items()):
+                if deadline <= now:
+                    del slot[key]
+                    del self._slot_of[key]
+                    expired.append(key)
+        return expired
+
+
 class TimeoutWatcher(object):
-    """ Looks for container timeouts """
-    def __init__(self, docker_interface):
+    """
+        Looks for container timeouts.
+
+        A single task samples, every `interval` seconds, the CPU time used by all the watched containers from the
+        cgroup filesystem, and checks the wall time limits with a timer wheel. The CPU time of the containers whose
+        cgroup cannot be found is read from the Docker stats API instead, with a stream per container.
+    """
+    def __init__(self, docker_interface, cgroup_root="/sys/fs/cgroup", interval=1.0):
         """ docker_interface is an ASYNC interface to docker """
 
         self._logger = logging.getLogger("inginious.agent.docker")
@@ -23,6 +127,12 @@ class TimeoutWatcher(object):
         self._watching = set()
         self._docker_interface = docker_interface
         self._running_asyncio_tasks = set()
+        self._cgroup_root = cgroup_root
+        self._interval = interval
+        self._cpu_limits = {}  # container id -> (path of the cgroup CPU usage file, CPU time limit in nanoseconds)
+        self._hard_timeouts = {}  # container id -> wall time limit, in seconds
+        self._timer_wheel = TimerWheel(interval)
+        self._sampler = None
 
     async def clean(self):
         """ Close all the running tasks watching for a container timeout. All references to
@@ -30,9 +140,15 @@ class TimeoutWatcher(object):
         """
         for x in self._running_asyncio_tasks:
             x.cancel()
+        if self._sampler is not None:
+            self._sampler.cancel()
+            self._sampler = None
         self._container_had_error = set()
         self._watching = set()
         self._running_asyncio_tasks = set()
+        self._cpu_limits = {}
+        self._hard_timeouts = {}
+        self._timer_wheel = TimerWheel(self._interval)
 
 
     async def was_killed(self, container_id):
@@ -41,8 +157,7 @@ class TimeoutWatcher(object):
         :param container_id: the container id to check
         :return: a string containing "timeout" if the container was killed. None if it was not (std format for container errors)
         """
-        if container_id in self._watching:
-            self._watching.remove(container_id)
+        self._forget(container_id)
         if container_id in self._container_had_error:
             self._container_had_error.remove(container_id)
             return "timeout"
@@ -50,11 +165,50 @@ class TimeoutWatcher(object):
 
     async def register_container(self, container_id, timeout, hard_timeout):
         self._watching.add(container_id)
-        task = self._loop.create_task(self._handle_container_timeout(container_id, timeout))
-        self._running_asyncio_tasks.add(task)
-        task.add_done_callback(self._remove_safe_task)
 
-        self._loop.call_later(hard_timeout, asyncio.ensure_future, self._handle_container_hard_timeout(container_id, hard_timeout))
+        cgroup_file = find_cgroup_cpu_usage_file(container_id, self._cgroup_root)
+        if cgroup_file is not None:
+            self._cpu_limits[container_id] = (cgroup_file, timeout * (10 ** 9))
+        else:
+            self._create_safe_task(self._handle_container_timeout(container_id, timeout))
+
+        self._hard_timeouts[container_id] = hard_timeout
+        self._timer_wheel.add(container_id, hard_timeout)
+
+        if self._sampler is None:
+            self._sampler = self._loop.create_task(self._sample())
+
+    def _forget(self, container_id):
+        """ Stops watching a container """
+        self._watching.discard(container_id)
+        self._cpu_limits.pop(container_id, None)
+        self._hard_timeouts.pop(container_id, None)
+        self._timer_wheel.remove(container_id)
+
+    async def _sample(self):
+        """ Checks periodically the CPU time and the wall time used by all the watched containers """
+        while True:
+            try:
+                await asyncio.sleep(self._interval)
+
+                for container_id, (cgroup_file, nano_timeout) in list(self._cpu_limits.items()):
+                    try:
+                        usage = read_cgroup_cpu_usage(cgroup_file)
+                    except (OSError, ValueError):
+                        del self._cpu_limits[container_id]  # the container is being removed
+                        continue
+                    if usage > nano_timeout:
+                        self._logger.info("Killing container %s as it used %i CPU seconds (max was %i)",
+                                          container_id, int(usage / (10 ** 9)), int(nano_timeout / (10 ** 9)))
+                        self._create_safe_task(self._kill_it_with_fire(container_id))
+
+                for container_id in self._timer_wheel.advance():
+                    self._create_safe_task(self._handle_container_hard_timeout(container_id,
+                                                                               self._hard_timeouts.get(container_id, 0)))
+            except asyncio.CancelledError:
+                return
+            except:
+                self._logger.exception("Exception in TimeoutWatcher._sample")
 
     async def _handle_container_timeout(self, container_id, timeout):
         """
@@ -82,7 +236,7 @@ class TimeoutWatcher(object):
 
     async def _handle_container_hard_timeout(self, container_id, hard_timeout):
         """
-        Kills a container (should be called with loop.call_later(hard_timeout, ...)) and displays a message on the log
+        Kills a container (called by the sampler when its wall time limit expires) and displays a message on the log
         :param container_id:
         :param hard_timeout:
         :return:
@@ -97,16 +251,23 @@ class TimeoutWatcher(object):
         Kill a container, with fire.
         """
         if container_id in self._watching:
-            self._watching.remove(container_id)
+            self._forget(container_id)
             self._container_had_error.add(container_id)
             try:
                 await self._docker_interface.kill_container(container_id)
             except:
                 pass #is ok
 
+    def _create_safe_task(self, coroutine):
+        """ Runs a coroutine in a task that is cancelled by clean() """
+        task = self._loop.create_task(coroutine)
+        self._running_asyncio_tasks.add(task)
+        task.add_done_callback(self._remove_safe_task)
+        return task
+
     def _remove_safe_task(self, task):
         """ Remove a task from _running_asyncio_tasks """
         try:
             self._running_asyncio_tasks.remove(task)
         except:
-            pass
\ No newline at end of file
+            pass
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Pool of grading containers created in advance """
+
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Hashable, List, Optional
+
+
+@dataclass
+class WarmContainer:
+    container_id: str
+    container_path: str  # directory whose subdirectories are mounted in the container
+    mem_limit: int
+    creation_time: float  # time needed to create and start the container, in seconds
+
+
+class WarmContainerPool(object):
+    """
+        Keeps, for each key (typically an environment), up to `size` grading containers that are created and
+        started, waiting for their "start" message. Taking a container from the pool thus removes the creation of
+        the container from the critical path of a job.
+
+        A key is only filled after it has been asked for once. The pool itself does not create containers: the agent
+        reserves slots with reserve() and adds the containers it created with add().
+
+        The methods can be called from any thread.
+    """
+
+    def __init__(self, size: int):
+        self._size = size
+        self._lock = threading.Lock()
+        self._containers: Dict[Hashable, Deque[WarmContainer]] = {}
+        self._pending: Dict[Hashable, int] = {}  # number of containers being created, for each key
+        self._closed = False
+        self._hits = 0
+        self._misses = 0
+        self._time_saved = 0.0
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(containers) for containers in self._containers.values())
+
+    def claim(self, key: Hashable) -> Optional[WarmContainer]:
+        """ Takes a container from the pool. Returns None if there is no container available for this key. """
+        with self._lock:
+            containers = self._containers.setdefault(key, deque())
+            if not containers:
+                self._misses += 1
+                return None
+            container = containers.popleft()
+            self._hits += 1
+            self._time_saved += container.creation_time
+            return container
+
+    def reserve(self, key: Hashable) -> bool:
+        """
+        Reserves a place for a new container in the pool. If True is returned, either add() or cancel() must be
+        called afterwards.
+        """
+        with self._lock:
+            if self._closed or len(self._containers.get(key, ())) + self._pending.get(key, 0) >= self._size:
+                return False
+            self._pending[key] = self._pending.get(key, 0) + 1
+            return True
+
+    def cancel(self, key: Hashable):
+        """ Releases a place reserved with reserve() """
+        with self._lock:
+            self._pending[key] -= 1
+
+    def add(self, key: Hashable, container: WarmContainer) -> bool:
+        """
+        Adds a new container in a place reserved with reserve().
+
+        :return: False if the pool was closed in the meantime. The container should then be removed by the caller.
+        """
+        with self._lock:
+            self._pending[key] -= 1
+            if self._closed:
+                return False
+            self._containers.setdefault(key, deque()).append(container)
+            return True
+
+    def discard(self, container_id: str) -> Optional[WarmContainer]:
+        """ Removes a container (that died) from the pool, and returns it. Returns None if it is not in the pool. """
+        with self._lock:
+            for containers in self._containers.values():
+                for container in containers:
+                    if container.container_id == container_id:
+                        containers.remove(container)
+                        return container
+        return None
+
+    def close(self) -> List[WarmContainer]:
+        """ Empties the pool and returns the containers it contained. The pool does not accept containers anymore. """
+        with self._lock:
+            self._closed = True
+            containers = [container for containers in self._containers.values() for container in containers]
+            self._containers = {}
+            return containers
+
+    def get_stats(self) -> Dict[str, float]:
+        """ Returns the number of hits and misses, the hit rate and the mean time saved per job, in seconds """
+        with self._lock:
+            claims = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / claims if claims else 0.0,
+                "time_saved_per_job": self._time_saved / claims if claims else 0.0
+            }
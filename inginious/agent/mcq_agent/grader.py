@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Grades the answers to MCQ tasks. Used by the MCQ agent, and by the webapp when it grades the MCQ in process. """
+
+import functools
+import gettext
+import json
+import os
+
+from inginious import get_root_path
+
+_I18N_PATH = os.path.join(get_root_path(), "agent", "mcq_agent", "i18n")
+_AVAILABLE_TRANSLATIONS = frozenset(x for x in os.listdir(_I18N_PATH) if os.path.isdir(os.path.join(_I18N_PATH, x)))
+
+
+@functools.lru_cache(maxsize=None)
+def get_translation(language):
+    """ Returns the translation of the messages of the grader in the given language, loaded once per process """
+    if language in _AVAILABLE_TRANSLATIONS:
+        return gettext.translation('messages', _I18N_PATH, [language])
+    return gettext.NullTranslations()
+
+
+def check_answer(problems, task_input, language):
+    """ Verify the answers in task_input. Returns seven values:
+
+    1. True the input is **currently** valid. (may become invalid after running the code), False else
+    2. True if the input needs to be run in the VM, False else
+    3. Main message, as a list (that can be join with ``\\n`` or ``<br/>`` for example)
+    4. Problem specific message, as a dictionnary (tuple of result/text)
+    5. Number of subproblems that (already) contain errors. <= Number of subproblems
+    6. Number of errors in MCQ problems. Not linked to the number of subproblems
+    7. The state of the problems, encoded in JSON
+
+    """
+    valid = True
+    need_launch = False
+    main_message = []
+    problem_messages = {}
+    error_count = 0
+    multiple_choice_error_count = 0
+    states = {}
+    for problem in problems:
+        problem_is_valid, problem_main_message, problem_s_messages, problem_mc_error_count, state = problem.check_answer(task_input, language)
+        states[problem.get_id()] = state
+        if problem_is_valid is None:
+            need_launch = True
+        elif problem_is_valid == False:
+            error_count += 1
+            valid = False
+        if problem_main_message is not None:
+            main_message.append(problem_main_message)
+        if problem_s_messages is not None:
+            problem_messages[problem.get_id()] = (("success" if problem_is_valid else "failed"), problem_s_messages)
+        multiple_choice_error_count += problem_mc_error_count
+    return valid, need_launch, main_message, problem_messages, error_count, multiple_choice_error_count, json.dumps(states)
+
+
+def grade(problems, task_input, language):
+    """
+    Grades the answers in task_input to the given problems.
+    :param problems: the list of the problem objects of the task (subclasses of inginious.common.tasks_problems.Problem)
+    :param task_input: the input of the submission, with its @lang and @state fields
+    :return: a tuple (result, text, grade, problems, state) as sent by the agent for the job, or None if one of the
+        problems must be run in a container (the task is not a pure MCQ)
+    """
+    _ = get_translation(language).gettext
+
+    result, need_emul, text, problems_messages, error_count, mcq_error_count, state = check_answer(problems, task_input, language)
+    if need_emul:
+        return None
+
+    internal_messages = {
+        "_wrong_answer_multiple": _("Wrong answer. Make sure to select all the valid possibilities"),
+        "_wrong_answer": _("Wrong answer"),
+        "_correct_answer": _("Correct answer"),
+    }
+
+    for key, (p_result, messages) in problems_messages.items():
+        messages = [internal_messages[message] if message in internal_messages else message for message in messages]
+        problems_messages[key] = (p_result, "\n\n".join(messages))
+
+    if error_count != 0:
+        text.append(_("You have {} wrong answer(s).").format(error_count))
+    if mcq_error_count != 0:
+        text.append("\n\n" + _("Among them, you have {} invalid answers in the multiple choice questions").format(mcq_error_count))
+
+    nb_subproblems = len(problems)
+    if nb_subproblems == 0:
+        text.append("No subproblems defined")
+        return "crashed", "\n".join(text), 0.0, problems_messages, task_input.get("@state", "")
+
+    grade = 100.0 * float(nb_subproblems - error_count) / float(nb_subproblems)
+    return ("success" if result else "failed"), "\n".join(text), grade, problems_messages, state
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import asyncio
+import logging
+import struct
+
+import msgpack
+import pytest
+
+from inginious.agent.docker_agent._container_stream import ContainerStreamDecoder
+
+
+def frame(content, outtype=1):
+    """ Wraps content in a docker multiplexed stream frame """
+    return struct.pack('>BxxxL', outtype, len(content)) + content
+
+
+def message(obj):
+    """ Encodes a message as sent by the containers """
+    encoded = msgpack.dumps(obj, use_bin_type=True)
+    return struct.pack('!I', len(encoded)) + encoded
+
+
+def decode_all(data, decode=True, chunk_size=None, max_message_size=None, decoder_out=None):
+    async def _run():
+        reader = asyncio.StreamReader()
+        for i in range(0, len(data), chunk_size or len(data) or 1):
+            reader.feed_data(data[i:i + (chunk_size or len(data))])
+        reader.feed_eof()
+        decoder = ContainerStreamDecoder(reader, logging.getLogger(), max_message_size)
+        if decoder_out is not None:
+            decoder_out.append(decoder)
+        return [msg async for msg in decoder.messages(decode)]
+    return asyncio.run(_run())
+
+
+class TestContainerStreamDecoder(object):
+
+    def test_messages_in_one_frame(self):
+        data = frame(message({"type": "a"}) + message({"type": "b", "list": [1, 2]}))
+        assert decode_all(data) == [{"type": "a"}, {"type": "b", "list": (1, 2)}]
+
+    def test_message_across_frames(self):
+        payload = message({"type": "result", "archive": b"x" * 100000})
+        data = b"".join(frame(payload[i:i + 1000]) for i in range(0, len(payload), 1000))
+        assert decode_all(data, chunk_size=777) == [{"type": "result", "archive": b"x" * 100000}]
+
+    def test_stderr_is_ignored(self):
+        data = frame(message({"type": "a"})[:3]) + frame(b"some error", 2) + frame(message({"type": "a"})[3:])
+        assert decode_all(data) == [{"type": "a"}]
+
+    def test_large_stderr_truncated(self, caplog):
+        caplog.set_level(logging.DEBUG)
+        data = frame(message({"type": "a"})) + frame(b"e" * 300000, 2) + frame(message({"type": "b"}))
+        assert decode_all(data, chunk_size=4096, max_message_size=1000) == [{"type": "a"}, {"type": "b"}]
+        logged = [record.args[0] for record in caplog.records if record.msg.startswith("Received stderr")]
+        assert sum(len(content) for content in logged) == 1000
+
+    def test_raw(self):
+        data = frame(message({"type": "a"}) + message({"type": "b"}))
+        assert decode_all(data, decode=False) == [message({"type": "a"}), message({"type": "b"})]
+
+    def test_many_messages(self):
+        messages = [{"type": "stdin", "n": i} for i in range(5000)]
+        payload = b"".join(message(msg) for msg in messages)
+        data = b"".join(frame(payload[i:i + 4096]) for i in range(0, len(payload), 4096))
+        assert decode_all(data) == messages
+
+    def test_empty_frame(self):
+        with pytest.raises(Exception):
+            decode_all(frame(message({"type": "a"})) + struct.pack('>BxxxL', 1, 0))
+
+    def test_incomplete(self):
+        with pytest.raises(asyncio.IncompleteReadError):
+            decode_all(frame(message({"type": "a"}))[:-2])
+
+    def test_binary_archive(self):
+        archive = bytes(range(256)) * 1000
+        assert decode_all(frame(message({"type": "result", "result": {"archive": archive}}))) == \
+               [{"type": "result", "result": {"archive": archive}}]
+
+    def test_large_message_discarded(self):
+        decoders = []
+        large = message({"type": "result", "archive": b"x" * 300000})
+        data = frame(message({"type": "a"})) + frame(large) + frame(message({"type": "b"}))
+        assert decode_all(data, max_message_size=1000, decoder_out=decoders) == [{"type": "a"}, {"type": "b"}]
+        assert decoders[0].discarded_messages == [len(large) - 4]
+        # the discarded message was never entirely buffered
+        assert len(decoders[0]._buffer) < 100000
+
+    def test_large_message_discarded_across_frames(self):
+        payload = message({"type": "a"}) + message({"type": "result", "archive": b"x" * 5000}) + message({"type": "b"})
+        data = b"".join(frame(payload[i:i + 100]) for i in range(0, len(payload), 100))
+        assert decode_all(data, decode=False, chunk_size=33, max_message_size=1000) == \
+               [message({"type": "a"}), message({"type": "b"})]
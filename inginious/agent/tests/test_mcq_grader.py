@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import json
+
+from inginious.agent.mcq_agent import grader
+from inginious.common.tasks_problems import CodeProblem, MatchProblem, MultipleChoiceProblem
+
+
+def make_problems():
+    return [MatchProblem("match", {"answer": "42"}, {}, None),
+            MultipleChoiceProblem("mcq", {"multiple": True, "choices": [{"text": "a", "valid": True},
+                                                                         {"text": "b", "valid": True},
+                                                                         {"text": "c"}]}, {}, None)]
+
+
+class TestMCQGrader(object):
+
+    def test_success(self):
+        result, text, grade, problems, state = grader.grade(make_problems(), {"match": "42", "mcq": [0, 1],
+                                                                              "@state": ""}, "en")
+        assert (result, text, grade) == ("success", "", 100.0)
+        assert problems == {"match": ("success", "Correct answer")}
+        assert json.loads(state) == {"match": "", "mcq": ""}
+
+    def test_failed(self):
+        result, text, grade, problems, _ = grader.grade(make_problems(), {"match": "42", "mcq": [0, 2]}, "en")
+        assert result == "failed" and grade == 50.0
+        assert problems == {"match": ("success", "Correct answer"),
+                            "mcq": ("failed", "Wrong answer. Make sure to select all the valid possibilities")}
+        assert text.startswith("You have 1 wrong answer(s).")
+        assert "Among them, you have 2 invalid answers" in text
+
+    def test_translation(self):
+        _, _, _, problems, _ = grader.grade(make_problems(), {"match": "41", "mcq": [0, 1]}, "fr")
+        assert problems["match"] == ("failed", "Réponse incorrecte")
+        assert grader.get_translation("fr") is grader.get_translation("fr")
+        assert grader.get_translation("../fr").gettext("Wrong answer") == "Wrong answer"
+
+    def test_no_problem(self):
+        assert grader.grade([], {"@state": "previous"}, "en") == ("crashed", "No subproblems defined", 0.0, {},
+                                                                  "previous")
+
+    def test_not_pure_mcq(self):
+        problems = make_problems() + [CodeProblem("code", {}, {}, None)]
+        assert grader.grade(problems, {"match": "42", "mcq": [0, 1], "code": ""}, "en") is None
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import msgpack
+import pytest
+
+from inginious.agent.docker_agent import get_student_container_limits
+
+# The API of the containers is not installed with INGInious, it is in the base container
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "..", "base-containers", "base"))
+from inginious_container_api import run_student  # noqa: E402
+from inginious_container_api.utils import receive_session_command, reset_student_environment, \
+    serve_student_session  # noqa: E402
+
+
+class FakeParentInfo(object):
+    mem_limit = 100
+    time_limit = 30
+    hard_time_limit = 90
+
+
+class FakeZMQSocket(object):
+    """ The socket of run_student to the agent, which gives the return value of the student container when it stops """
+
+    def __init__(self, student, retval):
+        self._student = student
+        self._retval = retval
+
+    def send(self, message):
+        pass
+
+    def recv(self):
+        self._student.join()
+        return msgpack.dumps({"type": "run_student_retval", "retval": self._retval}, use_bin_type=True)
+
+
+def serve(sock):
+    """ What _run_student_intern does in a student container started for a session """
+    sock.send(b'H')
+    fds, command = receive_session_command(sock)
+    if command is not None:
+        serve_student_session(sock, fds, command, lambda: None)
+    sock.close()
+
+
+@pytest.fixture
+def open_session(tmp_path, monkeypatch):
+    """ Opens a StudentSession whose student "container" is a thread running the given function on its socket """
+    exists = os.path.exists
+    monkeypatch.setattr(run_student.os.path, "exists",
+                        lambda path: path == "/.__input/__shared_kernel" or exists(path))
+
+    def open_session(student_main=serve, retval=0):
+        socket_path = str(tmp_path / "session.sock")
+        server = socket.socket(socket.AF_UNIX)
+        server.bind(socket_path)
+        server.listen(0)
+
+        def student():
+            sock = socket.socket(socket.AF_UNIX)
+            sock.connect(socket_path)
+            student_main(sock)
+        thread = threading.Thread(target=student)
+        thread.start()
+
+        monkeypatch.setattr(run_student, "create_student_socket",
+                            lambda both_dockers: (server, "session", socket_path, str(tmp_path / "session")))
+        monkeypatch.setattr(run_student, "start_student_container",
+                            lambda *args, **kwargs: (FakeZMQSocket(thread, retval), "container"))
+        return run_student.open_student_session(working_dir=str(tmp_path))
+
+    return open_session
+
+
+class TestStudentSession(object):
+
+    def test_limits(self):
+        parent = FakeParentInfo()
+        assert get_student_container_limits(parent, {"memory_limit": 0, "time_limit": 0,
+                                                     "hard_time_limit": 0}) == (100, 30, 90)
+        assert get_student_container_limits(parent, {"memory_limit": 50, "time_limit": 60,
+                                                     "hard_time_limit": 10}) == (50, 30, 10)
+
+    def test_commands(self, open_session, tmp_path):
+        with open_session() as session:
+            assert session.container_id == "container"
+            assert session.run_simple("echo hello") == ("hello\n", "", 0)
+            assert session.run_simple("cat", cmd_input="input") == ("input", "", 0)
+            assert session.run_simple("sh -c 'pwd; exit 3'", stdout_err_fuse=True) == (str(tmp_path) + "\n", 3)
+            assert set(session.last_usage) == {"cpu_time", "wall_time", "memory"}
+            assert session.last_usage["memory"] > 0
+        assert session.close() == 0
+
+    def test_command_limits(self, open_session):
+        with open_session() as session:
+            start = time.monotonic()
+            assert session.run("sleep 10", hard_time_limit=0.5) == 253
+            assert time.monotonic() - start < 5
+            assert session.run("python3 -c 'x = bytearray(64 * 1024 * 1024)'", memory_limit=16) == 252
+            assert session.last_usage["memory"] > 16
+            assert session.run("python3 -c 'x = bytearray(64 * 1024 * 1024)'") == 0
+
+    def test_killed(self, open_session):
+        def killed(sock):
+            sock.send(b'H')
+            sock.close()
+
+        session = open_session(killed, 253)
+        assert session.run("echo hello") == 253
+        assert session.last_usage is None
+        assert session.run("echo hello") == 253
+        assert session.close() == 253
+
+    @pytest.mark.skipif(os.getuid() != 0, reason="needs to run processes as another user")
+    def test_reset(self, tmp_path):
+        def as_student():
+            os.setgid(4242)
+            os.setuid(4242)
+
+        process = subprocess.Popen(["sleep", "30"], preexec_fn=as_student)
+        (tmp_path / "student").write_text("")
+        os.chown(str(tmp_path / "student"), 4242, 4242)
+        (tmp_path / "grader").write_text("")
+        # wait for the process to be running as the student
+        while os.stat("/proc/%i" % process.pid).st_uid != 4242:
+            time.sleep(0.01)
+
+        reset_student_environment(4242, [str(tmp_path)])
+        assert process.wait(5) == -9
+        assert os.listdir(str(tmp_path)) == ["grader"]
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from inginious.agent.docker_agent._task_cache import TaskCache, mount_overlay, unmount
+from inginious.common.filesystems.local import LocalFSProvider
+
+
+@pytest.fixture
+def tmp_dir():
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path)
+
+
+def make_task(root, name, files):
+    """ Creates a task directory containing the given files (dict path -> content), and returns its fs """
+    for path, content in files.items():
+        full_path = os.path.join(root, "tasks", name, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "w") as f:
+            f.write(content)
+    return LocalFSProvider(os.path.join(root, "tasks", name))
+
+
+class TestTaskCache(object):
+
+    def test_same_tree_shared(self, tmp_dir):
+        task_fs = make_task(tmp_dir, "task", {"run": "#!/bin/bash", "data/input.txt": "42"})
+        cache = TaskCache(os.path.join(tmp_dir, "cache"))
+        path = cache.acquire(task_fs)
+        assert cache.acquire(task_fs) == path
+        with open(os.path.join(path, "data", "input.txt")) as f:
+            assert f.read() == "42"
+
+    def test_modified_tree(self, tmp_dir):
+        task_fs = make_task(tmp_dir, "task", {"run": "#!/bin/bash"})
+        cache = TaskCache(os.path.join(tmp_dir, "cache"))
+        path = cache.acquire(task_fs)
+        os.utime(os.path.join(task_fs.prefix, "run"), (0, 0))
+        assert cache.acquire(task_fs) != path
+        tree_hash = TaskCache.get_tree_hash(task_fs)
+        make_task(tmp_dir, "task", {"new_file": ""})
+        assert TaskCache.get_tree_hash(task_fs) != tree_hash
+
+    def test_eviction(self, tmp_dir):
+        cache = TaskCache(os.path.join(tmp_dir, "cache"), max_entries=1)
+        first = cache.acquire(make_task(tmp_dir, "a", {"run": "a"}))
+        second = cache.acquire(make_task(tmp_dir, "b", {"run": "b"}))
+        assert os.path.exists(first)  # still in use
+        cache.release(first)
+        assert not os.path.exists(first)
+        assert os.path.exists(second)
+        cache.release(second)
+        assert os.path.exists(second)  # the last one is kept
+
+
+@pytest.mark.skipif(os.geteuid() != 0, reason="mounting an overlay needs root")
+def test_overlay(tmp_dir):
+    task_fs = make_task(tmp_dir, "task", {"run": "original"})
+    cache = TaskCache(os.path.join(tmp_dir, "cache"))
+    lower = cache.acquire(task_fs)
+    for directory in ["upper", "work", "merged"]:
+        os.mkdir(os.path.join(tmp_dir, directory))
+    merged = os.path.join(tmp_dir, "merged")
+    try:
+        mount_overlay(lower, os.path.join(tmp_dir, "upper"), os.path.join(tmp_dir, "work"), merged)
+    except OSError as e:
+        pytest.skip("overlays are not supported here (%s)" % e)
+    try:
+        with open(os.path.join(merged, "run"), "w") as f:
+            f.write("modified")
+    finally:
+        unmount(merged)
+    with open(os.path.join(lower, "run")) as f:
+        assert f.read() == "original"
+    with open(os.path.join(tmp_dir, "upper", "run")) as f:
+        assert f.read() == "modified"
+
+
+@pytest.mark.skipif(os.geteuid() != 0, reason="mounting an overlay needs root")
+def test_overlay_metacopy(tmp_dir):
+    task_fs = make_task(tmp_dir, "task", {"run": "original" * 1024})
+    cache = TaskCache(os.path.join(tmp_dir, "cache"))
+    lower = cache.acquire(task_fs)
+    for directory in ["upper", "work", "merged"]:
+        os.mkdir(os.path.join(tmp_dir, directory))
+    merged = os.path.join(tmp_dir, "merged")
+    try:
+        metacopy = mount_overlay(lower, os.path.join(tmp_dir, "upper"), os.path.join(tmp_dir, "work"), merged)
+    except OSError as e:
+        pytest.skip("overlays are not supported here (%s)" % e)
+    try:
+        # as the grading container does when it starts
+        os.chmod(os.path.join(merged, "run"), 0o777)
+        os.chown(os.path.join(merged, "run"), 4242, 4242)
+        with open(os.path.join(merged, "run")) as f:
+            assert f.read() == "original" * 1024
+    finally:
+        unmount(merged)
+    if not metacopy:
+        pytest.skip("overlays with metacopy=on are not supported here")
+    # only the metadata was copied
+    assert "trusted.overlay.metacopy" in os.listxattr(os.path.join(tmp_dir, "upper", "run"))
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import asyncio
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from inginious.agent.docker_agent._timeout_watcher import TimeoutWatcher, TimerWheel, find_cgroup_cpu_usage_file, \
+    read_cgroup_cpu_usage
+
+
+@pytest.fixture
+def cgroup_root():
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path)
+
+
+def write_cpu_usage(cgroup_root, container_id, seconds, v2=True):
+    """ Writes the CPU usage of a container as the cgroup filesystem would """
+    if v2:
+        path = os.path.join(cgroup_root, "system.slice", "docker-%s.scope" % container_id, "cpu.stat")
+        content = "usage_usec %d\nuser_usec 0\nsystem_usec 0\n" % (seconds * 10 ** 6)
+    else:
+        path = os.path.join(cgroup_root, "cpu,cpuacct", "docker", container_id, "cpuacct.usage")
+        content = "%d\n" % (seconds * 10 ** 9)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+class FakeDockerInterface(object):
+    def __init__(self):
+        self.killed = []
+
+    async def kill_container(self, container_id):
+        self.killed.append(container_id)
+
+    async def get_stats(self, container_id):
+        return iter([{"cpu_stats": {"cpu_usage": {"total_usage": 5 * 10 ** 9}}}])
+
+
+class TestCgroups(object):
+
+    def test_v2(self, cgroup_root):
+        write_cpu_usage(cgroup_root, "abc", 3)
+        path = find_cgroup_cpu_usage_file("abc", cgroup_root)
+        assert read_cgroup_cpu_usage(path) == 3 * 10 ** 9
+
+    def test_v1(self, cgroup_root):
+        write_cpu_usage(cgroup_root, "abc", 3, v2=False)
+        path = find_cgroup_cpu_usage_file("abc", cgroup_root)
+        assert read_cgroup_cpu_usage(path) == 3 * 10 ** 9
+
+    def test_not_found(self, cgroup_root):
+        assert find_cgroup_cpu_usage_file("abc", cgroup_root) is None
+
+
+class TestTimerWheel(object):
+
+    def test_expiration(self):
+        now = [100.0]
+        wheel = TimerWheel(1.0, 8, lambda: now[0])
+        wheel.add("a", 2.5)
+        wheel.add("b", 20)  # more than a turn of the wheel
+        wheel.add("c", 1)
+        now[0] = 101.0
+        assert wheel.advance() == ["c"]
+        now[0] = 102.0
+        assert wheel.advance() == []
+        now[0] = 103.0
+        assert wheel.advance() == ["a"]
+        now[0] = 110.0
+        assert wheel.advance() == []
+        now[0] = 125.0
+        assert wheel.advance() == ["b"]
+        assert len(wheel) == 0
+
+    def test_remove(self):
+        now = [0.0]
+        wheel = TimerWheel(1.0, 8, lambda: now[0])
+        wheel.add("a", 1)
+        wheel.add("b", 1)
+        wheel.remove("a")
+        wheel.remove("unknown")
+        assert "a" not in wheel
+        now[0] = 1.0
+        assert wheel.advance() == ["b"]
+
+
+class TestTimeoutWatcher(object):
+
+    def test_cpu_timeout(self, cgroup_root):
+        async def run():
+            docker = FakeDockerInterface()
+            watcher = TimeoutWatcher(docker, cgroup_root, interval=0.01)
+            write_cpu_usage(cgroup_root, "slow", 1)
+            write_cpu_usage(cgroup_root, "fast", 1)
+            await watcher.register_container("slow", 2, 60)
+            await watcher.register_container("fast", 2, 60)
+            await asyncio.sleep(0.05)
+            write_cpu_usage(cgroup_root, "slow", 3)
+            await asyncio.sleep(0.05)
+            result = docker.killed, await watcher.was_killed("slow"), await watcher.was_killed("fast")
+            await watcher.clean()
+            return result
+        assert asyncio.run(run()) == (["slow"], "timeout", None)
+
+    def test_hard_timeout(self, cgroup_root):
+        async def run():
+            docker = FakeDockerInterface()
+            watcher = TimeoutWatcher(docker, cgroup_root, interval=0.01)
+            write_cpu_usage(cgroup_root, "a", 0)
+            await watcher.register_container("a", 10, 0.02)
+            await asyncio.sleep(0.1)
+            result = docker.killed, await watcher.was_killed("a")
+            await watcher.clean()
+            return result
+        assert asyncio.run(run()) == (["a"], "timeout")
+
+    def test_docker_stats_fallback(self, cgroup_root):
+        async def run():
+            docker = FakeDockerInterface()
+            watcher = TimeoutWatcher(docker, cgroup_root, interval=0.01)
+            await watcher.register_container("no_cgroup", 2, 60)
+            await asyncio.sleep(0.05)
+            result = docker.killed, await watcher.was_killed("no_cgroup")
+            await watcher.clean()
+            return result
+        assert asyncio.run(run()) == (["no_cgroup"], "timeout")
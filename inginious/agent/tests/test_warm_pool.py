@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+from inginious.agent.docker_agent._warm_pool import WarmContainer, WarmContainerPool
+
+
+def container(container_id, creation_time=1.0):
+    return WarmContainer(container_id, "/tmp/" + container_id, 100, creation_time)
+
+
+class TestWarmContainerPool(object):
+
+    def test_claim_empty(self):
+        pool = WarmContainerPool(2)
+        assert pool.claim("env") is None
+        assert pool.get_stats() == {"hits": 0, "misses": 1, "hit_rate": 0.0, "time_saved_per_job": 0.0}
+
+    def test_reserve_up_to_size(self):
+        pool = WarmContainerPool(2)
+        assert pool.reserve("env")
+        assert pool.reserve("env")
+        assert not pool.reserve("env")
+        assert pool.add("env", container("a"))
+        assert not pool.reserve("env")
+        pool.cancel("env")
+        assert pool.reserve("env")
+        assert pool.reserve("other")
+
+    def test_claim_in_order(self):
+        pool = WarmContainerPool(2)
+        for container_id in ["a", "b"]:
+            assert pool.reserve("env")
+            pool.add("env", container(container_id))
+        assert pool.claim("other") is None
+        assert pool.claim("env").container_id == "a"
+        assert pool.claim("env").container_id == "b"
+        assert pool.claim("env") is None
+        assert len(pool) == 0
+
+    def test_stats(self):
+        pool = WarmContainerPool(1)
+        pool.reserve("env")
+        pool.add("env", container("a", 3.0))
+        pool.claim("env")
+        pool.claim("env")
+        stats = pool.get_stats()
+        assert stats["hits"] == 1 and stats["misses"] == 1
+        assert stats["hit_rate"] == 0.5
+        assert stats["time_saved_per_job"] == 1.5
+
+    def test_discard(self):
+        pool = WarmContainerPool(2)
+        for container_id in ["a", "b"]:
+            pool.reserve("env")
+            pool.add("env", container(container_id))
+        assert pool.discard("c") is None
+        assert pool.discard("a").container_id == "a"
+        assert pool.claim("env").container_id == "b"
+
+    def test_close(self):
+        pool = WarmContainerPool(2)
+        pool.reserve("env")
+        pool.reserve("env")
+        pool.add("env", container("a"))
+        assert [c.container_id for c in pool.close()] == ["a"]
+        assert not pool.add("env", container("b"))  # created while closing, the caller removes it
+        assert not pool.reserve("env")
+        assert pool.claim("env") is None
@@ -12,6 +12,8 @@ import zmq
 from typing import Dict
 from zmq.asyncio import Poller
 
+from inginious.backend.job_durations import JobDurations
+from inginious.backend.scheduling_policies import create_scheduling_policy
 from inginious.backend.topic_priority_queue import TopicPriorityQueue
 from inginious.common.asyncio_utils import create_safe_task
 from inginious.common.messages import BackendNewJob, AgentJobStarted, AgentJobDone, AgentJobSSHDebug, \
@@ -19,13 +21,13 @@ from inginious.common.messages import BackendNewJob, AgentJobStarted, AgentJobDo
     ClientHello, BackendUpdateEnvironments, Unknown, Ping, Pong, ClientGetQueue, BackendGetQueue, ZMQUtils
 
 # This will be pushed inside a TopicPriorityQueue that uses natural ordering (smallest element has the highest priority)
-# priority and time_received must thus be the two first element of the tuples.
-# a tuple with a small priority value will actually be processed first.
-WaitingJob = namedtuple('WaitingJob', ['priority', 'time_received', 'client_addr', 'job_id', 'msg'])
+# sort_key, given by the scheduling policy, and time_received must thus be the two first element of the tuples.
+# a tuple with a small sort key will actually be processed first.
+WaitingJob = namedtuple('WaitingJob', ['sort_key', 'time_received', 'client_addr', 'job_id', 'msg'])
 
 RunningJob = namedtuple('RunningJob', ['agent_addr', 'client_addr', 'msg', 'time_started'])
 EnvironmentInfo = namedtuple('EnvironmentInfo', ['last_id', 'created_last', 'agents', 'type'])
-AgentInfo = namedtuple('AgentInfo', ['name', 'environments'])  # environments is a list of tuple (type, environment)
+AgentInfo = namedtuple('AgentInfo', ['name', 'environments'])  # environments is a frozenset of tuple (type, environment)
 
 class Backend(object):
     """
@@ -33,7 +35,14 @@ class Backend(object):
         Schedule jobs on agents.
     """
 
-    def __init__(self, context, agent_addr, client_addr):
+    def __init__(self, context, agent_addr, client_addr, scheduling_config=None):
+        """
+        :param context: a ZMQ context
+        :param agent_addr: address to which the agents connect
+        :param client_addr: address to which the clients connect
+        :param scheduling_config: the configuration of the policy ordering the waiting jobs (see
+                                  inginious.backend.scheduling_policies.create_scheduling_policy). By default, FIFO.
+        """
         self._content = context
         self._loop = asyncio.get_event_loop()
         self._agent_addr = agent_addr
@@ -59,16 +68,19 @@ class Backend(object):
         self._registered_agents: Dict[bytes, AgentInfo] = {}  # all registered agents
         self._ping_count = {}  # ping count per addr of agents
 
-        # addr of available agents. May contain multiple times the same agent, because some agent can
-        # manage multiple jobs at once!
-        self._available_agents = []
+        # number of free job slots of each available agent, as some agents can manage multiple jobs at once.
+        # Agents without free slots are not present.
+        self._available_agents: Dict[bytes, int] = {}
 
         # These two share the same objects! Tuples should never be recreated.
-        self._waiting_jobs_pq = TopicPriorityQueue()  # priority queue for waiting jobs
+        self._waiting_jobs_pq = TopicPriorityQueue()  # priority queue for waiting jobs, indexed by job id
         self._waiting_jobs: Dict[str, WaitingJob] = {}  # all jobs waiting in queue
 
         self._job_running: Dict[str, RunningJob] = {}  # all running jobs
 
+        self._job_durations = JobDurations()  # observed durations of the jobs, per task
+        self._scheduling_policy = create_scheduling_policy(scheduling_config, self._job_durations)
+
     async def handle_agent_message(self, agent_addr, message):
         """Dispatch messages received from agents to the right handlers"""
         message_handlers = {
@@ -136,9 +148,11 @@ class Backend(object):
             return
 
         self._logger.info("Adding a new job %s %s to the queue", client_addr, message.job_id)
-        job = WaitingJob(message.priority, time.time(), client_addr, message.job_id, message)
+        time_received = time.time()
+        job = WaitingJob(self._scheduling_policy.get_sort_key(message, time_received), time_received, client_addr,
+                         message.job_id, message)
         self._waiting_jobs[message.job_id] = job
-        self._waiting_jobs_pq.put((message.environment_type, message.environment), job)
+        self._waiting_jobs_pq.put((message.environment_type, message.environment), job, message.job_id)
 
         await self.update_queue()
 
@@ -148,6 +162,7 @@ class Backend(object):
         if message.job_id in self._waiting_jobs:
             # Erase the job in waiting list
             waiting_job = self._waiting_jobs.pop(message.job_id)
+            self._waiting_jobs_pq.remove(message.job_id)
             previous_state = waiting_job.msg.inputdata.get("@state", "")
 
             # Do not forget to send a JobDone to the initiating client
@@ -179,49 +194,59 @@ class Backend(object):
         jobs_waiting = [(job.job_id, job.client_addr == client_addr, job.msg.taskset_id+"/"+job.msg.task_id, job.msg.launcher,
                                      self._get_time_limit_estimate(job.msg)) for job in self._waiting_jobs.values()]
 
-        await ZMQUtils.send_with_addr(self._client_socket, client_addr, BackendGetQueue(jobs_running, jobs_waiting))
+        #expected_durations: expected duration of the jobs, according to the previous jobs of the same task
+        expected_durations = {}
+        for job_id, job_msg in [(job_id, content.msg) for job_id, content in self._job_running.items()] + \
+                               [(job_id, job.msg) for job_id, job in self._waiting_jobs.items()]:
+            expected = self._job_durations.get_expected_duration(job_msg)
+            if expected is not None:
+                expected_durations[job_id] = expected
+
+        await ZMQUtils.send_with_addr(self._client_socket, client_addr, BackendGetQueue(jobs_running, jobs_waiting,
+                                                                                        expected_durations))
 
     async def update_queue(self):
         """
-        Send waiting jobs to available agents
+        Send waiting jobs to available agents.
+
+        Jobs are matched with the free slots of the agents in a single pass, before anything is sent. All the jobs
+        given to an agent are then sent to it in a single multipart frame.
         """
-        available_agents = list(self._available_agents) # do a copy to avoid bad things
+        jobs_to_send: Dict[bytes, list] = {}
 
         # Loop on available agents to maximize running jobs, and break if priority queue empty
-        for agent_addr in available_agents:
+        for agent_addr, free_slots in list(self._available_agents.items()):
             if self._waiting_jobs_pq.empty():
                 break  # nothing to do
 
-            try:
-                job = None
-                while job is None:
-                    # keep the object, do not unzip it directly! It's sometimes modified when a job is killed.
-                    topics = self._registered_agents[agent_addr].environments
-
-                    job = self._waiting_jobs_pq.get(topics)
-                    priority, insert_time, client_addr, job_id, job_msg = job
-
-                    # Ensure the job has not been removed (killed)
-                    if job_id not in self._waiting_jobs:
-                        job = None  # repeat the while loop. we need a job
-            except queue.Empty:
-                continue  # skip agent, nothing to do!
-
-            # We have found a job, let's remove the agent from the available list
-            self._available_agents.remove(agent_addr)
-
-            # Remove the job from the queue
-            del self._waiting_jobs[job_id]
-
-            # Send the job to agent
-            self._job_running[job_id] = RunningJob(agent_addr, client_addr, job_msg, time.time())
-            self._logger.info("Sending job %s %s to agent %s", client_addr, job_id, agent_addr)
-            await ZMQUtils.send_with_addr(self._agent_socket, agent_addr, BackendNewJob(job_id, job_msg.taskset_id, job_msg.task_id,
-                                                                                        job_msg.task_problems, job_msg.inputdata,
-                                                                                        job_msg.environment_type,
-                                                                                        job_msg.environment,
-                                                                                        job_msg.environment_parameters,
-                                                                                        job_msg.debug))
+            topics = self._registered_agents[agent_addr].environments
+            while free_slots > 0:
+                try:
+                    sort_key, insert_time, client_addr, job_id, job_msg = self._waiting_jobs_pq.get(topics)
+                except queue.Empty:
+                    break  # nothing to do for this agent
+                self._scheduling_policy.job_dispatched(job_msg, sort_key)
+
+                # Remove the job from the queue
+                del self._waiting_jobs[job_id]
+                free_slots -= 1
+
+                self._job_running[job_id] = RunningJob(agent_addr, client_addr, job_msg, time.time())
+                self._logger.info("Sending job %s %s to agent %s", client_addr, job_id, agent_addr)
+                jobs_to_send.setdefault(agent_addr, []).append(
+                    BackendNewJob(job_id, job_msg.taskset_id, job_msg.task_id, job_msg.task_problems,
+                                  job_msg.inputdata, job_msg.environment_type, job_msg.environment,
+                                  job_msg.environment_parameters, job_msg.debug))
+
+            # Update the number of free slots of the agent
+            if free_slots == 0:
+                del self._available_agents[agent_addr]
+            else:
+                self._available_agents[agent_addr] = free_slots
+
+        # Send the jobs to the agents
+        for agent_addr, messages in jobs_to_send.items():
+            await ZMQUtils.send_many_with_addr(self._agent_socket, agent_addr, messages)
 
     async def handle_agent_hello(self, agent_addr, message: AgentHello):
         """
@@ -234,9 +259,10 @@ class Backend(object):
             await self._delete_agent(agent_addr)
 
         self._registered_agents[agent_addr] = AgentInfo(message.friendly_name,
-                                                        [(etype, env) for etype, envs in
-                                                         message.available_environments.items() for env in envs])
-        self._available_agents.extend([agent_addr for _ in range(0, message.available_job_slots)])
+                                                        frozenset((etype, env) for etype, envs in
+                                                                  message.available_environments.items() for env in envs))
+        if message.available_job_slots > 0:
+            self._available_agents[agent_addr] = message.available_job_slots
         self._ping_count[agent_addr] = 0
 
         # update information about available environments
@@ -288,8 +314,13 @@ class Backend(object):
         self._logger.debug("Job %s started on agent %s", message.job_id, agent_addr)
         if message.job_id not in self._job_running:
             self._logger.warning("Agent %s said job %s was running, but it is not in the list of running jobs", agent_addr, message.job_id)
+            return
+
+        # The job really starts now, not when it was sent to the agent
+        running_job = self._job_running[message.job_id]._replace(time_started=time.time())
+        self._job_running[message.job_id] = running_job
 
-        await ZMQUtils.send_with_addr(self._client_socket, self._job_running[message.job_id].client_addr, BackendJobStarted(message.job_id))
+        await ZMQUtils.send_with_addr(self._client_socket, running_job.client_addr, BackendJobStarted(message.job_id))
 
     async def handle_agent_job_done(self, agent_addr, message: AgentJobDone):
         """Handle an AgentJobDone message. Send the data back to the client, and start new job if needed"""
@@ -301,8 +332,11 @@ class Backend(object):
                 self._logger.info("Job %s finished on agent %s", message.job_id, agent_addr)
                 # Remove the job from the list of running jobs
                 running_job = self._job_running.pop(message.job_id)
+                # Jobs that crashed or were killed do not tell anything about the duration of the task
+                if message.result[0] not in ("crash", "killed"):
+                    self._job_durations.add(running_job.msg, time.time() - running_job.time_started)
                 # The agent is available now
-                self._available_agents.append(agent_addr)
+                self._available_agents[agent_addr] = self._available_agents.get(agent_addr, 0) + 1
 
                 await ZMQUtils.send_with_addr(self._client_socket, running_job.client_addr,
                                               BackendJobDone(message.job_id, message.result, message.grade,
@@ -381,7 +415,7 @@ class Backend(object):
 
     async def _delete_agent(self, agent_addr):
         """ Deletes an agent """
-        self._available_agents = [agent for agent in self._available_agents if agent != agent_addr]
+        self._available_agents.pop(agent_addr, None)
         del self._registered_agents[agent_addr]
         await self._recover_jobs()
 
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Statistics about the observed durations of the jobs, used to estimate the duration of the next ones """
+
+from collections import OrderedDict
+from typing import Optional
+
+from inginious.common.messages import ClientNewJob
+
+# Upper bounds of the buckets of the histograms, in seconds, from 100ms to about 2 hours.
+# The last bucket contains all the durations above the last bound.
+_BUCKET_BOUNDS = [0.1 * 1.5 ** i for i in range(28)]
+
+
+class DurationHistogram(object):
+    """
+        Histogram of durations with logarithmic buckets. Observations fade out exponentially: the weight of an
+        observation is halved each `half_life` new observations, so that the histogram follows the recent behaviour of
+        a task.
+    """
+
+    def __init__(self, half_life=50):
+        self._counts = [0.0] * (len(_BUCKET_BOUNDS) + 1)
+        self._total = 0.0
+        self._decay = 0.5 ** (1.0 / half_life)
+
+    def __len__(self):
+        """ Returns the (decayed) number of observations """
+        return int(round(self._total))
+
+    def add(self, duration: float):
+        counts = self._counts
+        decay = self._decay
+        for i in range(len(counts)):
+            counts[i] *= decay
+
+        bucket = 0
+        while bucket < len(_BUCKET_BOUNDS) and duration > _BUCKET_BOUNDS[bucket]:
+            bucket += 1
+        counts[bucket] += 1.0
+        self._total = self._total * decay + 1.0
+
+    def quantile(self, q: float) -> Optional[float]:
+        """ Returns an approximation of the quantile `q` (between 0 and 1), or None if the histogram is empty """
+        if self._total == 0:
+            return None
+        target = q * self._total
+        cumulated = 0.0
+        for i, count in enumerate(self._counts):
+            cumulated += count
+            if cumulated >= target and count > 0:
+                return self._bucket_value(i)
+        return self._bucket_value(len(self._counts) - 1)
+
+    def mean(self) -> Optional[float]:
+        """ Returns an approximation of the mean, or None if the histogram is empty """
+        if self._total == 0:
+            return None
+        return sum(count * self._bucket_value(i) for i, count in enumerate(self._counts) if count) / self._total
+
+    @staticmethod
+    def _bucket_value(i):
+        """ Returns a representative value (the geometric middle) of a bucket """
+        if i == 0:
+            return _BUCKET_BOUNDS[0] / 2
+        if i == len(_BUCKET_BOUNDS):
+            return _BUCKET_BOUNDS[-1]
+        return (_BUCKET_BOUNDS[i - 1] * _BUCKET_BOUNDS[i]) ** 0.5
+
+
+class JobDurations(object):
+    """
+        Duration histograms of the jobs, per (taskset_id, task_id, environment). Only the `max_tasks` most recently
+        used tasks are kept.
+    """
+
+    def __init__(self, max_tasks=10000, half_life=50, min_observations=3):
+        """
+        :param max_tasks: maximum number of histograms kept in memory
+        :param half_life: number of observations after which the weight of an observation is halved
+        :param min_observations: minimum number of observations needed to give an estimate
+        """
+        self._histograms = OrderedDict()
+        self._max_tasks = max_tasks
+        self._half_life = half_life
+        self._min_observations = min_observations
+
+    def add(self, job: ClientNewJob, duration: float):
+        """ Records the duration of a job """
+        key = (job.taskset_id, job.task_id, job.environment)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = DurationHistogram(self._half_life)
+            if len(self._histograms) > self._max_tasks:
+                self._histograms.popitem(last=False)
+        else:
+            self._histograms.move_to_end(key)
+        histogram.add(duration)
+
+    def get_histogram(self, job: ClientNewJob) -> Optional[DurationHistogram]:
+        """ Returns the histogram of the durations of the jobs of the same task as `job`, if there is enough data """
+        histogram = self._histograms.get((job.taskset_id, job.task_id, job.environment))
+        if histogram is None or len(histogram) < self._min_observations:
+            return None
+        return histogram
+
+    def get_expected_duration(self, job: ClientNewJob) -> Optional[float]:
+        """ Returns the expected duration of a job, in seconds, or None if unknown """
+        histogram = self.get_histogram(job)
+        return histogram.mean() if histogram is not None else None
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Scheduling policies of the backend.
+
+    A scheduling policy gives a sort key to each job entering the waiting queue of the backend. Waiting jobs are then
+    given to the agents by increasing sort key. Sort keys always begin with the priority of the job, so that a job
+    with a higher priority (a smaller value) is always run first.
+"""
+
+from abc import ABCMeta, abstractmethod
+from typing import Any, Dict, Optional
+
+from inginious.backend.job_durations import JobDurations
+from inginious.common.messages import ClientNewJob
+
+
+class SchedulingPolicy(metaclass=ABCMeta):
+    """ Decides the order in which waiting jobs are given to the agents """
+
+    def __init__(self, config: Dict[str, Any], job_durations: Optional[JobDurations] = None):
+        """
+        :param config: the configuration of the policy. See the documentation of each policy.
+        :param job_durations: the statistics about the durations of the jobs, fed by the backend
+        """
+        self._config = config
+        self._job_durations = job_durations if job_durations is not None else JobDurations()
+
+    @classmethod
+    @abstractmethod
+    def get_id(cls):
+        """ Returns the policy id, used in the backend configuration """
+        pass
+
+    @abstractmethod
+    def get_sort_key(self, job: ClientNewJob, time_received: float) -> tuple:
+        """
+        Called when a job enters the queue.
+
+        :param job: the job
+        :param time_received: the time at which the backend received the job
+        :return: a comparable tuple. Jobs with the smallest keys are run first.
+        """
+        pass
+
+    def job_dispatched(self, job: ClientNewJob, sort_key: tuple):
+        """ Called when a job leaves the queue to be run on an agent """
+        pass
+
+
+class FIFOPolicy(SchedulingPolicy):
+    """ Runs the jobs by priority, then by order of arrival. This is the default policy. """
+
+    @classmethod
+    def get_id(cls):
+        return "fifo"
+
+    def get_sort_key(self, job, time_received):
+        return job.priority, time_received
+
+
+def _get_weights(config):
+    """ Reads the weights of the flows, and the default weight, from the configuration of a policy """
+    weights = {flow: float(weight) for flow, weight in config.get("weights", {}).items()}
+    default_weight = float(config.get("default_weight", 1))
+    if default_weight <= 0 or any(weight <= 0 for weight in weights.values()):
+        raise ValueError("Flow weights should be strictly positive")
+    return weights, default_weight
+
+
+def _get_flow_function(flow):
+    """ Returns a function giving the flow (the entity sharing the agents with the others) of a job """
+    flows = {
+        "taskset": lambda job: job.taskset_id,
+        "launcher": lambda job: job.launcher
+    }
+    try:
+        return flows[flow]
+    except KeyError:
+        raise ValueError("Unknown flow %s, should be one of %s" % (flow, ", ".join(flows))) from None
+
+
+class WeightedFairQueuingPolicy(SchedulingPolicy):
+    """
+        Weighted fair queuing between flows (either tasksets or launchers, i.e. users), using self-clocked fair
+        queuing: each job receives a virtual finish time, equal to the finish time of the previous job of its flow
+        (or the current virtual time if the flow was idle) plus the inverse of the weight of the flow. The virtual time
+        is the finish time of the last dispatched job.
+
+        A flow that floods the queue thus only delays its own jobs.
+
+        Configuration:
+
+        - ``flow``: ``taskset`` (the default) or ``launcher``
+        - ``weights``: a dict associating a weight to some flows. The default weight is ``default_weight``, 1 if not set.
+    """
+
+    def __init__(self, config, job_durations=None):
+        super(WeightedFairQueuingPolicy, self).__init__(config, job_durations)
+        self._get_flow = _get_flow_function(config.get("flow", "taskset"))
+        self._weights, self._default_weight = _get_weights(config)
+        self._virtual_time = 0.0
+        self._last_finish: Dict[str, float] = {}  # virtual finish time of the last job of each flow
+
+    @classmethod
+    def get_id(cls):
+        return "wfq"
+
+    def get_cost(self, job: ClientNewJob) -> float:
+        """ Returns the cost of a job, in the unit of the virtual time """
+        return 1.0
+
+    def get_sort_key(self, job, time_received):
+        flow = self._get_flow(job)
+        start = max(self._virtual_time, self._last_finish.get(flow, 0.0))
+        finish = start + self.get_cost(job) / self._weights.get(flow, self._default_weight)
+        self._last_finish[flow] = finish
+        return job.priority, finish, time_received
+
+    def job_dispatched(self, job, sort_key):
+        self._virtual_time = max(self._virtual_time, sort_key[1])
+
+        # Idle flows are forgotten, as they would start at the virtual time anyway
+        if len(self._last_finish) > 1024:
+            self._last_finish = {flow: finish for flow, finish in self._last_finish.items()
+                                 if finish > self._virtual_time}
+
+
+class DeficitRoundRobinPolicy(SchedulingPolicy):
+    """
+        Deficit round robin between flows (by default, the tasksets). At each round, each flow can run ``quantum``
+        jobs, multiplied by its weight. The jobs are assigned to a round when they enter the queue, and are run round
+        after round, by order of arrival inside a round. A flow that was idle starts at the current round, and cannot
+        use the quantum of the rounds it missed.
+
+        Configuration:
+
+        - ``flow``: ``taskset`` (the default) or ``launcher``
+        - ``quantum``: the number of jobs a flow can run at each round, 1 by default
+        - ``weights``: a dict associating a weight to some flows. The default weight is ``default_weight``, 1 if not set.
+    """
+
+    def __init__(self, config, job_durations=None):
+        super(DeficitRoundRobinPolicy, self).__init__(config, job_durations)
+        self._get_flow = _get_flow_function(config.get("flow", "taskset"))
+        self._quantum = float(config.get("quantum", 1))
+        if self._quantum <= 0:
+            raise ValueError("The quantum should be strictly positive")
+        self._weights, self._default_weight = _get_weights(config)
+        self._round = 0
+        self._flows: Dict[str, list] = {}  # flow -> [last round used by the flow, quantum used by the flow in that round]
+
+    @classmethod
+    def get_id(cls):
+        return "drr"
+
+    def get_sort_key(self, job, time_received):
+        flow = self._get_flow(job)
+        state = self._flows.get(flow)
+        if state is None or state[0] < self._round:
+            state = self._flows[flow] = [self._round, 0.0]
+
+        allowance = self._quantum * self._weights.get(flow, self._default_weight)
+        # Go to the next round(s) when the quantum of the flow for the current round is exhausted
+        while state[1] + 1.0 > allowance:
+            state[0] += 1
+            state[1] -= allowance
+        state[1] += 1.0
+        return job.priority, state[0], time_received
+
+    def job_dispatched(self, job, sort_key):
+        if sort_key[1] > self._round:
+            self._round = sort_key[1]
+            # Flows that did not use the current round are forgotten
+            if len(self._flows) > 1024:
+                self._flows = {flow: state for flow, state in self._flows.items() if state[0] >= self._round}
+
+
+class ShortestExpectedJobFirstPolicy(SchedulingPolicy):
+    """
+        Runs the jobs whose expected duration, according to the durations observed for the same task, is the
+        shortest first. To avoid starving long jobs, the jobs are actually ordered by their arrival time plus
+        ``duration_factor`` times their expected duration: a job expected to last one second more than another one
+        overtakes it only if it arrived less than ``duration_factor`` seconds after it.
+
+        Configuration:
+
+        - ``duration_factor``: 10 by default
+        - ``default_duration``: the duration of the jobs of tasks without enough observations, in seconds. By default,
+          the time limit of the task, or 30 seconds if it has none.
+    """
+
+    def __init__(self, config, job_durations=None):
+        super(ShortestExpectedJobFirstPolicy, self).__init__(config, job_durations)
+        self._duration_factor = float(config.get("duration_factor", 10))
+        self._default_duration = config.get("default_duration", None)
+
+    @classmethod
+    def get_id(cls):
+        return "sejf"
+
+    def get_expected_duration(self, job: ClientNewJob) -> float:
+        """ Returns the expected duration of a job, in seconds """
+        expected = self._job_durations.get_expected_duration(job)
+        if expected is not None:
+            return expected
+        if self._default_duration is not None:
+            return float(self._default_duration)
+        try:
+            return float(job.environment_parameters["limits"]["time"])
+        except:
+            return 30.0
+
+    def get_sort_key(self, job, time_received):
+        return job.priority, time_received + self._duration_factor * self.get_expected_duration(job)
+
+
+policies = {policy.get_id(): policy for policy in [FIFOPolicy, WeightedFairQueuingPolicy, DeficitRoundRobinPolicy,
+                                                   ShortestExpectedJobFirstPolicy]}
+
+
+def create_scheduling_policy(config: Optional[Dict[str, Any]] = None,
+                             job_durations: Optional[JobDurations] = None) -> SchedulingPolicy:
+    """
+    Creates a scheduling policy from its configuration.
+
+    :param config: a dict, whose ``policy`` key is the id of the policy (``fifo`` if not set). The other keys are given
+                   to the policy. None is equivalent to an empty dict.
+    :param job_durations: the statistics about the durations of the jobs, fed by the backend
+    """
+    config = dict(config or {})
+    policy_id = config.pop("policy", FIFOPolicy.get_id())
+    try:
+        policy = policies[policy_id]
+    except KeyError:
+        raise ValueError("Unknown scheduling policy %s, should be one of %s" % (policy_id, ", ".join(policies))) from None
+    return policy(config, job_durations)
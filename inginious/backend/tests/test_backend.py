@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import asyncio
+
+import zmq.asyncio
+
+from inginious.backend.backend import Backend
+from inginious.common.messages import AgentHello, AgentJobDone, AgentJobStarted, BackendNewJob, BackendGetQueue, \
+    ClientGetQueue, ClientHello, ClientKillJob, ClientNewJob, BackendJobDone, load
+
+
+class FakeSocket(object):
+    """ Records the multipart frames sent by the backend """
+
+    def __init__(self):
+        self.frames = []
+
+    async def send_multipart(self, message):
+        self.frames.append((message[0], [load(part) for part in message[1:]]))
+
+    def messages(self, cls):
+        return [(addr, msg) for addr, msgs in self.frames for msg in msgs if isinstance(msg, cls)]
+
+
+def run_with_backend(scenario):
+    """ Runs the coroutine function `scenario` with a backend whose sockets are replaced by FakeSockets """
+    async def _run():
+        context = zmq.asyncio.Context()
+        try:
+            backend = Backend(context, "inproc://agent", "inproc://client")
+            backend._agent_socket.close()
+            backend._client_socket.close()
+            backend._agent_socket = FakeSocket()
+            backend._client_socket = FakeSocket()
+            await backend.handle_client_hello(b"client", ClientHello("test"))
+            await scenario(backend)
+        finally:
+            context.destroy()
+    asyncio.run(_run())
+
+
+def new_job(job_id, environment="default", priority=0):
+    return ClientNewJob(job_id, priority, "taskset", "task", {}, {}, "docker", environment, {}, False, "test")
+
+
+def hello(name, slots, environments):
+    return AgentHello(name, slots, {"docker": {env: {"id": env, "created": 0, "ports": []} for env in environments}})
+
+
+class TestBackendDispatch(object):
+
+    def test_batched_dispatch(self):
+        async def scenario(backend):
+            for i in range(5):
+                await backend.handle_client_new_job(b"client", new_job("job%d" % i))
+            await backend.handle_agent_hello(b"agent1", hello("agent1", 3, ["default"]))
+
+            # all the jobs for an agent are sent in a single frame
+            assert [(addr, len(msgs)) for addr, msgs in backend._agent_socket.frames] == [(b"agent1", 3)]
+            assert b"agent1" not in backend._available_agents
+
+            await backend.handle_agent_hello(b"agent2", hello("agent2", 4, ["default"]))
+            assert backend._available_agents == {b"agent2": 2}
+            assert len(backend._agent_socket.messages(BackendNewJob)) == 5
+            assert len(backend._waiting_jobs) == 0
+            assert len(backend._job_running) == 5
+
+        run_with_backend(scenario)
+
+    def test_environments_and_slots(self):
+        async def scenario(backend):
+            await backend.handle_agent_hello(b"agent1", hello("agent1", 1, ["env1"]))
+            await backend.handle_client_new_job(b"client", new_job("job1", "env2"))
+            await backend.handle_client_new_job(b"client", new_job("job2", "env1"))
+            await backend.handle_client_new_job(b"client", new_job("job3", "env1"))
+
+            sent = backend._agent_socket.messages(BackendNewJob)
+            assert [msg.job_id for _, msg in sent] == ["job2"]
+
+            await backend.handle_agent_job_done(b"agent1", AgentJobDone("job2", ("success", ""), 100.0, {}, {}, {},
+                                                                        "", None, "", ""))
+            sent = backend._agent_socket.messages(BackendNewJob)
+            assert [msg.job_id for _, msg in sent] == ["job2", "job3"]
+            assert list(backend._waiting_jobs) == ["job1"]
+
+        run_with_backend(scenario)
+
+    def test_kill_waiting_job(self):
+        async def scenario(backend):
+            await backend.handle_client_new_job(b"client", new_job("job1"))
+            await backend.handle_client_new_job(b"client", new_job("job2"))
+            await backend.handle_client_kill_job(b"client", ClientKillJob("job1"))
+            assert backend._client_socket.messages(BackendJobDone)[0][1].result[0] == "killed"
+
+            await backend.handle_agent_hello(b"agent1", hello("agent1", 2, ["default"]))
+            assert [msg.job_id for _, msg in backend._agent_socket.messages(BackendNewJob)] == ["job2"]
+            assert backend._available_agents == {b"agent1": 1}
+
+        run_with_backend(scenario)
+
+
+class TestBackendJobDurations(object):
+
+    def test_expected_durations(self):
+        async def scenario(backend):
+            await backend.handle_agent_hello(b"agent1", hello("agent1", 1, ["default"]))
+            for i in range(3):
+                await backend.handle_client_new_job(b"client", new_job("job%d" % i))
+                await backend.handle_agent_job_started(b"agent1", AgentJobStarted("job%d" % i))
+                await backend.handle_agent_job_done(b"agent1", AgentJobDone("job%d" % i, ("success", ""), 100.0, {},
+                                                                            {}, {}, "", None, "", ""))
+
+            await backend.handle_client_new_job(b"client", new_job("job3"))
+            await backend.handle_client_new_job(b"client", new_job("job4", "other"))
+            await backend.handle_client_get_queue(b"client", ClientGetQueue())
+            queue = backend._client_socket.messages(BackendGetQueue)[0][1]
+            assert [job[0] for job in queue.jobs_running] == ["job3"]
+            assert [job[0] for job in queue.jobs_waiting] == ["job4"]
+            assert list(queue.expected_durations) == ["job3"]
+            assert queue.expected_durations["job3"] < 1.0
+
+        run_with_backend(scenario)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+from inginious.backend.job_durations import DurationHistogram, JobDurations
+from inginious.common.messages import ClientNewJob
+
+
+def new_job(task_id):
+    return ClientNewJob("job", 0, "taskset", task_id, {}, {}, "docker", "default", {}, False, "user")
+
+
+class TestDurationHistogram(object):
+
+    def test_empty(self):
+        histogram = DurationHistogram()
+        assert histogram.mean() is None
+        assert histogram.quantile(0.5) is None
+
+    def test_quantiles(self):
+        histogram = DurationHistogram(half_life=1000)
+        for _ in range(90):
+            histogram.add(1.0)
+        for _ in range(10):
+            histogram.add(60.0)
+        assert 0.7 < histogram.quantile(0.5) < 1.3
+        assert 40 < histogram.quantile(0.99) < 90
+        assert 5 < histogram.mean() < 9
+
+    def test_fade_out(self):
+        histogram = DurationHistogram(half_life=10)
+        for _ in range(100):
+            histogram.add(60.0)
+        for _ in range(50):
+            histogram.add(1.0)
+        assert histogram.quantile(0.9) < 2
+
+
+class TestJobDurations(object):
+
+    def test_expected_duration(self):
+        durations = JobDurations(min_observations=2)
+        durations.add(new_job("task1"), 10.0)
+        assert durations.get_expected_duration(new_job("task1")) is None
+        durations.add(new_job("task1"), 10.0)
+        assert 8 < durations.get_expected_duration(new_job("task1")) < 12
+        assert durations.get_expected_duration(new_job("task2")) is None
+
+    def test_bounded(self):
+        durations = JobDurations(max_tasks=10, min_observations=1)
+        for i in range(20):
+            durations.add(new_job("task%d" % i), 1.0)
+        assert durations.get_expected_duration(new_job("task0")) is None
+        assert durations.get_expected_duration(new_job("task19")) is not None
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import pytest
+
+from inginious.backend.job_durations import JobDurations
+from inginious.backend.scheduling_policies import create_scheduling_policy, FIFOPolicy, WeightedFairQueuingPolicy, \
+    DeficitRoundRobinPolicy
+from inginious.backend.topic_priority_queue import TopicPriorityQueue
+from inginious.common.messages import ClientNewJob
+
+
+def new_job(job_id, taskset_id, launcher="user", priority=0):
+    return ClientNewJob(job_id, priority, taskset_id, "task", {}, {}, "docker", "default", {}, False, launcher)
+
+
+def schedule(policy, jobs):
+    """ Queues all the jobs, then returns the order in which they are dispatched """
+    q = TopicPriorityQueue()
+    for i, job in enumerate(jobs):
+        q.put("default", (policy.get_sort_key(job, float(i)), job.job_id, job), job.job_id)
+    order = []
+    while not q.empty():
+        sort_key, job_id, job = q.get()
+        policy.job_dispatched(job, sort_key)
+        order.append(job_id)
+    return order
+
+
+class TestSchedulingPolicies(object):
+
+    def test_create(self):
+        assert isinstance(create_scheduling_policy(None), FIFOPolicy)
+        assert isinstance(create_scheduling_policy({"policy": "wfq", "flow": "launcher"}), WeightedFairQueuingPolicy)
+        assert isinstance(create_scheduling_policy({"policy": "drr", "quantum": 2}), DeficitRoundRobinPolicy)
+        with pytest.raises(ValueError):
+            create_scheduling_policy({"policy": "unknown"})
+        with pytest.raises(ValueError):
+            create_scheduling_policy({"policy": "wfq", "flow": "unknown"})
+        with pytest.raises(ValueError):
+            create_scheduling_policy({"policy": "drr", "weights": {"a": 0}})
+
+    def test_fifo(self):
+        jobs = [new_job("a1", "a"), new_job("a2", "a"), new_job("b1", "b"), new_job("p", "b", priority=-1)]
+        assert schedule(FIFOPolicy({}), jobs) == ["p", "a1", "a2", "b1"]
+
+    @pytest.mark.parametrize("policy", ["wfq", "drr"])
+    def test_flooding_taskset(self, policy):
+        jobs = [new_job("a%d" % i, "a") for i in range(4)] + [new_job("b1", "b"), new_job("b2", "b")]
+        assert schedule(create_scheduling_policy({"policy": policy}), jobs) == ["a0", "b1", "a1", "b2", "a2", "a3"]
+
+    @pytest.mark.parametrize("policy", ["wfq", "drr"])
+    def test_weights(self, policy):
+        jobs = [new_job("a%d" % i, "a") for i in range(4)] + [new_job("b%d" % i, "b") for i in range(4)]
+        order = schedule(create_scheduling_policy({"policy": policy, "weights": {"a": 2}}), jobs)
+        assert order[:6] == ["a0", "a1", "b0", "a2", "a3", "b1"]
+
+    def test_per_launcher(self):
+        jobs = [new_job("u%d" % i, "a", "spammer") for i in range(3)] + [new_job("v", "a", "student")]
+        assert schedule(create_scheduling_policy({"policy": "wfq", "flow": "launcher"}), jobs) == ["u0", "v", "u1", "u2"]
+
+    def test_idle_flow_does_not_accumulate(self):
+        policy = create_scheduling_policy({"policy": "drr"})
+        assert schedule(policy, [new_job("a%d" % i, "a") for i in range(5)]) == ["a%d" % i for i in range(5)]
+        # b was idle during the five first rounds, it cannot run five jobs in a row now. a already used the current round.
+        jobs = [new_job("a5", "a"), new_job("a6", "a"), new_job("b0", "b"), new_job("b1", "b")]
+        assert schedule(policy, jobs) == ["b0", "a5", "b1", "a6"]
+
+    def test_shortest_expected_job_first(self):
+        job_durations = JobDurations(min_observations=1)
+        for _ in range(5):
+            job_durations.add(new_job("x", "a"), 60.0)
+            job_durations.add(new_job("x", "b"), 1.0)
+        policy = create_scheduling_policy({"policy": "sejf", "duration_factor": 1}, job_durations)
+        # the long job only keeps its place if it arrived long enough before the short ones
+        jobs = [new_job("a1", "a"), new_job("b1", "b"), new_job("b2", "b")]
+        assert schedule(policy, jobs) == ["b1", "b2", "a1"]
+        assert policy.get_sort_key(new_job("a2", "a"), 0.0) < policy.get_sort_key(new_job("b3", "b"), 100.0)
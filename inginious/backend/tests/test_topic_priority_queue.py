@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import queue
+import random
+
+import pytest
+
+from inginious.backend.topic_priority_queue import TopicPriorityQueue
+
+
+class TestTopicPriorityQueue(object):
+
+    def test_get_order(self):
+        q = TopicPriorityQueue()
+        q.put("a", (3, "x"), "x")
+        q.put("b", (1, "y"), "y")
+        q.put("a", (2, "z"), "z")
+        assert len(q) == 3
+        assert q.get(["a"]) == (2, "z")
+        assert q.get(["a", "b"]) == (1, "y")
+        assert q.get() == (3, "x")
+        assert q.empty()
+
+    def test_get_unknown_topic(self):
+        q = TopicPriorityQueue()
+        q.put("a", (1, "x"))
+        assert q.empty(["b"])
+        with pytest.raises(queue.Empty):
+            q.get(["b"])
+
+    def test_remove(self):
+        q = TopicPriorityQueue()
+        q.put("a", (1, "x"), "x")
+        q.put("a", (2, "y"), "y")
+        q.put("b", (3, "z"), "z")
+        assert q.get(["a", "b"]) == (1, "x")
+        assert q.remove("y") == (2, "y")
+        assert "y" not in q
+        assert len(q) == 1
+        assert q.empty(["a"])
+        assert q.get(["a", "b"]) == (3, "z")
+        with pytest.raises(KeyError):
+            q.remove("y")
+
+    def test_duplicate_key(self):
+        q = TopicPriorityQueue()
+        q.put("a", (1, "x"), "x")
+        with pytest.raises(KeyError):
+            q.put("b", (2, "x"), "x")
+
+    def test_indexes_dropped(self):
+        q = TopicPriorityQueue()
+        for i in range(100):
+            q.put("t%d" % (i % 10), (i, "x"), i)
+            q.get(["t%d" % (i % 10), "agent%d" % i])
+        q.put("t0", (1, "y"), "y")
+        q.get(["t0", "t1"])
+        q.put("t1", (2, "z"), "z")
+        q.get(["t1", "t2"])
+        q.put("t0", (3, "w"), "w")
+        assert q.empty(["t0", "t1"]) is False
+        q.remove("w")
+        assert q._indexes == {}
+        assert all(not indexes for indexes in q._topic_indexes.values())
+
+    @pytest.mark.parametrize("put_ratio", [0.5, 0.3])
+    def test_random_against_naive(self, put_ratio):
+        """ Compares the queue with a naive implementation on a random sequence of operations """
+        rand = random.Random(42)
+        topics = ["t%d" % i for i in range(12)]
+        topic_sets = [rand.sample(topics, rand.randint(1, 6)) for _ in range(5)]
+        q = TopicPriorityQueue()
+        naive = {}  # key -> (topic, item)
+
+        for i in range(5000):
+            op = rand.random()
+            if op < put_ratio:
+                topic = rand.choice(topics)
+                item = (rand.randint(0, 3), i)
+                q.put(topic, item, i)
+                naive[i] = (topic, item)
+            elif op < put_ratio + 0.15 and naive:
+                key = rand.choice(list(naive))
+                assert q.remove(key) == naive.pop(key)[1]
+            else:
+                topic_set = rand.choice(topic_sets)
+                candidates = [(item, key) for key, (topic, item) in naive.items() if topic in topic_set]
+                if not candidates:
+                    assert q.empty(topic_set)
+                    with pytest.raises(queue.Empty):
+                        q.get(topic_set)
+                else:
+                    item, key = min(candidates)
+                    assert q.get(topic_set) == item
+                    del naive[key]
+            assert len(q) == len(naive)
@@ -1,5 +1,5 @@
 import queue
-from heapq import heappush, heappop
+from heapq import heappush, heappop, heapify, heapreplace
 
 
 class TopicPriorityQueue:
@@ -9,51 +9,194 @@ class TopicPriorityQueue:
         Uses python heaps behind the scenes, and thus maintains a natural ordering:
         the lowest element is returned first.
 
+        Elements can be removed by key in O(log n) (amortized). Removed entries are only flagged, and are discarded
+        from the heaps when they reach the top.
+
+        Each distinct set of topics given to get() is indexed: the index is a heap containing the heads of the topic
+        heaps it covers, updated each time one of these heads changes. Getting the best element for a set of topics
+        is thus in O(log n + log m) (amortized) instead of O(m), where m is the number of topics in the set. An index
+        is dropped as soon as all its topics are empty, so that the indexes of the sets of topics that are not used
+        anymore (for example, those of disconnected agents) do not accumulate.
+
         See the heapq library for more details.
     """
 
     def __init__(self):
-        self.queues = {}
+        self.queues = {}  # topic -> heap of entries [item, key, topic, removed]
         self.size = 0
+        self._entries = {}  # key -> entry, for entries that can be removed
+        self._indexes = {}  # frozenset of topics -> heap of (item, topic), containing (at least) the head of each topic
+        self._topic_indexes = {}  # topic -> set of the frozenset of topics indexes containing it
 
     def __len__(self):
         return self.size
 
+    def __contains__(self, key):
+        return key in self._entries
+
     def empty(self, topics=None):
         if topics is None:
             return self.size == 0
-        for topic in topics:
-            if topic in self.queues and len(self.queues[topic]) != 0:
-                return False
-        return True
+        return self._best_topic(topics) is None
 
-    def put(self, topic, item):
+    def put(self, topic, item, key=None):
         """
-        This operation is in O(log n), where n is the size of the queue for the given topic
+        This operation is in O(log n + k log m), where n is the size of the queue for the given topic and k is the
+        number of indexed sets of topics containing the topic
+
+        :param topic: the topic of the element
+        :param item: the element to add. Elements must be unique and comparable with each other.
+        :param key: an optional hashable key that allows to remove the element with remove(). Must be unique.
         """
+        if key is not None and key in self._entries:
+            raise KeyError("Key %s is already in the queue" % str(key))
+
+        entry = [item, key, topic, False]
         if topic not in self.queues:
             self.queues[topic] = []
-        heappush(self.queues[topic], item)
+            self._topic_indexes[topic] = {index for index in self._indexes if topic in index}
+
+        heap = self.queues[topic]
+        heappush(heap, entry)
+        if key is not None:
+            self._entries[key] = entry
         self.size += 1
 
+        if heap[0] is entry:
+            self._head_changed(topic)
+
+    def remove(self, key):
+        """
+        Removes the element associated with the given key. This operation is in O(log n) (amortized).
+
+        :return: the removed element
+        :raises: KeyError if the key is not in the queue
+        """
+        entry = self._entries.pop(key)
+        entry[3] = True
+        self.size -= 1
+
+        topic = entry[2]
+        heap = self.queues[topic]
+        if heap[0] is entry:
+            self._prune(heap)
+            self._head_changed(topic)
+        return entry[0]
+
     def get(self, topics=None):
         """
-        This operation is in O(m + log n) where m is the number of topics and n the size of the queue
+        This operation is in O(log n + log m) (amortized) where m is the number of topics and n the size of the queue.
+        The first call with a given set of topics builds its index in O(m).
 
         :param topics: a list of topics. If None, all topics are explored.
         :return: the smallest elements that fits in one of the topics
         :raises: queue.Empty exception if the queue has no elements that fits in any of the topics
         """
         if topics is None:
-            topics = self.queues.keys()
-
-        best_topic = None
-        best_elem = None
-        for topic in topics:
-            if topic in self.queues and len(self.queues[topic]) != 0 and (best_elem is None or best_elem > self.queues[topic][0]):
-                best_topic = topic
-                best_elem = self.queues[topic][0]
+            best_topic = self._best_topic(None)
+            index = None
+        else:
+            topics = frozenset(topics)
+            index = self._get_index(topics)
+            best_topic = self._best_indexed_topic(topics, index)
         if best_topic is None:
             raise queue.Empty()
+
+        heap = self.queues[best_topic]
+        item, key, _, _ = heappop(heap)
+        if key is not None:
+            del self._entries[key]
         self.size -= 1
-        return heappop(self.queues[best_topic])
+
+        self._prune(heap)
+        self._head_changed(best_topic, index)
+        return item
+
+    def _best_topic(self, topics):
+        """ Returns the topic, among the given ones, whose head is the smallest element, or None if they are empty """
+        if topics is None:
+            best_topic = None
+            best_elem = None
+            for topic, heap in self.queues.items():
+                if len(heap) != 0 and (best_elem is None or best_elem > heap[0][0]):
+                    best_topic = topic
+                    best_elem = heap[0][0]
+            return best_topic
+
+        topics = frozenset(topics)
+        return self._best_indexed_topic(topics, self._get_index(topics))
+
+    def _best_indexed_topic(self, topics, index):
+        """
+        Returns the topic at the top of the index of a set of topics, after removing its outdated heads. The index is
+        dropped if all its topics are empty.
+        """
+        queues = self.queues
+        while index:
+            item, topic = index[0]
+            heap = queues[topic]
+            if heap and heap[0][0] is item:
+                return topic
+            heappop(index)  # outdated head
+
+        del self._indexes[topics]
+        for topic in topics:
+            if topic in self._topic_indexes:
+                self._topic_indexes[topic].discard(topics)
+        return None
+
+    def _get_index(self, topics):
+        """
+        Returns the index associated with a set of topics, creating it if needed. Giving the topics as a frozenset
+        avoids a copy.
+        """
+        topics = frozenset(topics)
+        index = self._indexes.get(topics)
+        if index is None:
+            index = self._build_index(topics)
+            self._indexes[topics] = index
+            for topic in topics:
+                if topic in self._topic_indexes:
+                    self._topic_indexes[topic].add(topics)
+        return index
+
+    def _build_index(self, topics):
+        """ Creates a new index (a heap of topic heads) for a set of topics """
+        index = [(self.queues[topic][0][0], topic) for topic in topics
+                 if topic in self.queues and len(self.queues[topic]) != 0]
+        heapify(index)
+        return index
+
+    def _head_changed(self, topic, popped_index=None):
+        """
+        Pushes the new head of a topic inside the indexes that contain the topic.
+
+        :param popped_index: an index whose top is the previous head of the topic, which can thus be replaced directly
+        """
+        heap = self.queues[topic]
+        indexes = self._indexes
+        if not heap:
+            # Drops the indexes whose topics are all empty. Their other outdated heads are removed lazily.
+            for topics in list(self._topic_indexes[topic]):
+                index = indexes[topics]
+                if index is popped_index:
+                    heappop(index)
+                self._best_indexed_topic(topics, index)
+            return
+
+        head = (heap[0][0], topic)
+        for topics in self._topic_indexes[topic]:
+            index = indexes[topics]
+            if index is popped_index:
+                heapreplace(index, head)
+            elif len(index) > 4 * len(topics) + 16:
+                # too many outdated heads, compact the index
+                index[:] = self._build_index(topics)
+            else:
+                heappush(index, head)
+
+    @staticmethod
+    def _prune(heap):
+        """ Removes the removed entries at the top of a heap """
+        while heap and heap[0][3]:
+            heappop(heap)
@@ -180,17 +180,20 @@ class Client(BetterParanoidPirateClient):
 
         # Do some precomputation
         new_job_queue_cache = {}
-        # format is job_id: (nb_jobs_before, max_remaining_time)
+        # format is job_id: (nb_jobs_before, remaining_time)
+        # the remaining time is based on the expected duration of the jobs if known, on their time limit otherwise
         for (job_id, _, _2, _3, _4, start_time, max_time) in message.jobs_running:
+            duration = message.expected_durations.get(job_id, max_time)
             remaining = 0
-            if max_time > 0:
-                remaining = max(0, (start_time + max_time) - time.time())
+            if duration > 0:
+                remaining = max(0, (start_time + duration) - time.time())
             new_job_queue_cache[job_id] = (-1, remaining)
         wait_time = 0
         nb_tasks = 0
         for (job_id, _, _2, _3, timeout) in message.jobs_waiting:
-            if timeout > 0:
-                wait_time += timeout
+            duration = message.expected_durations.get(job_id, timeout)
+            if duration > 0:
+                wait_time += duration
             new_job_queue_cache[job_id] = (nb_tasks, wait_time)
             nb_tasks += 1
 
@@ -224,10 +227,11 @@ class Client(BetterParanoidPirateClient):
         except:
             self._logger.exception("Error occurred while calling ssh_callback for job %s", job_id)
 
-        # Call the callback
+        # Call the callback, outside of the event loop as it may block (to persist the result, for example)
         try:
-            callback(message.result, message.grade, message.problems, message.tests, message.custom, message.state,
-                     message.archive, message.stdout, message.stderr)
+            await self._loop.run_in_executor(None, lambda: callback(message.result, message.grade, message.problems,
+                                                                    message.tests, message.custom, message.state,
+                                                                    message.archive, message.stdout, message.stderr))
         except Exception as e:
             self._logger.exception("Failed to call the callback function for jobid %s: %s", job_id, repr(e),
                                    exc_info=True)
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Replays recorded submissions (the submission.test files of the tasks) through a Client, to check that their
+    grading did not change """
+
+import json
+import queue
+import time
+from collections import namedtuple
+
+OUTPUT_KEYS = ["result", "grade", "problems", "tests", "custom", "state", "archive", "stdout", "stderr"]
+
+# path: the path of the submission.test file, data: its content, with at least the input of the submission
+ReplayCase = namedtuple("ReplayCase", ["path", "taskset", "task", "data"])
+
+# differences: see compare_all_outputs. error: a message if the submission could not be replayed, None otherwise.
+# duration: time elapsed between the submission of the job and its result, in seconds. outputs: the new output of the
+# job, as a dict whose keys are OUTPUT_KEYS (None if the submission could not be replayed)
+ReplayResult = namedtuple("ReplayResult", ["case", "differences", "error", "duration", "outputs"])
+
+
+def compare_all_outputs(output1, output2, keys):
+    """
+    Compare both the output according to each key strategy
+    :param output1: output from the yaml
+    :param output2: output from the new job
+    :param keys: list of string, representing the keys for each value in the output
+    :return: a dict, whose the form is
+        {k: t,...} where k is a key whose the associated values in the outputs are different and t is a tuple containing
+        the values from both the outputs
+    """
+    return {
+            keys[i]: (output1[i], output2[i]) for i in range(len(keys))
+            if compare_output(output1[i], output2[i], keys[i]) and output1[i] is not None and output2[i] is not None
+        }
+
+
+def compare_output(output1, output2, key):
+    """
+    Compare atomic elements from the outputs
+    :param output1: atomic data structure from the yaml
+    :param output2: atomic data structure from the new job
+    :param key: key associated
+    :return: True if output1 and output2 are different, False otherwise
+    """
+
+    def result_compare(output1, output2):
+        """
+        Compare for the result key
+        :param output1: string
+        :param output2: tuple (string 1, string 2)
+        :return: True if output1 is different from the string 1 for output2
+        """
+        return output1 != output2[0]
+
+    def problems_compare(output1, output2):
+        """
+        Compare for the problems key
+        :param output1: dict whose each value is a list
+        :param output2: dict whose each value is a tuple
+        :return: True if output1 != output2, False otherwise
+        """
+        try:
+            for k in output1:  # same keys in output1 and output2
+                l = output1[k]  # in output1, values are lists of size 2
+                t = output2[k]  # in output2, values are tuples of size 2
+                if l[0] != t[0] or l[1] != t[1]:
+                    raise BaseException("")
+            return False
+        except:  # KeyError or BaseException => different outputs
+            return True
+
+    def archive_compare(output1, output2):
+        """
+        Return False because archives are always different
+        """
+        return False
+
+    def generic_compare(output1, output2):
+        """
+        Generic compare for keys
+        :param output1: string or different object (dict, list, ...)
+        :param output2: string or different object (dict, list, ...)
+        :return: see code
+        """
+        return output1 != output2
+
+    func = {
+        "result": result_compare,
+        "problems": problems_compare,
+        "archive": archive_compare
+    }
+    return func.get(key, generic_compare)(output1, output2)
+
+
+class ReplayEngine(object):
+    """
+        Replays ReplayCases through a Client, with at most `window` jobs submitted and not yet done at the same time, and
+        compares the new output of each job with the recorded one, for the given keys of the output (see OUTPUT_KEYS).
+    """
+
+    def __init__(self, client, window=16, keys=None, environment_timeout=60, launcher_name="Replay", debug=False):
+        """
+        :type client: inginious.client.client.AbstractClient
+        :param environment_timeout: time to wait, in seconds, for the environment of a task to be available
+        :param debug: True to run the jobs in debug mode, in which the stdout and stderr of the containers are returned
+        """
+        self._client = client
+        self._window = window
+        self._keys = keys if keys is not None else OUTPUT_KEYS
+        self._environment_timeout = environment_timeout
+        self._launcher_name = launcher_name
+        self._debug = debug
+        self._available_environments = set()
+
+    def replay(self, cases):
+        """ Replays the cases, and yields their ReplayResult as soon as they are done (not in the order of the cases) """
+        results = queue.Queue()
+        in_flight = 0
+        for case in cases:
+            while True:
+                try:
+                    result = results.get(block=in_flight >= self._window)
+                except queue.Empty:
+                    break
+                in_flight -= 1
+                yield result
+
+            if not self._wait_for_environment(case.task):
+                yield ReplayResult(case, {}, "Environment {}/{} not available".format(
+                    case.task.get_environment_type(), case.task.get_environment_id()), 0.0, None)
+                continue
+
+            self._submit(case, results)
+            in_flight += 1
+
+        for _ in range(in_flight):
+            yield results.get()
+
+    def _wait_for_environment(self, task):
+        """ Waits until the environment of the task is available to the client. Returns False after the timeout. """
+        environment = (task.get_environment_type(), task.get_environment_id())
+        deadline = time.monotonic() + self._environment_timeout
+        while environment not in self._available_environments:
+            if environment[1] in self._client.get_available_environments().get(environment[0], []):
+                self._available_environments.add(environment)
+            elif time.monotonic() < deadline:
+                time.sleep(0.1)
+            else:
+                return False
+        return True
+
+    def _submit(self, case, results):
+        """ Submits the job of a case. Its result is put in the results queue by the client. """
+        start = time.monotonic()
+
+        def job_done(result, grade, problems, tests, custom, state, archive, stdout, stderr):
+            outputs = dict(zip(OUTPUT_KEYS, [result, grade, problems, tests, custom, state, archive, stdout, stderr]))
+            differences = compare_all_outputs([case.data.get(key) for key in self._keys],
+                                              [outputs[key] for key in self._keys], self._keys)
+            results.put(ReplayResult(case, differences, None, time.monotonic() - start, outputs))
+
+        self._client.new_job(0, case.taskset, case.task, case.data["input"], job_done, self._launcher_name,
+                             self._debug)
+
+
+class ReplayReport(object):
+    """ Collects the ReplayResults of a replay, and summarizes them by task """
+
+    def __init__(self):
+        self._start = time.monotonic()
+        self._end = None
+        self.results = []
+
+    def add(self, result):
+        self.results.append(result)
+        self._end = time.monotonic()
+
+    def get_failed(self):
+        """ Returns the results whose output differs from the recorded one, or that could not be replayed """
+        return [result for result in self.results if result.differences or result.error is not None]
+
+    @staticmethod
+    def _get_status(result):
+        if result.error is not None:
+            return "error"
+        return "failed" if result.differences else "passed"
+
+    def to_dict(self):
+        """ Returns the report as a dict, with a summary, the results by task (with the time spent on each of them) and
+            the results of each case """
+        summary = {"cases": len(self.results), "passed": 0, "failed": 0, "error": 0,
+                   "duration": (self._end or self._start) - self._start}
+        tasks = {}
+        results = []
+        for result in self.results:
+            status = self._get_status(result)
+            summary[status] += 1
+
+            key = "{}/{}".format(result.case.taskset.get_id(), result.case.task.get_id())
+            task = tasks.setdefault(key, {"cases": 0, "passed": 0, "failed": 0, "error": 0, "duration": 0.0,
+                                          "max_duration": 0.0})
+            task["cases"] += 1
+            task[status] += 1
+            task["duration"] += result.duration
+            task["max_duration"] = max(task["max_duration"], result.duration)
+
+            results.append({"path": result.case.path, "taskset": result.case.taskset.get_id(),
+                            "task": result.case.task.get_id(), "status": status, "duration": result.duration,
+                            "differences": {key: {"expected": expected, "actual": actual}
+                                            for key, (expected, actual) in result.differences.items()},
+                            "error": result.error})
+        return {"summary": summary, "tasks": tasks, "results": results}
+
+    def to_json(self):
+        """ Returns the report in JSON. Values that cannot be encoded (bytes, for example) are given as strings. """
+        return json.dumps(self.to_dict(), default=str, indent=2)
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+
+import pytest
+import yaml
+
+from inginious.agent import Agent
+from inginious.backend.backend import Backend
+from inginious.client.client import Client
+from inginious.client.replay import ReplayCase, ReplayEngine, ReplayReport
+from inginious.common.filesystems.local import LocalFSProvider
+from inginious.frontend.arch_helper import start_asyncio_and_zmq
+from inginious.frontend.environment_types import register_base_env_types
+from inginious.frontend.task_dispensers.toc import TableOfContents
+from inginious.frontend.task_problems import get_default_displayable_problem_types
+from inginious.frontend.taskset_factory import create_factories
+
+
+class FakeAgent(Agent):
+    """ An in-process agent grading the answer to the problem "q" of the tasks: "42" succeeds. As the containers, it
+        only returns the output of the jobs in debug mode. """
+
+    def __init__(self, context, backend_addr, concurrency, filesystem, delay=0.02):
+        super().__init__(context, backend_addr, "Fake agent", concurrency, filesystem)
+        self.delay = delay
+        self.running = 0
+        self.max_running = 0
+
+    @property
+    def environments(self):
+        return {"docker": {"default": {"id": "default", "created": 0, "ports": []}}}
+
+    async def new_job(self, message):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(self.delay)
+        self.running -= 1
+        success = message.inputdata["q"] == "42"
+        await self.send_job_result(message.job_id, "success" if success else "failed", "feedback",
+                                   100.0 if success else 0.0, {}, {"correct": success}, {}, "", None,
+                                   "out" if message.debug else "", "")
+
+    async def kill_job(self, message):
+        pass
+
+
+@pytest.fixture
+def tasksets():
+    path = tempfile.mkdtemp()
+    os.makedirs(os.path.join(path, "taskset"))
+    with open(os.path.join(path, "taskset", "taskset.yaml"), "w") as f:
+        yaml.safe_dump({"name": "Taskset", "admins": []}, f)
+    for i in range(3):
+        os.makedirs(os.path.join(path, "taskset", "task%i" % i))
+        with open(os.path.join(path, "taskset", "task%i" % i, "task.yaml"), "w") as f:
+            yaml.safe_dump({"name": "Task %i" % i, "environment_id": "default", "environment_type": "docker",
+                            "problems": {"q": {"type": "code_single_line", "name": "Q", "header": ""}}}, f)
+
+    register_base_env_types()
+    fs_provider = LocalFSProvider(path)
+    taskset_factory, _, _ = create_factories(fs_provider, {TableOfContents.get_id(): TableOfContents},
+                                             get_default_displayable_problem_types())
+    yield fs_provider, taskset_factory.get_taskset("taskset")
+    shutil.rmtree(path)
+
+
+@pytest.fixture
+def arch(tasksets):
+    """ A client connected to a backend, with a fake agent running 4 jobs at the same time """
+    fs_provider, _ = tasksets
+    context, thread = start_asyncio_and_zmq()
+    client = Client(context, "inproc://backend_client")
+    backend = Backend(context, "inproc://backend_agent", "inproc://backend_client")
+    agent = FakeAgent(context, "inproc://backend_agent", 4, fs_provider)
+    loop = client._loop
+    loop.call_soon_threadsafe(loop.create_task, agent.run())
+    loop.call_soon_threadsafe(loop.create_task, backend.run())
+    client.start()
+    yield client, agent
+
+    async def shutdown():
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        loop.stop()
+    asyncio.run_coroutine_threadsafe(shutdown(), loop)
+    thread.join()
+
+
+def make_cases(taskset, count):
+    """ Cases alternating a good and a bad answer, all of them recorded as successful """
+    return [ReplayCase("task%i/test/%i.test" % (i % 3, i), taskset, taskset.get_task("task%i" % (i % 3)),
+                       {"input": {"q": "42" if i % 2 == 0 else "41"}, "result": "success", "grade": 100.0,
+                        "tests": {"correct": True}})
+            for i in range(count)]
+
+
+class TestReplayEngine(object):
+
+    def test_replay(self, tasksets, arch):
+        client, agent = arch
+        _, taskset = tasksets
+        report = ReplayReport()
+        for result in ReplayEngine(client, window=3, environment_timeout=10).replay(make_cases(taskset, 20)):
+            report.add(result)
+
+        assert 1 < agent.max_running <= 3
+        failed = report.get_failed()
+        assert sorted(result.case.path for result in failed) == sorted("task%i/test/%i.test" % (i % 3, i)
+                                                                       for i in range(1, 20, 2))
+        assert set(failed[0].differences) == {"result", "grade", "tests"}
+        assert failed[0].differences["result"][0] == "success"
+
+        data = json.loads(report.to_json())
+        assert data["summary"]["cases"] == 20 and data["summary"]["failed"] == 10
+        assert sum(task["cases"] for task in data["tasks"].values()) == 20
+        assert data["tasks"]["taskset/task0"]["duration"] > 0
+        assert all(result["status"] in ["passed", "failed"] for result in data["results"])
+
+    def test_keys(self, tasksets, arch):
+        client, _ = arch
+        _, taskset = tasksets
+        engine = ReplayEngine(client, window=8, keys=["tests"], environment_timeout=10)
+        results = list(engine.replay(make_cases(taskset, 4)))
+        assert [set(result.differences) for result in results if result.differences] == [{"tests"}, {"tests"}]
+
+    def test_debug(self, tasksets, arch):
+        client, _ = arch
+        _, taskset = tasksets
+        results = list(ReplayEngine(client, environment_timeout=10).replay(make_cases(taskset, 2)))
+        assert [result.outputs["stdout"] for result in results] == ["", ""]
+        results = list(ReplayEngine(client, environment_timeout=10, debug=True).replay(make_cases(taskset, 2)))
+        assert [result.outputs["stdout"] for result in results] == ["out", "out"]
+
+    def test_environment_unavailable(self, tasksets, arch):
+        client, _ = arch
+        _, taskset = tasksets
+        task = taskset.get_task("task0")
+        task._environment_id = "unknown"
+        results = list(ReplayEngine(client, environment_timeout=0.5).replay(make_cases(taskset, 1)))
+        assert results[0].error == "Environment docker/unknown not available"
+        assert ReplayReport().to_dict()["summary"]["cases"] == 0
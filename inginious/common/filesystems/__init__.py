@@ -140,3 +140,12 @@ class FileSystemProvider(metaclass=ABCMeta):
             ("url", None, url) where url is a url to a distant server which possess the file.
             ("invalid", None, None) if the file cannot be distributed
         """
+
+    def watch(self, callback):
+        """ Starts watching the changes made to the content of the prefix, by other processes as well. callback(path)
+            is then called from another thread for each changed file or folder, with its path relative to the prefix.
+
+            :returns: An object with a stop() method, or None if this provider cannot watch its content (the default).
+                      The callers must then check the modification times of the files themselves.
+        """
+        return None
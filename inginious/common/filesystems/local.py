@@ -1,14 +1,34 @@
 # coding=utf-8
 from __future__ import annotations
 
+import logging
 import mimetypes
 import os
 import shutil
 import zipstream
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+from watchdog.observers.polling import PollingObserver
 
 from inginious.common.filesystems import FileSystemProvider
 
 
+class _ChangeHandler(FileSystemEventHandler):
+    """ Forwards the paths of the changes seen by watchdog to a callback """
+    _IGNORED_EVENTS = {"opened", "closed_no_write"}  # simple reads
+
+    def __init__(self, prefix, callback):
+        self._prefix = prefix
+        self._callback = callback
+
+    def on_any_event(self, event):
+        if event.event_type in self._IGNORED_EVENTS:
+            return
+        for path in (event.src_path, getattr(event, "dest_path", "")):
+            if path:
+                self._callback(os.path.relpath(os.fsdecode(path), self._prefix))
+
+
 class LocalFSProvider(FileSystemProvider):
     """
     A FileSystemProvider that uses a real on-disk filesystem
@@ -106,6 +126,22 @@ class LocalFSProvider(FileSystemProvider):
         except:
             raise FileNotFoundError()
 
+    def watch(self, callback, polling_interval=5):
+        """ Watches the changes with inotify (or the native API of the OS), or, if it cannot be used (for instance when
+            the inotify watches are exhausted), by scanning the prefix every polling_interval seconds. """
+        handler = _ChangeHandler(self.prefix, callback)
+        try:
+            observer = Observer()
+            observer.schedule(handler, self.prefix, recursive=True)
+            observer.start()
+        except OSError:
+            logging.getLogger("inginious.fs").warning("Cannot watch %s natively, polling it every %i seconds",
+                                                      self.prefix, polling_interval, exc_info=True)
+            observer = PollingObserver(timeout=polling_interval)
+            observer.schedule(handler, self.prefix, recursive=True)
+            observer.start()
+        return observer
+
     def move(self, src, dest):
         self._checkpath(src)
         self._checkpath(dest)
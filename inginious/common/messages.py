@@ -5,7 +5,7 @@
 from typing import Dict, Type, Tuple, Union, Any, List, Optional
 
 import msgpack
-from dataclasses import dataclass, is_dataclass, asdict
+from dataclasses import dataclass, field, is_dataclass, asdict
 
 BackendJobId = str
 ClientJobId = str
@@ -132,9 +132,14 @@ class BackendGetQueue:
         - launcher is the name of the launcher, which may be anything
         - max_time the maximum time that can be used, or -1 if no timeout is set
 
+    - ``expected_durations`` : a dict associating, to the job ids of the running and waiting jobs, their expected
+      duration in seconds, according to the durations of the previous jobs of the same task. Jobs whose duration
+      cannot be estimated are not present.
+
     """
     jobs_running: List[Tuple[ClientJobId, bool, str, str, str, int, int]]
     jobs_waiting: List[Tuple[ClientJobId, bool, str, str, int]]
+    expected_durations: Dict[ClientJobId, float] = field(default_factory=dict)
 
 
 #################################################################
@@ -316,11 +321,23 @@ class ZMQUtils(object):
         message = [addr, dump(obj)]
         await socket.send_multipart(message)
 
+    @classmethod
+    async def send_many_with_addr(cls, socket, addr: bytes, objs):
+        """ Sends several messages to the same address in a single multipart frame. See recv_many. """
+        message = [addr] + [dump(obj) for obj in objs]
+        await socket.send_multipart(message)
+
     @classmethod
     async def recv(cls, socket, skip_first=False):
         message = await socket.recv_multipart()
         return load(message[0] if not skip_first else message[1])
 
+    @classmethod
+    async def recv_many(cls, socket):
+        """ Receives a multipart frame, that may contain multiple messages (see send_many_with_addr) """
+        message = await socket.recv_multipart()
+        return [load(part) for part in message]
+
     @classmethod
     async def send(cls, socket, obj, send_white=False):
         message_obj = dump(obj)
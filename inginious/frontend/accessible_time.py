@@ -6,10 +6,12 @@
 """ Contains AccessibleTime, class that represents the period of time when a course/task is accessible """
 
 from datetime import datetime
+from functools import lru_cache
 
 
+@lru_cache(maxsize=4096)
 def parse_date(date, default=None):
-    """ Parse a valid date """
+    """ Parse a valid date. The results are memoized, as the same dates are parsed for each task and user. """
     if date == "":
         if default is not None:
             return default
@@ -138,3 +140,58 @@ class AccessibleTime(object):
     def get_soft_end_date(self):
         """ Return a datetime object, representing the soft deadline for accessibility """
         return self._soft_end
+
+
+@lru_cache(maxsize=4096)
+def get_accessible_time(val=None):
+    """
+        Returns an AccessibleTime for val (see AccessibleTime.__init__). The instances are memoized and shared: they
+        must not be modified.
+    """
+    return AccessibleTime(val)
+
+
+class AccessibilityMatrix(object):
+    """
+        Accessibilities of a list of tasks for a list of users. Each user has a row of AccessibleTime, in the order
+        of the tasks. The users without specific accessibilities share the same default row.
+    """
+
+    def __init__(self, taskids, usernames, default_row, rows=None):
+        """
+        :param taskids: list of task ids
+        :param usernames: list of usernames
+        :param default_row: the AccessibleTime of each task, for the users that are not in rows
+        :param rows: dict username -> the AccessibleTime of each task for this user
+        """
+        self.taskids = list(taskids)
+        self.usernames = list(usernames)
+        self._task_index = {taskid: index for index, taskid in enumerate(self.taskids)}
+        self._default_row = tuple(default_row)
+        self._rows = rows or {}
+
+    def get_row(self, username):
+        """ Returns the AccessibleTime of each task for a user """
+        return self._rows.get(username, self._default_row)
+
+    def get(self, username, taskid):
+        """ Returns the AccessibleTime of a task for a user """
+        return self.get_row(username)[self._task_index[taskid]]
+
+    def get_started_tasks(self, when=None):
+        """ Returns a dict username -> list of the tasks that are or have been accessible to the user """
+        if when is None:
+            when = datetime.now()
+        started = {}  # id of a row -> started tasks, computed once per distinct row
+        result = {}
+        for username in self.usernames:
+            row = self.get_row(username)
+            if id(row) not in started:
+                started[id(row)] = [taskid for taskid, accessible_time in zip(self.taskids, row)
+                                    if accessible_time.after_start(when)]
+            result[username] = list(started[id(row)])
+        return result
+
+    def to_dict(self):
+        """ Returns a dict username -> dict taskid -> AccessibleTime """
+        return {username: dict(zip(self.taskids, self.get_row(username))) for username in self.usernames}
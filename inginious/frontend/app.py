@@ -23,14 +23,17 @@ import inginious.frontend.pages.preferences.utils as preferences_utils
 from inginious.frontend.environment_types import register_base_env_types
 from inginious.frontend.arch_helper import create_arch, start_asyncio_and_zmq
 from inginious.frontend.pages.utils import register_utils
+from inginious.frontend.parsable_text import ParsableText, RenderCache
 from inginious.frontend.plugin_manager import PluginManager
 from inginious.frontend.submission_manager import WebAppSubmissionManager
 from inginious.frontend.submission_manager import update_pending_jobs
+from inginious.frontend.submission_statistics import SubmissionStatisticsCache
 from inginious.frontend.template_helper import TemplateHelper
 from inginious.frontend.user_manager import UserManager
 from inginious.frontend.l10n_manager import L10nManager
 from inginious import get_root_path, __version__, DB_VERSION
 from inginious.frontend.taskset_factory import create_factories
+from inginious.frontend.course_user_summary import create_course_user_summary_indexes
 from inginious.common.entrypoints import filesystem_from_config_dict
 from inginious.common.filesystems.local import LocalFSProvider
 from inginious.frontend.lti_outcome_manager import LTIOutcomeManager
@@ -75,7 +78,9 @@ def _put_configuration_defaults(config):
         "ignore_change_ip": False,
         "httponly": True,
         "secret_key": "fLjUfxqXtfNoIldA0A0G",
-        "secure": False
+        "secure": False,
+        "refresh_interval": 60,
+        "cache_ttl": 0
     }
     for k, v in default_session_parameters.items():
         if k not in config['session_parameters']:
@@ -116,9 +121,12 @@ def get_homepath(ignore_session=False, force_cookieless=False):
         return request.url_root[:-1]
 
 
-def _close_app(mongo_client, client):
+def _close_app(mongo_client, client, submission_manager, task_factory, lti_outcome_manager):
     """ Ensures that the app is properly closed """
     client.close()
+    submission_manager.close()
+    lti_outcome_manager.stop()
+    task_factory.close()
     mongo_client.close()
 
 
@@ -149,6 +157,10 @@ def get_app(config):
         database.user_tasks.create_index([("courseid", pymongo.ASCENDING), ("taskid", pymongo.ASCENDING)])
         database.user_tasks.create_index([("courseid", pymongo.ASCENDING)])
         database.user_tasks.create_index([("username", pymongo.ASCENDING)])
+        database.course_registrations.create_index(
+            [("courseid", pymongo.ASCENDING), ("username", pymongo.ASCENDING)], unique=True)
+        database.course_registrations.create_index([("username", pymongo.ASCENDING)])
+        create_course_user_summary_indexes(database)
         database.db_version.insert_one({"db_version": DB_VERSION})
     elif db_version.get("db_version", 0) != DB_VERSION:
         raise Exception("Please update the database before running INGInious")
@@ -158,7 +170,8 @@ def get_app(config):
     flask_app.config.from_mapping(**config)
     flask_app.session_interface = MongoDBSessionInterface(
         mongo_client, config.get('mongo_opt', {}).get('database', 'INGInious'),
-        "sessions", config.get('SESSION_USE_SIGNER', False), True  # config.get('SESSION_PERMANENT', True)
+        "sessions", config.get('SESSION_USE_SIGNER', False), True,  # config.get('SESSION_PERMANENT', True)
+        config['session_parameters']["refresh_interval"], config['session_parameters']["cache_ttl"]
     )
 
     # Init gettext
@@ -219,17 +232,24 @@ def get_app(config):
 
     default_problem_types = get_default_displayable_problem_types()
 
-    taskset_factory, course_factory, task_factory = create_factories(fs_provider, default_task_dispensers, default_problem_types, plugin_manager, database)
+    taskset_factory, course_factory, task_factory = create_factories(fs_provider, default_task_dispensers, default_problem_types, plugin_manager, database,
+                                                                     config.get("watch_tasks", True),
+                                                                     config.get("watch_tasks_check_interval", 60))
 
     user_manager = UserManager(database, config.get('superadmins', []))
 
+    render_cache_size = config.get("render_cache_size", 2000)
+    ParsableText.set_cache(RenderCache(render_cache_size, database if config.get("render_cache_shared", False) else None)
+                           if render_cache_size else None)
+
     update_pending_jobs(database)
 
     client = create_arch(config, fs_provider, zmq_context, taskset_factory)
 
     lti_outcome_manager = LTIOutcomeManager(database, user_manager, course_factory)
 
-    submission_manager = WebAppSubmissionManager(client, user_manager, database, gridfs, plugin_manager, lti_outcome_manager)
+    submission_manager = WebAppSubmissionManager(client, user_manager, database, gridfs, plugin_manager, lti_outcome_manager,
+                                                 config.get("mcq_in_process", False))
     template_helper = TemplateHelper(plugin_manager, user_manager, config.get('use_minified_js', True))
 
     register_utils(database, user_manager, template_helper)
@@ -289,6 +309,7 @@ def get_app(config):
     flask_app.course_factory = course_factory
     flask_app.task_factory = task_factory
     flask_app.submission_manager = submission_manager
+    flask_app.submission_statistics_cache = SubmissionStatisticsCache(database)
     flask_app.user_manager = user_manager
     flask_app.l10n_manager = l10n_manager
     flask_app.template_helper = template_helper
@@ -318,4 +339,5 @@ def get_app(config):
     # Start the inginious.backend
     client.start()
 
-    return flask_app.wsgi_app, lambda: _close_app(mongo_client, client)
+    return flask_app.wsgi_app, lambda: _close_app(mongo_client, client, submission_manager, task_factory,
+                                                   lti_outcome_manager)
@@ -93,7 +93,8 @@ def create_arch(configuration, tasks_fs, context, taskset_factory):
         from inginious.backend.backend import Backend
 
         client = Client(context, "inproc://backend_client")
-        backend = Backend(context, "inproc://backend_agent", "inproc://backend_client")
+        backend = Backend(context, "inproc://backend_agent", "inproc://backend_client",
+                          local_config.get("scheduling", None))
         agent_docker = DockerAgent(context, "inproc://backend_agent", "Docker - Local agent", concurrency, tasks_fs, debug_host, debug_ports, tmp_dir, ssh_allowed=True)
         agent_mcq = MCQAgent(context, "inproc://backend_agent", "MCQ - Local agent", 1, tasks_fs, taskset_factory.get_task_factory().get_problem_types())
 
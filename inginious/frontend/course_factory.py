@@ -5,6 +5,9 @@
 
 """ Factory for loading courses from disk """
 
+import threading
+
+from bson.objectid import ObjectId
 from pymongo import ReturnDocument
 
 from inginious.frontend.log import get_course_logger
@@ -14,13 +17,21 @@ from inginious.frontend.courses import Course
 
 
 class CourseFactory(object):
-    """ Load courses from disk """
+    """
+        Load courses from the database.
+
+        The Course objects are cached in the process. Each update of a course descriptor through the factory stores
+        a new random version in the descriptor, so that the processes sharing the database notice the change by
+        only reading this version.
+    """
 
     def __init__(self, taskset_factory, task_factory, plugin_manager, database):
         self._taskset_factory = taskset_factory
         self._task_factory = task_factory
         self._plugin_manager = plugin_manager
         self._database = database
+        self._cache = {}  # courseid -> (version, Course)
+        self._cache_lock = threading.Lock()
 
         self._migrate_legacy_courses()
 
@@ -43,16 +54,20 @@ class CourseFactory(object):
         return self._task_factory
 
     def get_course_descriptor_content(self, courseid):
-        return self._database.courses.find_one({"_id": courseid})
+        """ Returns the descriptor of a course, without its (potentially long) list of students """
+        return self._database.courses.find_one({"_id": courseid}, {"students": 0})
 
     def update_course_descriptor_content(self, courseid, course_content):
+        course_content = dict(course_content, version=ObjectId())
         self._database.courses.find_one_and_update({"_id": courseid}, {"$set": course_content})
+        self._invalidate_course(courseid)
 
     def update_course_descriptor_element(self, courseid, key, value):
-        self._database.courses.find_one_and_update({"_id": courseid}, {"$set": {key: value}})
+        self._database.courses.find_one_and_update({"_id": courseid}, {"$set": {key: value, "version": ObjectId()}})
+        self._invalidate_course(courseid)
 
     def import_legacy_course(self, database, courseid):
-        course_desc = self.get_course_descriptor_content(courseid)
+        course_desc = self._database.courses.find_one({"_id": courseid})
         database.courses.find_one_and_update({"_id": courseid}, {"$set": course_desc}, upsert=True,
                                                       return_document=ReturnDocument.AFTER)
 
@@ -62,22 +77,29 @@ class CourseFactory(object):
             raise CourseAlreadyExistsException()
 
         descriptor["_id"] = courseid
+        descriptor["version"] = ObjectId()
         self._database.courses.insert_one(descriptor)
 
     def get_course(self, courseid):
+        version = self._database.courses.find_one({"_id": courseid}, {"version": 1})
+        course = self._get_cached_course(courseid, version.get("version")) if version is not None else None
+        if course is not None:
+            return course
+
         course_desc = self.get_course_descriptor_content(courseid)
         try:
-            return Course(courseid, course_desc, self._taskset_factory, self._task_factory, self._plugin_manager, self._database)
+            return self._create_course(courseid, course_desc)
         except Exception as e:
             raise CourseNotFoundException()
 
     def get_all_courses(self):
-        course_descriptors = self._database.courses.find({})
+        course_descriptors = self._database.courses.find({}, {"students": 0})
         result = {}
         for course_desc in course_descriptors:
             courseid = course_desc["_id"]
             try:
-                result[courseid] = Course(courseid, course_desc, self._taskset_factory, self._task_factory, self._plugin_manager, self._database)
+                result[courseid] = self._get_cached_course(courseid, course_desc.get("version")) or \
+                                   self._create_course(courseid, course_desc)
             except Exception:
                 get_course_logger(courseid).warning("Cannot open course", exc_info=True)
 
@@ -85,6 +107,36 @@ class CourseFactory(object):
 
     def delete_course(self, courseid):
         self._database.courses.delete_one({"_id": courseid})
+        self._invalidate_course(courseid)
+
+    def _get_cached_course(self, courseid, version):
+        """ Returns the cached Course if it has the given version and its task set did not change, None otherwise """
+        with self._cache_lock:
+            cached = self._cache.get(courseid)
+        if cached is None or cached[0] != version:
+            return None
+        try:
+            if self._taskset_factory.get_taskset(cached[1].get_taskset().get_id()) is not cached[1].get_taskset():
+                return None
+        except Exception:
+            return None
+        return cached[1]
+
+    def _create_course(self, courseid, course_desc):
+        """ Creates a Course from its descriptor, and caches it """
+        version = course_desc.get("version") if course_desc is not None else None
+        # Legacy descriptors without task dispenser get one built from the current task list, that may change
+        cacheable = course_desc is not None and "task_dispenser" in course_desc
+        course = Course(courseid, course_desc, self._taskset_factory, self._task_factory, self._plugin_manager,
+                        self._database)
+        if cacheable:
+            with self._cache_lock:
+                self._cache[courseid] = (version, course)
+        return course
+
+    def _invalidate_course(self, courseid):
+        with self._cache_lock:
+            self._cache.pop(courseid, None)
 
     def _migrate_legacy_courses(self):
         courseids = []
@@ -113,6 +165,7 @@ class CourseFactory(object):
                     cleaned_taskset_descriptor["dispenser_data"] = taskset_descriptor.get("dispenser_data", {})
                 taskset_descriptor["tasksetid"] = courseid
                 taskset_descriptor["admins"] = taskset_descriptor.get("admins", []) + taskset_descriptor.get("tutors", [])
+                taskset_descriptor["version"] = ObjectId()
                 self._database.courses.update_one({"_id": courseid}, {"$set": taskset_descriptor}, upsert=True)
                 self._taskset_factory.update_taskset_descriptor_content(courseid, cleaned_taskset_descriptor)
             except TasksetNotFoundException as e:
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Materialized view of the user_tasks collection, with one document per course and per user:
+
+    ::
+
+        {"courseid": "course", "username": "user", "stamp": ObjectId(...),
+         "tasks": [{"taskid": "task1", "tried": 2, "succeeded": True, "grade": 100.0}, ...]}
+
+    The course-wide tables (grades, progress) are then read with a single indexed request, instead of aggregating the
+    user_tasks of all the students. The weights and the accessibility of the tasks depend on the course configuration
+    and on the current time: they are applied when reading the summaries.
+
+    The summaries of a user are recomputed from its user_tasks after each change. The stamp of the summary read before
+    the user_tasks must still be there when writing it, so that a summary computed from outdated user_tasks never
+    overwrites a newer one.
+"""
+
+import logging
+
+import pymongo
+from bson import ObjectId
+from pymongo import ReplaceOne
+
+_logger = logging.getLogger("inginious.webapp.course_user_summary")
+_MAX_ATTEMPTS = 10
+_CHUNK_SIZE = 1000
+_SUMMARY_FIELDS = ("taskid", "tried", "succeeded", "grade")
+
+
+def create_course_user_summary_indexes(database):
+    """ Creates the indexes of the course_user_summary collection """
+    database.course_user_summary.create_index([("courseid", pymongo.ASCENDING), ("username", pymongo.ASCENDING)],
+                                              unique=True)
+    database.course_user_summary.create_index([("username", pymongo.ASCENDING)])
+
+
+def _get_task_summary(user_task):
+    return {field: user_task.get(field) for field in _SUMMARY_FIELDS}
+
+
+def get_course_user_summaries(database, courseid, usernames=None, taskids=None):
+    """
+    :param database: the MongoDB database
+    :param courseid: the course id
+    :param usernames: the list of the users to get. If None, all the users that saw a task of the course.
+    :param taskids: if not None, only keep these tasks
+    :return: a dict, in the form {username: {taskid: {"taskid": ..., "tried": ..., "succeeded": ..., "grade": ...}}}.
+             The users that did not see any task of the course are absent.
+    """
+    query = {"courseid": courseid}
+    if usernames is not None:
+        query["username"] = {"$in": list(usernames)}
+    taskids = set(taskids) if taskids is not None else None
+
+    return {summary["username"]: {task["taskid"]: task for task in summary["tasks"]
+                                  if taskids is None or task["taskid"] in taskids}
+            for summary in database.course_user_summary.find(query, {"username": 1, "tasks": 1})}
+
+
+def update_course_user_summaries(database, courseid, usernames):
+    """ Recomputes the summaries of some users of a course from their user_tasks """
+    usernames = sorted(set(usernames))
+    for i in range(0, len(usernames), _CHUNK_SIZE):
+        _update_course_user_summaries(database, courseid, set(usernames[i:i + _CHUNK_SIZE]))
+
+
+def _update_course_user_summaries(database, courseid, usernames):
+    for _ in range(_MAX_ATTEMPTS):
+        if not usernames:
+            return
+
+        stamps = {summary["username"]: summary.get("stamp") for summary in database.course_user_summary.find(
+            {"courseid": courseid, "username": {"$in": list(usernames)}}, {"username": 1, "stamp": 1})}
+        tasks = {username: [] for username in usernames}
+        for user_task in database.user_tasks.find({"courseid": courseid, "username": {"$in": list(usernames)}},
+                                                  {field: 1 for field in _SUMMARY_FIELDS + ("username",)}):
+            tasks[user_task["username"]].append(_get_task_summary(user_task))
+
+        # A summary changed since it was read does not match its filter anymore: the upsert then fails with a
+        # duplicate key error, and the summary is recomputed
+        ordered_usernames = sorted(usernames)
+        try:
+            database.course_user_summary.bulk_write([
+                ReplaceOne({"courseid": courseid, "username": username, "stamp": stamps.get(username)},
+                           {"courseid": courseid, "username": username, "stamp": ObjectId(), "tasks": tasks[username]},
+                           upsert=True)
+                for username in ordered_usernames], ordered=False)
+            return
+        except pymongo.errors.BulkWriteError as e:
+            if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                raise
+            usernames = {ordered_usernames[error["index"]] for error in e.details["writeErrors"]}
+
+    _logger.warning("Cannot update the summaries of %s in course %s, concurrently updated", usernames, courseid)
+
+
+def rebuild_course_user_summaries(database, courseid=None):
+    """
+    Rebuilds all the summaries of a course (or of all the courses if courseid is None) from the user_tasks. The
+    summaries are missing until the rebuild ends: only used offline, by the database updater.
+    :return: the number of summaries built
+    """
+    if courseid is None:
+        return sum(rebuild_course_user_summaries(database, courseid)
+                   for courseid in database.user_tasks.distinct("courseid"))
+
+    database.course_user_summary.delete_many({"courseid": courseid})
+    summaries = {}
+    for user_task in database.user_tasks.find({"courseid": courseid},
+                                              {field: 1 for field in _SUMMARY_FIELDS + ("username",)}):
+        summaries.setdefault(user_task["username"], []).append(_get_task_summary(user_task))
+
+    documents = [{"courseid": courseid, "username": username, "stamp": ObjectId(), "tasks": tasks}
+                 for username, tasks in summaries.items()]
+    for i in range(0, len(documents), _CHUNK_SIZE):
+        database.course_user_summary.insert_many(documents[i:i + _CHUNK_SIZE])
+    return len(documents)
+
+
+def remove_task_from_course_user_summaries(database, courseid, taskid):
+    """
+    Removes a task from the summaries of a course, after its user_tasks were deleted. The summaries are stamped again,
+    so that a concurrent update that read the user_tasks before their deletion is recomputed.
+    """
+    database.course_user_summary.update_many({"courseid": courseid},
+                                             {"$pull": {"tasks": {"taskid": taskid}}, "$set": {"stamp": ObjectId()}})
+
+
+def delete_course_user_summaries(database, courseid=None, username=None):
+    """ Deletes the summaries of a course and/or of a user """
+    query = {}
+    if courseid is not None:
+        query["courseid"] = courseid
+    if username is not None:
+        query["username"] = username
+    database.course_user_summary.delete_many(query)
@@ -7,7 +7,10 @@
 # https://flasksession.readthedocs.io/
 
 import re
-from datetime import datetime
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
 from bson.objectid import ObjectId
 
 try:
@@ -26,17 +29,49 @@ from inginious.frontend.pages.lti import LTILaunchPage
 class MongoDBSession(CallbackDict, SessionMixin):
     """Baseclass for server-side based sessions."""
 
-    def __init__(self, initial=None, sid=None, permanent=None, cookieless=False):
+    def __init__(self, initial=None, sid=None, permanent=None, cookieless=False, stored_data=None,
+                 stored_expiration=None):
         def on_update(self):
             self.modified = True
         CallbackDict.__init__(self, initial, on_update)
         self.sid = sid
         self.modified = False
         self.cookieless = cookieless
+        # Serialized data and expiration date in the database, to detect the changes when saving the session
+        self.stored_data = stored_data
+        self.stored_expiration = stored_expiration
         if permanent:
             self.permanent = permanent
 
 
+class SessionCache(object):
+    """ Thread-safe cache of the serialized sessions of the process, whose entries expire after ttl seconds """
+
+    def __init__(self, ttl, max_entries=10000):
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # sid -> (time of insertion, document), by order of insertion
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._entries.get(sid)
+        if entry is None or entry[0] + self._ttl < time.monotonic():
+            return None
+        return entry[1]
+
+    def put(self, sid, document):
+        with self._lock:
+            self._entries.pop(sid, None)
+            self._entries[sid] = (time.monotonic(), document)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def remove(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+
+
 class MongoDBSessionInterface(SessionInterface):
     """A Session interface that uses mongodb as backend.
     :param client: A ``pymongo.MongoClient`` instance.
@@ -44,18 +79,25 @@ class MongoDBSessionInterface(SessionInterface):
     :param collection: The collection you want to use.
     :param use_signer: Whether to sign the session id cookie or not.
     :param permanent: Whether to use permanent session or not.
+    :param refresh_interval: Minimum time, in seconds, between two updates of the expiration date of an unmodified
+        session in the database.
+    :param cache_ttl: Time, in seconds, during which the sessions read or written by the process are kept in memory
+        instead of being read from the database. 0 disables the cache. Sessions modified by another process may be
+        seen with this delay.
     """
 
     serializer = pickle
     session_class = MongoDBSession
 
     def __init__(self, client, db, collection, use_signer=False,
-                 permanent=True):
+                 permanent=True, refresh_interval=60, cache_ttl=0):
         self.client = client
         self.store = client[db][collection]
         self.store.create_index('expiration')  # ensure index
         self.use_signer = use_signer
         self.permanent = permanent
+        self.refresh_interval = timedelta(seconds=refresh_interval)
+        self.cache = SessionCache(cache_ttl) if cache_ttl > 0 else None
 
     def _generate_sid(self):
         return str(ObjectId())
@@ -103,16 +145,26 @@ class MongoDBSessionInterface(SessionInterface):
                 return self.session_class(sid=sid, permanent=self.permanent, cookieless=cookieless)
 
         store_id = sid
-        document = self.store.find_one({'_id': store_id})
-        if document and document.get('expiration') <= datetime.utcnow():
+        document = self.cache.get(store_id) if self.cache is not None else None
+        if document is None:
+            document = self.store.find_one({'_id': store_id})
+            if document is not None and self.cache is not None:
+                self.cache.put(store_id, document)
+        expiration = document.get('expiration') if document else None
+        if expiration is not None and expiration.tzinfo is None:
+            expiration = expiration.replace(tzinfo=timezone.utc)  # dates are read from the database as naive UTC
+        if expiration is not None and expiration <= datetime.now(timezone.utc):
             # Delete expired session
             self.store.delete_one({'_id': store_id})
+            if self.cache is not None:
+                self.cache.remove(store_id)
             document = None
         if document is not None:
             try:
-                val = document['data']
-                data = self.serializer.loads(want_bytes(val))
-                return self.session_class(data, sid=sid, cookieless=cookieless)
+                val = want_bytes(document['data'])
+                data = self.serializer.loads(val)
+                return self.session_class(data, sid=sid, cookieless=cookieless, stored_data=val,
+                                          stored_expiration=expiration)
             except:
                 return self.session_class(sid=sid, permanent=self.permanent, cookieless=cookieless)
         return self.session_class(sid=sid, permanent=self.permanent, cookieless=cookieless)
@@ -124,6 +176,8 @@ class MongoDBSessionInterface(SessionInterface):
         if not session:
             if session.modified:
                 self.store.delete_one({'_id': store_id})
+                if self.cache is not None:
+                    self.cache.remove(store_id)
                 response.delete_cookie(self.get_cookie_name(app), domain=domain, path=path)
             return
 
@@ -132,9 +186,18 @@ class MongoDBSessionInterface(SessionInterface):
         expires = self.get_expiration_time(app, session)
         cookieless = session.cookieless
         val = self.serializer.dumps(dict(session))
-        self.store.update_one({'_id': store_id},
-                              {"$set": {'data': val, 'expiration': expires, 'cookieless': cookieless}},
-                              upsert=True)
+        # The serialized data is compared, as modifications of mutable values of the session are not tracked.
+        # Unmodified sessions are only written to extend their expiration, at most once per refresh_interval.
+        if val != session.stored_data or session.stored_expiration is None:
+            self.store.update_one({'_id': store_id},
+                                  {"$set": {'data': val, 'expiration': expires, 'cookieless': cookieless}},
+                                  upsert=True)
+        elif expires is not None and expires - session.stored_expiration >= self.refresh_interval:
+            self.store.update_one({'_id': store_id}, {"$set": {'expiration': expires}})
+        else:
+            expires = session.stored_expiration
+        if self.cache is not None:
+            self.cache.put(store_id, {'_id': store_id, 'data': val, 'expiration': expires, 'cookieless': cookieless})
         if self.use_signer:
             session_id = self._get_signer(app).sign(session.sid).decode()
         else:
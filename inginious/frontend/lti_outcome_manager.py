@@ -4,10 +4,14 @@
 # more information about the licensing of this file.
 
 """ Manages the calls to the TC """
+import collections
+import heapq
+import itertools
 import logging
 import threading
-import queue
 import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
 from lti import OutcomeRequest
 
@@ -15,75 +19,81 @@ from pymongo import ReturnDocument
 
 
 class LTIOutcomeManager(threading.Thread):
-    def __init__(self, database, user_manager, course_factory):
+    """
+        Sends the grades of the LTI submissions to the tool consumers (TC), with a pool of threads.
+
+        The grades to send are queued in the lis_outcome_queue collection, with one entry per user, task and LTI
+        result id: queuing a grade for an entry already waiting only makes it due again, and the latest grade is read
+        when it is sent. add() increments the version of the entry: an entry modified while its grade was being sent
+        is kept, and sent again.
+
+        At most max_per_consumer grades are sent at the same time to a given consumer. An entry that cannot be sent is
+        retried after a delay doubling at each attempt (from retry_delay up to max_retry_delay seconds), stored with
+        the entry as next_attempt, and dropped after max_attempts attempts.
+    """
+
+    def __init__(self, database, user_manager, course_factory, workers=16, max_per_consumer=4, max_attempts=10,
+                 retry_delay=1.0, max_retry_delay=3600.0):
+        """
+        :type database: pymongo.database.Database
+        :type user_manager: inginious.frontend.user_manager.UserManager
+        :type course_factory: inginious.frontend.course_factory.CourseFactory
+        """
         super(LTIOutcomeManager, self).__init__()
         self.daemon = True
         self._database = database
         self._user_manager = user_manager
         self._course_factory = course_factory
-        self._queue = queue.Queue()
+        self._workers = workers
+        self._max_per_consumer = max_per_consumer
+        self._max_attempts = max_attempts
+        self._retry_delay = retry_delay
+        self._max_retry_delay = max_retry_delay
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="LTIOutcomeManager")
+        self._condition = threading.Condition()
+        self._entries = {}  # mongo id -> entry
+        self._heap = []  # (due time, sequence, mongo id)
+        self._sequence = itertools.count()
+        self._in_flight = set()
+        self._consumers = collections.Counter()  # consumer key -> number of grades being sent
         self._stopped = False
         self._logger = logging.getLogger("inginious.webapp.lti_outcome_manager")
+
+        self._stats = {"sent": 0, "failed_attempts": 0, "dropped": 0, "coalesced": 0}
+        self._sent_times = collections.deque(maxlen=100000)
         self.start()
 
     def stop(self):
-        self._stopped = True
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._executor.shutdown(wait=False)
+
+    def get_stats(self):
+        """ Returns a dict describing the activity of the manager, with the number of grades sent per second during the
+            last minute """
+        with self._condition:
+            stats = dict(self._stats)
+            stats["waiting"] = len(self._entries) - len(self._in_flight)
+            stats["in_flight"] = len(self._in_flight)
+            now = time.monotonic()
+            stats["throughput"] = sum(1 for sent_time in self._sent_times if now - sent_time < 60) / 60.0
+        return stats
 
     def run(self):
         # Load old tasks from the database
-        for todo in self._database.lis_outcome_queue.find({}):
-            self._add_to_queue(todo)
+        for entry in self._database.lis_outcome_queue.find({}):
+            self._schedule(entry)
 
         try:
-            while not self._stopped:
-                time.sleep(0.5)
-                data = self._queue.get()
-
-                mongo_id, username, courseid, taskid, consumer_key, service_url, result_id, nb_attempt = data
-
-                try:
-                    course = self._course_factory.get_course(courseid)
-                    task = course.get_task(taskid)
-
-                    consumer_secret = course.lti_keys()[consumer_key]
-
-                    grade = self._user_manager.get_task_cache(username, courseid, task.get_id())["grade"]
-                    grade = grade / 100.0
-                    if grade > 1:
-                        grade = 1
-                    if grade < 0:
-                        grade = 0
-                except Exception:
-                    self._logger.error("An exception occurred while getting a course/LTI secret/grade in LTIOutcomeManager.", exc_info=True)
-                    continue
-
-                try:
-                    outcome_response = OutcomeRequest({"consumer_key": consumer_key,
-                                                       "consumer_secret": consumer_secret,
-                                                       "lis_outcome_service_url": service_url,
-                                                       "lis_result_sourcedid": result_id}).post_replace_result(grade)
-
-                    if outcome_response.code_major == "success":
-                        self._delete_in_db(mongo_id)
-                        self._logger.debug("Successfully sent grade to TC: %s", str(data))
-                        continue
-                except Exception:
-                    self._logger.error("An exception occurred while sending a grade to the TC.", exc_info=True)
-
-                if nb_attempt < 5:
-                    self._logger.debug("An error occurred while sending a grade to the TC. Retrying...")
-                    self._increment_attempt(mongo_id)
-                else:
-                    self._logger.error("An error occurred while sending a grade to the TC. Maximum number of retries reached.")
-                    self._delete_in_db(mongo_id)
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    return
+                self._dispatch(batch)
         except KeyboardInterrupt:
             pass
 
-    def _add_to_queue(self, mongo_entry):
-        self._queue.put((mongo_entry["_id"], mongo_entry["username"], mongo_entry["courseid"],
-                         mongo_entry["taskid"], mongo_entry["consumer_key"], mongo_entry["service_url"],
-                         mongo_entry["result_id"], mongo_entry["nb_attempt"]))
-
     def add(self, username, courseid, taskid, consumer_key, service_url, result_id):
         """ Add a job in the queue
         :param username:
@@ -97,25 +107,148 @@ class LTIOutcomeManager(threading.Thread):
                   "taskid": taskid, "service_url": service_url,
                   "consumer_key": consumer_key, "result_id": result_id}
 
-        entry = self._database.lis_outcome_queue.find_one_and_update(search, {"$set": {"nb_attempt": 0}},
-                                                                     return_document=ReturnDocument.BEFORE, upsert=True)
-        if entry is None:  # and it should be
-            self._add_to_queue(self._database.lis_outcome_queue.find_one(search))
-
-    def _delete_in_db(self, mongo_id):
-        """
-        Delete an element from the queue in the database
-        :param mongo_id:
-        :return:
-        """
-        self._database.lis_outcome_queue.delete_one({"_id": mongo_id})
-
-    def _increment_attempt(self, mongo_id):
-        """
-        Increment the number of attempt for an entry and
-        :param mongo_id:
-        :return:
+        entry = self._database.lis_outcome_queue.find_one_and_update(
+            search, {"$set": {"nb_attempt": 0, "next_attempt": datetime.now()}, "$inc": {"version": 1}},
+            return_document=ReturnDocument.AFTER, upsert=True)
+        if entry["version"] > 1:
+            with self._condition:
+                self._stats["coalesced"] += 1
+        self._schedule(entry)
+
+    @staticmethod
+    def _get_due_time(entry):
+        next_attempt = entry.get("next_attempt")
+        return next_attempt.timestamp() if next_attempt is not None else 0.0
+
+    def _schedule(self, entry):
+        """ Keeps the last version of an entry, and plans its sending if it is not being sent. Concurrent calls to
+            add() may schedule the versions of an entry out of order: an older version is ignored. """
+        with self._condition:
+            if not self._keep(entry):
+                return
+            if entry["_id"] not in self._in_flight:
+                heapq.heappush(self._heap, (self._get_due_time(entry), next(self._sequence), entry["_id"]))
+                self._condition.notify()
+
+    def _keep(self, entry):
+        """ Replaces the known entry with the same id by the given one, unless the known entry is a newer version.
+            Must be called with the condition held. Returns True if the given entry is kept. """
+        current = self._entries.get(entry["_id"])
+        if current is not None and current.get("version", 0) > entry.get("version", 0):
+            return False
+        self._entries[entry["_id"]] = entry
+        return True
+
+    def _next_batch(self):
+        """ Waits for entries to be due, and marks them as being sent
+        :return: the list of the entries to send, or None if the manager is stopped
         """
-        entry = self._database.lis_outcome_queue.find_one_and_update({"_id": mongo_id}, {"$inc": {"nb_attempt": 1}})
+        with self._condition:
+            while not self._stopped:
+                now = time.time()
+                batch, postponed = [], []
+                while self._heap and self._heap[0][0] <= now and len(self._in_flight) < self._workers:
+                    item = heapq.heappop(self._heap)
+                    entry = self._entries.get(item[2])
+                    if entry is None or item[2] in self._in_flight or self._get_due_time(entry) != item[0]:
+                        continue  # outdated item
+                    if self._consumers[entry["consumer_key"]] >= self._max_per_consumer:
+                        postponed.append(item)
+                        continue
+                    self._consumers[entry["consumer_key"]] += 1
+                    self._in_flight.add(item[2])
+                    batch.append(entry)
+                for item in postponed:
+                    heapq.heappush(self._heap, item)
+                if batch:
+                    return batch
+
+                # The end of a sending wakes the loop up too
+                next_due = min((item[0] for item in self._heap if item[0] > now), default=None)
+                self._condition.wait(next_due - now if next_due is not None else None)
+        return None
+
+    def _dispatch(self, batch):
+        """ Reads the LTI secrets and the grades of the entries, and sends them with the pool of threads """
+        courses = {}
+        grades = {}
+        for courseid in {entry["courseid"] for entry in batch}:
+            entries = [entry for entry in batch if entry["courseid"] == courseid]
+            for user_task in self._database.user_tasks.find(
+                    {"courseid": courseid, "username": {"$in": list({entry["username"] for entry in entries})},
+                     "taskid": {"$in": list({entry["taskid"] for entry in entries})}},
+                    {"username": 1, "taskid": 1, "grade": 1}):
+                grades[(courseid, user_task["username"], user_task["taskid"])] = user_task["grade"]
+
+        for entry in batch:
+            try:
+                if entry["courseid"] not in courses:
+                    courses[entry["courseid"]] = self._course_factory.get_course(entry["courseid"])
+                consumer_secret = courses[entry["courseid"]].lti_keys()[entry["consumer_key"]]
+                grade = grades[(entry["courseid"], entry["username"], entry["taskid"])] / 100.0
+                grade = min(max(grade, 0), 1)
+            except Exception:
+                self._logger.error("An exception occurred while getting a course/LTI secret/grade in LTIOutcomeManager.", exc_info=True)
+                self._done(entry, False)
+                continue
+
+            try:
+                self._executor.submit(self._send, entry, consumer_secret, grade)
+            except RuntimeError:  # stopped
+                return
+
+    def _send(self, entry, consumer_secret, grade):
+        success = False
+        try:
+            outcome_response = OutcomeRequest({"consumer_key": entry["consumer_key"],
+                                               "consumer_secret": consumer_secret,
+                                               "lis_outcome_service_url": entry["service_url"],
+                                               "lis_result_sourcedid": entry["result_id"]}).post_replace_result(grade)
+            success = outcome_response.code_major == "success"
+        except Exception:
+            self._logger.error("An exception occurred while sending a grade to the TC.", exc_info=True)
 
-        self._add_to_queue(entry)
+        try:
+            self._done(entry, success)
+        except Exception:
+            self._logger.exception("An exception occurred while updating the LTI outcome queue.")
+
+    def _done(self, entry, success):
+        """ Removes a sent entry from the queue, or plans its next attempt. An entry modified in the meantime (as
+            told by its version) is kept and sent again. """
+        mongo_id = entry["_id"]
+        search = {"_id": mongo_id, "version": entry.get("version")}
+        retry = None
+        if success:
+            self._database.lis_outcome_queue.delete_one(search)
+            self._logger.debug("Successfully sent grade to TC: %s", str(entry))
+        elif entry["nb_attempt"] + 1 < self._max_attempts:
+            self._logger.debug("An error occurred while sending a grade to the TC. Retrying...")
+            delay = min(self._retry_delay * 2 ** entry["nb_attempt"], self._max_retry_delay)
+            retry = self._database.lis_outcome_queue.find_one_and_update(
+                search, {"$inc": {"nb_attempt": 1}, "$set": {"next_attempt": datetime.now() + timedelta(seconds=delay)}},
+                return_document=ReturnDocument.AFTER)
+        else:
+            self._logger.error("An error occurred while sending a grade to the TC. Maximum number of retries reached.")
+            self._database.lis_outcome_queue.delete_one(search)
+
+        with self._condition:
+            if success:
+                self._stats["sent"] += 1
+                self._sent_times.append(time.monotonic())
+            else:
+                self._stats["failed_attempts"] += 1
+                if retry is None and self._entries.get(mongo_id) is entry:
+                    self._stats["dropped"] += 1
+
+            self._in_flight.discard(mongo_id)
+            self._consumers[entry["consumer_key"]] -= 1
+            if retry is not None:
+                # A newer version scheduled by add() while the grade was being sent replaces the retry
+                self._keep(retry)
+            elif self._entries.get(mongo_id) is entry:
+                del self._entries[mongo_id]
+            if mongo_id in self._entries:
+                current = self._entries[mongo_id]
+                heapq.heappush(self._heap, (self._get_due_time(current), next(self._sequence), mongo_id))
+            self._condition.notify()
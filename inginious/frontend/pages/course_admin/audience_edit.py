@@ -91,7 +91,8 @@ class CourseEditAudience(INGIniousAdminPage):
                 return redirect(self.app.get_homepath() + "/admin/" + courseid + "/students?audiences")
         else:
             audiences_dict = json.loads(data["audiences"])
-            student_list = self.user_manager.get_course_registered_users(course, False)
+            student_list = set(self.user_manager.get_course_registered_users(course, False))
+            to_register = []
             for username in audiences_dict[0]["students"]:
                 userdata = self.database.users.find_one({"username": username})
                 if userdata is None:
@@ -100,7 +101,8 @@ class CourseEditAudience(INGIniousAdminPage):
                     # Display the page
                     return self.display_page(course, audienceid, msg, error)
                 elif username not in student_list:
-                    self.user_manager.course_register_user(course, username, force=True)
+                    to_register.append(username)
+            self.user_manager.course_register_users(course, to_register)
             self.database.audiences.update_one(
                 {"_id": ObjectId(audiences_dict[0]["_id"])},
                 {"$set": {"students": audiences_dict[0]["students"],
@@ -16,6 +16,7 @@ from flask import redirect, Response
 from werkzeug.exceptions import NotFound
 
 
+from inginious.frontend.course_user_summary import delete_course_user_summaries, update_course_user_summaries
 from inginious.frontend.pages.course_admin.utils import INGIniousAdminPage
 from inginious.frontend.user_manager import UserManager
 
@@ -32,10 +33,11 @@ class CourseDangerZonePage(INGIniousAdminPage):
                 if key in submission and type(submission[key]) == bson.objectid.ObjectId and gridfs.exists(submission[key]):
                     gridfs.delete(submission[key])
 
-        self.database.courses.update_one({"_id": courseid}, {"$set": {"students": []}})
+        self.database.course_registrations.delete_many({"courseid": courseid})
         self.database.audiences.delete_many({"courseid": courseid})
         self.database.groups.delete_many({"courseid": courseid})
         self.database.user_tasks.delete_many({"courseid": courseid})
+        delete_course_user_summaries(self.database, courseid)
         self.database.submissions.delete_many({"courseid": courseid})
 
         self._logger.info("Course %s wiped.", courseid)
@@ -48,8 +50,8 @@ class CourseDangerZonePage(INGIniousAdminPage):
             os.makedirs(os.path.dirname(filepath))
 
         with zipfile.ZipFile(filepath, "w", allowZip64=True) as zipf:
-            course_obj = self.database.courses.find_one({"_id": courseid})
-            students = course_obj.get("students", []) if course_obj else []
+            students = [registration["username"] for registration in
+                        self.database.course_registrations.find({"courseid": courseid}, {"username": 1})]
             zipf.writestr("students.json", bson.json_util.dumps(students), zipfile.ZIP_DEFLATED)
 
             audiences = self.database.audiences.find({"courseid": courseid})
@@ -92,7 +94,8 @@ class CourseDangerZonePage(INGIniousAdminPage):
 
             students = bson.json_util.loads(zipf.read("students.json").decode("utf-8"))
             if len(students) > 0:
-                self.database.courses.update_one({"_id": courseid}, {"$set": {"students": students}}, upsert=True)
+                self.database.course_registrations.insert_many([{"courseid": courseid, "username": username}
+                                                                for username in set(students)])
 
             audiences = bson.json_util.loads(zipf.read("audiences.json").decode("utf-8"))
             if len(audiences) > 0:
@@ -105,6 +108,8 @@ class CourseDangerZonePage(INGIniousAdminPage):
             user_tasks = bson.json_util.loads(zipf.read("user_tasks.json").decode("utf-8"))
             if len(user_tasks) > 0:
                 self.database.user_tasks.insert_many(user_tasks)
+                update_course_user_summaries(self.database, courseid,
+                                             {user_task["username"] for user_task in user_tasks})
 
             submissions = bson.json_util.loads(zipf.read("submissions.json").decode("utf-8"))
             for submission in submissions:
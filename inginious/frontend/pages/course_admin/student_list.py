@@ -180,14 +180,15 @@ class CourseStudentListPage(INGIniousAdminPage):
                     for group in groups:
                         group["students"] = []
                         self.database.groups.replace_one({"_id": group["_id"]}, group)
-                    self.database.courses.find_one_and_update({"_id": course.get_id()}, {"$set": {"students": []}})
+                    self.database.course_registrations.delete_many({"courseid": course.get_id()})
                 else:
                     self.user_manager.course_unregister_user(course.get_id(), data["username"])
             except:
                 pass
         elif "register_student" in data:
             try:
-                self.user_manager.course_register_user(course, data["username"].strip(), '', True)
+                self.user_manager.course_register_users(course, [username.strip() for username in
+                                                                 data["username"].split(",") if username.strip()])
             except:
                 pass
 
@@ -270,11 +271,10 @@ class CourseStudentListPage(INGIniousAdminPage):
                                               "tutors": value})
 
                     # update list of students and tutors of the course.
-                    new_students = list(set(stud_list).union(set(course_students)))
+                    self.user_manager.course_register_users(course, course_students)
                     new_tutors = list(set(course.get_admins()).union(set(course_tutors)))
 
-                    self.database.courses.update_one({"_id": courseid}, {"$set": {"students": new_students,
-                                                                                  "tutors": new_tutors}})
+                    self.database.courses.update_one({"_id": courseid}, {"$set": {"tutors": new_tutors}})
 
                     # this is done to avoid removing the audience id and impact the group audience filter.
                     for audience in audiences:
@@ -463,18 +463,17 @@ class CourseStudentListPage(INGIniousAdminPage):
 
         students, errored_students = [], []
 
-        # Check the students
+        # Check the students, and register them if needed
+        student_list = set(student_list)
+        to_register = [student for student in new_data["students"]
+                       if student not in student_list and student not in audience["tutors"]]
+        accepted = student_list.union(self.user_manager.course_register_users(course, to_register),
+                                      set(to_register).intersection(course.get_admins()))
         for student in new_data["students"]:
-            if student in student_list:
+            if student in accepted:
                 students.append(student)
             else:
-                # Check if user can be registered
-                user_info = self.user_manager.get_user_info(student)
-                if user_info is None or student in audience["tutors"]:
-                    errored_students.append(student)
-                else:
-                    self.user_manager.course_register_user(course, student, force=True)
-                    students.append(student)
+                errored_students.append(student)
 
         removed_students = [student for student in audience["students"] if student not in new_data["students"]]
         self.database.audiences.find_one_and_update({"courseid": course.get_id()},
@@ -53,14 +53,12 @@ class CourseSubmissionsPage(INGIniousSubmissionsAdminPage):
                     sub_folders = list(download_type.split('/'))
                 else:
                     sub_folders = list(download_type.split('/')) + ["submissiondateid"]
-                archive, error = self.submission_manager.get_submission_archive(course, data, sub_folders, simplify="simplify" in user_input)
-                if not error:
-                    response = Response(response=archive, content_type='application/x-gzip')
-                    response.headers['Content-Disposition'] = 'attachment; filename="submissions.tgz"'
-                    return response
-                else:
-                    msgs.append(_("The following submission could not be prepared for download: {}").format(error))
-                    return self.page(course, params, msgs=msgs)
+                # The archive is generated while it is sent: the submissions that cannot be prepared are listed in
+                # an errors.txt file at its root
+                archive = self.submission_manager.stream_submission_archive(course, data, sub_folders, simplify="simplify" in user_input)
+                response = Response(response=archive, content_type='application/x-gzip')
+                response.headers['Content-Disposition'] = 'attachment; filename="submissions.tgz"'
+                return response
 
             elif "replay" in user_input:
                 if not self.user_manager.has_admin_rights_on_course(course):
@@ -102,11 +100,10 @@ class CourseSubmissionsPage(INGIniousSubmissionsAdminPage):
 
             self._logger.info("Downloading submission %s - %s - %s - %s", submission['_id'], submission['courseid'],
                               submission['taskid'], submission['username'])
-            archive, error = self.submission_manager.get_submission_archive(course, [submission], [])
-            if not error:
-                response = Response(response=archive, content_type='application/x-gzip')
-                response.headers['Content-Disposition'] = 'attachment; filename="submissions.tgz"'
-                return response
+            archive = self.submission_manager.stream_submission_archive(course, [submission], [])
+            response = Response(response=archive, content_type='application/x-gzip')
+            response.headers['Content-Disposition'] = 'attachment; filename="submissions.tgz"'
+            return response
 
         params = self.get_input_params(user_input, course)
         return self.page(course, params)
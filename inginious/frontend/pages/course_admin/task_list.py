@@ -9,6 +9,7 @@ import flask
 from collections import OrderedDict
 from natsort import natsorted
 
+from inginious.frontend.course_user_summary import remove_task_from_course_user_summaries
 from inginious.frontend.pages.course_admin.utils import INGIniousAdminPage
 
 
@@ -81,6 +82,7 @@ class CourseTaskListPage(INGIniousAdminPage):
                     self.submission_manager.get_gridfs().delete(submission[key])
 
         self.database.user_tasks.delete_many({"courseid": courseid, "taskid": taskid})
+        remove_task_from_course_user_summaries(self.database, courseid, taskid)
         self.database.submissions.delete_many({"courseid": courseid, "taskid": taskid})
 
         logging.getLogger("inginious.webapp.task_edit").info("Task %s/%s wiped.", courseid, taskid)
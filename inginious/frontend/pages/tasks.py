@@ -256,6 +256,16 @@ class BaseTaskPage(object):
                     task, result, is_admin, False, tags=course.get_tags()
                 ))
 
+        elif "@action" in userinput and userinput["@action"] == "wait" and "submissionid" in userinput:
+            # Hanging request, answered as soon as the result (or the remote debugging information) is available.
+            # The client then asks for it with the "check" action.
+            changed = self.submission_manager.wait_for_submission(userinput["submissionid"], 20,
+                                                                  userinput.get("ssh_known") == "true",
+                                                                  user_check=not is_admin)
+            return Response(content_type='application/json', response=json.dumps({
+                "status": "changed" if changed else "waiting"
+            }))
+
         elif "@action" in userinput and userinput["@action"] == "load_submission_input" and "submissionid" in userinput:
             submission = self.submission_manager.get_submission(userinput["submissionid"], user_check=not is_admin)
             submission = self.submission_manager.get_input_from_submission(submission)
@@ -4,12 +4,17 @@
 # more information about the licensing of this file.
 
 """ Tools to parse text """
+import contextlib
+import hashlib
 import html
 import re
 import gettext
+import threading
 import flask
+import pymongo
 import tidylib
 
+from collections import OrderedDict, namedtuple
 from datetime import datetime
 from urllib.parse import urlparse
 from docutils import core, nodes
@@ -22,12 +27,38 @@ from docutils.writers import html4css1
 from inginious.frontend.accessible_time import parse_date
 
 
-def _get_inginious_translation():
+RenderContext = namedtuple("RenderContext", ["language", "translation", "lti"])
+
+_local = threading.local()
+
+
+def get_render_context():
+    """ Returns the RenderContext (language and translation of the interface, and whether the links are rewritten for
+        LTI) in which the texts are rendered in the current thread """
+    context = getattr(_local, "render_context", None)
+    if context is not None:
+        return context
     # If we are on a webpage, or even anywhere in the app, this should be defined
-    if flask.has_app_context():
-        return flask.current_app.l10n_manager.get_translation_obj()
-    else:
-        return gettext.NullTranslations()
+    if flask.has_request_context():
+        return RenderContext(flask.session.get("language", ""), flask.current_app.l10n_manager.get_translation_obj(),
+                             re.match(r"^(/@[a-f0-9A-F_]*@)", flask.request.path) is not None)
+    return RenderContext("", gettext.NullTranslations(), False)
+
+
+@contextlib.contextmanager
+def render_context(context):
+    """ Renders the texts in the given RenderContext in the current thread (outside of the request of the user who
+        will read them, for example) """
+    previous = getattr(_local, "render_context", None)
+    _local.render_context = context
+    try:
+        yield
+    finally:
+        _local.render_context = previous
+
+
+def _get_inginious_translation():
+    return get_render_context().translation
 
 
 class EmptiableCodeBlock(CodeBlock):
@@ -150,8 +181,7 @@ class _CustomHTMLWriter(html4css1.Writer, object):
             if tagname == 'a' and "href" in attributes and not attributes["href"].startswith('#'):
                 attributes["target"] = "_blank"
             # Rewrite paths if we are in LTI mode
-            # TODO: this should be an argument passed through all the functions
-            if re.match(r"^(/@[a-f0-9A-F_]*@)", flask.request.path if flask.has_app_context() else ""):
+            if get_render_context().lti:
                 if tagname == 'a' and 'href' in attributes:
                     attributes['href'] = self.rewrite_lti_url(attributes['href'])
                 elif tagname == 'img' and 'src' in attributes:
@@ -234,9 +264,86 @@ class _CustomHTMLWriter(html4css1.Writer, object):
                 self.body.append('</div>\n')
             self.body.append('</div>\n')
 
+class RenderCache(object):
+    """
+        Bounded LRU cache of the texts rendered by ParsableText, keyed by a hash of the content, the parser, the
+        show_everything flag and the RenderContext. If a database is given, the rendered texts are also shared with the
+        other processes of the webapp through the rendered_texts collection, where they expire after max_age seconds.
+
+        Texts with a hidden-until directive are never cached, as their rendering depends on the current time.
+    """
+
+    def __init__(self, max_entries=2000, database=None, max_age=7 * 86400, max_text_size=256 * 1024):
+        """
+        :type database: pymongo.database.Database
+        """
+        self._max_entries = max_entries
+        self._database = database
+        self._max_text_size = max_text_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> rendered text
+        self._stats = {"hits": 0, "shared_hits": 0, "misses": 0}
+        if database is not None:
+            database.rendered_texts.create_index("created", expireAfterSeconds=max_age)
+
+    def get_key(self, content, mode, show_everything, context):
+        """ Returns the key of a text in the cache, or None if it must not be cached """
+        if not isinstance(content, str) or len(content) > self._max_text_size or "hidden-until" in content:
+            return None
+        digest = hashlib.sha256(content.encode("utf-8", "surrogatepass")).hexdigest()
+        return "%s:%s:%i:%s:%i" % (digest, mode, bool(show_everything), context.language, context.lti)
+
+    def get(self, key):
+        """ Returns the rendered text stored with the key, or None """
+        with self._lock:
+            rendered = self._entries.get(key)
+            if rendered is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return rendered
+
+        if self._database is not None:
+            entry = self._database.rendered_texts.find_one({"_id": key}, {"text": 1})
+            if entry is not None:
+                self._store(key, entry["text"])
+                with self._lock:
+                    self._stats["shared_hits"] += 1
+                return entry["text"]
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, key, rendered):
+        """ Stores a rendered text """
+        self._store(key, rendered)
+        if self._database is not None:
+            try:
+                self._database.rendered_texts.update_one(
+                    {"_id": key}, {"$setOnInsert": {"text": rendered, "created": datetime.utcnow()}}, upsert=True)
+            except pymongo.errors.DuplicateKeyError:
+                pass  # stored by another process in the meantime
+
+    def _store(self, key, rendered):
+        with self._lock:
+            self._entries[key] = rendered
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def get_stats(self):
+        """ Returns a dict with the number of hits (in process, and in the database) and misses of the cache """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        return stats
+
+
 class ParsableText(object):
     """Allow to parse a string with different parsers"""
 
+    _cache = RenderCache()
+
     def __init__(self, content, mode="rst", show_everything=False, translation=gettext.NullTranslations()):
         """
             content             The string to be parsed.
@@ -252,6 +359,15 @@ class ParsableText(object):
         self._mode = mode
         self._show_everything = show_everything
 
+    @classmethod
+    def set_cache(cls, cache):
+        """ Sets the RenderCache of the rendered texts, or None to render the texts each time they are parsed """
+        cls._cache = cache
+
+    @classmethod
+    def get_cache(cls):
+        return cls._cache
+
     def original_content(self):
         """ Returns the original content """
         return self._content
@@ -259,6 +375,13 @@ class ParsableText(object):
     def parse(self, debug=False):
         """Returns parsed text"""
         if self._parsed is None:
+            cache = self._cache if not debug else None
+            key = cache.get_key(self._content, self._mode, self._show_everything, get_render_context()) \
+                if cache is not None else None
+            self._parsed = cache.get(key) if key is not None else None
+            if self._parsed is not None:
+                return self._parsed
+
             try:
                 if self._mode == "html":
                     self._parsed = self.html(self._content, self._show_everything, self._translation)
@@ -270,6 +393,10 @@ class ParsableText(object):
                 else:
                     self._parsed = self._translation.gettext("<b>Parsing failed</b>: <pre>{}</pre>").format(
                         html.escape(self._content))
+                    return self._parsed
+
+            if key is not None:
+                cache.put(key, self._parsed)
         return self._parsed
 
     def __str__(self):
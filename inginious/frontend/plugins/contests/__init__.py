@@ -13,7 +13,7 @@ import pymongo
 import flask
 
 from werkzeug.exceptions import NotFound
-from inginious.frontend.accessible_time import AccessibleTime
+from inginious.frontend.accessible_time import get_accessible_time
 from inginious.frontend.pages.course_admin.utils import INGIniousAdminPage
 from inginious.frontend.pages.utils import INGIniousAuthPage
 from inginious.frontend.task_dispensers.toc import TableOfContents
@@ -54,12 +54,12 @@ class Contest(TableOfContents):
         data, errors = TableOfContents.check_dispenser_data(self, dispenser_data)
         return {"toc_data": data, "contest_settings": self._contest_settings} if data else None, errors
 
-    def get_accessibilities(self, taskids, usernames): # pylint: disable=unused-argument
+    def get_task_accessibilities(self, taskids):
         contest_data = self.get_contest_data()
         if contest_data['enabled']:
-            return {username: {taskid: AccessibleTime(contest_data['start'] + '/') for taskid in taskids} for username in usernames}
+            return {taskid: get_accessible_time(contest_data['start'] + '/') for taskid in taskids}
         else:
-            return TableOfContents.get_accessibilities(self, taskids, usernames)
+            return TableOfContents.get_task_accessibilities(self, taskids)
 
     def get_contest_data(self):
         """ Returns the settings of the contest for this course """
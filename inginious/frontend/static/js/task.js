@@ -353,76 +353,104 @@ function submitTask(with_ssh)
     }, 200);
 }
 
-//Wait for a job to end
-function waitForSubmission(submissionid)
+//False if the server cannot notify the end of the jobs, in which case their status is polled
+var submissionPushSupported = true;
+
+//Wait for a job to end. The server answers the "wait" action when the result (or the remote debugging
+//information, if sshKnown is not true) is available, or after a timeout.
+function waitForSubmission(submissionid, sshKnown)
 {
-    setTimeout(function()
+    if(submissionPushSupported)
     {
         var url = $('form#task').attr("action");
-        jQuery.post(url, {"@action": "check", "submissionid": submissionid}, null, "json")
-            .done(function(data)
+        jQuery.post(url, {"@action": "wait", "submissionid": submissionid, "ssh_known": sshKnown === true}, null, "json")
+            .done(function()
             {
-                if("status" in data && data['status'] === "waiting")
-                {
-                    waitForSubmission(submissionid);
-                    if("ssh_host" in data && "ssh_port" in data && "ssh_user" in data && "ssh_password" in data)
-                        displayRemoteDebug(submissionid, data);
-                    else
-                        displayTaskLoadingAlert(data, submissionid);
+                checkSubmission(submissionid);
+            })
+            .fail(function()
+            {
+                submissionPushSupported = false;
+                waitForSubmission(submissionid, sshKnown);
+            });
+    }
+    else
+    {
+        setTimeout(function()
+        {
+            checkSubmission(submissionid);
+        }, 1000);
+    }
+}
 
-                }
-                else if("status" in data && "result" in data && "grade" in data)
-                {
-                    updateMainTags(data);
-                    if("debug" in data)
-                        displayDebugInfo(data["debug"]);
-
-                    if(data['result'] == "failed")
-                        displayTaskStudentAlertWithProblems(data, "danger", false);
-                    else if(data['result'] == "success")
-                        displayTaskStudentAlertWithProblems(data, "success", false);
-                    else if(data['result'] == "timeout")
-                        displayTaskStudentAlertWithProblems(data, "warning", false);
-                    else if(data['result'] == "overflow")
-                        displayTaskStudentAlertWithProblems(data, "warning", false);
-                    else if(data['result'] == "killed")
-                        displayTaskStudentAlertWithProblems(data, "warning", false);
-                    else // == "error"
-                        displayTaskStudentAlertWithProblems(data, "danger", false);
-
-                    if("tests" in data){
-                        updateSubmission(submissionid, data['result'], data["grade"], data["tests"]);
-                    }else{
-                        updateSubmission(submissionid, data['result'], data["grade"], []);
-                    }
-                    unblurTaskForm();
-
-                    if("replace" in data && data["replace"] && $('#my_submission').length) {
-                        displayEvaluatedSubmission(submissionid, true);
-                    } else if($('#my_submission').length) {
-                        displayEvaluatedSubmission($('#my_submission').attr('data-submission-id'), false);
-                    }
-
-                    if("feedback_script" in data)
-                        eval(data["feedback_script"]);
-                }
+//Get the status of a job, and display its result if it has ended
+function checkSubmission(submissionid)
+{
+    var url = $('form#task').attr("action");
+    jQuery.post(url, {"@action": "check", "submissionid": submissionid}, null, "json")
+        .done(function(data)
+        {
+            if("status" in data && data['status'] === "waiting")
+            {
+                var sshKnown = "ssh_host" in data && "ssh_port" in data && "ssh_user" in data && "ssh_password" in data;
+                waitForSubmission(submissionid, sshKnown);
+                if(sshKnown)
+                    displayRemoteDebug(submissionid, data);
                 else
-                {
+                    displayTaskLoadingAlert(data, submissionid);
+
+            }
+            else if("status" in data && "result" in data && "grade" in data)
+            {
+                updateMainTags(data);
+                if("debug" in data)
+                    displayDebugInfo(data["debug"]);
+
+                if(data['result'] == "failed")
                     displayTaskStudentAlertWithProblems(data, "danger", false);
-                    updateSubmission(submissionid, "error", "0.0", []);
-                    updateTaskStatus("Failed", 0);
-                    unblurTaskForm();
+                else if(data['result'] == "success")
+                    displayTaskStudentAlertWithProblems(data, "success", false);
+                else if(data['result'] == "timeout")
+                    displayTaskStudentAlertWithProblems(data, "warning", false);
+                else if(data['result'] == "overflow")
+                    displayTaskStudentAlertWithProblems(data, "warning", false);
+                else if(data['result'] == "killed")
+                    displayTaskStudentAlertWithProblems(data, "warning", false);
+                else // == "error"
+                    displayTaskStudentAlertWithProblems(data, "danger", false);
+
+                if("tests" in data){
+                    updateSubmission(submissionid, data['result'], data["grade"], data["tests"]);
+                }else{
+                    updateSubmission(submissionid, data['result'], data["grade"], []);
                 }
+                unblurTaskForm();
 
-            })
-            .fail(function()
+                if("replace" in data && data["replace"] && $('#my_submission').length) {
+                    displayEvaluatedSubmission(submissionid, true);
+                } else if($('#my_submission').length) {
+                    displayEvaluatedSubmission($('#my_submission').attr('data-submission-id'), false);
+                }
+
+                if("feedback_script" in data)
+                    eval(data["feedback_script"]);
+            }
+            else
             {
                 displayTaskStudentAlertWithProblems(data, "danger", false);
                 updateSubmission(submissionid, "error", "0.0", []);
                 updateTaskStatus("Failed", 0);
                 unblurTaskForm();
-            });
-    }, 1000);
+            }
+
+        })
+        .fail(function()
+        {
+            displayTaskStudentAlertWithProblems({"title": $("#internalerror").text(), "text": ""}, "danger", false);
+            updateSubmission(submissionid, "error", "0.0", []);
+            updateTaskStatus("Failed", 0);
+            unblurTaskForm();
+        });
 }
 
 //Kill a running submission
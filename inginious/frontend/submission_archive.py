@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Streams tgz archives of submissions """
+
+import collections
+import copy
+import gzip
+import io
+import logging
+import os.path
+import tarfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import bson
+
+import inginious.common.custom_yaml
+
+_DOUBLE_EXTENSIONS = ('.tar.gz', '.tar.bz2', '.tar.bz', '.tar.xz')
+
+
+class _StreamBuffer(object):
+    """ Write-only file-like object, whose content is consumed by chunks """
+
+    def __init__(self):
+        self._chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        """ Returns and forgets the data written since the last call """
+        data = b"".join(self._chunks)
+        self._chunks = []
+        self.size = 0
+        return data
+
+
+class _PrefetchWindow(object):
+    """ The submissions being prepared, and the size of the submissions prepared but not written yet """
+
+    def __init__(self):
+        self.running = set()
+        self.size = 0
+
+    def update(self):
+        """ Counts the size of the submissions prepared since the last call """
+        for future in [future for future in self.running if future.done()]:
+            self.running.discard(future)
+            self.size += future.result()[2]
+
+    def remove(self, future):
+        """ Forgets a prepared submission, once written """
+        if future in self.running:
+            self.running.discard(future)
+        else:
+            self.size -= future.result()[2]
+
+
+class SubmissionArchive(object):
+    """
+        Iterable over the chunks of a tgz archive of submissions, generated while it is sent.
+
+        Each submission is prepared once, even if it is placed at several paths: a pool of threads loads its input and
+        its job archive from GridFS, serializes it in YAML and decompresses the job archive, up to `prefetch`
+        submissions ahead of the one being written in the archive. No more submission is prepared while the ones
+        prepared and waiting to be written hold more than `prefetch_size` bytes. The submissions that cannot be
+        prepared are skipped and listed in `errors` (and in an errors.txt file at the root of the archive).
+    """
+
+    def __init__(self, gridfs, submissions_paths, simplify=False, threads=8, prefetch=64,
+                 prefetch_size=64 * 1024 * 1024, chunk_size=64 * 1024, compresslevel=6):
+        """
+        :type gridfs: gridfs.GridFS
+        :param submissions_paths: a list of tuples (submission, list of the folders where to place the submission)
+        :param simplify: place the files uploaded by the student at the root of the folders of the submissions
+        :param prefetch: maximum number of submissions prepared ahead of the one being written
+        :param prefetch_size: maximum size in bytes of the submissions prepared ahead, before preparing another one
+        """
+        self._gridfs = gridfs
+        self._submissions_paths = submissions_paths
+        self._simplify = simplify
+        self._threads = threads
+        self._prefetch = prefetch
+        self._prefetch_size = prefetch_size
+        self._chunk_size = chunk_size
+        self._compresslevel = compresslevel
+        self._logger = logging.getLogger("inginious.webapp.submissions")
+        self.errors = []
+
+    def __iter__(self):
+        buffer = _StreamBuffer()
+        # The stream mode of tarfile compresses at level 9, much slower for a barely smaller archive
+        gzip_file = gzip.GzipFile(fileobj=buffer, mode="wb", compresslevel=self._compresslevel)
+        tar = tarfile.open(fileobj=gzip_file, mode="w|")
+        executor = ThreadPoolExecutor(self._threads, thread_name_prefix="SubmissionArchive")
+        pending = collections.deque()
+        try:
+            submissions_paths = iter(self._submissions_paths)
+            window = _PrefetchWindow()
+            self._prefetch_submissions(executor, submissions_paths, pending, window)
+
+            while pending:
+                future, paths = pending[0]
+                while not future.done():
+                    # Keep the threads busy while the next submission to write is being prepared
+                    wait(window.running, return_when=FIRST_COMPLETED)
+                    self._prefetch_submissions(executor, submissions_paths, pending, window)
+                pending.popleft()
+                window.remove(future)
+                submissionid, members, _ = future.result()
+                self._prefetch_submissions(executor, submissions_paths, pending, window)
+                if members is None:
+                    self.errors.append(submissionid)
+                    continue
+                for path in paths:
+                    for name, info, data in members:
+                        info = copy.copy(info)
+                        info.name = path + "/" + name if path else name
+                        tar.addfile(info, io.BytesIO(data) if data is not None else None)
+                if buffer.size >= self._chunk_size:
+                    yield buffer.pop()
+
+            if self.errors:
+                data = "".join("%s\n" % submissionid for submissionid in self.errors).encode("utf-8")
+                info = tarfile.TarInfo(name="errors.txt")
+                info.size = len(data)
+                info.mtime = time.time()
+                tar.addfile(info, io.BytesIO(data))
+            tar.close()
+            gzip_file.close()
+            yield buffer.pop()
+        finally:
+            # The download may be interrupted: do not prepare the remaining submissions
+            for future, _ in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def _prefetch_submissions(self, executor, submissions_paths, pending, window):
+        """
+        Starts the preparation of the next submissions, while the prefetch window is not full. The size of a
+        submission is only known once it is prepared: at most one submission per thread is being prepared at a time,
+        so that the memory used is bounded by prefetch_size plus the size of a submission per thread.
+        """
+        while len(pending) < self._prefetch:
+            window.update()
+            if len(window.running) >= self._threads or window.size >= self._prefetch_size:
+                return
+            submission_paths = next(submissions_paths, None)
+            if submission_paths is None:
+                return
+            future = executor.submit(self._prepare, submission_paths[0])
+            pending.append((future, submission_paths[1]))
+            window.running.add(future)
+
+    def _prepare(self, submission):
+        """
+        Loads and serializes a submission.
+        :return: a tuple (submission id, list of tuples (name, TarInfo, data), size of the data), the list being None
+                 on failure
+        """
+        try:
+            submission = dict(submission)
+            if not isinstance(submission["input"], dict):
+                submission["input"] = bson.BSON.decode(self._gridfs.get(submission["input"]).read())
+            mtime = time.mktime(submission["submitted_on"].timetuple())
+            members = [self._member("submission.test", inginious.common.custom_yaml.dump(submission).encode('utf-8'),
+                                    mtime)]
+
+            if submission.get("archive"):
+                with tarfile.open(fileobj=io.BytesIO(self._gridfs.get(submission["archive"]).read()),
+                                  mode="r:gz") as subtar:
+                    for member in subtar.getmembers():
+                        data = subtar.extractfile(member).read() if member.isfile() else None
+                        members.append(("archive/" + member.name, member, data))
+
+            for pid, problem in (submission["input"] or {}).items():
+                if isinstance(problem, dict) and "filename" in problem:
+                    # Get the extension (match extensions with more than one dot too)
+                    ext = next((ext for ext in _DOUBLE_EXTENSIONS if problem['filename'].endswith(ext)), None)
+                    if ext is None:
+                        _, ext = os.path.splitext(problem['filename'])
+                    if self._simplify and (pid + ext) != "submission.test":
+                        name = pid + ext
+                    else:
+                        name = "uploaded_files/" + pid + ext
+                    members.append(self._member(name, problem['value'], mtime))
+
+            return str(submission["_id"]), members, sum(info.size for _, info, _ in members)
+        except Exception:
+            self._logger.exception("Cannot add submission %s to an archive", submission.get("_id"))
+            return str(submission.get("_id")), None, 0
+
+    @staticmethod
+    def _member(name, data, mtime):
+        info = tarfile.TarInfo(name=name)
+        info.size = len(data)
+        info.mtime = mtime
+        return name, info, data
@@ -4,13 +4,9 @@
 # more information about the licensing of this file.
 
 """ Manages submissions """
-import io
 import gettext
 import logging
-import os.path
-import tarfile
 import tempfile
-import time
 from typing import Dict, List
 import bson
 import pymongo
@@ -18,22 +14,28 @@ import pymongo
 import flask
 from datetime import datetime
 from bson.objectid import ObjectId
-from pymongo.collection import ReturnDocument
 
-import inginious.common.custom_yaml
-from inginious.frontend.parsable_text import ParsableText
+from inginious.agent.mcq_agent import grader
+from inginious.frontend.parsable_text import ParsableText, get_render_context
+from inginious.frontend.submission_archive import SubmissionArchive
+from inginious.frontend.submission_notifier import SubmissionNotifier
+from inginious.frontend.submission_statistics import record_submission_changes
+from inginious.frontend.submission_writer import JobCompletion, JobCompletionWriter
 
 
 class WebAppSubmissionManager:
     """ Manages submissions. Communicates with the database and the client. """
 
-    def __init__(self, client, user_manager, database, gridfs, plugin_manager, lti_outcome_manager):
+    def __init__(self, client, user_manager, database, gridfs, plugin_manager, lti_outcome_manager,
+                 mcq_in_process=False):
         """
         :type client: inginious.client.client.AbstractClient
         :type user_manager: inginious.frontend.user_manager.UserManager
         :type database: pymongo.database.Database
         :type gridfs: gridfs.GridFS
         :type plugin_manager: inginious.frontend.plugin_manager.PluginManager
+        :param mcq_in_process: if True, the new submissions to the pure MCQ tasks are graded in the webapp, without
+            being sent to the backend
         :return:
         """
         self._client = client
@@ -43,68 +45,68 @@ class WebAppSubmissionManager:
         self._plugin_manager = plugin_manager
         self._logger = logging.getLogger("inginious.webapp.submissions")
         self._lti_outcome_manager = lti_outcome_manager
+        self._mcq_in_process = mcq_in_process
+        self._notifier = SubmissionNotifier(database)
+        self._notifier.start()
+        self._completion_writer = JobCompletionWriter(database, gridfs, user_manager, plugin_manager,
+                                                      lti_outcome_manager, self._notifier)
 
     def _job_done_callback(self, submissionid, course, task, result, grade, problems, tests, custom, state, archive, stdout,
-                           stderr, task_dispenser,  newsub=True):
-        """ Callback called by Client when a job is done. Updates the submission in the database with the data returned after the completion of the
-        job """
-        submission = self.get_submission(submissionid, False)
-
-        submission = self.get_input_from_submission(submission)
-
-        data = {
-            "status": ("done" if result[0] == "success" or result[0] == "failed" else "error"),
-            # error only if error was made by INGInious
-            "result": result[0],
-            "grade": grade,
-            "text": result[1],
-            "tests": tests,
-            "problems": problems,
-            "archive": (self._gridfs.put(archive) if archive is not None else None),
-            "custom": custom,
-            "state": state,
-            "stdout": stdout,
-            "stderr": stderr
-        }
-
-        unset_obj = {
-            "jobid": "",
-            "ssh_host": "",
-            "ssh_port": "",
-            "ssh_user": "",
-            "ssh_password": ""
-        }
+                           stderr, task_dispenser,  newsub=True, render_context=None):
+        """ Callback called by Client when a job is done. Queues the data returned after the completion of the job, to
+        be written in the database by the job completion writer. Blocks if too many completions are waiting. """
+        self._completion_writer.put(JobCompletion(submissionid, course, task, result, grade, problems, tests, custom,
+                                                  state, archive, stdout, stderr, task_dispenser, newsub,
+                                                  render_context))
+
+    def _grade_mcq_in_process(self, submissionid, course, task, inputdata, task_dispenser):
+        """ Grades a new submission to a MCQ task with the problems of the cached task, and writes its result before
+        returning. Returns False if the task is not a pure MCQ, or if the submission cannot be graded or its result
+        written: the submission must then be sent to the backend. """
+        try:
+            result = grader.grade(task.get_problems(), inputdata, inputdata["@lang"])
+        except Exception:
+            self._logger.exception("Cannot grade submission %s in the webapp, sending it to the backend", submissionid)
+            return False
+        if result is None:
+            return False
 
-        # Save submission to database
+        result, text, grade, problems, state = result
         try:
-            submission = self._database.submissions.find_one_and_update(
-                {"_id": submission["_id"]},
-                {"$set": data, "$unset": unset_obj},
-                return_document=ReturnDocument.AFTER
-            )
+            self._completion_writer.write(JobCompletion(submissionid, course, task, (result, text), round(grade, 2),
+                                                        problems, {}, {}, state, None, None, None, task_dispenser,
+                                                        True, get_render_context()))
+        except Exception:
+            self._logger.exception("Cannot write the result of submission %s", submissionid)
+            # Sent to the backend only if the result was not written, so that it is not counted twice
+            return self._database.submissions.count_documents({"_id": submissionid, "status": "waiting"}) == 0
+        return True
 
-            for username in submission["username"]:
-                self._user_manager.update_user_stats(username, course, task, submission, result[0], grade, state, newsub, task_dispenser)
+    def get_job_completion_stats(self):
+        """ Returns statistics about the persistence of the job completions (see JobCompletionWriter.get_stats) """
+        return self._completion_writer.get_stats()
 
-        # Check for size as it also takes the MongoDB command into consideration
-        except pymongo.errors.DocumentTooLarge:
-            data = {"status": "error", "text": _("Maximum submission size exceeded. Check feedback, stdout, stderr and state."), "grade": 0.0}
-            submission = self._database.submissions.find_one_and_update(
-                {"_id": submission["_id"]},
-                {"$set": data, "$unset": unset_obj},
-                return_document=ReturnDocument.AFTER
-            )
+    def close(self):
+        """ Writes the pending job completions in the database """
+        self._completion_writer.close()
+        self._notifier.stop()
 
-        self._plugin_manager.call_hook("submission_done", submission=submission, archive=archive, newsub=newsub)
+    def wait_for_submission(self, submissionid, timeout, ssh_known=False, user_check=True):
+        """
+        Waits, without polling, until a submission is done or, if ssh_known is False, until the information needed to
+        connect to its remote debugging session is available.
+
+        :param timeout: maximum time to wait, in seconds
+        :return: True if the submission changed (or does not exist), False if the timeout expired
+        """
+        def is_changed():
+            submission = self._database.submissions.find_one({"_id": ObjectId(submissionid)},
+                                                             {"status": 1, "username": 1, "ssh_host": 1})
+            if submission is None or (user_check and not self.user_is_submission_owner(submission)):
+                return True
+            return submission["status"] != "waiting" or ("ssh_host" in submission and not ssh_known)
 
-        if "outcome_service_url" in submission and "outcome_result_id" in submission and "outcome_consumer_key" in submission:
-            for username in submission["username"]:
-                self._lti_outcome_manager.add(username,
-                                              submission["courseid"],
-                                              submission["taskid"],
-                                              submission["outcome_consumer_key"],
-                                              submission["outcome_service_url"],
-                                              submission["outcome_result_id"])
+        return self._notifier.wait(submissionid, is_changed, timeout)
 
     def _before_submission_insertion(self, course, task, inputdata, debug, obj):
         """
@@ -212,6 +214,7 @@ class WebAppSubmissionManager:
              "$unset": {"result": "", "grade": "", "text": "", "tests": "", "problems": "", "archive": "", "state": "",
                         "custom": ""}
              })
+        record_submission_changes(self._database, [submission["courseid"]])
 
         jobid = self._client.new_job(1, course.get_taskset(), task, inputdata,
                                      (lambda result, grade, problems, tests, custom, state, archive, stdout, stderr:
@@ -316,18 +319,22 @@ class WebAppSubmissionManager:
         submissionid = self._database.submissions.insert_one(obj).inserted_id
         to_remove = self._after_submission_insertion(course, task, inputdata, debug, obj, submissionid, task_dispenser)
 
-        ssh_callback = lambda host, port, user, password: self._handle_ssh_callback(submissionid, host, port, user, password)
-
-        jobid = self._client.new_job(0, course.get_taskset(), task, inputdata,
-                                     (lambda result, grade, problems, tests, custom, state, archive, stdout, stderr:
-                                      self._job_done_callback(submissionid, course, task, result, grade, problems, tests,
-                                                              custom, state, archive, stdout, stderr, task_dispenser, True)),
-                                     "Frontend - {}".format(username), debug, ssh_callback)
-
-        self._database.submissions.update_one(
-            {"_id": submissionid, "status": "waiting"},
-            {"$set": {"jobid": jobid}}
-        )
+        if not (self._mcq_in_process and task.get_environment_type() == "mcq" and
+                self._grade_mcq_in_process(submissionid, course, task, inputdata, task_dispenser)):
+            ssh_callback = lambda host, port, user, password: self._handle_ssh_callback(submissionid, host, port, user, password)
+            render_context = get_render_context()
+
+            jobid = self._client.new_job(0, course.get_taskset(), task, inputdata,
+                                         (lambda result, grade, problems, tests, custom, state, archive, stdout, stderr:
+                                          self._job_done_callback(submissionid, course, task, result, grade, problems, tests,
+                                                                  custom, state, archive, stdout, stderr, task_dispenser, True,
+                                                                  render_context)),
+                                         "Frontend - {}".format(username), debug, ssh_callback)
+
+            self._database.submissions.update_one(
+                {"_id": submissionid, "status": "waiting"},
+                {"$set": {"jobid": jobid}}
+            )
 
         self._logger.info("New submission from %s - %s - %s/%s - %s", self._user_manager.session_username(),
                           self._user_manager.session_email(), course.get_id(), task.get_id(),
@@ -535,7 +542,7 @@ class WebAppSubmissionManager:
         """ Returns the GridFS used by the submission manager """
         return self._gridfs
 
-    def get_submission_archive(self, course, submissions, sub_folders, archive_file=None, simplify=False):
+    def stream_submission_archive(self, course, submissions, sub_folders, simplify=False):
         """
         :param course: the course object linked to the submission
         :param submissions: a list of submissions
@@ -554,7 +561,9 @@ class WebAppSubmissionManager:
             ["username", "submissionid"], the archive will contain two folders:
             - a/9083081/
             - b/9083081/
-        :return: a file-like object containing a tgz archive of all the submissions
+        :param simplify: place the files uploaded by the students at the root of the folders of the submissions
+        :return: a SubmissionArchive, iterable over the chunks of a tgz archive of all the submissions, generated while
+            it is consumed. Its attribute `errors` lists the ids of the submissions that could not be added.
         """
 
         if "audience" in sub_folders:
@@ -586,88 +595,35 @@ class WebAppSubmissionManager:
             else:
                 yield from generate_paths(sub, path + [remaining_sub_folders[0]], remaining_sub_folders[1:])
 
-        file_to_put = {}
+        used_paths = set()
+        submissions_paths = []
         for submission in submissions:
             # generate all paths where the submission must belong
+            paths = []
             for base_path in generate_paths(submission, [], sub_folders):
                 base_path = "/".join(base_path)
                 path, i = base_path, 1
-                while path in file_to_put:
+                while path in used_paths:
                     path = base_path + "-" + str(i)
                     i += 1
-                file_to_put[path] = submission
+                used_paths.add(path)
+                paths.append(path)
+            submissions_paths.append((submission, paths))
+
+        return SubmissionArchive(self._gridfs, submissions_paths, simplify)
 
+    def get_submission_archive(self, course, submissions, sub_folders, archive_file=None, simplify=False):
+        """
+        Writes a tgz archive of the submissions in a file. See stream_submission_archive for the parameters.
+        :return: a tuple (file-like object containing the archive, ids of the submissions that could not be added
+            separated by commas, or an empty string)
+        """
+        archive = self.stream_submission_archive(course, submissions, sub_folders, simplify)
         tmpfile = archive_file if archive_file is not None else tempfile.TemporaryFile()
-        tar = tarfile.open(fileobj=tmpfile, mode='w:gz')
-        error = ""
-
-        # NOTE there is a bit of redundancy here: if a submission is in multiple folder, the file will be reprocessed
-        # each time. Not sure optimizing this is necessary.
-        for base_path, submission in file_to_put.items():
-            try:
-                submission = self.get_input_from_submission(submission)
-                submission_yaml = io.BytesIO(inginious.common.custom_yaml.dump(submission).encode('utf-8'))
-                submission_yaml_fname = base_path + '/submission.test'
-
-                # Avoid putting two times the same submission on the same place
-                if submission_yaml_fname not in tar.getnames():
-
-                    info = tarfile.TarInfo(name=submission_yaml_fname)
-                    info.size = submission_yaml.getbuffer().nbytes
-                    info.mtime = time.mktime(submission["submitted_on"].timetuple())
-
-                    # Add file in tar archive
-                    tar.addfile(info, fileobj=submission_yaml)
-
-                    # If there is an archive, add it too
-                    if 'archive' in submission and submission['archive'] is not None and submission['archive'] != "":
-                        subfile = self._gridfs.get(submission['archive'])
-                        subtar = tarfile.open(fileobj=subfile, mode="r:gz")
-
-                        for member in subtar.getmembers():
-                            subtarfile = subtar.extractfile(member)
-                            member.name = base_path + "/archive/" + member.name
-                            tar.addfile(member, subtarfile)
-
-                        subtar.close()
-                        subfile.close()
-
-                    # If there files that were uploaded by the student, add them
-                    if submission['input'] is not None:
-                        for pid, problem in submission['input'].items():
-                            if isinstance(problem, dict) and "filename" in problem:
-                                # Get the extension (match extensions with more than one dot too)
-                                DOUBLE_EXTENSIONS = ['.tar.gz', '.tar.bz2', '.tar.bz', '.tar.xz']
-                                ext = ""
-                                if not problem['filename'].endswith(tuple(DOUBLE_EXTENSIONS)):
-                                    _, ext = os.path.splitext(problem['filename'])
-                                else:
-                                    for t_ext in DOUBLE_EXTENSIONS:
-                                        if problem['filename'].endswith(t_ext):
-                                            ext = t_ext
-
-                                subfile = io.BytesIO(problem['value'])
-                                if simplify and (pid + ext) != "submission.test":
-                                    taskfname = base_path + '/' + pid + ext
-                                else:
-                                    taskfname = base_path + '/uploaded_files/' + pid + ext
-
-                                # Generate file info
-                                info = tarfile.TarInfo(name=taskfname)
-                                info.size = subfile.getbuffer().nbytes
-                                info.mtime = time.mktime(submission["submitted_on"].timetuple())
-
-                                # Add file in tar archive
-                                tar.addfile(info, fileobj=subfile)
-
-            except Exception as e:
-                error = str(submission["_id"])
-                break
-
-        # Close tarfile and put tempfile cursor at 0
-        tar.close()
+        for chunk in archive:
+            tmpfile.write(chunk)
         tmpfile.seek(0)
-        return tmpfile, error
+        return tmpfile, ", ".join(archive.errors)
 
     def _handle_ssh_callback(self, submission_id, host, port, user, password):
         """ Handles the creation of a remote ssh server """
@@ -679,6 +635,7 @@ class WebAppSubmissionManager:
                 "ssh_password": password
             }
             self._database.submissions.update_one({"_id": submission_id}, {"$set": obj})
+            self._notifier.publish(submission_id)
 
     def get_job_queue_snapshot(self):
         """ Get a snapshot of the remote backend job queue. May be a cached version.
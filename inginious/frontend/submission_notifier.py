@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Notifies the requests waiting for the status of a submission to change """
+
+import logging
+import threading
+import time
+import uuid
+
+import pymongo
+from pymongo.cursor import CursorType
+
+
+class SubmissionNotifier(object):
+    """
+        Hub on which the submission manager publishes the changes of the submissions (result available, remote debug
+        information), and on which the requests of the students wait for them, instead of polling the database.
+
+        When start() is called, the changes are also published in a capped collection, that is tailed by all the
+        webapp processes using the same database: a request is notified even if the job was started by another
+        process. The waiters always check the database themselves, the notifications only tell them when to do so.
+    """
+
+    def __init__(self, database, collection_name="submission_events", collection_size=1024 * 1024):
+        """
+        :type database: pymongo.database.Database
+        """
+        self._database = database
+        self._collection_name = collection_name
+        self._collection_size = collection_size
+        self._origin = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._waiters = {}  # submission id -> set of threading.Event
+        self._collection = None
+        self._stopped = False
+        self._logger = logging.getLogger("inginious.webapp.submissions")
+
+    def start(self):
+        """ Publishes the changes to the other webapp processes, and listens to theirs """
+        try:
+            if self._collection_name not in self._database.list_collection_names():
+                self._database.create_collection(self._collection_name, capped=True, size=self._collection_size)
+        except pymongo.errors.CollectionInvalid:
+            pass  # created by another process in the meantime
+        except pymongo.errors.PyMongoError:
+            self._logger.warning("Cannot create the %s capped collection. The status of the submissions will only be "
+                                 "pushed to the students connected to the process running the job.",
+                                 self._collection_name, exc_info=True)
+            return
+        self._collection = self._database[self._collection_name]
+        threading.Thread(target=self._tail, daemon=True, name="SubmissionNotifier").start()
+
+    def stop(self):
+        self._stopped = True
+
+    def publish(self, submissionid):
+        """ Wakes up the requests waiting for a change of the submission """
+        self._notify(str(submissionid))
+        if self._collection is not None:
+            try:
+                self._collection.insert_one({"submissionid": str(submissionid), "origin": self._origin})
+            except pymongo.errors.PyMongoError:
+                self._logger.warning("Cannot publish the change of submission %s", submissionid, exc_info=True)
+
+    def wait(self, submissionid, is_changed, timeout):
+        """
+        Waits for a submission to change.
+
+        :param submissionid: id of the submission
+        :param is_changed: function without argument telling if the submission is in the state waited for. It is
+            called before waiting and after each notification.
+        :param timeout: maximum time to wait, in seconds
+        :return: True if is_changed() returned True before the timeout, False otherwise
+        """
+        submissionid = str(submissionid)
+        event = threading.Event()
+        with self._lock:
+            self._waiters.setdefault(submissionid, set()).add(event)
+        try:
+            deadline = time.monotonic() + timeout
+            while not is_changed():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not event.wait(remaining):
+                    return False
+                event.clear()
+            return True
+        finally:
+            with self._lock:
+                self._waiters[submissionid].discard(event)
+                if not self._waiters[submissionid]:
+                    del self._waiters[submissionid]
+
+    def _notify(self, submissionid):
+        with self._lock:
+            events = list(self._waiters.get(submissionid, ()))
+        for event in events:
+            event.set()
+
+    def _tail(self):
+        """ Notifies the waiters of the changes published by the other processes """
+        last_id, started = None, False
+        while not self._stopped:
+            try:
+                if not started:  # skip the events published before
+                    last = self._collection.find_one({}, sort=[("$natural", pymongo.DESCENDING)])
+                    last_id = last["_id"] if last is not None else None
+                    started = True
+                query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+                cursor = self._collection.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive and not self._stopped:
+                    for event in cursor:
+                        last_id = event["_id"]
+                        if event.get("origin") != self._origin:
+                            self._notify(event["submissionid"])
+                # The cursor dies when the collection is empty
+                time.sleep(0.5)
+            except pymongo.errors.PyMongoError:
+                self._logger.warning("Error while listening to the changes of the submissions", exc_info=True)
+                time.sleep(5)
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Statistics about the submissions of a course, computed in a single pass over the submissions """
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import bson
+import pymongo
+from pymongo import UpdateOne
+
+
+class SubmissionStatistics(object):
+    """
+        Counters of the submissions (and of the successful ones) per task, per user, per period of time, and per tag,
+        filled by a single pass over the submissions with add().
+    """
+
+    def __init__(self, taskids, tagids, best_submissions, hourly):
+        """
+        :param taskids: the ids of the tasks of the course. The submissions to other tasks are ignored by the tags.
+        :param tagids: the ids of the tags of the course whose results are computed
+        :param best_submissions: the set of the ids of the submissions used for evaluation
+        :param hourly: True to count the submissions by hour, False by day
+        """
+        self._taskids = set(taskids)
+        self._tagids = list(tagids)
+        self._best_submissions = best_submissions
+        self._hourly = hourly
+        self.submissions = 0
+        self.best = 0
+        self.best_succeeded = 0
+        self.tasks = {}  # taskid -> [submissions, successful submissions]
+        self.users = {}  # username -> [submissions, successful submissions]
+        self.periods = {}  # datetime -> [submissions, successful submissions]
+        self.tags = OrderedDict((tagid, {}) for tagid in self._tagids)  # tagid -> {(group, taskid): [4 counters]}
+        self._tag_totals = {tagid: [0, 0, 0, 0] for tagid in self._tagids}
+
+    def add(self, submission):
+        """ Counts a submission, with at least the fields _id, taskid, username, submitted_on, result and tests """
+        success = 1 if submission.get("result") == "success" else 0
+        best = submission["_id"] in self._best_submissions
+        self.submissions += 1
+        if best:
+            self.best += 1
+            self.best_succeeded += success
+
+        counters = self.tasks.setdefault(submission["taskid"], [0, 0])
+        counters[0] += 1
+        counters[1] += success
+        for username in submission["username"]:
+            counters = self.users.setdefault(username, [0, 0])
+            counters[0] += 1
+            counters[1] += success
+
+        submitted_on = submission["submitted_on"]
+        period = datetime(submitted_on.year, submitted_on.month, submitted_on.day,
+                          submitted_on.hour if self._hourly else 0)
+        counters = self.periods.setdefault(period, [0, 0])
+        counters[0] += 1
+        counters[1] += success
+
+        if submission["taskid"] in self._taskids:
+            key = ("".join(submission["username"]), submission["taskid"])
+            tests = submission.get("tests") or {}
+            for tagid in self._tagids:
+                # submissions, submissions with the tag, evaluation submissions, evaluation submissions with the tag
+                tagged = 1 if tests.get(tagid) else 0
+                for counters in (self.tags[tagid].setdefault(key, [0, 0, 0, 0]), self._tag_totals[tagid]):
+                    counters[0] += 1
+                    counters[1] += tagged
+                    if best:
+                        counters[2] += 1
+                        counters[3] += tagged
+
+    def get_tag_results(self, ponderation):
+        """
+        :param ponderation: if True, the results of each user and task have the same weight. Otherwise, each
+            submission has the same weight.
+        :return: a list of tuples (tagid, percentage of submissions with the tag, percentage of evaluation submissions
+            with the tag)
+        """
+        output = []
+        for tagid, counters in self.tags.items():
+            if not counters:
+                continue
+            if not ponderation:
+                results = self._tag_totals[tagid]
+                output.append((tagid, 100 * safe_div(results[1], results[0]), 100 * safe_div(results[3], results[2])))
+            else:
+                total = sum(safe_div(a[1], a[0]) for a in counters.values())
+                best = sum(safe_div(a[3], a[2]) for a in counters.values())
+                output.append((tagid, 100 * safe_div(total, len(counters)), 100 * safe_div(best, len(counters))))
+        return output
+
+
+def safe_div(x, y):
+    """ Safe division to avoid /0 errors """
+    if y == 0:
+        return 0
+    return x / y
+
+
+def record_submission_changes(database, courseids):
+    """ Counts a change of the results of the submissions of each given course (the completion or the replay of a
+        submission), which invalidates the statistics cached for these courses """
+    database.submission_changes.bulk_write([UpdateOne({"_id": courseid}, {"$inc": {"changes": 1}}, upsert=True)
+                                            for courseid in set(courseids)], ordered=False)
+
+
+class SubmissionStatisticsCache(object):
+    """
+        Caches the SubmissionStatistics computed for a course and a filter. An entry is valid as long as the last
+        submission of the course, the number of its waiting submissions and its counter of changes (see
+        record_submission_changes) did not change, and for max_age seconds at most. The deletion of submissions other
+        than the last one is only seen after max_age seconds.
+    """
+
+    def __init__(self, database, max_entries=32, max_age=600):
+        """
+        :type database: pymongo.database.Database
+        """
+        self._database = database
+        self._max_entries = max_entries
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (stamp, time, statistics)
+
+    def _get_stamp(self, courseid):
+        last = self._database.submissions.find_one({"courseid": courseid}, {"_id": 1},
+                                                   sort=[("_id", pymongo.DESCENDING)])
+        waiting = self._database.submissions.count_documents({"courseid": courseid, "status": "waiting"})
+        changes = self._database.submission_changes.find_one({"_id": courseid})
+        return last["_id"] if last is not None else None, waiting, changes["changes"] if changes is not None else 0
+
+    @staticmethod
+    def _get_digest(best_submissions):
+        """ Returns a digest of the set of the ids of the evaluation submissions """
+        digest = hashlib.sha1()
+        for submissionid in sorted(best_submissions):
+            digest.update(str(submissionid).encode())
+        return digest.hexdigest()
+
+    def get_statistics(self, courseid, filter, limit, taskids, tagids, best_submissions, hourly):
+        """
+        :param filter: the filter of the submissions, including the course
+        :param limit: the maximum number of submissions read
+        :return: the SubmissionStatistics of the submissions matching the filter, computed or cached
+        """
+        key = (courseid, bson.BSON.encode(filter), limit, tuple(sorted(taskids)), tuple(tagids), hourly,
+               self._get_digest(best_submissions))
+        stamp = self._get_stamp(courseid)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stamp and time.monotonic() - entry[1] < self._max_age:
+                self._entries.move_to_end(key)
+                return entry[2]
+
+        statistics = SubmissionStatistics(taskids, tagids, best_submissions, hourly)
+        projection = {"taskid": 1, "username": 1, "submitted_on": 1, "result": 1}
+        projection.update({"tests." + tagid: 1 for tagid in tagids})
+        for submission in self._database.submissions.find(filter, projection, limit=limit or 0):
+            statistics.add(submission)
+
+        with self._lock:
+            self._entries[key] = (stamp, time.monotonic(), statistics)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        return statistics
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Persists the results of the jobs in the database, by batches, outside of the event loop of the client """
+
+import logging
+import queue
+import threading
+import time
+from collections import namedtuple
+
+import pymongo
+from pymongo import UpdateOne
+
+from inginious.frontend.course_user_summary import update_course_user_summaries
+from inginious.frontend.parsable_text import ParsableText, render_context
+from inginious.frontend.submission_statistics import record_submission_changes
+
+# render_context is the RenderContext of the author of a new submission, in which its feedback is rendered in advance
+JobCompletion = namedtuple("JobCompletion", ["submissionid", "course", "task", "result", "grade", "problems", "tests",
+                                             "custom", "state", "archive", "stdout", "stderr", "task_dispenser",
+                                             "newsub", "render_context"], defaults=[None])
+
+_UNSET_OBJ = {"jobid": "", "ssh_host": "", "ssh_port": "", "ssh_user": "", "ssh_password": ""}
+
+
+class JobCompletionWriter(object):
+    """
+        Writes the job completions given to put() in the database, with a pool of worker threads. Each worker takes
+        all the completions waiting in its queue (up to max_batch_size) and persists them with a single bulk write
+        on the submissions collection and a single bulk write on the user_tasks collection, before calling the
+        submission_done hooks and sending the LTI outcomes.
+
+        The completions of a task are always given to the same worker, which writes them in the order they were
+        put: an older submission cannot become the default one of a user after a newer one.
+
+        The queues are bounded: put() blocks when max_queue_size / workers completions are waiting for the same
+        worker, which slows down the caller instead of letting the backlog grow without limit. get_stats() tells how
+        often and how long this happens.
+    """
+
+    def __init__(self, database, gridfs, user_manager, plugin_manager, lti_outcome_manager, notifier=None, workers=2,
+                 max_queue_size=1000, max_batch_size=100):
+        """
+        :type database: pymongo.database.Database
+        :type gridfs: gridfs.GridFS
+        :type user_manager: inginious.frontend.user_manager.UserManager
+        :type plugin_manager: inginious.frontend.plugin_manager.PluginManager
+        :type lti_outcome_manager: inginious.frontend.lti_outcome_manager.LTIOutcomeManager
+        :type notifier: inginious.frontend.submission_notifier.SubmissionNotifier
+        """
+        self._database = database
+        self._gridfs = gridfs
+        self._user_manager = user_manager
+        self._plugin_manager = plugin_manager
+        self._lti_outcome_manager = lti_outcome_manager
+        self._notifier = notifier
+        self._max_batch_size = max_batch_size
+        # max_queue_size is shared between the queues of the workers
+        self._queues = [queue.Queue(max(1, max_queue_size // workers)) for _ in range(workers)]
+        self._logger = logging.getLogger("inginious.webapp.submissions")
+
+        self._stats_lock = threading.Lock()
+        self._stats = {"completions": 0, "batches": 0, "max_queue_size": 0, "blocked_puts": 0, "blocked_time": 0.0,
+                       "total_latency": 0.0, "max_latency": 0.0}
+
+        self._workers = [threading.Thread(target=self._run, args=(worker_queue,), daemon=True,
+                                          name="JobCompletionWriter-%i" % i)
+                         for i, worker_queue in enumerate(self._queues)]
+        for worker in self._workers:
+            worker.start()
+
+    def put(self, completion: JobCompletion):
+        """ Adds a job completion to the queue of the worker of its task. Blocks while this queue is full. """
+        item = (time.monotonic(), completion)
+        worker_queue = self._queues[hash((completion.course.get_id(), completion.task.get_id())) % len(self._queues)]
+        try:
+            worker_queue.put_nowait(item)
+        except queue.Full:
+            start = time.monotonic()
+            worker_queue.put(item)
+            with self._stats_lock:
+                self._stats["blocked_puts"] += 1
+                self._stats["blocked_time"] += time.monotonic() - start
+        with self._stats_lock:
+            self._stats["max_queue_size"] = max(self._stats["max_queue_size"], self._get_queue_size())
+
+    def write(self, completion: JobCompletion):
+        """ Writes a job completion immediately, in the calling thread, instead of queuing it """
+        item = (time.monotonic(), completion)
+        self._write_batch([completion])
+        self._update_stats([item])
+
+    def close(self):
+        """ Writes the completions still in the queues, and stops the workers """
+        for worker_queue in self._queues:
+            worker_queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def get_stats(self):
+        """ Returns a dict describing the activity of the writer and the backpressure on the callers """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queue_size"] = self._get_queue_size()
+        stats["mean_batch_size"] = stats["completions"] / stats["batches"] if stats["batches"] else 0.0
+        stats["mean_latency"] = stats.pop("total_latency") / stats["completions"] if stats["completions"] else 0.0
+        return stats
+
+    def _get_queue_size(self):
+        """ Returns the number of completions waiting in the queues """
+        return sum(worker_queue.qsize() for worker_queue in self._queues)
+
+    def _run(self, worker_queue):
+        """ Main loop of a worker """
+        while True:
+            batch = [worker_queue.get()]
+            while batch[-1] is not None and len(batch) < self._max_batch_size:
+                try:
+                    batch.append(worker_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = batch[-1] is None
+            if stop:
+                batch.pop()
+
+            if batch:
+                try:
+                    self._write_batch([completion for _, completion in batch])
+                except Exception:
+                    self._logger.exception("Failed to write %i job completions", len(batch))
+                self._update_stats(batch)
+
+            if stop:
+                return
+
+    def _update_stats(self, batch):
+        """ Records the latency of the completions of a batch that was written """
+        now = time.monotonic()
+        with self._stats_lock:
+            self._stats["batches"] += 1
+            self._stats["completions"] += len(batch)
+            for queued_on, _ in batch:
+                self._stats["total_latency"] += now - queued_on
+                self._stats["max_latency"] = max(self._stats["max_latency"], now - queued_on)
+            if self._stats["batches"] % 100 == 0:
+                self._logger.debug("Job completion writer: %s", self._stats)
+
+    @staticmethod
+    def _get_data(completion, archive_id):
+        """ Returns the fields of the submission to update """
+        return {
+            "status": ("done" if completion.result[0] == "success" or completion.result[0] == "failed" else "error"),
+            # error only if error was made by INGInious
+            "result": completion.result[0],
+            "grade": completion.grade,
+            "text": completion.result[1],
+            "tests": completion.tests,
+            "problems": completion.problems,
+            "archive": archive_id,
+            "custom": completion.custom,
+            "state": completion.state,
+            "stdout": completion.stdout,
+            "stderr": completion.stderr
+        }
+
+    def _write_batch(self, batch):
+        """ Persists a batch of job completions. When a write of the batch fails, the completions are written one at a
+            time, so that a single faulty completion cannot prevent the others from being persisted """
+        archive_ids = [self._put_archive(completion) for completion in batch]
+        try:
+            self._database.submissions.bulk_write([
+                UpdateOne({"_id": c.submissionid}, {"$set": self._get_data(c, archive_id), "$unset": _UNSET_OBJ})
+                for c, archive_id in zip(batch, archive_ids)
+            ], ordered=False)
+            submissions = {sub["_id"]: sub for sub in
+                           self._database.submissions.find({"_id": {"$in": [c.submissionid for c in batch]}})}
+        except Exception as e:
+            # Find which completion(s) are too large or cannot be written
+            if not isinstance(e, pymongo.errors.DocumentTooLarge):
+                self._logger.exception("Failed to write %i job completions at once, writing them one by one",
+                                       len(batch))
+            for completion, archive_id in zip(batch, archive_ids):
+                self._write_one(completion, archive_id)
+            return
+
+        batch = [c for c in batch if c.submissionid in submissions]
+
+        # New submissions: update the user_tasks cache in bulk, without reading it. The order of the operations is
+        # kept, so that several submissions of the same user for the same task are applied in sequence.
+        operations = []
+        summaries = {}  # courseid -> usernames whose summary must be updated
+        for completion in batch:
+            if completion.newsub:
+                submission = submissions[completion.submissionid]
+                evaluation_mode = completion.task_dispenser.get_evaluation_mode(completion.task.get_id())
+                operations.append([])
+                for username in submission["username"]:
+                    operations[-1] += self._user_manager.get_new_submission_operations(
+                        username, submission, completion.result[0], completion.grade, completion.state,
+                        evaluation_mode)
+                summaries.setdefault(submission["courseid"], set()).update(submission["username"])
+        if operations:
+            self._write_user_tasks(operations)
+        for courseid, usernames in summaries.items():
+            try:
+                update_course_user_summaries(self._database, courseid, usernames)
+            except Exception:
+                self._logger.exception("Failed to update the summaries of %i users of course %s", len(usernames),
+                                       courseid)
+        self._record_changes([submissions[c.submissionid]["courseid"] for c in batch])
+
+        for completion in batch:
+            submission = submissions[completion.submissionid]
+            if not completion.newsub:
+                self._update_user_stats(completion, submission)
+            self._submission_done(completion, submission)
+
+    def _write_user_tasks(self, operations):
+        """ Applies the operations on user_tasks of each new submission (a list of lists), in order. When the bulk
+            write fails, the operations that were not applied are retried one submission at a time. """
+        try:
+            self._database.user_tasks.bulk_write([op for ops in operations for op in ops], ordered=True)
+            return
+        except pymongo.errors.BulkWriteError as e:
+            # The operations are ordered: those before the first error were applied
+            applied = e.details["writeErrors"][0]["index"] if e.details.get("writeErrors") else 0
+            self._logger.exception("Failed to update the statistics of %i submissions at once, retrying them one by "
+                                   "one", len(operations))
+        except Exception:
+            applied = 0
+            self._logger.exception("Failed to update the statistics of %i submissions at once, retrying them one by "
+                                   "one", len(operations))
+
+        for ops in operations:
+            remaining = ops[applied:]
+            applied = max(0, applied - len(ops))
+            if not remaining:
+                continue
+            try:
+                self._database.user_tasks.bulk_write(remaining, ordered=True)
+            except Exception:
+                self._logger.exception("Failed to update the statistics of a submission")
+
+    def _record_changes(self, courseids):
+        """ Invalidates the submission statistics cached for the courses of persisted submissions """
+        if not courseids:
+            return
+        try:
+            record_submission_changes(self._database, courseids)
+        except Exception:
+            self._logger.exception("Failed to record the changes of the submissions of %s", ", ".join(set(courseids)))
+
+    def _update_user_stats(self, completion, submission):
+        """ Updates the statistics of the authors of a persisted submission """
+        try:
+            for username in submission["username"]:
+                self._user_manager.update_user_stats(username, completion.course, completion.task, submission,
+                                                     completion.result[0], completion.grade, completion.state,
+                                                     completion.newsub, completion.task_dispenser)
+        except Exception:
+            self._logger.exception("Failed to update the statistics of submission %s", completion.submissionid)
+
+    def _put_archive(self, completion):
+        """ Stores the archive of a job completion in GridFS, and returns its id (None if it cannot be stored) """
+        if completion.archive is None:
+            return None
+        try:
+            return self._gridfs.put(completion.archive)
+        except Exception:
+            self._logger.exception("Failed to store the archive of submission %s", completion.submissionid)
+            return None
+
+    def _render_feedback(self, completion, submission):
+        """ Renders the feedback of a submission as its author will display it, so that it is read from the cache of
+            the rendered texts (see ParsableText) instead of being parsed again """
+        texts = [completion.result[1]]
+        for feedback in (completion.problems or {}).values():
+            texts.append(feedback if isinstance(feedback, str) else feedback[1])
+        try:
+            with render_context(completion.render_context):
+                for text in texts:
+                    if isinstance(text, str):
+                        ParsableText(text, submission.get("response_type", "rst")).parse()
+        except Exception:
+            self._logger.exception("Error while rendering the feedback of submission %s", completion.submissionid)
+
+    def _write_one(self, completion, archive_id):
+        """ Persists a single job completion, storing an error if it cannot be written in the database (for example
+            if it is too large) """
+        try:
+            submission = self._database.submissions.find_one_and_update(
+                {"_id": completion.submissionid},
+                {"$set": self._get_data(completion, archive_id), "$unset": _UNSET_OBJ},
+                return_document=pymongo.ReturnDocument.AFTER
+            )
+        except Exception as e:
+            # Check for size as it also takes the MongoDB command into consideration
+            if isinstance(e, pymongo.errors.DocumentTooLarge):
+                text = _("Maximum submission size exceeded. Check feedback, stdout, stderr and state.")
+            else:
+                self._logger.exception("Failed to write the job completion of submission %s", completion.submissionid)
+                text = _("An internal error occurred while saving the result of the submission.")
+            try:
+                submission = self._database.submissions.find_one_and_update(
+                    {"_id": completion.submissionid},
+                    {"$set": {"status": "error", "text": text, "grade": 0.0}, "$unset": _UNSET_OBJ},
+                    return_document=pymongo.ReturnDocument.AFTER
+                )
+            except Exception:
+                self._logger.exception("Failed to write an error in submission %s", completion.submissionid)
+                return
+        else:
+            if submission is not None:
+                self._update_user_stats(completion, submission)
+
+        if submission is not None:
+            self._record_changes([submission["courseid"]])
+            self._submission_done(completion, submission)
+
+    def _submission_done(self, completion, submission):
+        """ Notifies the waiting students, calls the submission_done hook and sends the LTI outcome of a persisted
+            submission """
+        if completion.render_context is not None:
+            self._render_feedback(completion, submission)
+
+        if self._notifier is not None:
+            self._notifier.publish(completion.submissionid)
+
+        try:
+            self._plugin_manager.call_hook("submission_done", submission=submission, archive=completion.archive,
+                                           newsub=completion.newsub)
+
+            if "outcome_service_url" in submission and "outcome_result_id" in submission and "outcome_consumer_key" in submission:
+                for username in submission["username"]:
+                    self._lti_outcome_manager.add(username,
+                                                  submission["courseid"],
+                                                  submission["taskid"],
+                                                  submission["outcome_consumer_key"],
+                                                  submission["outcome_service_url"],
+                                                  submission["outcome_result_id"])
+        except Exception:
+            self._logger.exception("Error while completing submission %s", completion.submissionid)
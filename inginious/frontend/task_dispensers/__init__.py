@@ -1,5 +1,7 @@
 from abc import ABCMeta, abstractmethod
 
+from inginious.frontend.accessible_time import AccessibilityMatrix
+
 
 class TaskDispenser(metaclass=ABCMeta):
     legacy_fields = {}
@@ -93,10 +95,19 @@ class TaskDispenser(metaclass=ABCMeta):
         """ Returns the AccessibleTime instance for a set of taskids and usernames """
         pass
 
+    def get_accessibility_matrix(self, taskids, usernames):
+        """
+        Returns the AccessibleTime instances for a set of taskids and usernames, as an AccessibilityMatrix. Dispensers
+        should override this method when the accessibilities can be shared between users.
+        """
+        taskids = list(taskids)
+        result = self.get_accessibilities(taskids, usernames)
+        return AccessibilityMatrix(taskids, usernames, [], {username: tuple(result[username][taskid] for taskid in taskids)
+                                                            for username in usernames})
+
     def get_accessibility(self, taskid, username):
         """ Returns the AccessibleTime instance for a taskid and username """
-        result = self.get_accessibilities([taskid], [username])
-        return result[username][taskid]
+        return self.get_accessibility_matrix([taskid], [username]).get(username, taskid)
 
     def get_user_task_list(self, usernames):
         """
@@ -105,9 +116,7 @@ class TaskDispenser(metaclass=ABCMeta):
         :return: Returns a dictionary with username as key and the user task list as value
         """
         taskids = self._task_list_func()
-        result = self.get_accessibilities(taskids, usernames)
-
-        return {username: [taskid for taskid in result[username].keys() if result[username][taskid].after_start()] for username in result}
+        return self.get_accessibility_matrix(taskids, usernames).get_started_tasks()
 
     @abstractmethod
     def get_ordered_tasks(self):
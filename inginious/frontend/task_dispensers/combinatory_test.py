@@ -8,7 +8,7 @@ import inginious
 from inginious.frontend.task_dispensers.toc import TableOfContents
 from inginious.frontend.task_dispensers.util import SectionConfigItem, Weight, SubmissionStorage, EvaluationMode, \
     Categories, SubmissionLimit, Accessibility
-from inginious.frontend.accessible_time import AccessibleTime
+from inginious.frontend.accessible_time import get_accessible_time
 
 
 class CombinatoryTest(TableOfContents):
@@ -26,18 +26,24 @@ class CombinatoryTest(TableOfContents):
     def get_group_submission(self, taskid):
         return False
 
-    def get_accessibilities(self, taskids, usernames):
-        result = {username: {taskid: AccessibleTime(False) for taskid in taskids} for username in usernames}
+    def get_task_accessibilities(self, taskids):
+        """ The tasks are only accessible to the users to whom they were randomly given """
+        return {taskid: get_accessible_time(False) for taskid in taskids}
+
+    def get_user_accessibilities(self, taskids, usernames):
+        taskids = set(taskids)
+        result = {username: {} for username in usernames}
         for index, section in enumerate(self._toc):
-            task_list = [taskid for taskid in section.get_tasks()
-                         if AccessibleTime(Accessibility.get_value(self._task_config.get(taskid, {}))).after_start()]
+            accessibilities = TableOfContents.get_task_accessibilities(self, section.get_tasks())
+            task_list = [taskid for taskid in section.get_tasks() if accessibilities[taskid].after_start()]
             amount_questions = int(section.get_config().get("amount", 0))
             for username in usernames:
                 rand = Random("{}#{}#{}".format(username, index, section.get_title()))
                 random_order_choices = task_list.copy()
                 rand.shuffle(random_order_choices)
                 for taskid in random_order_choices[0:amount_questions]:
-                    result[username][taskid] = AccessibleTime(Accessibility.get_value(self._task_config.get(taskid, {})))
+                    if taskid in taskids:
+                        result[username][taskid] = accessibilities[taskid]
 
         return result
 
@@ -5,6 +5,7 @@
 import copy
 import inginious
 from collections import OrderedDict
+from datetime import datetime
 
 from functools import reduce
 from operator import concat
@@ -12,7 +13,8 @@ from inginious.frontend.task_dispensers.util import check_toc, parse_tasks_confi
     SectionsList, SectionConfigItem, GroupSubmission, Weight, SubmissionStorage, EvaluationMode, Categories, \
     SubmissionLimit, Accessibility
 from inginious.frontend.task_dispensers import TaskDispenser
-from inginious.frontend.accessible_time import AccessibleTime
+from inginious.frontend.accessible_time import AccessibilityMatrix, get_accessible_time
+from inginious.frontend.course_user_summary import get_course_user_summaries
 
 
 class TableOfContents(TaskDispenser):
@@ -70,8 +72,26 @@ class TableOfContents(TaskDispenser):
 
     def get_accessibilities(self, taskids, usernames):
         """  Get the accessible time of this task """
-        return {username: {taskid: AccessibleTime(Accessibility.get_value(self._task_config.get(taskid, {})))
-                           for taskid in taskids } for username in usernames}
+        return self.get_accessibility_matrix(taskids, usernames).to_dict()
+
+    def get_task_accessibilities(self, taskids):
+        """ Returns a dict taskid -> the AccessibleTime shared by the users without a specific accessibility """
+        return {taskid: get_accessible_time(Accessibility.get_value(self._task_config.get(taskid, {})))
+                for taskid in taskids}
+
+    def get_user_accessibilities(self, taskids, usernames):
+        """ Returns a dict username -> dict taskid -> AccessibleTime, for the users and tasks whose accessibility
+            differs from get_task_accessibilities """
+        return {}
+
+    def get_accessibility_matrix(self, taskids, usernames):
+        """ Returns the AccessibleTime instances for a set of taskids and usernames, as an AccessibilityMatrix """
+        taskids = list(taskids)
+        default = self.get_task_accessibilities(taskids)
+        rows = {}
+        for username, accessibilities in self.get_user_accessibilities(taskids, usernames).items():
+            rows[username] = tuple(accessibilities.get(taskid, default[taskid]) for taskid in taskids)
+        return AccessibilityMatrix(taskids, usernames, [default[taskid] for taskid in taskids], rows)
 
     def get_categories(self, taskid):
         """Returns the categories specified for the taskid by the administrator"""
@@ -85,19 +105,18 @@ class TableOfContents(TaskDispenser):
     def get_course_grades(self, usernames):
         """ Returns the grade of a user for the current course"""
         taskids = list(self._task_list_func().keys())
-        task_list = self.get_accessibilities(taskids, usernames)
-        user_tasks = self._database.user_tasks.find(
-            {"username": {"$in": usernames}, "courseid": self._element_id, "taskid": {"$in": taskids}})
+        task_list = self.get_accessibility_matrix(taskids, usernames)
+        summaries = get_course_user_summaries(self._database, self._element_id, usernames, taskids)
 
         tasks_weight = {taskid: self.get_weight(taskid) for taskid in taskids}
         tasks_scores = {username: [0.0, 0.0] for username in usernames}
 
-        for user_task in user_tasks:
-            username = user_task["username"]
-            if task_list[username][user_task["taskid"]].after_start():
-                weighted_score = user_task["grade"] * tasks_weight[user_task["taskid"]]
-                tasks_scores[username][0] += weighted_score
-                tasks_scores[username][1] += tasks_weight[user_task["taskid"]]
+        now = datetime.now()
+        for username, user_tasks in summaries.items():
+            for taskid, user_task in user_tasks.items():
+                if task_list.get(username, taskid).after_start(now):
+                    tasks_scores[username][0] += user_task["grade"] * tasks_weight[taskid]
+                    tasks_scores[username][1] += tasks_weight[taskid]
 
         return {username: round(tasks_scores[username][0]/tasks_scores[username][1])
                 if tasks_scores[username][1] > 0 else 0 for username in usernames}
@@ -5,7 +5,7 @@
 from abc import ABCMeta, abstractmethod
 from collections import namedtuple
 from inginious.common.base import id_checker
-from inginious.frontend.accessible_time import AccessibleTime
+from inginious.frontend.accessible_time import get_accessible_time
 
 SectionConfigItem = namedtuple('SectionConfigItem', ['label', 'type', 'default'])
 
@@ -196,7 +196,7 @@ class Accessibility(TaskConfigItem):
     def get_value(cls, task_config):
         accessibility = task_config.get(cls.get_id(), cls.default)
         try:
-            AccessibleTime(accessibility)
+            get_accessible_time(accessibility)
         except Exception as message:
             raise InvalidTocException("Invalid task accessibility : {}".format(message))
         return accessibility
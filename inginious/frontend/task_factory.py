@@ -5,6 +5,8 @@
 
 """ Factory for loading tasks from disk """
 
+import itertools
+import time
 from os.path import splitext
 from inginious.common.filesystems import FileSystemProvider
 from inginious.frontend.log import get_taskset_logger
@@ -17,16 +19,40 @@ from inginious.frontend.tasks import Task
 
 
 class TaskFactory(object):
-    """ Load tasks from disk """
-
-    def __init__(self, filesystem: FileSystemProvider, plugin_manager, task_problem_types):
+    """
+        Load tasks from disk.
+
+        When watch_filesystem is True and the filesystem can be watched, the cached tasks are invalidated as soon as
+        their files change. Each change stores a new generation number for the task (or for the whole taskset, for
+        the shared translations), and checking a cached task only compares these numbers, without accessing the
+        filesystem. The modification times are still checked every check_interval seconds, for the changes the
+        watcher cannot see: those made from another host on a network filesystem (NFS, ...), and those made in a
+        symlinked folder, which is not followed. Without a watcher, the modification times of the task files are
+        checked at each access.
+    """
+
+    def __init__(self, filesystem: FileSystemProvider, plugin_manager, task_problem_types, watch_filesystem=False,
+                 check_interval=60):
         self._filesystem = filesystem
         self._plugin_manager = plugin_manager
-        self._cache = {}
+        self._cache = {}  # (tasksetid, taskid) -> (Task, last modification times, generation, last check)
+        self._readable_tasks = {}  # tasksetid -> (generation, list of task ids, last listing)
+        self._check_interval = check_interval
         self._task_file_managers = {}
         self._task_problem_types = task_problem_types
         self.add_custom_task_file_manager(TaskYAMLFileReader())
 
+        # tasksetid, (tasksetid, taskid) or (tasksetid, None) for the task list -> generation of the last change
+        self._generations = {}
+        self._generation_counter = itertools.count(1)
+        self._watcher = filesystem.watch(self._file_changed) if watch_filesystem else None
+
+    def close(self):
+        """ Stops watching the filesystem """
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+
     def set_problem_types(self, problem_types):
         """ Set the problem types for the current TaskFactory.
 
@@ -49,7 +75,17 @@ class TaskFactory(object):
         """
         if not id_checker(taskid):
             raise InvalidNameException("Task with invalid name: " + taskid)
-        if self._cache_update_needed(taskset, taskid):
+        if self._watcher is not None:
+            cached = self._cache.get((taskset.get_id(), taskid))
+            if cached is None or cached[2] != self._get_generation(taskset.get_id(), taskid):
+                self._update_cache(taskset, taskid)
+            elif time.monotonic() - cached[3] > self._check_interval:
+                checked_on = time.monotonic()
+                if self._cache_update_needed(taskset, taskid):
+                    self._update_cache(taskset, taskid)
+                else:
+                    self._cache[(taskset.get_id(), taskid)] = cached[:3] + (checked_on,)
+        elif self._cache_update_needed(taskset, taskid):
             self._update_cache(taskset, taskid)
 
         return self._cache[(taskset.get_id(), taskid)][0]
@@ -126,15 +162,27 @@ class TaskFactory(object):
             self.get_task_fs(tasksetid, taskid).put(path_to_descriptor, descriptor_manager.dump(content))
         except:
             raise TaskNotFoundException()
+        finally:
+            self._task_changed(tasksetid, taskid)
 
     def get_readable_tasks(self, taskset):
         """ Returns the list of all available tasks in a taskset """
+        if self._watcher is not None:
+            cached = self._readable_tasks.get(taskset.get_id())
+            if cached is not None and cached[0] == self._generations.get((taskset.get_id(), None)) and \
+                    time.monotonic() - cached[2] <= self._check_interval:
+                return list(cached[1])
+
+        generation = self._generations.get((taskset.get_id(), None))
+        listed_on = time.monotonic()
         taskset_fs = self._filesystem.from_subfolder(taskset.get_id())
         tasks = [
             task[0:len(task)-1]  # remove trailing /
             for task in taskset_fs.list(folders=True, files=False, recursive=False)
             if self._task_file_exists(taskset_fs.from_subfolder(task))]
-        return tasks
+        if self._watcher is not None:
+            self._readable_tasks[taskset.get_id()] = (generation, tasks, listed_on)
+        return list(tasks)
 
     def _task_file_exists(self, task_fs):
         """ Returns true if a task file exists in this directory """
@@ -155,10 +203,12 @@ class TaskFactory(object):
                 task_fs.delete("task."+ext)
             except:
                 pass
+        self._task_changed(tasksetid, taskid)
 
     def get_all_tasks(self, taskset):
         """
-        :return: a table containing taskid=>Task pairs
+        :return: a table containing taskid=>Task pairs. When the filesystem is watched, the task list and the cached
+                 tasks are validated without accessing the filesystem.
         """
         tasks = self.get_readable_tasks(taskset)
         output = {}
@@ -265,14 +315,42 @@ class TaskFactory(object):
         if not id_checker(taskid):
             raise InvalidNameException("Task with invalid name: " + taskid)
 
+        # Read before the files, so that the changes made while loading them invalidate the new entry
+        generation = self._get_generation(taskset.get_id(), taskid)
+        checked_on = time.monotonic()
         task_fs = self.get_task_fs(taskset.get_id(), taskid)
         last_modif, task_content = self._get_last_updates(taskset, taskid, task_fs, True)
 
         self._cache[(taskset.get_id(), taskid)] = (
             Task(taskset, taskid, task_content, self._plugin_manager, self._task_problem_types),
-            last_modif
+            last_modif,
+            generation,
+            checked_on
         )
 
+    def _get_generation(self, tasksetid, taskid):
+        """ Returns the generations of the last changes of the taskset and of the task """
+        return self._generations.get(tasksetid), self._generations.get((tasksetid, taskid))
+
+    def _task_changed(self, tasksetid, taskid, task_list=True):
+        """ Invalidates the cached task (if taskid is None, all the tasks of the taskset) and the task list """
+        self._generations[(tasksetid, taskid) if taskid is not None else tasksetid] = next(self._generation_counter)
+        if task_list:
+            self._generations[(tasksetid, None)] = next(self._generation_counter)
+
+    def _file_changed(self, path):
+        """ Called by the filesystem watcher for each changed file or folder, relative to the root of the tasksets """
+        parts = path.split("/")
+        if parts[0] in (".", ""):
+            return
+        if len(parts) == 1:  # the taskset folder itself
+            self._task_changed(parts[0], None)
+        elif parts[1].startswith("$"):  # $common and $i18n, shared by all the tasks of the taskset
+            self._task_changed(parts[0], None, False)
+        else:  # a task folder (or a file of the taskset, such as taskset.yaml), or a file or folder of a task
+            # The task list only depends on the task folders and on their descriptors
+            self._task_changed(parts[0], parts[1], len(parts) == 2 or parts[2].startswith("task."))
+
     def update_cache_for_taskset(self, tasksetid):
         """
         Clean/update the cache of all the tasks for a given taskset (id)
@@ -284,6 +362,7 @@ class TaskFactory(object):
                 to_drop.append(tid)
         for tid in to_drop:
             del self._cache[(tasksetid, tid)]
+        self._readable_tasks.pop(tasksetid, None)
 
     def create_task(self, taskset, taskid, init_content):
         """ Create a new taskset folder and set initial descriptor content, folder can already exist
@@ -302,6 +381,7 @@ class TaskFactory(object):
             raise TaskAlreadyExistsException("Task with id " + taskid + " already exists.")
         else:
             task_fs.put("task.yaml", get_json_or_yaml("task.yaml", init_content))
+            self._task_changed(taskset.get_id(), taskid)
 
         get_taskset_logger(taskset.get_id()).info("Task %s created in the factory.", taskid)
 
@@ -320,6 +400,7 @@ class TaskFactory(object):
 
         if task_fs.exists():
             task_fs.delete()
+            self._task_changed(tasksetid, taskid)
             get_taskset_logger(tasksetid).info("Task %s erased from the factory.", taskid)
 
     def get_problem_types(self):
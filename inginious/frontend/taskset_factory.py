@@ -232,18 +232,22 @@ class TasksetFactory(object):
         self._task_factory.update_cache_for_taskset(tasksetid)
 
 
-def create_factories(fs_provider, task_dispensers, task_problem_types, plugin_manager=None, database=None):
+def create_factories(fs_provider, task_dispensers, task_problem_types, plugin_manager=None, database=None,
+                     watch_filesystem=False, check_interval=60):
     """
     Shorthand for creating Factories
     :param fs_provider: A FileSystemProvider leading to the tasksets
     :param plugin_manager: a Plugin Manager instance. If None, a new Hook Manager is created
+    :param watch_filesystem: True to invalidate the cached tasks by watching the filesystem
+    :param check_interval: when the filesystem is watched, interval in seconds between the checks of the modification
+        times of a cached task, for the changes the watcher cannot see
     :param task_class:
     :return: a tuple with two objects: the first being of type CourseFactory, the second of type TaskFactory
     """
     if plugin_manager is None:
         plugin_manager = PluginManager()
 
-    task_factory = TaskFactory(fs_provider, plugin_manager, task_problem_types)
+    task_factory = TaskFactory(fs_provider, plugin_manager, task_problem_types, watch_filesystem, check_interval)
     taskset_factory = TasksetFactory(fs_provider, task_factory, task_dispensers, database)
     course_factory = CourseFactory(taskset_factory, task_factory, plugin_manager, database) if database is not None else None
 
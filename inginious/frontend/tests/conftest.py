@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import mongomock
+import mongomock.collection
+import pytest
+
+
+@pytest.fixture
+def mongomock_bulk_sort(monkeypatch):
+    """ Recent versions of pymongo give a sort argument to the bulk updates, unknown to mongomock: it is ignored """
+    for name in ["add_update", "add_replace"]:
+        method = getattr(mongomock.collection.BulkOperationBuilder, name)
+        monkeypatch.setattr(mongomock.collection.BulkOperationBuilder, name,
+                            lambda self, *args, sort=None, method=method, **kwargs: method(self, *args, **kwargs))
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+from datetime import datetime
+
+from inginious.frontend.accessible_time import AccessibleTime, get_accessible_time
+from inginious.frontend.task_dispensers.combinatory_test import CombinatoryTest
+from inginious.frontend.task_dispensers.toc import TableOfContents
+
+TASKS = {"open": None, "closed": None, "future": None, "dated": None}
+CONFIG = {"open": {"accessibility": True}, "closed": {"accessibility": False},
+          "future": {"accessibility": "2100-01-01 / 2100-02-01"},
+          "dated": {"accessibility": "2000-01-01 10:00 / 2000-02-01 / 2100-01-01"}}
+
+
+class TestAccessibleTime(object):
+
+    def test_dates(self):
+        accessible_time = AccessibleTime("2000-01-01 10:00 / 2000-02-01 / 2100-01-01 00:00:00")
+        assert accessible_time.get_start_date() == datetime(2000, 1, 1, 10)
+        assert accessible_time.get_soft_end_date() == datetime(2000, 2, 1)
+        assert accessible_time.get_end_date() == datetime(2100, 1, 1)
+        assert accessible_time.is_open() and not accessible_time.is_open_with_soft_deadline()
+
+    def test_shared(self):
+        assert get_accessible_time("2000-01-01 / 2100-01-01") is get_accessible_time("2000-01-01 / 2100-01-01")
+
+
+class TestAccessibilityMatrix(object):
+
+    def test_toc(self):
+        dispenser = TableOfContents(lambda: TASKS, {"toc": [], "config": CONFIG}, None, "course")
+        matrix = dispenser.get_accessibility_matrix(TASKS, ["alice", "bob"])
+        assert matrix.get_row("alice") is matrix.get_row("bob")
+        assert matrix.get("bob", "dated").get_end_date() == datetime(2100, 1, 1)
+        assert matrix.get_started_tasks() == {"alice": ["open", "dated"], "bob": ["open", "dated"]}
+        assert dispenser.get_user_task_list(["alice"]) == {"alice": ["open", "dated"]}
+        assert dispenser.get_accessibilities(["closed"], ["alice"])["alice"]["closed"].is_never_accessible()
+
+    def test_user_accessibilities(self):
+        toc = [{"id": "section", "title": "Section", "config": {"amount": 1},
+                "tasks_list": {"open": 0, "dated": 1, "future": 2}}]
+        dispenser = CombinatoryTest(lambda: TASKS, {"toc": toc, "config": CONFIG}, None, "course")
+        usernames = ["user%i" % i for i in range(20)]
+        started = dispenser.get_user_task_list(usernames)
+        for username in usernames:
+            assert len(started[username]) == 1
+            assert started[username][0] in ("open", "dated")
+        assert len(set(task for tasks in started.values() for task in tasks)) == 2
+        assert dispenser.get_accessibilities(TASKS, usernames[:1])[usernames[0]]["future"].is_never_accessible()
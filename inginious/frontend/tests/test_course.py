@@ -10,7 +10,11 @@ import os
 import tempfile
 import shutil
 
+import mongomock
+from bson.objectid import ObjectId
+
 from inginious.common.filesystems.local import LocalFSProvider
+from inginious.frontend.exceptions import CourseNotFoundException
 from inginious.frontend.taskset_factory import create_factories
 from inginious.common.tasks_problems import *
 from inginious.frontend.task_dispensers.toc import TableOfContents
@@ -120,3 +124,50 @@ class TestCourseWrite(object):
                                                                  "public": True})
         assert dict(taskset_factory.get_taskset_descriptor_content("test")) == {"name": "b", "admins": ["b"],
                                                                               "public": True}
+
+
+@pytest.fixture()
+def course_factory():
+    register_base_env_types()
+    dir_path = tempfile.mkdtemp()
+    shutil.copytree(os.path.join(os.path.dirname(__file__), 'tasks', 'test'), os.path.join(dir_path, 'test'))
+    database = mongomock.MongoClient().INGInious
+    _, course_factory, _ = create_factories(LocalFSProvider(dir_path), task_dispensers, problem_types,
+                                            database=database)
+    course_factory.create_course("course", {"name": "Course", "admins": [], "tasksetid": "test",
+                                            "task_dispenser": "toc", "dispenser_data": {"toc": [], "config": {}},
+                                            "students": ["alice"]})
+    yield course_factory, database
+    shutil.rmtree(dir_path)
+
+
+class TestCourseCache(object):
+    """ Test the cache of the Course objects """
+
+    def test_cached(self, course_factory):
+        course_factory, _ = course_factory
+        course = course_factory.get_course("course")
+        assert course_factory.get_course("course") is course
+        assert course_factory.get_all_courses()["course"] is course
+        assert "students" not in course_factory.get_course_descriptor_content("course")
+
+    def test_update(self, course_factory):
+        course_factory, _ = course_factory
+        course = course_factory.get_course("course")
+        course_factory.update_course_descriptor_element("course", "name", "Renamed")
+        assert course_factory.get_course("course") is not course
+        assert course_factory.get_course("course").get_name(None) == "Renamed"
+
+    def test_external_update(self, course_factory):
+        course_factory, database = course_factory
+        course = course_factory.get_course("course")
+        # Update made by another process sharing the database
+        database.courses.update_one({"_id": "course"}, {"$set": {"name": "Renamed", "version": ObjectId()}})
+        assert course_factory.get_course("course").get_name(None) == "Renamed"
+
+    def test_delete(self, course_factory):
+        course_factory, _ = course_factory
+        course_factory.get_course("course")
+        course_factory.delete_course("course")
+        with pytest.raises(CourseNotFoundException):
+            course_factory.get_course("course")
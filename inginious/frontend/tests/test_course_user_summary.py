@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import mongomock
+import pytest
+
+from inginious.frontend.course_user_summary import create_course_user_summary_indexes, get_course_user_summaries, \
+    update_course_user_summaries, rebuild_course_user_summaries, remove_task_from_course_user_summaries
+from inginious.frontend.task_dispensers.toc import TableOfContents
+from inginious.frontend.user_manager import UserManager
+
+
+@pytest.fixture
+def database(mongomock_bulk_sort):
+    database = mongomock.MongoClient().db
+    create_course_user_summary_indexes(database)
+    return database
+
+
+def add_user_task(database, username, taskid, tried, grade, courseid="course"):
+    database.user_tasks.insert_one({"username": username, "courseid": courseid, "taskid": taskid, "tried": tried,
+                                    "succeeded": grade == 100.0, "grade": grade, "submissionid": None, "state": ""})
+
+
+class TestCourseUserSummary(object):
+
+    def test_update(self, database):
+        add_user_task(database, "alice", "task1", 2, 100.0)
+        add_user_task(database, "alice", "task2", 1, 50.0)
+        add_user_task(database, "alice", "task1", 1, 0.0, courseid="other")
+        update_course_user_summaries(database, "course", ["alice", "bob"])
+
+        summaries = get_course_user_summaries(database, "course")
+        assert summaries["alice"]["task1"] == {"taskid": "task1", "tried": 2, "succeeded": True, "grade": 100.0}
+        assert summaries["bob"] == {}
+        assert list(get_course_user_summaries(database, "course", ["alice"], ["task2"])["alice"]) == ["task2"]
+
+        database.user_tasks.update_one({"username": "alice", "taskid": "task2"}, {"$set": {"grade": 80.0}})
+        update_course_user_summaries(database, "course", ["alice"])
+        assert get_course_user_summaries(database, "course")["alice"]["task2"]["grade"] == 80.0
+
+    def test_concurrent_update(self, database, monkeypatch):
+        add_user_task(database, "alice", "task1", 1, 0.0)
+        update_course_user_summaries(database, "course", ["alice"])
+
+        # Another process updates the user_tasks and the summary between our reads and our write
+        find = database.user_tasks.find
+
+        def concurrent_find(*args, **kwargs):
+            monkeypatch.setattr(database.user_tasks, "find", find)
+            result = list(find(*args, **kwargs))
+            database.user_tasks.update_one({"username": "alice"}, {"$set": {"grade": 100.0}})
+            update_course_user_summaries(database, "course", ["alice"])
+            return result
+        monkeypatch.setattr(database.user_tasks, "find", concurrent_find)
+
+        update_course_user_summaries(database, "course", ["alice"])
+        assert get_course_user_summaries(database, "course")["alice"]["task1"]["grade"] == 100.0
+
+    def test_rebuild(self, database):
+        for i in range(5):
+            add_user_task(database, "user%i" % i, "task%i" % (i % 2), i, 20.0 * i)
+            add_user_task(database, "user%i" % i, "task2", 1, 100.0, courseid="other")
+        update_course_user_summaries(database, "course", ["user%i" % i for i in range(5)])
+        incremental = get_course_user_summaries(database, "course")
+
+        assert rebuild_course_user_summaries(database) == 10
+        assert get_course_user_summaries(database, "course") == incremental
+
+    def test_remove_task(self, database, monkeypatch):
+        add_user_task(database, "alice", "task1", 1, 0.0)
+        add_user_task(database, "alice", "task2", 1, 100.0)
+        update_course_user_summaries(database, "course", ["alice"])
+
+        # The task is wiped between the reads and the write of a concurrent update
+        find = database.user_tasks.find
+
+        def concurrent_find(*args, **kwargs):
+            monkeypatch.setattr(database.user_tasks, "find", find)
+            result = list(find(*args, **kwargs))
+            database.user_tasks.delete_many({"courseid": "course", "taskid": "task1"})
+            remove_task_from_course_user_summaries(database, "course", "task1")
+            return result
+        monkeypatch.setattr(database.user_tasks, "find", concurrent_find)
+
+        update_course_user_summaries(database, "course", ["alice"])
+        assert list(get_course_user_summaries(database, "course")["alice"]) == ["task2"]
+
+    def test_user_manager(self, database):
+        user_manager = UserManager(database, [])
+        user_manager.user_saw_task("alice", "course", "task1")
+        assert get_course_user_summaries(database, "course")["alice"]["task1"]["tried"] == 0
+
+    def test_course_grades(self, database):
+        tasks = {"task1": None, "task2": None, "closed": None}
+        config = {"task1": {"weight": 3, "accessibility": True}, "task2": {"accessibility": True},
+                  "closed": {"accessibility": False}}
+        add_user_task(database, "alice", "task1", 1, 100.0)
+        add_user_task(database, "alice", "task2", 1, 0.0)
+        add_user_task(database, "alice", "closed", 1, 0.0)
+        rebuild_course_user_summaries(database)
+        dispenser = TableOfContents(lambda: tasks, {"toc": [], "config": config}, database, "course")
+        assert dispenser.get_course_grades(["alice", "bob"]) == {"alice": 75, "bob": 0}
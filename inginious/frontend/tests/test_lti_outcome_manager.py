@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import threading
+import time
+from datetime import datetime
+
+import mongomock
+import pytest
+
+import inginious.frontend.lti_outcome_manager
+from inginious.frontend.lti_outcome_manager import LTIOutcomeManager
+
+
+class FakeCourse(object):
+    def lti_keys(self):
+        return {"consumer1": "secret1", "consumer2": "secret2"}
+
+
+class FakeCourseFactory(object):
+    def get_course(self, courseid):
+        return FakeCourse()
+
+
+class FakeToolConsumer(object):
+    """ Replaces OutcomeRequest, and records the grades posted """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.grades = []
+        self.running = {}
+        self.max_running = {}
+        self.success = True
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, params):
+        consumer = self
+
+        class Request(object):
+            def post_replace_result(self, grade):
+                with consumer.lock:
+                    key = params["consumer_key"]
+                    consumer.running[key] = consumer.running.get(key, 0) + 1
+                    consumer.max_running[key] = max(consumer.max_running.get(key, 0), consumer.running[key])
+                consumer.release.wait()
+                time.sleep(0.01)
+                with consumer.lock:
+                    consumer.running[key] -= 1
+                    consumer.grades.append((params["lis_result_sourcedid"], grade))
+
+                class Response(object):
+                    code_major = "success" if consumer.success else "failure"
+                return Response()
+        return Request()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def database():
+    database = mongomock.MongoClient().db
+    database.user_tasks.insert_many([{"courseid": "course", "taskid": "task", "username": "user%i" % i,
+                                      "grade": float(i * 10)} for i in range(20)])
+    return database
+
+
+@pytest.fixture
+def consumer(monkeypatch):
+    consumer = FakeToolConsumer()
+    monkeypatch.setattr(inginious.frontend.lti_outcome_manager, "OutcomeRequest", consumer)
+    return consumer
+
+
+class TestLTIOutcomeManager(object):
+
+    def test_send(self, database, consumer):
+        manager = LTIOutcomeManager(database, None, FakeCourseFactory())
+        for i in range(20):
+            manager.add("user%i" % i, "course", "task", "consumer%i" % (i % 2 + 1), "url", "result%i" % i)
+        wait_for(lambda: manager.get_stats()["sent"] == 20)
+        manager.stop()
+
+        assert sorted(consumer.grades) == sorted(("result%i" % i, min(i / 10.0, 1.0)) for i in range(20))
+        assert database.lis_outcome_queue.count_documents({}) == 0
+        assert max(consumer.max_running.values()) <= 4
+
+    def test_coalescing(self, database, consumer):
+        consumer.release.clear()
+        manager = LTIOutcomeManager(database, None, FakeCourseFactory(), max_per_consumer=1)
+        manager.add("user1", "course", "task", "consumer1", "url", "result1")
+        wait_for(lambda: consumer.running.get("consumer1") == 1)
+
+        # The grade changes while the previous one is being sent, and twice while it waits
+        for grade in [30.0, 40.0, 50.0]:
+            database.user_tasks.update_one({"username": "user1"}, {"$set": {"grade": grade}})
+            manager.add("user1", "course", "task", "consumer1", "url", "result1")
+        consumer.release.set()
+        wait_for(lambda: database.lis_outcome_queue.count_documents({}) == 0)
+        manager.stop()
+
+        assert consumer.grades[-1] == ("result1", 0.5)
+        assert len(consumer.grades) == 2
+        assert manager.get_stats()["coalesced"] == 3
+
+    def test_backoff(self, database, consumer):
+        consumer.success = False
+        manager = LTIOutcomeManager(database, None, FakeCourseFactory(), max_attempts=3, retry_delay=0.05)
+        manager.add("user1", "course", "task", "consumer1", "url", "result1")
+        wait_for(lambda: manager.get_stats()["failed_attempts"] == 1)
+        entry = database.lis_outcome_queue.find_one()
+        assert entry["nb_attempt"] == 1 and entry["next_attempt"] > datetime.now()
+
+        wait_for(lambda: manager.get_stats()["dropped"] == 1)
+        manager.stop()
+        assert len(consumer.grades) == 3
+        assert database.lis_outcome_queue.count_documents({}) == 0
+
+    def test_restart(self, database, consumer):
+        database.lis_outcome_queue.insert_one({"username": "user2", "courseid": "course", "taskid": "task",
+                                               "service_url": "url", "consumer_key": "consumer1",
+                                               "result_id": "result2", "nb_attempt": 0})
+        manager = LTIOutcomeManager(database, None, FakeCourseFactory())
+        wait_for(lambda: manager.get_stats()["sent"] == 1)
+        manager.stop()
+        assert consumer.grades == [("result2", 0.2)]
+
+    def test_out_of_order_versions(self, database, consumer):
+        consumer.release.clear()
+        manager = LTIOutcomeManager(database, None, FakeCourseFactory())
+        manager.add("user1", "course", "task", "consumer1", "url", "result1")
+        wait_for(lambda: consumer.running.get("consumer1") == 1)
+        stale = database.lis_outcome_queue.find_one()
+
+        # A concurrent add() schedules its (older) version after the newer one
+        manager.add("user1", "course", "task", "consumer1", "url", "result1")
+        manager._schedule(stale)
+        consumer.release.set()
+        wait_for(lambda: database.lis_outcome_queue.count_documents({}) == 0)
+        manager.stop()
+        assert len(consumer.grades) == 2
+
+    def test_stale_retry(self, database, consumer, monkeypatch):
+        consumer.release.clear()
+        consumer.success = False
+        manager = LTIOutcomeManager(database, None, FakeCourseFactory(), retry_delay=60)
+        manager.add("user1", "course", "task", "consumer1", "url", "result1")
+        wait_for(lambda: consumer.running.get("consumer1") == 1)
+
+        # A concurrent add() schedules a newer version after the retry of the failed sending is written
+        find_one_and_update = database.lis_outcome_queue.find_one_and_update
+
+        def concurrent_find_one_and_update(*args, **kwargs):
+            monkeypatch.setattr(database.lis_outcome_queue, "find_one_and_update", find_one_and_update)
+            result = find_one_and_update(*args, **kwargs)
+            consumer.success = True
+            manager.add("user1", "course", "task", "consumer1", "url", "result1")
+            return result
+        monkeypatch.setattr(database.lis_outcome_queue, "find_one_and_update", concurrent_find_one_and_update)
+
+        consumer.release.set()
+        wait_for(lambda: database.lis_outcome_queue.count_documents({}) == 0)
+        manager.stop()
+        assert len(consumer.grades) == 2
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+from datetime import timedelta
+
+import flask
+import mongomock
+import pytest
+
+from inginious.frontend.flask.mongo_sessions import MongoDBSessionInterface
+
+
+class CountingCollection(object):
+    """ Counts the requests made on a collection """
+    def __init__(self, collection):
+        self._collection = collection
+        self.calls = []
+
+    def __getattr__(self, name):
+        self.calls.append(name)
+        return getattr(self._collection, name)
+
+
+def make_app(**kwargs):
+    app = flask.Flask(__name__)
+    app.secret_key = "secret"
+    app.session_interface = MongoDBSessionInterface(mongomock.MongoClient(), "INGInious", "sessions", True, True,
+                                                    **kwargs)
+    app.session_interface.store = CountingCollection(app.session_interface.store)
+
+    @app.route("/login")
+    def login():
+        flask.session["user"] = {"name": "alice", "visits": 0}
+        return ""
+
+    @app.route("/visit")
+    def visit():
+        flask.session["user"]["visits"] += 1  # not seen by the session dict itself
+        return ""
+
+    @app.route("/get")
+    def get():
+        return str(flask.session["user"]["visits"])
+
+    return app
+
+
+@pytest.fixture
+def app():
+    return make_app()
+
+
+class TestMongoDBSessionInterface(object):
+
+    def test_unmodified_not_written(self, app):
+        client = app.test_client()
+        client.get("/login")
+        store = app.session_interface.store
+        assert store.calls.count("update_one") == 1
+        assert client.get("/get").data == b"0"
+        assert store.calls.count("update_one") == 1
+        assert store.calls.count("find_one") == 1
+
+    def test_nested_modification(self, app):
+        client = app.test_client()
+        client.get("/login")
+        client.get("/visit")
+        client.get("/visit")
+        assert app.session_interface.store.calls.count("update_one") == 3
+        assert client.get("/get").data == b"2"
+
+    def test_refresh_expiration(self):
+        app = make_app(refresh_interval=0)
+        client = app.test_client()
+        client.get("/login")
+        expiration = app.session_interface.store.find_one({})["expiration"]
+        app.permanent_session_lifetime = timedelta(days=40)
+        client.get("/get")
+        assert app.session_interface.store.find_one({})["expiration"] > expiration
+
+    def test_cache(self):
+        app = make_app(cache_ttl=60)
+        client = app.test_client()
+        client.get("/login")
+        client.get("/visit")
+        assert client.get("/get").data == b"1"
+        assert app.session_interface.store.calls.count("find_one") == 0
@@ -3,7 +3,22 @@
 # This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
 # more information about the licensing of this file.
 
-from inginious.frontend.parsable_text import ParsableText
+import gettext
+
+import mongomock
+import pytest
+
+from inginious.frontend.parsable_text import ParsableText, RenderCache, RenderContext, render_context
+
+
+@pytest.fixture(autouse=True)
+def cache():
+    """ Gives each test an empty cache of the rendered texts """
+    previous = ParsableText.get_cache()
+    cache = RenderCache()
+    ParsableText.set_cache(cache)
+    yield cache
+    ParsableText.set_cache(previous)
 
 
 class TestParsableText(object):
@@ -86,4 +101,64 @@ class TestParsableText(object):
             .. hidden-until:: 22/05/2102
 
                 Something
-            """, show_everything=True)
\ No newline at end of file
+            """, show_everything=True)
+
+
+class TestRenderCache(object):
+    def count_rst(self, monkeypatch):
+        calls = []
+        orig_rst = ParsableText.rst
+        monkeypatch.setattr(ParsableText, "rst", staticmethod(
+            lambda *args, **kwargs: calls.append(args) or orig_rst(*args, **kwargs)))
+        return calls
+
+    def test_cached(self, cache, monkeypatch):
+        calls = self.count_rst(monkeypatch)
+        first = ParsableText("``test``").parse()
+        assert ParsableText("``test``").parse() == first
+        assert len(calls) == 1
+        assert cache.get_stats()["hits"] == 1
+
+        ParsableText("``test``", show_everything=True).parse()
+        with render_context(RenderContext("fr", gettext.NullTranslations(), False)):
+            ParsableText("``test``").parse()
+        with render_context(RenderContext("", gettext.NullTranslations(), True)):
+            ParsableText("``test``").parse()
+        assert len(calls) == 4
+
+    def test_not_cached(self, cache, monkeypatch):
+        calls = self.count_rst(monkeypatch)
+        content = """
+        .. hidden-until:: 22/05/2102
+
+            Something
+        """
+        assert "Something" not in ParsableText(content).parse()
+        assert "Something" not in ParsableText(content).parse()
+        ParsableText.set_cache(None)
+        ParsableText("``test``").parse()
+        ParsableText("``test``").parse()
+        assert len(calls) == 4
+        assert cache.get_stats()["entries"] == 0
+
+    def test_bounded(self):
+        cache = RenderCache(max_entries=2)
+        ParsableText.set_cache(cache)
+        for i in range(3):
+            ParsableText("text %i" % i).parse()
+        assert cache.get_stats()["entries"] == 2
+        key = cache.get_key("text 0", "rst", False, RenderContext("", None, False))
+        assert cache.get(key) is None
+
+    def test_shared(self, monkeypatch):
+        database = mongomock.MongoClient().db
+        ParsableText.set_cache(RenderCache(database=database))
+        rendered = ParsableText("``test``").parse()
+        assert database.rendered_texts.count_documents({}) == 1
+
+        # Another process of the webapp
+        other = RenderCache(database=database)
+        ParsableText.set_cache(other)
+        calls = self.count_rst(monkeypatch)
+        assert ParsableText("``test``").parse() == rendered
+        assert not calls and other.get_stats()["shared_hits"] == 1
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import io
+import os
+import tarfile
+import time
+from datetime import datetime
+
+import bson
+import yaml
+from bson import ObjectId
+
+from inginious.frontend.submission_archive import SubmissionArchive
+
+
+class FakeGridFS(object):
+    def __init__(self):
+        self.files = {}
+        self.reads = 0
+
+    def put(self, data):
+        file_id = ObjectId()
+        self.files[file_id] = data
+        return file_id
+
+    def get(self, file_id):
+        self.reads += 1
+        return io.BytesIO(self.files[file_id])
+
+
+def make_job_archive(files):
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode="w:gz") as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name=name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return data.getvalue()
+
+
+def read_archive(archive):
+    with tarfile.open(fileobj=io.BytesIO(b"".join(archive)), mode="r:gz") as tar:
+        return {member.name: tar.extractfile(member).read() for member in tar.getmembers() if member.isfile()}
+
+
+class TestSubmissionArchive(object):
+
+    def make_submission(self, gridfs, upload=b"upload", **kwargs):
+        submission = {"_id": ObjectId(), "courseid": "course", "taskid": "task", "username": ["alice"],
+                      "submitted_on": datetime(2020, 1, 1), "archive": None,
+                      "input": gridfs.put(bson.BSON.encode({"code": "print(1)",
+                                                            "file": {"filename": "a.tar.gz", "value": upload}}))}
+        submission.update(kwargs)
+        return submission
+
+    def test_content(self):
+        gridfs = FakeGridFS()
+        submission = self.make_submission(gridfs, archive=gridfs.put(make_job_archive({"out/log.txt": b"log"})))
+        files = read_archive(SubmissionArchive(gridfs, [(submission, ["task/alice", "task/bob"])]))
+
+        assert set(files) == {prefix + name for prefix in ["task/alice/", "task/bob/"]
+                              for name in ["submission.test", "archive/out/log.txt", "uploaded_files/file.tar.gz"]}
+        assert files["task/bob/archive/out/log.txt"] == b"log"
+        assert files["task/alice/uploaded_files/file.tar.gz"] == b"upload"
+        assert yaml.safe_load(files["task/alice/submission.test"])["input"]["code"] == "print(1)"
+        assert isinstance(submission["input"], ObjectId)  # the submission given is not modified
+
+    def test_simplify_and_root(self):
+        gridfs = FakeGridFS()
+        files = read_archive(SubmissionArchive(gridfs, [(self.make_submission(gridfs), [""])], simplify=True))
+        assert set(files) == {"submission.test", "file.tar.gz"}
+
+    def test_errors(self):
+        gridfs = FakeGridFS()
+        broken = self.make_submission(gridfs, input=ObjectId())
+        submissions_paths = [(self.make_submission(gridfs, os.urandom(1000)), ["sub%i" % i]) for i in range(50)]
+        archive = SubmissionArchive(gridfs, submissions_paths[:20] + [(broken, ["broken"])] + submissions_paths[20:],
+                                    threads=4, prefetch=8, chunk_size=1)
+        chunks = list(archive)
+        files = read_archive(chunks)
+
+        assert len(chunks) > 1
+        assert archive.errors == [str(broken["_id"])]
+        assert files["errors.txt"] == (str(broken["_id"]) + "\n").encode("utf-8")
+        assert not any(name.startswith("broken") for name in files)
+        assert len([name for name in files if name.endswith("submission.test")]) == 50
+
+    def test_prefetch_size(self):
+        gridfs = FakeGridFS()
+        submissions_paths = [(self.make_submission(gridfs, os.urandom(100000)), ["sub%i" % i]) for i in range(30)]
+        archive = iter(SubmissionArchive(gridfs, submissions_paths, threads=2, prefetch=30, prefetch_size=150000,
+                                         chunk_size=1))
+        chunks = [next(archive)]
+        time.sleep(0.1)
+
+        # The first submission is written, two are prepared ahead and two are being prepared at most
+        assert gridfs.reads <= 5
+        chunks += list(archive)
+        assert len([name for name in read_archive(chunks) if name.endswith("submission.test")]) == 30
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import threading
+import time
+
+from bson import ObjectId
+
+from inginious.frontend.submission_notifier import SubmissionNotifier
+
+
+class TestSubmissionNotifier(object):
+
+    def test_publish(self):
+        notifier = SubmissionNotifier(None)
+        submissionid = ObjectId()
+        status = {"done": False}
+
+        def finish():
+            time.sleep(0.05)
+            notifier.publish(ObjectId())  # another submission
+            status["done"] = True
+            notifier.publish(submissionid)
+
+        thread = threading.Thread(target=finish)
+        thread.start()
+        start = time.monotonic()
+        assert notifier.wait(str(submissionid), lambda: status["done"], 5)
+        assert time.monotonic() - start < 1
+        thread.join()
+
+    def test_already_changed(self):
+        notifier = SubmissionNotifier(None)
+        assert notifier.wait(ObjectId(), lambda: True, 5)
+
+    def test_timeout(self):
+        notifier = SubmissionNotifier(None)
+        submissionid = ObjectId()
+        threading.Timer(0.02, lambda: notifier.publish(submissionid)).start()
+        assert not notifier.wait(submissionid, lambda: False, 0.1)
+        assert notifier._waiters == {}
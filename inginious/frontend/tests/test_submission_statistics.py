@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+from datetime import datetime
+
+import mongomock
+import pytest
+
+from inginious.frontend.submission_statistics import SubmissionStatisticsCache, record_submission_changes
+
+
+def submission(username, taskid, result, hour, tests=None, status="done"):
+    return {"courseid": "course", "taskid": taskid, "username": [username], "result": result, "status": status,
+            "submitted_on": datetime(2020, 1, 1, hour, 30), "tests": tests or {}, "stdout": "output"}
+
+
+@pytest.fixture
+def database(mongomock_bulk_sort):
+    database = mongomock.MongoClient().db
+    database.submissions.insert_many([
+        submission("alice", "task1", "failed", 8),
+        submission("alice", "task1", "success", 9, {"loop": True}),
+        submission("bob", "task1", "success", 9, {"loop": True, "syntax": False}),
+        submission("bob", "task2", "failed", 10, {"syntax": True}),
+        submission("bob", "other", "success", 10, {"loop": True}),
+    ])
+    return database
+
+
+class TestSubmissionStatistics(object):
+
+    def get_statistics(self, cache, database, best=(), hourly=True):
+        best_submissions = {sub["_id"] for sub in database.submissions.find({"result": "success"})} \
+            if best == "success" else set()
+        return cache.get_statistics("course", {"courseid": "course"}, 0, ["task1", "task2"], ["loop", "syntax"],
+                                    best_submissions, hourly)
+
+    def test_counters(self, database):
+        statistics = self.get_statistics(SubmissionStatisticsCache(database), database, "success")
+        assert (statistics.submissions, statistics.best, statistics.best_succeeded) == (5, 3, 3)
+        assert statistics.tasks == {"task1": [3, 2], "task2": [1, 0], "other": [1, 1]}
+        assert statistics.users == {"alice": [2, 1], "bob": [3, 2]}
+        assert statistics.periods == {datetime(2020, 1, 1, 8): [1, 0], datetime(2020, 1, 1, 9): [2, 2],
+                                      datetime(2020, 1, 1, 10): [2, 1]}
+
+        # the submission to the unknown task "other" is ignored by the tags
+        assert statistics.get_tag_results(False) == [("loop", 50.0, 100.0), ("syntax", 25.0, 0.0)]
+        results = dict((tagid, (total, best)) for tagid, total, best in statistics.get_tag_results(True))
+        assert results["loop"] == (pytest.approx(100 * (0.5 + 1 + 0) / 3), pytest.approx(100 * 2 / 3))
+        assert results["syntax"] == (pytest.approx(100 / 3), 0.0)
+
+    def test_daily(self, database):
+        statistics = self.get_statistics(SubmissionStatisticsCache(database), database, hourly=False)
+        assert statistics.periods == {datetime(2020, 1, 1): [5, 3]}
+
+    def test_cache(self, database):
+        cache = SubmissionStatisticsCache(database)
+        statistics = self.get_statistics(cache, database)
+        assert self.get_statistics(cache, database) is statistics
+
+        database.submissions.insert_one(submission("carol", "task2", None, 11, status="waiting"))
+        statistics = self.get_statistics(cache, database)
+        assert statistics.submissions == 6 and statistics.tasks["task2"] == [2, 0]
+        assert self.get_statistics(cache, database) is statistics
+
+        database.submissions.update_one({"username": "carol"}, {"$set": {"status": "done", "result": "success"}})
+        statistics = self.get_statistics(cache, database)
+        assert statistics.tasks["task2"] == [2, 1]
+
+        # replay of a submission that is not the last one, as done by replay_job and the JobCompletionWriter
+        database.submissions.update_one({"username": "bob", "taskid": "task2"}, {"$set": {"result": "success"}})
+        record_submission_changes(database, ["course"])
+        statistics = self.get_statistics(cache, database)
+        assert statistics.tasks["task2"] == [2, 2]
+        assert self.get_statistics(cache, database) is statistics
+
+    def test_cache_best_submissions(self, database):
+        cache = SubmissionStatisticsCache(database)
+        statistics = self.get_statistics(cache, database)
+        assert statistics.best == 0
+        # the evaluation mode of a task changed
+        assert self.get_statistics(cache, database, "success").best == 3
+
+    def test_cache_expiration(self, database):
+        cache = SubmissionStatisticsCache(database, max_entries=1, max_age=0)
+        statistics = self.get_statistics(cache, database)
+        assert self.get_statistics(cache, database) is not statistics
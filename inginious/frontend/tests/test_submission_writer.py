@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import gettext
+
+import mongomock
+import mongomock.collection
+import pymongo
+import pytest
+from bson import ObjectId
+
+from inginious.frontend.parsable_text import ParsableText, RenderCache, RenderContext
+from inginious.frontend.plugin_manager import PluginManager
+from inginious.frontend.submission_writer import JobCompletion, JobCompletionWriter
+from inginious.frontend.user_manager import UserManager
+
+
+class FakeCourse(object):
+    def get_id(self):
+        return "course"
+
+
+class FakeTask(object):
+    def __init__(self, taskid="task"):
+        self._taskid = taskid
+
+    def get_id(self):
+        return self._taskid
+
+
+class FakeTaskDispenser(object):
+    def __init__(self, evaluation_mode):
+        self._evaluation_mode = evaluation_mode
+
+    def get_evaluation_mode(self, taskid):
+        return self._evaluation_mode
+
+
+class FakeGridFS(object):
+    def __init__(self):
+        self.files = {}
+
+    def put(self, data):
+        file_id = ObjectId()
+        self.files[file_id] = data
+        return file_id
+
+
+class FakeLTIOutcomeManager(object):
+    def __init__(self):
+        self.outcomes = []
+
+    def add(self, username, courseid, taskid, consumer_key, service_url, result_id):
+        self.outcomes.append((username, courseid, taskid))
+
+
+def insert_submission(database, username, lti=False, taskid="task"):
+    submission = {"courseid": "course", "taskid": taskid, "username": [username], "status": "waiting",
+                  "jobid": "job"}
+    if lti:
+        submission.update({"outcome_service_url": "url", "outcome_result_id": "id", "outcome_consumer_key": "key"})
+    return database.submissions.insert_one(submission).inserted_id
+
+
+def completion(submissionid, grade, evaluation_mode="best", archive=None, taskid="task"):
+    result = ("success" if grade == 100.0 else "failed", "feedback")
+    return JobCompletion(submissionid, FakeCourse(), FakeTask(taskid), result, grade, {}, {}, {}, "state%i" % grade, archive, "",
+                         "", FakeTaskDispenser(evaluation_mode), True)
+
+
+def failing_submissions_bulk_write(exception):
+    """ Returns a Collection.bulk_write raising the given exception on the submissions collection """
+    bulk_write = mongomock.collection.Collection.bulk_write
+
+    def failing_bulk_write(collection, *args, **kwargs):
+        if collection.name == "submissions":
+            raise exception
+        return bulk_write(collection, *args, **kwargs)
+    return failing_bulk_write
+
+
+@pytest.fixture
+def database(mongomock_bulk_sort):
+    return mongomock.MongoClient().db
+
+
+class TestJobCompletionWriter(object):
+
+    def make_writer(self, database, **kwargs):
+        self.gridfs = FakeGridFS()
+        self.plugin_manager = PluginManager()
+        self.done = []
+        self.plugin_manager.add_hook("submission_done", lambda submission, archive, newsub: self.done.append(submission))
+        self.lti_outcome_manager = FakeLTIOutcomeManager()
+        return JobCompletionWriter(database, self.gridfs, UserManager(database, []), self.plugin_manager,
+                                   self.lti_outcome_manager, **kwargs)
+
+    def test_submissions(self, database):
+        writer = self.make_writer(database)
+        first = insert_submission(database, "alice")
+        second = insert_submission(database, "bob", lti=True)
+        writer.put(completion(first, 100.0, archive=b"archive"))
+        writer.put(completion(second, 50.0))
+        writer.close()
+
+        submission = database.submissions.find_one({"_id": first})
+        assert submission["status"] == "done" and submission["result"] == "success"
+        assert submission["grade"] == 100.0 and "jobid" not in submission
+        assert self.gridfs.files[submission["archive"]] == b"archive"
+        assert database.submissions.find_one({"_id": second})["archive"] is None
+        assert sorted(sub["_id"] for sub in self.done) == sorted([first, second])
+        assert self.lti_outcome_manager.outcomes == [("bob", "course", "task")]
+        assert writer.get_stats()["completions"] == 2
+
+    @pytest.mark.parametrize("evaluation_mode", ["best", "last"])
+    def test_user_tasks_same_as_update_user_stats(self, database, evaluation_mode):
+        """ The bulk updates of user_tasks must give the same result as UserManager.update_user_stats """
+        grades = [20.0, 80.0, 50.0, 100.0, 0.0]
+
+        writer = self.make_writer(database, workers=1, max_batch_size=3)
+        submissionids = [insert_submission(database, "alice") for _ in grades]
+        for submissionid, grade in zip(submissionids, grades):
+            writer.put(completion(submissionid, grade, evaluation_mode))
+        writer.close()
+        bulk = database.user_tasks.find_one({"username": "alice"}, {"_id": 0})
+
+        legacy_database = mongomock.MongoClient().legacy
+        user_manager = UserManager(legacy_database, [])
+        for submissionid, grade in zip(submissionids, grades):
+            c = completion(submissionid, grade, evaluation_mode)
+            user_manager.update_user_stats("alice", None, c.task, {"_id": submissionid, "courseid": "course",
+                                                                   "taskid": "task"},
+                                           c.result[0], grade, c.state, True, c.task_dispenser)
+        legacy = legacy_database.user_tasks.find_one({"username": "alice"}, {"_id": 0})
+
+        assert bulk == legacy
+        assert bulk["tried"] == 5
+        assert bulk["grade"] == (100.0 if evaluation_mode == "best" else 0.0)
+
+    def test_order(self, database):
+        """ The completions of a task are written in order, even with several workers """
+        writer = self.make_writer(database, workers=4, max_batch_size=2)
+        last = {}
+        for i in range(40):
+            taskid = "task%i" % (i % 8)
+            last[taskid] = insert_submission(database, "alice", taskid=taskid)
+            writer.put(completion(last[taskid], float(i), "last", taskid=taskid))
+        writer.close()
+
+        for taskid, submissionid in last.items():
+            user_task = database.user_tasks.find_one({"username": "alice", "taskid": taskid})
+            assert user_task["submissionid"] == submissionid and user_task["tried"] == 5
+
+    def test_backpressure(self, database):
+        writer = self.make_writer(database, workers=1, max_queue_size=2, max_batch_size=1)
+        for _ in range(20):
+            writer.put(completion(insert_submission(database, "alice"), 10.0))
+        writer.close()
+        stats = writer.get_stats()
+        assert stats["completions"] == 20
+        assert stats["max_queue_size"] <= 2
+        assert database.submissions.count_documents({"status": "done"}) == 20
+
+    def test_write(self, database):
+        writer = self.make_writer(database, workers=1)
+        submissionid = insert_submission(database, "alice")
+        writer.write(completion(submissionid, 100.0))
+
+        # Written before returning, without the workers
+        assert database.submissions.find_one({"_id": submissionid})["status"] == "done"
+        assert database.user_tasks.find_one({"username": "alice"})["grade"] == 100.0
+        assert [sub["_id"] for sub in self.done] == [submissionid]
+        assert writer.get_stats()["completions"] == 1
+        writer.close()
+
+    def test_render_feedback(self, database, monkeypatch):
+        cache = RenderCache()
+        monkeypatch.setattr(ParsableText, "_cache", cache)
+        context = RenderContext("fr", gettext.NullTranslations(), False)
+        writer = self.make_writer(database, workers=1)
+        submissionid = insert_submission(database, "alice")
+        writer.write(completion(submissionid, 50.0)._replace(problems={"q1": ["failed", "*Wrong*"]},
+                                                             render_context=context))
+        writer.close()
+
+        for text in ["feedback", "*Wrong*"]:
+            assert cache.get(cache.get_key(text, "rst", False, context)) is not None
+
+    def test_batch_failure(self, database, monkeypatch):
+        """ When a batch cannot be written, its completions are written one by one """
+        monkeypatch.setattr(mongomock.collection.Collection, "bulk_write",
+                            failing_submissions_bulk_write(pymongo.errors.AutoReconnect("connection lost")))
+
+        writer = self.make_writer(database, workers=1)
+        submissionids = [insert_submission(database, "alice"), insert_submission(database, "bob", lti=True)]
+        writer._write_batch([completion(submissionids[0], 100.0, archive=b"archive"),
+                             completion(submissionids[1], 50.0)])
+        writer.close()
+
+        assert database.submissions.count_documents({"status": "done"}) == 2
+        assert database.user_tasks.find_one({"username": "alice"})["tried"] == 1
+        assert database.user_tasks.find_one({"username": "bob"})["grade"] == 50.0
+        assert sorted(sub["_id"] for sub in self.done) == sorted(submissionids)
+        assert self.lti_outcome_manager.outcomes == [("bob", "course", "task")]
+
+    def test_user_tasks_failure(self, database, monkeypatch):
+        """ The operations on user_tasks that were not applied when the bulk write failed are retried """
+        bulk_write = mongomock.collection.Collection.bulk_write
+        failures = []
+
+        def failing_bulk_write(collection, operations, *args, **kwargs):
+            if collection.name == "user_tasks" and not failures:
+                # Apply the operations of the first submission and the first operation of the second one
+                failures.append(operations)
+                bulk_write(collection, operations[:4], *args, **kwargs)
+                raise pymongo.errors.BulkWriteError({"writeErrors": [{"index": 4}]})
+            return bulk_write(collection, operations, *args, **kwargs)
+        monkeypatch.setattr(mongomock.collection.Collection, "bulk_write", failing_bulk_write)
+
+        writer = self.make_writer(database, workers=1)
+        submissionids = [insert_submission(database, "alice") for _ in range(3)]
+        writer._write_batch([completion(submissionid, grade, "last")
+                             for submissionid, grade in zip(submissionids, [20.0, 80.0, 50.0])])
+        writer.close()
+
+        assert failures
+        user_task = database.user_tasks.find_one({"username": "alice"})
+        assert user_task["tried"] == 3
+        assert user_task["grade"] == 50.0
+        assert len(self.done) == 3
+
+    def test_unwritable_completion(self, database, monkeypatch):
+        """ A completion that cannot be written is stored as an error, without preventing the others to be written """
+        writer = self.make_writer(database, workers=1)
+        good, bad = insert_submission(database, "alice"), insert_submission(database, "bob")
+        find_one_and_update = mongomock.collection.Collection.find_one_and_update
+
+        def failing_find_one_and_update(collection, filter, update, *args, **kwargs):
+            if filter["_id"] == bad and update["$set"].get("status") == "done":
+                raise pymongo.errors.OperationFailure("invalid document")
+            return find_one_and_update(collection, filter, update, *args, **kwargs)
+        monkeypatch.setattr(mongomock.collection.Collection, "find_one_and_update", failing_find_one_and_update)
+        monkeypatch.setattr(mongomock.collection.Collection, "bulk_write",
+                            failing_submissions_bulk_write(pymongo.errors.OperationFailure("invalid document")))
+
+        writer._write_batch([completion(good, 100.0), completion(bad, 50.0)])
+        writer.close()
+
+        assert database.submissions.find_one({"_id": good})["status"] == "done"
+        assert database.submissions.find_one({"_id": bad})["status"] == "error"
+        assert sorted(sub["_id"] for sub in self.done) == sorted([good, bad])
@@ -7,6 +7,9 @@ from collections import OrderedDict
 
 import pytest
 import os
+import shutil
+import tempfile
+import time
 
 from inginious.common.filesystems.local import LocalFSProvider
 from inginious.common.exceptions import InvalidNameException, TaskUnreadableException
@@ -32,6 +35,25 @@ def ressource(request):
     yield taskset_factory, task_factory
 
 
+@pytest.fixture()
+def watched_ressource(request):
+    register_base_env_types()
+    dir_path = tempfile.mkdtemp()
+    shutil.copytree(os.path.join(os.path.dirname(__file__), 'tasks', 'test'), os.path.join(dir_path, 'test'))
+    taskset_factory, course_factory, task_factory = create_factories(LocalFSProvider(dir_path), task_dispensers,
+                                                                     problem_types, watch_filesystem=True)
+    yield taskset_factory, task_factory, dir_path
+    task_factory.close()
+    shutil.rmtree(dir_path)
+
+
+def wait_for(condition, timeout=10):
+    start = time.monotonic()
+    while not condition() and time.monotonic() - start < timeout:
+        time.sleep(0.01)
+    return condition()
+
+
 class TestTaskBasic(object):
 
     def test_task_loading(self, ressource):
@@ -180,3 +202,77 @@ class TestTaskProblem(object):
         assert not p.input_is_consistent({"unittest": {"filename": "test.txt", "content": "test"}}, [".txt"],
                                          100)
         assert not p.input_is_consistent({"unittest": "text"}, [".txt"], 100)
+
+
+class TestTaskCacheWatch(object):
+
+    def test_cache_hit_without_filesystem_access(self, watched_ressource, monkeypatch):
+        taskset_factory, task_factory, _ = watched_ressource
+        taskset = taskset_factory.get_taskset('test')
+        tasks = task_factory.get_all_tasks(taskset)
+        assert sorted(tasks) == ['task1', 'task2', 'task3', 'task4']
+
+        def fail(*args, **kwargs):
+            raise AssertionError("filesystem accessed")
+        monkeypatch.setattr(LocalFSProvider, "exists", fail)
+        monkeypatch.setattr(LocalFSProvider, "list", fail)
+        monkeypatch.setattr(LocalFSProvider, "get_last_modification_time", fail)
+        assert task_factory.get_all_tasks(taskset) == tasks
+
+    def test_external_changes(self, watched_ressource):
+        taskset_factory, task_factory, dir_path = watched_ressource
+        taskset = taskset_factory.get_taskset('test')
+        task = task_factory.get_task(taskset, 'task1')
+        with open(os.path.join(dir_path, 'test', 'task1', 'task.yaml')) as f:
+            content = f.read()
+        with open(os.path.join(dir_path, 'test', 'task1', 'task.yaml'), 'w') as f:
+            f.write(content.replace('name: "Task 3"', 'name: "Changed"'))
+        assert wait_for(lambda: task_factory.get_task(taskset, 'task1') is not task)
+        assert task_factory.get_task(taskset, 'task1').get_name(None) == "Changed"
+
+        shutil.copytree(os.path.join(dir_path, 'test', 'task1'), os.path.join(dir_path, 'test', 'task5'))
+        assert wait_for(lambda: 'task5' in task_factory.get_all_tasks(taskset))
+        shutil.rmtree(os.path.join(dir_path, 'test', 'task5'))
+        assert wait_for(lambda: 'task5' not in task_factory.get_all_tasks(taskset))
+
+    def test_update_through_factory(self, watched_ressource):
+        taskset_factory, task_factory, _ = watched_ressource
+        taskset = taskset_factory.get_taskset('test')
+        task = task_factory.get_task(taskset, 'task1')
+        content = task_factory.get_task_descriptor_content('test', 'task1')
+        content["name"] = "Updated"
+        task_factory.update_task_descriptor_content('test', 'task1', content)
+        assert task_factory.get_task(taskset, 'task1').get_name(None) == "Updated"
+
+    def test_changes_not_seen_by_the_watcher(self, monkeypatch):
+        """ The changes made from another host on a network filesystem are seen by the periodic checks """
+        class BlindWatcher(object):
+            def stop(self):
+                pass
+        monkeypatch.setattr(LocalFSProvider, "watch", lambda self, callback: BlindWatcher())
+
+        register_base_env_types()
+        dir_path = tempfile.mkdtemp()
+        shutil.copytree(os.path.join(os.path.dirname(__file__), 'tasks', 'test'), os.path.join(dir_path, 'test'))
+        try:
+            taskset_factory, _, task_factory = create_factories(LocalFSProvider(dir_path), task_dispensers,
+                                                                problem_types, watch_filesystem=True,
+                                                                check_interval=0.5)
+            taskset = taskset_factory.get_taskset('test')
+            task = task_factory.get_task(taskset, 'task1')
+            assert 'task5' not in task_factory.get_all_tasks(taskset)
+
+            descriptor = os.path.join(dir_path, 'test', 'task1', 'task.yaml')
+            with open(descriptor) as f:
+                content = f.read()
+            with open(descriptor, 'w') as f:
+                f.write(content.replace('name: "Task 3"', 'name: "Changed"'))
+            os.utime(descriptor, (time.time() + 10, time.time() + 10))
+            shutil.copytree(os.path.join(dir_path, 'test', 'task1'), os.path.join(dir_path, 'test', 'task5'))
+            assert task_factory.get_task(taskset, 'task1') is task
+
+            time.sleep(0.6)
+            assert task_factory.get_task(taskset, 'task1').get_name(None) == "Changed"
+            assert 'task5' in task_factory.get_all_tasks(taskset)
+        finally:
+            shutil.rmtree(dir_path)
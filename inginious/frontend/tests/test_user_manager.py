@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+import mongomock
+import pymongo
+import pytest
+
+from inginious.frontend.user_manager import UserManager
+
+
+class FakeCourse(object):
+    def __init__(self, courseid, admins):
+        self._courseid = courseid
+        self._admins = admins
+
+    def get_id(self):
+        return self._courseid
+
+    def get_admins(self):
+        return self._admins
+
+
+@pytest.fixture
+def user_manager():
+    database = mongomock.MongoClient().db
+    database.course_registrations.create_index([("courseid", pymongo.ASCENDING), ("username", pymongo.ASCENDING)],
+                                               unique=True)
+    database.users.insert_many([{"username": username, "realname": username, "email": username + "@example.com",
+                                 "bindings": {}, "language": "en"} for username in ["alice", "bob", "carol", "admin"]])
+    return UserManager(database, [])
+
+
+class TestCourseRegistrations(object):
+
+    def test_register(self, user_manager):
+        course = FakeCourse("course", ["admin"])
+        assert user_manager.course_register_user(course, "alice", force=True)
+        assert not user_manager.course_register_user(course, "alice", force=True)
+        assert user_manager.course_is_user_registered(course, "alice")
+        assert not user_manager.course_is_user_registered(course, "bob")
+        assert not user_manager.course_is_user_registered(FakeCourse("other", []), "alice")
+        assert sorted(user_manager.get_course_registered_users(course)) == ["admin", "alice"]
+        assert user_manager.get_course_registered_users(course, False) == ["alice"]
+
+    def test_bulk(self, user_manager):
+        course = FakeCourse("course", ["admin"])
+        user_manager.course_register_user(course, "alice", force=True)
+        assert user_manager.course_register_users(course, ["alice", "bob", "carol", "admin", "unknown"]) == \
+               ["bob", "carol"]
+        assert sorted(user_manager.get_course_registered_users(course, False)) == ["alice", "bob", "carol"]
+
+        user_manager._database.audiences.insert_one({"courseid": "course", "students": ["alice", "bob"], "tutors": []})
+        user_manager.course_unregister_users("course", ["alice", "carol"])
+        assert user_manager.get_course_registered_users(course, False) == ["bob"]
+        assert user_manager._database.audiences.find_one({})["students"] == ["bob"]
+
+    def test_delete_user(self, user_manager):
+        user_manager.course_register_user(FakeCourse("course", []), "alice", force=True)
+        user_manager.course_register_user(FakeCourse("other", []), "alice", force=True)
+        assert user_manager.delete_user("alice")
+        assert user_manager._database.course_registrations.count_documents({}) == 0
@@ -17,13 +17,16 @@ from functools import reduce
 from natsort import natsorted
 from collections import OrderedDict, namedtuple
 import pymongo
-from pymongo import ReturnDocument
+from pymongo import ReturnDocument, UpdateOne
 from binascii import hexlify
 import os
 import re
 from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError
 
+from inginious.frontend.course_user_summary import get_course_user_summaries, update_course_user_summaries, \
+    delete_course_user_summaries
+
 
 class AuthInvalidInputException(Exception):
     pass
@@ -558,8 +561,9 @@ class UserManager:
         else:
             self._database.submissions.delete_many({"username": username})
             self._database.user_tasks.delete_many({"username": username})
-            user_courses = self._database.courses.find({"students": username})
-            for elem in user_courses: self.course_unregister_user(elem['_id'], username)
+            delete_course_user_summaries(self._database, username=username)
+            user_courses = self._database.course_registrations.find({"username": username})
+            for elem in user_courses: self.course_unregister_user(elem['courseid'], username)
         return True
 
     def create_user(self, values):
@@ -614,43 +618,29 @@ class UserManager:
             Note that only the task already seen at least one time will be present in the dict task_grades.
         """
 
-        match = {"courseid": course.get_id()}
-        if usernames is not None:
-            match["username"] = {"$in": usernames}
-
-        tasks = course.get_tasks()
-        taskids = tasks.keys()
-        match["taskid"] = {"$in": list(taskids)}
-
-        data = list(self._database.user_tasks.aggregate(
-            [
-                {"$match": match},
-                {"$group": {
-                    "_id": "$username",
-                    "task_tried": {"$sum": {"$cond": [{"$ne": ["$tried", 0]}, 1, 0]}},
-                    "total_tries": {"$sum": "$tried"},
-                    "task_succeeded": {"$addToSet": {"$cond": ["$succeeded", "$taskid", False]}},
-                    "task_grades": {"$addToSet": {"taskid": "$taskid", "grade": "$grade"}}
-                }}
-            ]))
-
         if usernames is None:
             usernames = self.get_course_registered_users(course=course, with_admins=False)
 
+        summaries = get_course_user_summaries(self._database, course.get_id(), usernames, course.get_tasks().keys())
+
         retval = {username: {"task_succeeded": 0, "task_grades": [], "grade": 0} for username in usernames}
 
         users_tasks_list = course.get_task_dispenser().get_user_task_list(usernames)
         users_grade = course.get_task_dispenser().get_course_grades(usernames)
 
-        for result in data:
-            username = result["_id"]
-            visible_tasks = users_tasks_list.get(username, [])
-            result["task_succeeded"] = len(set(result["task_succeeded"]).intersection(visible_tasks))
-            result["task_grades"] = {dg["taskid"]: dg["grade"] for dg in result["task_grades"] if
-                                     dg["taskid"] in visible_tasks}
-
-            result["grade"] = users_grade[username]
-            retval[username] = result
+        for username, user_tasks in summaries.items():
+            if not user_tasks:
+                continue
+            visible_tasks = set(users_tasks_list.get(username, []))
+            retval[username] = {
+                "task_tried": sum(1 for user_task in user_tasks.values() if user_task["tried"] != 0),
+                "total_tries": sum(user_task["tried"] for user_task in user_tasks.values()),
+                "task_succeeded": sum(1 for taskid, user_task in user_tasks.items()
+                                      if user_task["succeeded"] and taskid in visible_tasks),
+                "task_grades": {taskid: user_task["grade"] for taskid, user_task in user_tasks.items()
+                                if taskid in visible_tasks},
+                "grade": users_grade[username]
+            }
 
         return retval
 
@@ -695,31 +685,23 @@ class UserManager:
 
     def user_saw_task(self, username, courseid, taskid):
         """ Set in the database that the user has viewed this task """
-        self._database.user_tasks.update_one({"username": username, "courseid": courseid, "taskid": taskid},
-                                             {"$setOnInsert": {"username": username, "courseid": courseid,
-                                                               "taskid": taskid,
-                                                               "tried": 0, "succeeded": False, "grade": 0.0,
-                                                               "submissionid": None, "state": ""}},
-                                             upsert=True)
+        result = self._database.user_tasks.update_one({"username": username, "courseid": courseid, "taskid": taskid},
+                                                      {"$setOnInsert": {"username": username, "courseid": courseid,
+                                                                        "taskid": taskid,
+                                                                        "tried": 0, "succeeded": False, "grade": 0.0,
+                                                                        "submissionid": None, "state": ""}},
+                                                      upsert=True)
+        if result.upserted_id is not None:
+            update_course_user_summaries(self._database, courseid, [username])
 
     def update_user_stats(self, username, course, task, submission, result_str, grade, state, newsub, task_dispenser):
         """ Update stats with a new submission """
         self.user_saw_task(username, submission["courseid"], submission["taskid"])
 
         if newsub:
-            old_submission = self._database.user_tasks.find_one_and_update(
-                {"username": username, "courseid": submission["courseid"], "taskid": submission["taskid"]},
-                {"$inc": {"tried": 1, "tokens.amount": 1}})
-
-            # Check if the submission is the default download
-            set_default = task_dispenser.get_evaluation_mode(task.get_id()) == 'last' or \
-                          (task_dispenser.get_evaluation_mode(task.get_id()) == 'best' and old_submission.get('grade', 0.0) <= grade)
-
-            if set_default:
-                self._database.user_tasks.find_one_and_update(
-                    {"username": username, "courseid": submission["courseid"], "taskid": submission["taskid"]},
-                    {"$set": {"succeeded": result_str == "success", "grade": grade, "state": state,
-                              "submissionid": submission['_id']}})
+            self._database.user_tasks.bulk_write(
+                self.get_new_submission_operations(username, submission, result_str, grade, state,
+                                                   task_dispenser.get_evaluation_mode(task.get_id())), ordered=True)
         else:
             old_submission = self._database.user_tasks.find_one(
                 {"username": username, "courseid": submission["courseid"], "taskid": submission["taskid"]})
@@ -754,6 +736,28 @@ class UserManager:
                         "state": submission["state"]
                     }})
 
+        update_course_user_summaries(self._database, submission["courseid"], [username])
+
+    @staticmethod
+    def get_new_submission_operations(username, submission, result_str, grade, state, evaluation_mode):
+        """ Returns the operations on the user_tasks collection recording a new submission of a user, to be applied
+            in order. The submission becomes the default one if it is the last one, or if it is the best one: the
+            grade is compared by the database, as another thread may be updating the same entry. """
+        key = {"username": username, "courseid": submission["courseid"], "taskid": submission["taskid"]}
+        operations = [UpdateOne(key, {"$setOnInsert": {"username": username, "courseid": submission["courseid"],
+                                                       "taskid": submission["taskid"],
+                                                       "tried": 0, "succeeded": False, "grade": 0.0,
+                                                       "submissionid": None, "state": ""}}, upsert=True),
+                      UpdateOne(key, {"$inc": {"tried": 1, "tokens.amount": 1}})]
+
+        set_default = {"$set": {"succeeded": result_str == "success", "grade": grade, "state": state,
+                                "submissionid": submission["_id"]}}
+        if evaluation_mode == 'last':
+            operations.append(UpdateOne(key, set_default))
+        elif evaluation_mode == 'best':
+            operations.append(UpdateOne(dict(key, grade={"$lte": grade}), set_default))
+        return operations
+
     def task_is_visible_by_user(self, course, task, username=None, lti=None):
         """ Returns true if the task is visible and can be accessed by the user
 
@@ -899,12 +903,48 @@ class UserManager:
         if self.course_is_user_registered(course, username):
             return False  # already registered?
 
-        self._database.courses.find_one_and_update({"_id": course.get_id()}, {"$push": {"students": username}},
-                                                   upsert=True)
+        try:
+            self._database.course_registrations.insert_one({"courseid": course.get_id(), "username": username})
+        except pymongo.errors.DuplicateKeyError:
+            return False  # registered concurrently
 
         self._logger.info("User %s registered to course %s", username, course.get_id())
         return True
 
+    def course_register_users(self, course, usernames):
+        """
+        Registers several users to a course at once, without checking the registration conditions of the course
+        (as the registrations made by the course administrators)
+        :param course: a Course object
+        :param usernames: an iterable of usernames. Unknown users, administrators and already registered users are
+            ignored.
+        :return: the list of the newly registered usernames
+        """
+        usernames = set(usernames) - set(course.get_admins())
+        if not usernames:
+            return []
+
+        existing = {user["username"] for user in self._database.users.find({"username": {"$in": list(usernames)}},
+                                                                            {"username": 1})}
+        registered = {registration["username"] for registration in self._database.course_registrations.find(
+            {"courseid": course.get_id(), "username": {"$in": list(existing)}}, {"username": 1})}
+        new_usernames = sorted(existing - registered)
+        if not new_usernames:
+            return []
+
+        try:
+            self._database.course_registrations.insert_many(
+                [{"courseid": course.get_id(), "username": username} for username in new_usernames], ordered=False)
+        except pymongo.errors.BulkWriteError as e:
+            # Users registered concurrently are not newly registered
+            if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+                raise
+            duplicates = {error["op"]["username"] for error in e.details["writeErrors"]}
+            new_usernames = [username for username in new_usernames if username not in duplicates]
+
+        self._logger.info("%i users registered to course %s", len(new_usernames), course.get_id())
+        return new_usernames
+
     def course_unregister_user(self, course_id, username=None):
         """
         Unregister a user to the course
@@ -929,10 +969,29 @@ class UserManager:
             {"courseid": course_id, "students": username},
             {"$pull": {"students": username}})
 
-        self._database.courses.find_one_and_update({"_id": course_id}, {"$pull": {"students": username}})
+        self._database.course_registrations.delete_one({"courseid": course_id, "username": username})
 
         self._logger.info("User %s unregistered from course %s", username, course_id)
 
+    def course_unregister_users(self, course_id, usernames):
+        """
+        Unregisters several users from a course at once, and removes them from the audiences and groups of the course
+        :param course_id: a course id
+        :param usernames: an iterable of usernames
+        """
+        usernames = list(set(usernames))
+        if not usernames:
+            return
+
+        self._database.audiences.update_many({"courseid": course_id, "students": {"$in": usernames}},
+                                             {"$pull": {"students": {"$in": usernames}}})
+        self._database.groups.update_many({"courseid": course_id, "students": {"$in": usernames}},
+                                          {"$pull": {"students": {"$in": usernames}}})
+        result = self._database.course_registrations.delete_many({"courseid": course_id,
+                                                                  "username": {"$in": usernames}})
+
+        self._logger.info("%i users unregistered from course %s", result.deleted_count, course_id)
+
     def course_is_open_to_user(self, course, username=None, lti=None, return_reason=False):
         """ Checks if a user is can access a course
 
@@ -997,7 +1056,8 @@ class UserManager:
         if self.has_admin_rights_on_course(course, username):
             return True
 
-        return self._database.courses.find_one({"students": username, "_id": course.get_id()}) is not None
+        return self._database.course_registrations.find_one({"courseid": course.get_id(),
+                                                             "username": username}) is not None
 
     def get_course_registered_users(self, course, with_admins=True):
         """
@@ -1007,8 +1067,8 @@ class UserManager:
         :return: a list of usernames that are registered to the course
         """
 
-        course_obj = self._database.courses.find_one({"_id": course.get_id()})
-        l = course_obj.get("students", []) if course_obj else []
+        l = [registration["username"] for registration in
+             self._database.course_registrations.find({"courseid": course.get_id()}, {"username": 1})]
 
         if with_admins:
             return list(set(l + course.get_admins()))
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures the time needed to get the tasks accessible to all the students of a course (as done by the grades and
+    student list pages), with the accessibilities shared between the users, or with an AccessibleTime parsed for
+    each task and user as before.
+"""
+
+import argparse
+import time
+
+import inginious.frontend.accessible_time as accessible_time
+from inginious.frontend.task_dispensers.toc import TableOfContents
+from inginious.frontend.task_dispensers.util import Accessibility
+
+
+def legacy_user_task_list(dispenser, taskids, usernames):
+    """ TaskDispenser.get_user_task_list, as it was with a new AccessibleTime for each task and user """
+    task_config = dispenser.get_dispenser_data()["config"]
+    parse_date = accessible_time.parse_date
+    accessible_time.parse_date = parse_date.__wrapped__  # without memoization
+    try:
+        result = {username: {taskid: accessible_time.AccessibleTime(
+            Accessibility.get_value(task_config.get(taskid, {}))) for taskid in taskids} for username in usernames}
+        return {username: [taskid for taskid in result[username].keys() if result[username][taskid].after_start()]
+                for username in result}
+    finally:
+        accessible_time.parse_date = parse_date
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=2000, help="number of students")
+    parser.add_argument("--tasks", type=int, default=100, help="number of tasks")
+    parser.add_argument("--legacy", action="store_true", help="parse the accessibility for each task and user")
+    args = parser.parse_args()
+
+    tasks = {"task%i" % i: None for i in range(args.tasks)}
+    config = {taskid: {"accessibility": "2020-%02i-01 08:00 / 2030-%02i-15 / 2030-%02i-20 23:59:59"
+                                        % ((i % 12) + 1, (i % 12) + 1, (i % 12) + 1)}
+              for i, taskid in enumerate(tasks)}
+    dispenser = TableOfContents(lambda: tasks, {"toc": [], "config": config}, None, "course")
+    usernames = ["user%i" % i for i in range(args.users)]
+
+    start = time.perf_counter()
+    if args.legacy:
+        result = legacy_user_task_list(dispenser, tasks, usernames)
+    else:
+        result = dispenser.get_user_task_list(usernames)
+    elapsed = time.perf_counter() - start
+
+    assert all(len(taskids) == args.tasks for taskids in result.values())
+    print("%s: %.1f ms for %i users x %i tasks" % ("legacy" if args.legacy else "shared", elapsed * 1000, args.users,
+                                                   args.tasks))
+
+
+if __name__ == "__main__":
+    main()
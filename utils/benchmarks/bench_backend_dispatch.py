@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Measures the time needed by the backend to schedule a burst of submissions on its agents """
+
+import argparse
+import asyncio
+import time
+
+import zmq.asyncio
+
+from inginious.backend.backend import Backend
+from inginious.common.messages import AgentHello, ClientHello, ClientNewJob
+
+
+class FakeSocket(object):
+    """ Counts the frames sent by the backend, without sending them """
+
+    def __init__(self):
+        self.frames = 0
+        self.messages = 0
+
+    async def send_multipart(self, message):
+        self.frames += 1
+        self.messages += len(message) - 1
+
+
+async def burst(args, agents_first):
+    context = zmq.asyncio.Context()
+    backend = Backend(context, "inproc://agent", "inproc://client")
+    backend._agent_socket.close()
+    backend._client_socket.close()
+    backend._agent_socket = agent_socket = FakeSocket()
+    backend._client_socket = FakeSocket()
+    await backend.handle_client_hello(b"client", ClientHello("bench"))
+
+    environments = {"docker": {"env%d" % i: {"id": "env%d" % i, "created": 0, "ports": []}
+                               for i in range(args.environments)}}
+    jobs = [ClientNewJob("job%d" % i, 0, "taskset", "task%d" % (i % 20), {}, {"@state": ""}, "docker",
+                         "env%d" % (i % args.environments), {"limits": {"time": 30}}, False, "user%d" % i)
+            for i in range(args.jobs)]
+
+    async def add_agents():
+        for i in range(args.agents):
+            await backend.handle_agent_hello(("agent%d" % i).encode(),
+                                             AgentHello("agent%d" % i, args.slots, environments))
+
+    async def add_jobs():
+        for job in jobs:
+            await backend.handle_client_new_job(b"client", job)
+
+    start = time.perf_counter()
+    if agents_first:
+        await add_agents()
+        start = time.perf_counter()
+        await add_jobs()
+    else:
+        await add_jobs()
+        await add_agents()
+    elapsed = time.perf_counter() - start
+
+    print("%-22s %5d jobs dispatched in %7.2f ms (%d frames to agents, %d jobs still waiting)" % (
+        "agents then jobs:" if agents_first else "jobs then agents:", agent_socket.messages, elapsed * 1000,
+        agent_socket.frames, len(backend._waiting_jobs)))
+    context.destroy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, default=500, help="number of submissions in the burst")
+    parser.add_argument("--agents", type=int, default=16, help="number of agents")
+    parser.add_argument("--slots", type=int, default=32, help="number of job slots per agent")
+    parser.add_argument("--environments", type=int, default=10, help="number of environments")
+    args = parser.parse_args()
+
+    asyncio.run(burst(args, agents_first=False))
+    asyncio.run(burst(args, agents_first=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures the throughput and the peak memory allocated by the decoding of the stream sent by a grading container to the
+    Docker agent, on a synthetic multiplexed stream made of many small messages, or of a single large result message.
+    The previous decoder, which re-sliced its buffer for each message, can be run for comparison with --legacy.
+"""
+
+import argparse
+import asyncio
+import logging
+import struct
+import time
+import tracemalloc
+
+import msgpack
+
+from inginious.agent.docker_agent._container_stream import ContainerStreamDecoder
+
+
+def build_stream(size, small, frame_size):
+    if small:
+        messages = []
+        total = 0
+        i = 0
+        while total < size:
+            encoded = msgpack.dumps({"type": "stdin", "student_container_id": "c" * 64, "n": i, "data": "x" * 100},
+                                    use_bin_type=True)
+            messages.append(struct.pack('!I', len(encoded)) + encoded)
+            total += len(messages[-1])
+            i += 1
+        payload = b"".join(messages)
+    else:
+        encoded = msgpack.dumps({"type": "result", "result": {"archive": "x" * size}}, use_bin_type=True)
+        payload = struct.pack('!I', len(encoded)) + encoded
+    frames = [struct.pack('>BxxxL', 1, len(payload[i:i + frame_size])) + payload[i:i + frame_size]
+              for i in range(0, len(payload), frame_size)]
+    return b"".join(frames)
+
+
+async def legacy_messages(reader_stream):
+    """ The previous implementation of the decoding, copying the buffer for each message """
+    buffer = bytearray()
+    while not reader_stream.at_eof():
+        outtype, length = struct.unpack_from('>BxxxL', await reader_stream.readexactly(8))
+        content = await reader_stream.readexactly(length)
+        if outtype == 1:
+            buffer += content
+        while len(buffer) > 4 and len(buffer) >= 4 + struct.unpack('!I', buffer[0:4])[0]:
+            length = struct.unpack('!I', buffer[0:4])[0]
+            msg = buffer[4:4 + length]
+            buffer = buffer[4 + length:]
+            yield msgpack.unpackb(msg, use_list=False)
+
+
+async def decode(data, legacy):
+    reader = asyncio.StreamReader()
+
+    async def feed():
+        """ Feeds the stream progressively, as a socket would """
+        with memoryview(data) as view:
+            for i in range(0, len(data), 65536):
+                reader.feed_data(view[i:i + 65536])
+                await asyncio.sleep(0)
+        reader.feed_eof()
+
+    feeder = asyncio.ensure_future(feed())
+    messages = legacy_messages(reader) if legacy else ContainerStreamDecoder(reader, logging.getLogger()).messages()
+    count = 0
+    try:
+        async for _ in messages:
+            count += 1
+    except asyncio.IncompleteReadError:
+        pass  # end of the stream, as in the agent
+    await feeder
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=50, help="size of the stream, in MB")
+    parser.add_argument("--frame-size", type=int, default=32768, help="size of the docker frames, in bytes")
+    parser.add_argument("--large", action="store_true", help="send a single large result instead of small messages")
+    parser.add_argument("--legacy", action="store_true", help="use the previous decoder")
+    args = parser.parse_args()
+
+    data = build_stream(args.size * 1024 * 1024, not args.large, args.frame_size)
+    start = time.perf_counter()
+    count = asyncio.run(decode(data, args.legacy))
+    elapsed = time.perf_counter() - start
+
+    # second run to measure the memory, as tracing the allocations slows down the decoding
+    tracemalloc.start()
+    asyncio.run(decode(data, args.legacy))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print("%s decoder: %d messages, %.1f MB in %.2f s (%.1f MB/s), peak memory %.1f MB" % (
+        "legacy" if args.legacy else "new", count, len(data) / 2 ** 20, elapsed, len(data) / 2 ** 20 / elapsed,
+        peak / 2 ** 20))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures the time needed to compute the grades and progress of all the students of a course, as displayed by the
+    student list page, from the course_user_summary collection, or by aggregating the user_tasks as before, with a
+    mocked database (mongomock).
+"""
+
+import argparse
+import time
+
+import mongomock
+
+from inginious.frontend.course_user_summary import create_course_user_summary_indexes, rebuild_course_user_summaries
+from inginious.frontend.task_dispensers.toc import TableOfContents
+from inginious.frontend.user_manager import UserManager
+
+
+class FakeCourse(object):
+    def __init__(self, tasks, dispenser):
+        self._tasks = tasks
+        self._dispenser = dispenser
+
+    def get_id(self):
+        return "course"
+
+    def get_tasks(self):
+        return self._tasks
+
+    def get_task_dispenser(self):
+        return self._dispenser
+
+    def get_admins(self):
+        return []
+
+
+def legacy_course_caches(database, usernames, course):
+    """ UserManager.get_course_caches and TableOfContents.get_course_grades, as they were with the user_tasks """
+    taskids = list(course.get_tasks().keys())
+    data = list(database.user_tasks.aggregate([
+        {"$match": {"courseid": course.get_id(), "username": {"$in": usernames}, "taskid": {"$in": taskids}}},
+        {"$group": {
+            "_id": "$username",
+            "task_tried": {"$sum": {"$cond": [{"$ne": ["$tried", 0]}, 1, 0]}},
+            "total_tries": {"$sum": "$tried"},
+            "task_succeeded": {"$addToSet": {"$cond": ["$succeeded", "$taskid", False]}},
+            "task_grades": {"$addToSet": {"taskid": "$taskid", "grade": "$grade"}}
+        }}]))
+    dispenser = course.get_task_dispenser()
+    users_tasks_list = dispenser.get_user_task_list(usernames)
+    task_list = dispenser.get_accessibility_matrix(taskids, usernames)
+    tasks_scores = {username: [0.0, 0.0] for username in usernames}
+    for user_task in database.user_tasks.find({"username": {"$in": usernames}, "courseid": course.get_id(),
+                                               "taskid": {"$in": taskids}}):
+        if task_list.get(user_task["username"], user_task["taskid"]).after_start():
+            tasks_scores[user_task["username"]][0] += user_task["grade"] * dispenser.get_weight(user_task["taskid"])
+            tasks_scores[user_task["username"]][1] += dispenser.get_weight(user_task["taskid"])
+
+    retval = {username: {"task_succeeded": 0, "task_grades": [], "grade": 0} for username in usernames}
+    for result in data:
+        visible_tasks = users_tasks_list.get(result["_id"], [])
+        result["task_succeeded"] = len(set(result["task_succeeded"]).intersection(visible_tasks))
+        result["task_grades"] = {dg["taskid"]: dg["grade"] for dg in result["task_grades"]
+                                 if dg["taskid"] in visible_tasks}
+        score = tasks_scores[result["_id"]]
+        result["grade"] = round(score[0] / score[1]) if score[1] > 0 else 0
+        retval[result["_id"]] = result
+    return retval
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=5000, help="number of students")
+    parser.add_argument("--tasks", type=int, default=20, help="number of tasks")
+    parser.add_argument("--legacy", action="store_true", help="aggregate the user_tasks, as before")
+    args = parser.parse_args()
+
+    database = mongomock.MongoClient().INGInious
+    create_course_user_summary_indexes(database)
+    tasks = {"task%i" % i: None for i in range(args.tasks)}
+    usernames = ["user%i" % i for i in range(args.users)]
+    database.user_tasks.insert_many([
+        {"username": username, "courseid": "course", "taskid": taskid, "tried": (i + j) % 3,
+         "succeeded": (i + j) % 2 == 0, "grade": float((i * j) % 101), "submissionid": None, "state": ""}
+        for i, username in enumerate(usernames) for j, taskid in enumerate(tasks)])
+    rebuild_course_user_summaries(database)
+
+    dispenser = TableOfContents(lambda: tasks, {"toc": [], "config": {taskid: {"accessibility": True}
+                                                                      for taskid in tasks}}, database, "course")
+    course = FakeCourse(tasks, dispenser)
+    user_manager = UserManager(database, [])
+
+    start = time.perf_counter()
+    if args.legacy:
+        result = legacy_course_caches(database, usernames, course)
+    else:
+        result = user_manager.get_course_caches(usernames, course)
+    elapsed = time.perf_counter() - start
+
+    assert len(result) == args.users
+    print("%s: %.0f ms for the grades and progress of %i students x %i tasks"
+          % ("user_tasks" if args.legacy else "summaries", elapsed * 1000, args.users, args.tasks))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures the number of container lifecycles (create, start, kill, remove) per second done through DockerInterface,
+    against a fake Docker daemon listening on a Unix socket.
+"""
+
+import argparse
+import json
+import os
+import re
+import socketserver
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+
+import docker
+
+from inginious.agent.docker_agent._docker_interface import DockerInterface
+
+
+class FakeDockerHandler(BaseHTTPRequestHandler):
+    """ Answers the few endpoints used by a container lifecycle """
+    protocol_version = "HTTP/1.1"
+    counts = {"connections": 0, "requests": 0}
+
+    def setup(self):
+        super(FakeDockerHandler, self).setup()
+        self.counts["connections"] += 1
+
+    def address_string(self):
+        return "unix"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, code, content=None):
+        body = json.dumps(content).encode() if content is not None else b""
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        self.counts["requests"] += 1
+        length = int(self.headers.get("Content-Length", 0))
+        if length:
+            self.rfile.read(length)
+        path = re.sub(r"^/v[0-9.]+", "", self.path.split("?")[0])
+        if path == "/version":
+            self._reply(200, {"ApiVersion": "1.41", "Version": "20.10.0", "MinAPIVersion": "1.12"})
+        elif path == "/containers/create":
+            self._reply(201, {"Id": uuid.uuid4().hex, "Warnings": []})
+        elif path.endswith("/json"):
+            self._reply(200, {"Id": path.split("/")[2], "Name": "/bench", "State": {"Status": "created"}})
+        elif path.endswith("/start") or path.endswith("/kill") or self.command == "DELETE":
+            self._reply(204)
+        else:
+            self._reply(404, {"message": "not found"})
+
+    do_GET = do_POST = do_DELETE = _handle
+
+
+class FakeDockerDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass  # clients closing their connections
+
+
+class LegacyDockerInterface(DockerInterface):
+    """ A new client for each call, and a lookup of the container before each action """
+
+    @property
+    def _docker(self):
+        return docker.from_env()
+
+    def create_container(self, image, *args, **kwargs):
+        return self._docker.containers.create(image, stdin_open=True).id
+
+    def start_container(self, container_id):
+        self._docker.containers.get(container_id).start()
+
+    def kill_container(self, container_id, signal=None):
+        self._docker.containers.get(container_id).kill(signal)
+
+    def remove_container(self, container_id):
+        self._docker.containers.get(container_id).remove(v=True, link=False, force=True)
+
+
+def lifecycle(interface, tmp_dir):
+    container_id = interface.create_container("ingi/inginious-c-default", False, 100, tmp_dir, tmp_dir, tmp_dir,
+                                              tmp_dir, (1024, 1024), "runc")
+    interface.start_container(container_id)
+    interface.kill_container(container_id)
+    interface.remove_container(container_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lifecycles", type=int, default=2000, help="number of container lifecycles")
+    parser.add_argument("--threads", type=int, default=4, help="number of threads using the interface")
+    parser.add_argument("--legacy", action="store_true", help="use a new client for each call, as before")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        socket_path = os.path.join(tmp_dir, "docker.sock")
+        server = FakeDockerDaemon(socket_path, FakeDockerHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        os.environ["DOCKER_HOST"] = "unix://" + socket_path
+
+        interface = LegacyDockerInterface() if args.legacy else DockerInterface()
+        lifecycle(interface, tmp_dir)  # warm up
+        FakeDockerHandler.counts.update(connections=0, requests=0)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as executor:
+            for future in [executor.submit(lifecycle, interface, tmp_dir) for _ in range(args.lifecycles)]:
+                future.result()
+        elapsed = time.perf_counter() - start
+        server.shutdown()
+
+    print("%s interface: %i lifecycles in %.2f s (%.0f lifecycles/s), %.1f requests and %.2f connections per lifecycle"
+          % ("legacy" if args.legacy else "new", args.lifecycles, elapsed, args.lifecycles / elapsed,
+             FakeDockerHandler.counts["requests"] / args.lifecycles,
+             FakeDockerHandler.counts["connections"] / args.lifecycles))
+
+
+if __name__ == "__main__":
+    main()
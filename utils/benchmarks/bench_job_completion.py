@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Sends job completions at a fixed rate to the frontend, and measures how fast they are persisted in a mocked
+    database (in memory, with a simulated round trip time for each request). Compares the batched writer pool with
+    the previous behaviour, that wrote each completion with several requests from the event loop of the client.
+"""
+
+import argparse
+import copy
+import itertools
+import threading
+import time
+
+from bson import ObjectId
+from pymongo import ReplaceOne, ReturnDocument
+from pymongo.results import UpdateResult
+
+from inginious.frontend.course_user_summary import update_course_user_summaries
+from inginious.frontend.plugin_manager import PluginManager
+from inginious.frontend.submission_writer import JobCompletion, JobCompletionWriter
+from inginious.frontend.user_manager import UserManager
+
+
+class FakeCollection(object):
+    """
+        In-memory collection, indexed by key_fields, that implements the few requests used to persist the job
+        completions. Each request waits for a simulated round trip to the database.
+    """
+    def __init__(self, key_fields, latency):
+        self._key_fields = key_fields
+        self._latency = latency
+        self._lock = threading.Lock()
+        self.documents = {}
+
+    def _get_key(self, filter):
+        return tuple(filter[field] for field in self._key_fields)
+
+    def _find(self, filter):
+        """ Returns the keys of the documents matching a filter, found by key if it contains the key fields """
+        if not all(field in filter for field in self._key_fields):
+            return [key for key, document in self.documents.items() if all(
+                document.get(field) in value["$in"] if isinstance(value, dict) else document.get(field) == value
+                for field, value in filter.items())]
+        keys = itertools.product(*[filter[field]["$in"] if isinstance(filter[field], dict) else [filter[field]]
+                                   for field in self._key_fields])
+        return [key for key in keys if key in self.documents and all(
+            self.documents[key].get(field) <= value["$lte"] if isinstance(value, dict) and "$lte" in value else True
+            for field, value in filter.items())]
+
+    def _update(self, filter, update, upsert):
+        """ Updates a document and returns its previous version """
+        keys = self._find(filter)
+        if not keys and not upsert:
+            return None
+        if keys:
+            old = copy.deepcopy(self.documents[keys[0]])
+            document = self.documents[keys[0]]
+        else:
+            old = None
+            document = self.documents.setdefault(self._get_key(filter), dict(filter, **update.get("$setOnInsert", {})))
+        document.update(update.get("$set", {}))
+        for field in update.get("$unset", {}):
+            document.pop(field, None)
+        for field, value in update.get("$inc", {}).items():
+            *path, last = field.split(".")
+            target = document
+            for part in path:
+                target = target.setdefault(part, {})
+            target[last] = target.get(last, 0) + value
+        return old
+
+    def find(self, filter, *args, **kwargs):
+        time.sleep(self._latency)
+        with self._lock:
+            return [copy.deepcopy(self.documents[key]) for key in self._find(filter)]
+
+    def find_one(self, filter, *args, **kwargs):
+        documents = self.find(filter)
+        return documents[0] if documents else None
+
+    def update_one(self, filter, update, upsert=False):
+        time.sleep(self._latency)
+        with self._lock:
+            upserted = upsert and not self._find(filter)
+            self._update(filter, update, upsert)
+            return UpdateResult({"upserted": self._get_key(filter) if upserted else None}, True)
+
+    def find_one_and_update(self, filter, update, upsert=False, return_document=ReturnDocument.BEFORE):
+        time.sleep(self._latency)
+        with self._lock:
+            old = self._update(filter, update, upsert)
+            if return_document == ReturnDocument.AFTER:
+                return copy.deepcopy(self.documents[self._find(filter)[0]])
+            return old
+
+    def bulk_write(self, operations, ordered=True):
+        time.sleep(self._latency)
+        with self._lock:
+            for operation in operations:
+                if isinstance(operation, ReplaceOne):
+                    self.documents[self._get_key(operation._filter)] = copy.deepcopy(operation._doc)
+                else:
+                    self._update(operation._filter, operation._doc, operation._upsert)
+
+
+class FakeDatabase(object):
+    def __init__(self, latency):
+        self.submissions = FakeCollection(["_id"], latency)
+        self.user_tasks = FakeCollection(["username", "courseid", "taskid"], latency)
+        self.course_user_summary = FakeCollection(["courseid", "username"], latency)
+        self.submission_changes = FakeCollection(["_id"], latency)
+
+
+class FakeGridFS(object):
+    def put(self, data):
+        return ObjectId()
+
+
+class Course(object):
+    def get_id(self):
+        return "course"
+
+
+class Task(object):
+    def __init__(self, taskid):
+        self._taskid = taskid
+
+    def get_id(self):
+        return self._taskid
+
+
+class TaskDispenser(object):
+    def get_evaluation_mode(self, taskid):
+        return "best"
+
+
+def legacy_job_done(database, user_manager, completion):
+    """ The requests done by the previous version of WebAppSubmissionManager._job_done_callback """
+    submission = database.submissions.find_one({"_id": completion.submissionid})
+    database.submissions.find_one({"_id": submission["_id"]})  # get_input_from_submission
+    submission = database.submissions.find_one_and_update(
+        {"_id": submission["_id"]}, {"$set": {"status": "done", "grade": completion.grade}},
+        return_document=ReturnDocument.AFTER)
+    for username in submission["username"]:
+        # UserManager.update_user_stats, for a new submission
+        key = {"username": username, "courseid": submission["courseid"], "taskid": submission["taskid"]}
+        user_manager.user_saw_task(username, submission["courseid"], submission["taskid"])
+        old_submission = database.user_tasks.find_one_and_update(key, {"$inc": {"tried": 1, "tokens.amount": 1}})
+        if old_submission.get("grade", 0.0) <= completion.grade:
+            database.user_tasks.find_one_and_update(key, {"$set": {
+                "succeeded": completion.result[0] == "success", "grade": completion.grade, "state": completion.state,
+                "submissionid": submission["_id"]}})
+        update_course_user_summaries(database, submission["courseid"], [username])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--completions", type=int, default=5000, help="number of job completions")
+    parser.add_argument("--rate", type=float, default=1000, help="job completions per second")
+    parser.add_argument("--latency", type=float, default=0.5, help="round trip time of a request, in milliseconds")
+    parser.add_argument("--workers", type=int, default=2, help="number of writer threads")
+    parser.add_argument("--users", type=int, default=200, help="number of students")
+    parser.add_argument("--tasks", type=int, default=10, help="number of tasks")
+    parser.add_argument("--legacy", action="store_true", help="write each completion with individual requests")
+    args = parser.parse_args()
+
+    database = FakeDatabase(args.latency / 1000)
+    user_manager = UserManager(database, [])
+    submissionids = [ObjectId() for _ in range(args.completions)]
+    for i, submissionid in enumerate(submissionids):
+        database.submissions.documents[(submissionid,)] = {"_id": submissionid, "courseid": "course",
+                                                           "taskid": "task%i" % (i % args.tasks),
+                                                           "username": ["user%i" % (i % args.users)],
+                                                           "status": "waiting"}
+    completions = [JobCompletion(submissionid, Course(), Task("task%i" % (i % args.tasks)), ("success", ""),
+                                 float(i % 100), {}, {}, {}, "", None, "", "", TaskDispenser(), True)
+                   for i, submissionid in enumerate(submissionids)]
+
+    writer = None if args.legacy else JobCompletionWriter(database, FakeGridFS(), user_manager, PluginManager(),
+                                                          None, workers=args.workers)
+    start = time.perf_counter()
+    for i, completion in enumerate(completions):
+        delay = start + i / args.rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        if writer is None:
+            legacy_job_done(database, user_manager, completion)
+        else:
+            writer.put(completion)
+    if writer is not None:
+        writer.close()
+    elapsed = time.perf_counter() - start
+
+    assert all(submission["status"] == "done" for submission in database.submissions.documents.values())
+    print("%s: %i completions persisted in %.2f s (%.0f/s, offered %.0f/s)"
+          % ("legacy" if args.legacy else "writer pool", args.completions, elapsed, args.completions / elapsed,
+             args.rate))
+    if writer is not None:
+        stats = writer.get_stats()
+        print("batches: %i, mean batch size: %.1f, mean latency: %.1f ms, max latency: %.1f ms, "
+              "max queue size: %i, blocked puts: %i (%.2f s)"
+              % (stats["batches"], stats["mean_batch_size"], stats["mean_latency"] * 1000,
+                 stats["max_latency"] * 1000, stats["max_queue_size"], stats["blocked_puts"],
+                 stats["blocked_time"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures the throughput of the LTI grade pass-back, with the LTIOutcomeManager or with the single thread sending
+    one grade every 0.5 second as before, against a local stub tool consumer answering each request after a simulated
+    latency. The database is mocked in memory, with the few requests used by the LTIOutcomeManager.
+"""
+
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import bson
+from lti import OutcomeRequest
+
+from inginious.frontend.lti_outcome_manager import LTIOutcomeManager
+
+RESPONSE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<imsx_POXEnvelopeResponse xmlns="http://www.imsglobal.org/services/ltiv1p1/xsd/imsoms_v1p0">
+  <imsx_POXHeader><imsx_POXResponseHeaderInfo>
+    <imsx_version>V1.0</imsx_version><imsx_messageIdentifier>1</imsx_messageIdentifier>
+    <imsx_statusInfo><imsx_codeMajor>success</imsx_codeMajor><imsx_severity>status</imsx_severity>
+      <imsx_description>Score updated</imsx_description><imsx_messageRefIdentifier>1</imsx_messageRefIdentifier>
+      <imsx_operationRefIdentifier>replaceResult</imsx_operationRefIdentifier></imsx_statusInfo>
+  </imsx_POXResponseHeaderInfo></imsx_POXHeader>
+  <imsx_POXBody><replaceResultResponse/></imsx_POXBody>
+</imsx_POXEnvelopeResponse>"""
+
+
+def make_handler(latency, counter):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            time.sleep(latency)
+            with counter["lock"]:
+                counter["requests"] += 1
+            self.send_response(200)
+            self.send_header("Content-Type", "application/xml")
+            self.send_header("Content-Length", str(len(RESPONSE)))
+            self.end_headers()
+            self.wfile.write(RESPONSE)
+
+        def log_message(self, *args):
+            pass
+    return Handler
+
+
+class FakeCollection(object):
+    """ In-memory collection. Filters contain equalities and $in, updates $set and $inc. """
+    def __init__(self):
+        self.documents = {}
+
+    @staticmethod
+    def _match(document, filter):
+        return all(document.get(field) in value["$in"] if isinstance(value, dict) else document.get(field) == value
+                   for field, value in filter.items())
+
+    def insert_many(self, documents):
+        for document in documents:
+            document.setdefault("_id", bson.ObjectId())
+            self.documents[document["_id"]] = document
+
+    def find(self, filter, projection=None):
+        if isinstance(filter.get("_id"), bson.ObjectId):
+            documents = [self.documents[filter["_id"]]] if filter["_id"] in self.documents else []
+        else:
+            documents = self.documents.values()
+        return [dict(document) for document in documents if self._match(document, filter)]
+
+    def find_one(self, filter, projection=None):
+        documents = self.find(filter)
+        return documents[0] if documents else None
+
+    def find_one_and_update(self, filter, update, return_document=False, upsert=False):
+        documents = self.find(filter)
+        if not documents:
+            return None
+        document = self.documents[documents[0]["_id"]]
+        document.update(update.get("$set", {}))
+        for field, value in update.get("$inc", {}).items():
+            document[field] = document.get(field, 0) + value
+        return dict(document)
+
+    def delete_one(self, filter):
+        for document in self.find(filter)[:1]:
+            del self.documents[document["_id"]]
+
+
+class FakeDatabase(object):
+    def __init__(self):
+        self.user_tasks = FakeCollection()
+        self.lis_outcome_queue = FakeCollection()
+
+
+class FakeCourse(object):
+    def lti_keys(self):
+        return {"consumer%i" % i: "secret" for i in range(10)}
+
+
+class FakeCourseFactory(object):
+    def get_course(self, courseid):
+        return FakeCourse()
+
+
+def legacy_send(database, course_factory, grades):
+    """ LTIOutcomeManager.run, as it was """
+    for todo in list(database.lis_outcome_queue.find({}))[:grades]:
+        time.sleep(0.5)
+        course = course_factory.get_course(todo["courseid"])
+        consumer_secret = course.lti_keys()[todo["consumer_key"]]
+        grade = database.user_tasks.find_one({"username": todo["username"], "courseid": todo["courseid"],
+                                              "taskid": todo["taskid"]})["grade"] / 100.0
+        outcome_response = OutcomeRequest({"consumer_key": todo["consumer_key"], "consumer_secret": consumer_secret,
+                                           "lis_outcome_service_url": todo["service_url"],
+                                           "lis_result_sourcedid": todo["result_id"]}).post_replace_result(grade)
+        if outcome_response.code_major == "success":
+            database.lis_outcome_queue.delete_one({"_id": todo["_id"]})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--grades", type=int, default=2000, help="number of grades to send")
+    parser.add_argument("--consumers", type=int, default=4, help="number of tool consumers")
+    parser.add_argument("--latency", type=float, default=20, help="response time of the consumer, in milliseconds")
+    parser.add_argument("--workers", type=int, default=16, help="threads sending the grades")
+    parser.add_argument("--legacy", action="store_true", help="send one grade every 0.5 second, as before")
+    args = parser.parse_args()
+
+    counter = {"lock": threading.Lock(), "requests": 0}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(args.latency / 1000, counter))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    service_url = "http://127.0.0.1:%i/outcomes" % server.server_address[1]
+
+    database = FakeDatabase()
+    database.user_tasks.insert_many([{"courseid": "course", "taskid": "task", "username": "user%i" % i,
+                                      "grade": float(i % 101)} for i in range(args.grades)])
+    entries = [("user%i" % i, "course", "task", "consumer%i" % (i % args.consumers), service_url, "result%i" % i)
+               for i in range(args.grades)]
+
+    # The grades are queued beforehand, as after a deadline, and sent when the manager starts
+    database.lis_outcome_queue.insert_many([
+        {"username": username, "courseid": courseid, "taskid": taskid, "consumer_key": consumer_key,
+         "service_url": url, "result_id": result_id, "nb_attempt": 0}
+        for username, courseid, taskid, consumer_key, url, result_id in entries])
+
+    start = time.perf_counter()
+    if args.legacy:
+        legacy_send(database, FakeCourseFactory(), args.grades)
+    else:
+        manager = LTIOutcomeManager(database, None, FakeCourseFactory(), workers=args.workers)
+        while manager.get_stats()["sent"] < args.grades:
+            time.sleep(0.01)
+        manager.stop()
+    elapsed = time.perf_counter() - start
+
+    print("%s: %i grades sent in %.1f s (%.1f grades/s)" % ("legacy" if args.legacy else "LTIOutcomeManager",
+                                                           counter["requests"], elapsed,
+                                                           counter["requests"] / elapsed))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
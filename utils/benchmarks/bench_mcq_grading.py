@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures the submit-to-feedback latency of a quiz of multiple choice and match questions, graded in the webapp
+    with the problems of the cached task, or sent to a MCQ agent through a local client and backend (over inproc ZMQ
+    sockets, as in the local arch). The writing of the result in the database, the same in both cases, is not measured.
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+
+import yaml
+
+from inginious.agent.mcq_agent import MCQAgent, grader
+from inginious.backend.backend import Backend
+from inginious.client.client import Client
+from inginious.common.filesystems.local import LocalFSProvider
+from inginious.frontend.arch_helper import start_asyncio_and_zmq
+from inginious.frontend.environment_types import register_base_env_types
+from inginious.frontend.task_dispensers.toc import TableOfContents
+from inginious.frontend.task_problems import get_default_displayable_problem_types
+from inginious.frontend.taskset_factory import create_factories
+
+
+def create_quiz(tasks_dir, questions):
+    """ Creates a taskset with a quiz of the given number of questions, and returns a correct answer to it """
+    os.makedirs(os.path.join(tasks_dir, "bench", "quiz"))
+    with open(os.path.join(tasks_dir, "bench", "taskset.yaml"), "w") as f:
+        yaml.safe_dump({"name": "Benchmark", "admins": []}, f)
+
+    problems, answers = {}, {}
+    for i in range(questions):
+        if i % 2:
+            problems["q%i" % i] = {"type": "match", "name": "Question %i" % i, "header": "What is %i + 1?" % i,
+                                   "answer": str(i + 1)}
+            answers["q%i" % i] = str(i + 1)
+        else:
+            problems["q%i" % i] = {"type": "multiple_choice", "name": "Question %i" % i, "multiple": True,
+                                   "header": "Which ones?", "choices": [
+                                       {"text": "Choice %i" % j, "valid": j < 2, "feedback": "Feedback %i" % j}
+                                       for j in range(6)]}
+            answers["q%i" % i] = [0, 1]
+    with open(os.path.join(tasks_dir, "bench", "quiz", "task.yaml"), "w") as f:
+        yaml.safe_dump({"name": "Quiz", "environment_id": "mcq", "environment_type": "mcq",
+                        "problems": problems}, f)
+    return answers
+
+
+def in_process(task, answers, submissions):
+    latencies = []
+    for _ in range(submissions):
+        start = time.perf_counter()
+        grader.grade(task.get_problems(), dict(answers, **{"@lang": "fr", "@state": ""}), "fr")
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def with_agent(fs_provider, taskset_factory, taskset, task, answers, submissions):
+    zmq_context, _ = start_asyncio_and_zmq()
+    client = Client(zmq_context, "inproc://backend_client")
+    backend = Backend(zmq_context, "inproc://backend_agent", "inproc://backend_client")
+    agent = MCQAgent(zmq_context, "inproc://backend_agent", "MCQ - Local agent", 1, fs_provider,
+                     taskset_factory.get_task_factory().get_problem_types())
+    loop = client._loop
+    loop.call_soon_threadsafe(loop.create_task, agent.run())
+    loop.call_soon_threadsafe(loop.create_task, backend.run())
+    client.start()
+    while "mcq" not in client.get_available_environments():
+        time.sleep(0.01)
+
+    latencies = []
+    for _ in range(submissions):
+        done = threading.Event()
+        start = time.perf_counter()
+        client.new_job(0, taskset, task, dict(answers, **{"@lang": "fr", "@state": ""}), lambda *args: done.set())
+        done.wait()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--questions", type=int, default=20, help="number of questions of the quiz")
+    parser.add_argument("--submissions", type=int, default=500, help="number of submissions, graded one at a time")
+    parser.add_argument("--agent", action="store_true", help="grade the submissions with a MCQ agent")
+    args = parser.parse_args()
+
+    tasks_dir = tempfile.mkdtemp()
+    try:
+        answers = create_quiz(tasks_dir, args.questions)
+        register_base_env_types()
+        fs_provider = LocalFSProvider(tasks_dir)
+        taskset_factory, _, task_factory = create_factories(fs_provider, {TableOfContents.get_id(): TableOfContents},
+                                                            get_default_displayable_problem_types())
+        taskset = taskset_factory.get_taskset("bench")
+        task = task_factory.get_task(taskset, "quiz")
+
+        if args.agent:
+            latencies = with_agent(fs_provider, taskset_factory, taskset, task, answers, args.submissions)
+        else:
+            latencies = in_process(task, answers, args.submissions)
+    finally:
+        shutil.rmtree(tasks_dir)
+
+    latencies.sort()
+    print("%s: %i submissions of %i questions, latency mean %.3f ms, median %.3f ms, p99 %.3f ms" % (
+        "MCQ agent" if args.agent else "in process", args.submissions, args.questions,
+        statistics.mean(latencies) * 1000, latencies[len(latencies) // 2] * 1000,
+        latencies[int(len(latencies) * 0.99)] * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures the throughput of the course registrations, stored in the course_registrations collection, or pushed in
+    the students list of the course document as before. The database is mocked in memory: the documents are stored
+    encoded in BSON, so that, like with MongoDB, reading or updating a document costs in proportion to its size.
+"""
+
+import argparse
+import itertools
+import time
+
+import bson
+
+from inginious.frontend.user_manager import UserManager
+
+
+class FakeCursor(list):
+    def skip(self, skip):
+        return self
+
+    def limit(self, limit):
+        return self
+
+
+class FakeCollection(object):
+    """
+        In-memory collection, with a unique index on key_fields, that implements the few requests used by the
+        registrations. Filters contain either all the key fields (as values or {"$in": [...]}), or only equalities.
+    """
+    def __init__(self, key_fields):
+        self._key_fields = key_fields
+        self.documents = {}
+
+    def _find(self, filter):
+        if all(field in filter for field in self._key_fields):
+            keys = itertools.product(*[filter[field]["$in"] if isinstance(filter[field], dict) else [filter[field]]
+                                       for field in self._key_fields])
+            documents = [bson.decode(self.documents[key]) for key in keys if key in self.documents]
+        else:
+            documents = [bson.decode(document) for document in self.documents.values()]
+        return [document for document in documents if all(
+            value in document.get(field) if isinstance(document.get(field), list) else document.get(field) == value
+            for field, value in filter.items() if not isinstance(value, dict))]
+
+    def _insert(self, document):
+        key = tuple(document[field] for field in self._key_fields)
+        if key in self.documents:
+            raise Exception("Duplicate key")
+        self.documents[key] = bson.encode(document)
+
+    def find(self, filter, projection=None):
+        return FakeCursor(self._find(filter))
+
+    def find_one(self, filter, projection=None):
+        documents = self._find(filter)
+        return documents[0] if documents else None
+
+    def insert_one(self, document):
+        self._insert(document)
+
+    def insert_many(self, documents, ordered=True):
+        for document in documents:
+            self._insert(document)
+
+    def find_one_and_update(self, filter, update, upsert=False):
+        document = self.find_one(filter) or dict(filter)
+        for field, value in update["$push"].items():
+            document.setdefault(field, []).append(value)
+        self.documents[tuple(document[field] for field in self._key_fields)] = bson.encode(document)
+
+
+class FakeDatabase(object):
+    def __init__(self):
+        self.users = FakeCollection(["username"])
+        self.courses = FakeCollection(["_id"])
+        self.course_registrations = FakeCollection(["courseid", "username"])
+
+
+class FakeCourse(object):
+    def get_id(self):
+        return "course"
+
+    def get_admins(self):
+        return []
+
+
+def legacy_register(database, course, username):
+    """ UserManager.course_register_user, as it was with the students stored in the course document """
+    if database.courses.find_one({"students": username, "_id": course.get_id()}) is not None:
+        return False
+    database.courses.find_one_and_update({"_id": course.get_id()}, {"$push": {"students": username}}, upsert=True)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--registered", type=int, default=20000, help="number of students already registered")
+    parser.add_argument("--users", type=int, default=2000, help="number of students to register")
+    parser.add_argument("--mode", choices=["legacy", "single", "bulk"], default="single",
+                        help="legacy: push in the course document, single: one registration at a time, "
+                             "bulk: all the registrations at once")
+    args = parser.parse_args()
+
+    database = FakeDatabase()
+    registered = ["registered%i" % i for i in range(args.registered)]
+    usernames = ["user%i" % i for i in range(args.users)]
+    database.users.insert_many([{"username": username, "realname": username, "email": username + "@example.com",
+                                 "bindings": {}, "language": "en"} for username in usernames])
+    user_manager = UserManager(database, [])
+    course = FakeCourse()
+    if args.mode == "legacy":
+        database.courses.insert_one({"_id": "course", "name": "Course", "students": registered})
+    else:
+        database.courses.insert_one({"_id": "course", "name": "Course"})
+        database.course_registrations.insert_many([{"courseid": "course", "username": username}
+                                                   for username in registered])
+
+    start = time.perf_counter()
+    if args.mode == "legacy":
+        for username in usernames:
+            legacy_register(database, course, username)
+    elif args.mode == "single":
+        for username in usernames:
+            user_manager.course_register_user(course, username, force=True)
+    else:
+        user_manager.course_register_users(course, usernames)
+    elapsed = time.perf_counter() - start
+
+    print("%s: %.0f registrations/s with %i students already registered, course document of %i bytes"
+          % (args.mode, args.users / elapsed, args.registered, len(database.courses.documents[("course",)])))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures the time needed to render the texts of a task page (the statement of the task, the headers of its problems
+    and the feedback of the last submission) with ParsableText, with or without the cache of the rendered texts.
+"""
+
+import argparse
+import time
+
+from inginious.frontend.parsable_text import ParsableText, RenderCache
+
+STATEMENT = """
+Exercise
+--------
+
+Write a function ``fibonacci(n)`` returning the *n*-th Fibonacci number, computed in **linear** time.
+
+.. note::
+
+    The function must not be recursive. See `Wikipedia <https://en.wikipedia.org/wiki/Fibonacci_number>`_.
+
+.. code-block:: python
+
+    def fibonacci(n):
+        a, b = 0, 1
+        for _ in range(n):
+            a, b = b, a + b
+        return a
+
+=====  =========
+n      fibonacci
+=====  =========
+0      0
+1      1
+10     55
+=====  =========
+
+- The input is a positive integer.
+- The output is an integer.
+"""
+
+HEADER = """Question {i}: complete the function ``f{i}``, with at least *{i}* lines.
+
+.. code-block:: python
+
+    def f{i}():
+        pass
+"""
+
+FEEDBACK = """You have 2 wrong answer(s).
+
+.. error::
+
+    Test ``test_{i}`` failed: expected ``55``, got ``34``.
+"""
+
+
+def render_page(problems):
+    texts = [STATEMENT] + [HEADER.format(i=i) for i in range(problems)] + [FEEDBACK.format(i=0)]
+    return [ParsableText(text, "rst").parse() for text in texts]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--views", type=int, default=200, help="number of displays of the task page")
+    parser.add_argument("--problems", type=int, default=5, help="number of problems of the task")
+    args = parser.parse_args()
+
+    for name, cache in [("no cache", None), ("cache", RenderCache())]:
+        ParsableText.set_cache(cache)
+        start = time.perf_counter()
+        for _ in range(args.views):
+            render_page(args.problems)
+        elapsed = time.perf_counter() - start
+        print("%-8s: %i task pages rendered in %.2f s (%.3f ms per page)" % (name, args.views, elapsed,
+                                                                          elapsed / args.views * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures the time needed to replay the submission.test files of a taskset with the ReplayEngine, one at a time (as
+    inginious-autotest and inginious-test-task did) or with several of them submitted at the same time. The jobs are
+    graded by an agent sleeping for a fixed time instead of running a container, through a local client and backend.
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+import yaml
+
+from inginious.agent import Agent
+from inginious.backend.backend import Backend
+from inginious.client.client import Client
+from inginious.client.replay import ReplayCase, ReplayEngine, ReplayReport
+from inginious.common.filesystems.local import LocalFSProvider
+from inginious.frontend.arch_helper import start_asyncio_and_zmq
+from inginious.frontend.environment_types import register_base_env_types
+from inginious.frontend.task_dispensers.toc import TableOfContents
+from inginious.frontend.task_problems import get_default_displayable_problem_types
+from inginious.frontend.taskset_factory import create_factories
+
+
+class SleepAgent(Agent):
+    """ An agent whose jobs sleep for a fixed time, as long as a container run, and always succeed """
+
+    def __init__(self, context, backend_addr, concurrency, filesystem, duration):
+        super().__init__(context, backend_addr, "Sleep agent", concurrency, filesystem)
+        self.duration = duration
+
+    @property
+    def environments(self):
+        return {"docker": {"default": {"id": "default", "created": 0, "ports": []}}}
+
+    async def new_job(self, message):
+        await asyncio.sleep(self.duration)
+        await self.send_job_result(message.job_id, "success", "", 100.0, {}, {}, {}, "", None, "", "")
+
+    async def kill_job(self, message):
+        pass
+
+
+def create_taskset(tasks_dir, tasks):
+    os.makedirs(os.path.join(tasks_dir, "bench"))
+    with open(os.path.join(tasks_dir, "bench", "taskset.yaml"), "w") as f:
+        yaml.safe_dump({"name": "Benchmark", "admins": []}, f)
+    for i in range(tasks):
+        os.makedirs(os.path.join(tasks_dir, "bench", "task%i" % i))
+        with open(os.path.join(tasks_dir, "bench", "task%i" % i, "task.yaml"), "w") as f:
+            yaml.safe_dump({"name": "Task %i" % i, "environment_id": "default", "environment_type": "docker",
+                            "problems": {"q": {"type": "code", "name": "Q", "header": ""}}}, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks", type=int, default=10, help="number of tasks of the taskset")
+    parser.add_argument("--submissions", type=int, default=10, help="number of submission.test files per task")
+    parser.add_argument("--duration", type=float, default=0.1, help="duration of a job, in seconds")
+    parser.add_argument("--concurrency", type=int, default=16, help="number of jobs run at the same time by the agent")
+    parser.add_argument("--window", type=int, default=16, help="number of jobs submitted at the same time")
+    args = parser.parse_args()
+
+    tasks_dir = tempfile.mkdtemp()
+    try:
+        create_taskset(tasks_dir, args.tasks)
+        register_base_env_types()
+        fs_provider = LocalFSProvider(tasks_dir)
+        taskset_factory, _, _ = create_factories(fs_provider, {TableOfContents.get_id(): TableOfContents},
+                                                 get_default_displayable_problem_types())
+        taskset = taskset_factory.get_taskset("bench")
+        cases = [ReplayCase("task%i/test/%i.test" % (i, j), taskset, taskset.get_task("task%i" % i),
+                            {"input": {"q": "print(%i)" % j}, "result": "success", "grade": 100.0})
+                 for i in range(args.tasks) for j in range(args.submissions)]
+
+        zmq_context, _ = start_asyncio_and_zmq()
+        client = Client(zmq_context, "inproc://backend_client")
+        backend = Backend(zmq_context, "inproc://backend_agent", "inproc://backend_client")
+        agent = SleepAgent(zmq_context, "inproc://backend_agent", args.concurrency, fs_provider, args.duration)
+        loop = client._loop
+        loop.call_soon_threadsafe(loop.create_task, agent.run())
+        loop.call_soon_threadsafe(loop.create_task, backend.run())
+        client.start()
+
+        for window in sorted({1, args.window}):
+            report = ReplayReport()
+            start = time.perf_counter()
+            for result in ReplayEngine(client, window).replay(cases):
+                report.add(result)
+            elapsed = time.perf_counter() - start
+            print("window %3i: %i submissions replayed in %.2f s (%.1f submissions/s), %i failed" % (
+                window, len(cases), elapsed, len(cases) / elapsed, len(report.get_failed())))
+    finally:
+        shutil.rmtree(tasks_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Deterministic simulation of the backend scheduling policies. Replays a job arrival trace on a given number of job
+    slots, and reports the waiting time percentiles per course (taskset) for each policy.
+
+    A trace is a CSV file with the columns ``time,taskset_id,launcher,duration`` (times in seconds). Without a trace, a
+    synthetic one is generated: a course flooding the queue at the end of an exam, a few regular courses, and one
+    student resubmitting continuously.
+"""
+
+import argparse
+import csv
+import heapq
+import random
+
+from inginious.backend.job_durations import JobDurations
+from inginious.backend.scheduling_policies import create_scheduling_policy
+from inginious.backend.topic_priority_queue import TopicPriorityQueue
+from inginious.common.messages import ClientNewJob
+
+
+def generate_trace(seed):
+    rand = random.Random(seed)
+    trace = []
+    # exam: 600 students submitting during the last two minutes
+    for i in range(600):
+        trace.append((60 + rand.uniform(0, 120), "exam", "exam_student%d" % i, rand.uniform(5, 15)))
+    # regular courses, about one submission every 5 seconds each
+    for course in ["course1", "course2", "course3"]:
+        for i in range(60):
+            trace.append((rand.uniform(0, 300), course, "%s_student%d" % (course, rand.randint(0, 30)),
+                          rand.uniform(2, 6)))
+    # a student resubmitting every second
+    for i in range(120):
+        trace.append((100 + i, "course1", "spammer", 3.0))
+    trace.sort()
+    return trace
+
+
+def read_trace(path):
+    with open(path, newline="") as f:
+        return sorted((float(row["time"]), row["taskset_id"], row["launcher"], float(row["duration"]))
+                      for row in csv.DictReader(f))
+
+
+def write_trace(path, trace):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["time", "taskset_id", "launcher", "duration"])
+        writer.writerows(trace)
+
+
+def simulate(trace, slots, policy_config):
+    """ Returns the waiting times of the jobs of each taskset """
+    job_durations = JobDurations()
+    policy = create_scheduling_policy(policy_config, job_durations)
+    queue = TopicPriorityQueue()
+    events = [(arrival, 1, i) for i, (arrival, _, _, _) in enumerate(trace)]  # (time, type, job), 0 is job end
+    heapq.heapify(events)
+    free_slots = slots
+    waiting_times = {}
+
+    jobs = [ClientNewJob(str(i), 0, taskset_id, "task", {}, {}, "docker", "default", {}, False, launcher)
+            for i, (_, taskset_id, launcher, _) in enumerate(trace)]
+
+    while events:
+        now, event_type, i = heapq.heappop(events)
+        if event_type == 0:
+            free_slots += 1
+            job_durations.add(jobs[i], trace[i][3])
+        else:
+            queue.put("default", (policy.get_sort_key(jobs[i], now), now, i, jobs[i]), i)
+
+        while free_slots > 0 and not queue.empty():
+            sort_key, arrival, i, job = queue.get()
+            policy.job_dispatched(job, sort_key)
+            free_slots -= 1
+            waiting_times.setdefault(job.taskset_id, []).append(now - arrival)
+            heapq.heappush(events, (now + trace[i][3], 0, i))
+
+    return waiting_times
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trace", help="CSV trace to replay", default=None)
+    parser.add_argument("--write-trace", help="write the (generated) trace to a CSV file", default=None)
+    parser.add_argument("--slots", type=int, default=32, help="number of job slots of the agents")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic trace")
+    args = parser.parse_args()
+
+    trace = read_trace(args.trace) if args.trace else generate_trace(args.seed)
+    if args.write_trace:
+        write_trace(args.write_trace, trace)
+
+    configs = [{"policy": "fifo"}, {"policy": "wfq"}, {"policy": "wfq", "flow": "launcher"},
+               {"policy": "drr", "quantum": 4}, {"policy": "sejf"}]
+    print("%d jobs, %d slots" % (len(trace), args.slots))
+    for config in configs:
+        print()
+        print(", ".join("%s=%s" % item for item in config.items()))
+        print("    %-12s %6s %8s %8s %8s %8s" % ("taskset", "jobs", "p50", "p90", "p99", "max"))
+        waiting_times = simulate(trace, args.slots, config)
+        for taskset_id, times in sorted(waiting_times.items()):
+            print("    %-12s %6d %7.1fs %7.1fs %7.1fs %7.1fs" % (taskset_id, len(times), percentile(times, 50),
+                                                             percentile(times, 90), percentile(times, 99), max(times)))
+        total_waiting_time = sum(sum(times) for times in waiting_times.values())
+        print("    mean turnaround time: %.1fs" % ((total_waiting_time + sum(job[3] for job in trace)) / len(trace)))
+
+
+if __name__ == "__main__":
+    main()
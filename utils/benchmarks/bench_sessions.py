@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures the overhead of the sessions on requests that do not modify them (such as the AJAX polls of the task
+    page), with a mocked database (mongomock, with a simulated round trip time for each request).
+"""
+
+import argparse
+import time
+
+import flask
+import mongomock
+
+from inginious.frontend.flask.mongo_sessions import MongoDBSessionInterface
+
+
+class SlowCollection(object):
+    """ Collection that waits for a simulated round trip before each request """
+    def __init__(self, collection, latency):
+        self._collection = collection
+        self._latency = latency
+        self.requests = 0
+
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+
+        def call(*args, **kwargs):
+            self.requests += 1
+            time.sleep(self._latency)
+            return method(*args, **kwargs)
+        return call
+
+
+def run(args, session_interface):
+    app = flask.Flask(__name__)
+    app.secret_key = "secret"
+
+    @app.route("/login")
+    def login():
+        flask.session.update({"loggedin": True, "username": "student", "email": "student@example.com",
+                              "realname": "Student", "language": "en", "tos_signed": True, "token": None, "lti": None})
+        return ""
+
+    @app.route("/poll")
+    def poll():
+        return flask.session["username"]
+
+    if session_interface is not None:
+        app.session_interface = session_interface
+    client = app.test_client()
+    client.get("/login")
+
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        client.get("/poll")
+    return (time.perf_counter() - start) / args.requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000, help="number of requests")
+    parser.add_argument("--latency", type=float, default=0.5, help="round trip time of a request, in milliseconds")
+    parser.add_argument("--cache-ttl", type=float, default=0, help="lifetime of the session cache, in seconds")
+    parser.add_argument("--always-write", action="store_true",
+                        help="write the session at each request, as before (refresh_interval=0)")
+    args = parser.parse_args()
+
+    baseline = run(args, None)  # signed cookie sessions of flask, without database
+
+    session_interface = MongoDBSessionInterface(mongomock.MongoClient(), "INGInious", "sessions", True, True,
+                                                0 if args.always_write else 60, args.cache_ttl)
+    session_interface.store = SlowCollection(session_interface.store, args.latency / 1000)
+    per_request = run(args, session_interface)
+
+    print("%s, cache ttl %gs: %.3f ms of session overhead per request, %.2f database requests per request"
+          % ("always write" if args.always_write else "skip unmodified", args.cache_ttl,
+             (per_request - baseline) * 1000, session_interface.store.requests / (args.requests + 1)))
+
+
+if __name__ == "__main__":
+    main()
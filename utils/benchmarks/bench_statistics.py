@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures the time needed to compute the submission panels of the statistics page (tasks, users, graph, global and
+    tag statistics) in a single projected pass, with and without the cache, or with the four queries of before, one of
+    them reading the whole submissions. The database is mocked in memory: the submissions are stored encoded in BSON,
+    each query decodes all of them (as a collection scan does) and the documents returned are encoded and decoded
+    again (as they are sent to the webapp). The aggregations of before are run as such scans, grouped in Python.
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import bson
+
+from inginious.frontend.submission_statistics import SubmissionStatisticsCache
+
+TAGS = ["tag%i" % i for i in range(10)]
+
+
+class FakeCursor(list):
+    def limit(self, limit):
+        return self[:limit] if limit else self
+
+
+class FakeCollection(object):
+    """ In-memory collection of submissions, implementing the few requests of the statistics. Filters are ignored. """
+    def __init__(self):
+        self._documents = []
+        self._statuses = []
+
+    def insert_many(self, documents):
+        for document in documents:
+            document.setdefault("_id", bson.ObjectId())
+            self._documents.append(bson.encode(document))
+            self._statuses.append(document["status"])
+
+    def find(self, filter, projection=None, limit=0):
+        result = FakeCursor()
+        for data in self._documents[:limit or None]:
+            document = bson.decode(data)
+            if projection is not None:
+                projected = {"_id": document["_id"]}
+                for field in projection:
+                    field, _, subfield = field.partition(".")
+                    if field in document and subfield:
+                        projected.setdefault(field, {})[subfield] = document[field].get(subfield)
+                    elif field in document:
+                        projected[field] = document[field]
+                document = projected
+            result.append(bson.decode(bson.encode(document)))
+        return result
+
+    def find_one(self, filter, projection=None, sort=None):
+        return bson.decode(self._documents[-1]) if self._documents else None
+
+    def count_documents(self, filter):
+        return self._statuses.count(filter["status"])
+
+
+class FakeDatabase(object):
+    def __init__(self):
+        self.submissions = FakeCollection()
+
+
+def group(documents, key):
+    groups = {}
+    for document in documents:
+        for value in key(document):
+            counters = groups.setdefault(value, [0, 0])
+            counters[0] += 1
+            counters[1] += 1 if document["result"] == "success" else 0
+    return sorted(groups.items(), key=lambda x: -x[1][0])
+
+
+def legacy_statistics(database, filter, limit, taskids, best_submissions):
+    """ The _tasks_stats, _users_stats, _graph_stats and _global_stats of CourseStatisticsPage, as they were """
+    group(database.submissions.find(filter, {"taskid": 1, "result": 1}).limit(limit), lambda x: [x["taskid"]])
+    group(database.submissions.find(filter, {"username": 1, "result": 1}).limit(limit), lambda x: x["username"])
+    group(database.submissions.find(filter, {"submitted_on": 1, "result": 1}).limit(limit),
+          lambda x: [x["submitted_on"].date()])
+
+    data = list(database.submissions.find(filter).limit(limit))
+    super_dict = {}
+    for submission in data:
+        submission["best"] = submission["_id"] in best_submissions
+        if submission["taskid"] in taskids:
+            username = "".join(submission["username"])
+            for tag in TAGS:
+                counters = super_dict.setdefault(tag, {}).setdefault(username, {}).setdefault(submission["taskid"],
+                                                                                              [0, 0, 0, 0])
+                counters[0] += 1
+                if "tests" in submission and tag in submission["tests"] and submission["tests"][tag]:
+                    counters[1] += 1
+                if submission["best"]:
+                    counters[2] += 1
+                    if "tests" in submission and tag in submission["tests"] and submission["tests"][tag]:
+                        counters[3] += 1
+    return len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--submissions", type=int, default=200000, help="number of submissions")
+    parser.add_argument("--users", type=int, default=2000, help="number of students")
+    parser.add_argument("--tasks", type=int, default=50, help="number of tasks")
+    parser.add_argument("--legacy", action="store_true", help="run the four queries of before")
+    args = parser.parse_args()
+
+    random.seed(0)
+    database = FakeDatabase()
+    taskids = ["task%i" % i for i in range(args.tasks)]
+    start_date = datetime(2020, 1, 1)
+    database.submissions.insert_many([
+        {"courseid": "course", "taskid": random.choice(taskids), "username": ["user%i" % random.randrange(args.users)],
+         "submitted_on": start_date + timedelta(seconds=random.randrange(60 * 86400)), "status": "done",
+         "result": random.choice(["success", "failed"]), "grade": 50.0, "text": "Feedback " * 20,
+         "problems": {"q1": ["failed", "Wrong answer " * 20]}, "stdout": "output\n" * 100, "stderr": "",
+         "tests": {tag: random.random() < 0.2 for tag in TAGS}, "input": None, "archive": None}
+        for _ in range(args.submissions)])
+    best_submissions = {submission["_id"] for submission in database.submissions.find({}, {}).limit(
+        args.users * args.tasks // 2)}
+    filter = {"courseid": "course", "submitted_on": {"$gte": start_date, "$lt": start_date + timedelta(days=61)}}
+
+    if args.legacy:
+        start = time.perf_counter()
+        count = legacy_statistics(database, filter, args.submissions, set(taskids), best_submissions)
+        print("legacy: %.1f s for %i submissions" % (time.perf_counter() - start, count))
+    else:
+        cache = SubmissionStatisticsCache(database)
+        for run in ["single pass", "cached"]:
+            start = time.perf_counter()
+            statistics = cache.get_statistics("course", filter, args.submissions, taskids, TAGS, best_submissions,
+                                              False)
+            statistics.get_tag_results(False)
+            print("%s: %.3f s for %i submissions" % (run, time.perf_counter() - start, statistics.submissions))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures the overhead per test case of a student session: the time needed to send a command to the student
+    container of the session, run it and get back its return value and resources used, minus the time needed to run
+    the command directly. The student container is replaced by a thread of this process, running the same code on the
+    other end of the socket. With --image, the time needed to create, start, wait and remove a container of this image
+    with Docker (what run_student does for each test case) is measured too.
+"""
+
+import argparse
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "base-containers", "base"))
+from inginious_container_api import run_student  # noqa: E402
+from inginious_container_api.utils import receive_session_command, serve_student_session  # noqa: E402
+
+
+class LocalStudentSession(run_student.StudentSession):
+    """ A student session whose student container is a thread of this process """
+
+    def __init__(self):
+        super(LocalStudentSession, self).__init__()
+        self._shared_kernel = True
+        self._start()
+
+    def _start(self):
+        self._connection, student = socket.socketpair(socket.AF_UNIX)
+        self._student = threading.Thread(target=self._serve, args=(student,))
+        self._student.start()
+        assert self._connection.recv(1) == b'H'
+
+    @staticmethod
+    def _serve(sock):
+        sock.send(b'H')
+        fds, command = receive_session_command(sock)
+        serve_student_session(sock, fds, command, lambda: None)
+        sock.close()
+
+    def _wait_for_container(self):
+        self._student.join()
+        self._retval = 0
+        return self._retval
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cases", type=int, default=200, help="number of test cases")
+    parser.add_argument("--command", default="true", help="command run for each test case")
+    parser.add_argument("--image", help="Docker image of a student container, to measure a container lifecycle")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    for _ in range(args.cases):
+        subprocess.run(shlex.split(args.command), stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+    direct = (time.perf_counter() - start) / args.cases
+
+    with LocalStudentSession() as session:
+        start = time.perf_counter()
+        for _ in range(args.cases):
+            session.run(args.command)
+        in_session = (time.perf_counter() - start) / args.cases
+    print("student session: %.3f ms per test case (%.3f ms of overhead over running the command directly)" % (
+        in_session * 1000, (in_session - direct) * 1000))
+
+    if args.image:
+        import docker
+        client = docker.from_env()
+        cases = min(args.cases, 20)
+        start = time.perf_counter()
+        for _ in range(cases):
+            client.containers.run(args.image, args.command, network_mode="none", remove=True)
+        per_container = (time.perf_counter() - start) / cases
+        print("new container:   %.3f ms per test case (%i containers)" % (per_container * 1000, cases))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures the time needed to export the submissions of a task as a tgz archive, streamed by a SubmissionArchive or
+    written in a temporary file as before, with the submission inputs and job archives in an in-memory GridFS (with a
+    simulated round trip time for each read).
+"""
+
+import argparse
+import io
+import os
+import tarfile
+import tempfile
+import time
+from datetime import datetime
+
+import bson
+from bson import ObjectId
+
+import inginious.common.custom_yaml
+from inginious.frontend.submission_archive import SubmissionArchive
+
+
+class FakeGridFS(object):
+    """ In-memory GridFS, waiting for a simulated round trip before each read """
+    def __init__(self, latency):
+        self._files = {}
+        self._latency = latency
+
+    def put(self, data):
+        file_id = ObjectId()
+        self._files[file_id] = data
+        return file_id
+
+    def get(self, file_id):
+        time.sleep(self._latency)
+        return io.BytesIO(self._files[file_id])
+
+
+def legacy_archive(gridfs, submissions_paths):
+    """ WebAppSubmissionManager.get_submission_archive, as it was """
+    tmpfile = tempfile.TemporaryFile()
+    tar = tarfile.open(fileobj=tmpfile, mode='w:gz')
+    for submission, paths in submissions_paths:
+        for base_path in paths:
+            submission = dict(submission)
+            if not isinstance(submission["input"], dict):
+                submission["input"] = bson.BSON.decode(gridfs.get(submission['input']).read())
+            submission_yaml = io.BytesIO(inginious.common.custom_yaml.dump(submission).encode('utf-8'))
+            submission_yaml_fname = base_path + '/submission.test'
+            if submission_yaml_fname not in tar.getnames():
+                info = tarfile.TarInfo(name=submission_yaml_fname)
+                info.size = submission_yaml.getbuffer().nbytes
+                info.mtime = time.mktime(submission["submitted_on"].timetuple())
+                tar.addfile(info, fileobj=submission_yaml)
+
+                if submission.get("archive"):
+                    subfile = gridfs.get(submission['archive'])
+                    subtar = tarfile.open(fileobj=subfile, mode="r:gz")
+                    for member in subtar.getmembers():
+                        subtarfile = subtar.extractfile(member)
+                        member.name = base_path + "/archive/" + member.name
+                        tar.addfile(member, subtarfile)
+                    subtar.close()
+                    subfile.close()
+
+                for pid, problem in submission['input'].items():
+                    if isinstance(problem, dict) and "filename" in problem:
+                        _, ext = os.path.splitext(problem['filename'])
+                        subfile = io.BytesIO(problem['value'])
+                        info = tarfile.TarInfo(name=base_path + '/uploaded_files/' + pid + ext)
+                        info.size = subfile.getbuffer().nbytes
+                        info.mtime = time.mktime(submission["submitted_on"].timetuple())
+                        tar.addfile(info, fileobj=subfile)
+    tar.close()
+    tmpfile.seek(0)
+    while tmpfile.read(1024 * 1024):
+        pass
+
+
+def make_job_archive(i):
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode="w:gz") as tar:
+        for name, content in [("stdout.txt", b"test %i passed\n" % i * 50), ("result.json", b'{"grade": %i}' % i)]:
+            info = tarfile.TarInfo(name=name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return data.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--submissions", type=int, default=10000, help="number of submissions")
+    parser.add_argument("--latency", type=float, default=0.5, help="round trip time of a GridFS read, in milliseconds")
+    parser.add_argument("--threads", type=int, default=8, help="threads preparing the submissions")
+    parser.add_argument("--legacy", action="store_true", help="write the archive in a temporary file, as before")
+    args = parser.parse_args()
+
+    gridfs = FakeGridFS(args.latency / 1000)
+    submissions_paths = []
+    for i in range(args.submissions):
+        task_input = {"code": "def f(x):\n    return x * %i\n" % i,
+                      "file": {"filename": "answer.py", "value": b"print(%i)\n" % i * 20}}
+        submission = {"_id": ObjectId(), "courseid": "course", "taskid": "task%i" % (i % 10),
+                      "username": ["user%i" % (i % 1000)], "submitted_on": datetime(2020, 1, 1), "status": "done",
+                      "result": "success", "grade": 100.0, "text": "Well done", "problems": {},
+                      "input": gridfs.put(bson.BSON.encode(task_input)), "archive": gridfs.put(make_job_archive(i))}
+        submissions_paths.append((submission, ["%s/%s/%i" % (submission["taskid"], submission["username"][0], i)]))
+
+    start = time.perf_counter()
+    if args.legacy:
+        legacy_archive(gridfs, submissions_paths)
+        first_chunk = time.perf_counter() - start
+    else:
+        first_chunk = None
+        for _ in SubmissionArchive(gridfs, submissions_paths, threads=args.threads):
+            if first_chunk is None:
+                first_chunk = time.perf_counter() - start
+    elapsed = time.perf_counter() - start
+
+    print("%s: %.1f s for %i submissions (%.0f submissions/s), first chunk after %.2f s"
+          % ("legacy" if args.legacy else "streamed", elapsed, args.submissions, args.submissions / elapsed,
+             first_chunk))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Measures the time needed to get all the (already cached) tasks of a large taskset, as done by many pages, with
+    the task cache validated by watching the filesystem, or by checking the modification times of the task files.
+"""
+
+import argparse
+import os
+import shutil
+import struct
+import tempfile
+import time
+
+from inginious.common.filesystems.local import LocalFSProvider
+from inginious.frontend.environment_types import register_base_env_types
+from inginious.frontend.task_problems import get_default_displayable_problem_types
+from inginious.frontend.taskset_factory import create_factories
+
+TASK = """
+author: Author
+name: "Task {}"
+environment_type: docker
+environment_id: default
+environment_parameters:
+    limits: {{time: 30, memory: 100, disk: 100}}
+problems:
+    question:
+        type: code
+        name: Question
+        header: Write some code
+        language: python
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks", type=int, default=300, help="number of tasks in the taskset")
+    parser.add_argument("--loads", type=int, default=100, help="number of loads of the taskset")
+    parser.add_argument("--mtime", action="store_true", help="check the modification times, as before")
+    args = parser.parse_args()
+
+    register_base_env_types()
+    dir_path = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(dir_path, "taskset", "$i18n"))
+        with open(os.path.join(dir_path, "taskset", "taskset.yaml"), "w") as f:
+            f.write("name: Taskset\nadmins: []\n")
+        for lang in ["fr", "de", "es"]:
+            with open(os.path.join(dir_path, "taskset", "$i18n", lang + ".mo"), "wb") as f:
+                f.write(struct.pack("<7I", 0x950412de, 0, 0, 28, 28, 0, 28))  # empty catalog
+        for i in range(args.tasks):
+            os.makedirs(os.path.join(dir_path, "taskset", "task%i" % i))
+            with open(os.path.join(dir_path, "taskset", "task%i" % i, "task.yaml"), "w") as f:
+                f.write(TASK.format(i))
+
+        taskset_factory, _, task_factory = create_factories(LocalFSProvider(dir_path), {},
+                                                            get_default_displayable_problem_types(),
+                                                            watch_filesystem=not args.mtime)
+        taskset = taskset_factory.get_taskset("taskset")
+        assert len(task_factory.get_all_tasks(taskset)) == args.tasks
+
+        start = time.perf_counter()
+        for _ in range(args.loads):
+            task_factory.get_all_tasks(taskset)
+        elapsed = time.perf_counter() - start
+        task_factory.close()
+    finally:
+        shutil.rmtree(dir_path)
+
+    print("%s: %.2f ms per load of a taskset of %i tasks" % ("mtime" if args.mtime else "watched",
+                                                              elapsed / args.loads * 1000, args.tasks))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+"""
+    Compares the time needed to provide the task files to a job: a copy of the task directory for each job, or an
+    overlay on top of the task cache of the agent (which needs root). As in a real job, the permissions and the owner
+    of all the task files are then changed, as the grading container does when it starts (set_directory_rights in
+    base-containers/base/bin/INGInious).
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from inginious.agent.docker_agent import _task_cache
+from inginious.agent.docker_agent._task_cache import TaskCache, mount_overlay, unmount
+from inginious.common.filesystems.local import LocalFSProvider
+
+
+def make_task(path, files, file_size):
+    os.makedirs(path)
+    content = os.urandom(file_size)
+    for i in range(files):
+        directory = os.path.join(path, "data%d" % (i % 10))
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "file%d" % i), "wb") as f:
+            f.write(content)
+
+
+def set_directory_rights(path):
+    """ What the grading container does on /task when it starts """
+    os.chmod(path, 0o777)
+    os.chown(path, 4242, 4242)
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            os.chmod(os.path.join(root, name), 0o777)
+            os.chown(os.path.join(root, name), 4242, 4242)
+
+
+def job_with_copy(task_fs, tmp_dir, _cache):
+    job_path = tempfile.mkdtemp(dir=tmp_dir)
+    task_fs.copy_from(None, os.path.join(job_path, "task"))
+    set_directory_rights(os.path.join(job_path, "task"))
+    shutil.rmtree(job_path)
+
+
+def job_with_overlay(task_fs, tmp_dir, cache):
+    job_path = tempfile.mkdtemp(dir=tmp_dir)
+    task_path = os.path.join(job_path, "task")
+    for directory in [task_path, os.path.join(job_path, "upper"), os.path.join(job_path, "work")]:
+        os.mkdir(directory)
+    lower_path = cache.acquire(task_fs)
+    mount_overlay(lower_path, os.path.join(job_path, "upper"), os.path.join(job_path, "work"), task_path)
+    set_directory_rights(task_path)
+    with open(os.path.join(task_path, "student_code.py"), "w") as f:
+        f.write("print('hello')")
+    unmount(task_path)
+    cache.release(lower_path)
+    shutil.rmtree(job_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=200, help="number of files in the task")
+    parser.add_argument("--file-size", type=int, default=256, help="size of each file, in KiB")
+    parser.add_argument("--jobs", type=int, default=50, help="number of jobs")
+    parser.add_argument("--copy", action="store_true", help="copy the task for each job, as before")
+    parser.add_argument("--no-metacopy", action="store_true", help="mount the overlays without metacopy=on")
+    args = parser.parse_args()
+    if args.no_metacopy:
+        _task_cache._metacopy_supported = False
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        make_task(os.path.join(tmp_dir, "task"), args.files, args.file_size * 1024)
+        task_fs = LocalFSProvider(os.path.join(tmp_dir, "task"))
+        cache = TaskCache(os.path.join(tmp_dir, "cache"))
+        job = job_with_copy if args.copy else job_with_overlay
+
+        job(task_fs, tmp_dir, cache)  # fills the cache
+        start = time.perf_counter()
+        for _ in range(args.jobs):
+            job(task_fs, tmp_dir, cache)
+        elapsed = time.perf_counter() - start
+
+    name = "copy" if args.copy else "overlay without metacopy" if args.no_metacopy else "overlay"
+    print("%s: %.2f ms per job for a task of %i files (%.1f MiB)"
+          % (name, elapsed / args.jobs * 1000, args.files,
+             args.files * args.file_size / 1024))
+
+
+if __name__ == "__main__":
+    main()
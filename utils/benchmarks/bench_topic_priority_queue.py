@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# This file is part of INGInious. See the LICENSE and the COPYRIGHTS files for
+# more information about the licensing of this file.
+
+""" Micro-benchmark of the put, get and kill (remove) operations of the backend TopicPriorityQueue """
+
+import argparse
+import queue
+import random
+import time
+
+from inginious.backend.topic_priority_queue import TopicPriorityQueue
+
+
+def timed(name, nb_ops, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print("%-8s %8d ops  %8.3f s  %10.0f ops/s" % (name, nb_ops, elapsed, nb_ops / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, default=100000, help="number of jobs to queue")
+    parser.add_argument("--topics", type=int, default=50, help="number of environments")
+    parser.add_argument("--agent-topics", type=int, default=30, help="number of environments per agent")
+    parser.add_argument("--agents", type=int, default=10, help="number of distinct agent configurations")
+    parser.add_argument("--kill-ratio", type=float, default=0.3, help="ratio of jobs killed before being run")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rand = random.Random(args.seed)
+    topics = [("docker", "env%d" % i) for i in range(args.topics)]
+    agents = [frozenset(rand.sample(topics, min(args.agent_topics, len(topics)))) for _ in range(args.agents)]
+    jobs = [(rand.choice(topics), (rand.randint(0, 2), i), "job%d" % i) for i in range(args.jobs)]
+    killed = rand.sample([job_id for _, _, job_id in jobs], int(args.jobs * args.kill_ratio))
+
+    q = TopicPriorityQueue()
+
+    def put():
+        for topic, item, job_id in jobs:
+            q.put(topic, item, job_id)
+
+    def kill():
+        for job_id in killed:
+            q.remove(job_id)
+
+    got = []
+
+    def get():
+        i = 0
+        misses = 0
+        while misses < len(agents):
+            try:
+                got.append(q.get(agents[i % len(agents)]))
+                misses = 0
+            except queue.Empty:
+                misses += 1
+            i += 1
+
+    timed("put", len(jobs), put)
+    timed("kill", len(killed), kill)
+    timed("get", len(jobs) - len(killed), get)
+    print("%d jobs dispatched, %d left in queue" % (len(got), len(q)))
+
+
+if __name__ == "__main__":
+    main()
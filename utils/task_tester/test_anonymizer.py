@@ -13,7 +13,7 @@ FIELDS_TO_REPLACE = [
     ('time', ''), ('@time', ''), ('@email', 'anonymized@anonymized'), ('@username', 'anonymized')
 ]
 
-BASE_CMD = 'python3 utils/task_tester/inginious-submission-anonymizer '
+BASE_CMD = 'python3 %s ' % os.path.join(os.path.dirname(os.path.abspath(__file__)), 'inginious-submission-anonymizer')
 
 @pytest.fixture
 def get_simple_submission():
@@ -149,8 +149,8 @@ use_minified_js: true
 
 def check_anonymization(path, data, cmd):
 
-    """ Run FUT """
-    out = sp.run(cmd, shell=True, capture_output=True)
+    """ Run FUT, in a temporary directory as it falls back on the current directory without a tasks directory """
+    out = sp.run(cmd, shell=True, capture_output=True, cwd=data[0])
 
     """ Get archive data """
     _, courseid, taskid, archive, users = data
@@ -238,5 +238,5 @@ def test_simple_no_configuration(get_simple_archive, mock_inginious_install):
 
     """ Run FUT """
     cmd = BASE_CMD + "--configuration={config} {courseid} {archive}".format(courseid=courseid, archive=archive, config='non-existing-path')
-    out = sp.run(cmd, capture_output=True, shell=True)
+    out = sp.run(cmd, capture_output=True, shell=True, cwd=path)
     assert out.returncode == 1